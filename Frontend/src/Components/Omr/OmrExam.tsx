@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useLocation, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 
@@ -30,12 +30,46 @@ interface SubjectQuestions {
   levelCounts: {
     [key: number]: number;
   };
+  // Paged delivery: the subject's page, fetched when the student reaches it
+  url?: string;
+  loaded?: boolean;
+}
+
+interface PagedSubject {
+  id: number;
+  subject: string;
+  level_counts: { [key: number]: number };
+  url: string;
+}
+
+interface SubjectPage {
+  id: number;
+  subject: string;
+  questions: Question[];
+  level_counts: { [key: number]: number };
+  next: number | null;
 }
 
 interface Answers {
   [questionId: string]: string;
 }
 
+// How often unsynced answer changes are pushed to the server draft
+const AUTOSAVE_INTERVAL_MS = 5000;
+
+const API_BASE = "http://127.0.0.1:8000";
+
+// Prefetch hints from a Link header: <url>; rel=prefetch; as=fetch|image
+const parsePrefetchLinks = (header?: string): { url: string; as: string }[] => {
+  if (!header) return [];
+  return header.split(/,\s*(?=<)/).flatMap((part) => {
+    const match = part.match(/<([^>]+)>(.*)/);
+    if (!match || !/rel=prefetch/.test(match[2])) return [];
+    const as = match[2].match(/as=(\w+)/);
+    return [{ url: match[1], as: as ? as[1] : "fetch" }];
+  });
+};
+
 const OMRPage: React.FC = () => {
   const [questionsBySubject, setQuestionsBySubject] = useState<SubjectQuestions[]>([]);
   const [currentSubjectIndex, setCurrentSubjectIndex] = useState<number>(0);
@@ -57,6 +91,26 @@ const OMRPage: React.FC = () => {
   const subjectIdsParam = query.get("subject_ids") || "";
   const subjectIds = subjectIdsParam.split(",").filter(Boolean);
   const studentId = query.get("student_id") || localStorage.getItem("student_id") || "";
+  // Set by the invigilator's link for seeded papers; the server rebuilds the paper from it
+  const examSession = query.get("exam_session") || "";
+
+  // Answers changed since the last acknowledged autosave, keyed like `answers`
+  const pendingAnswersRef = useRef<Answers>({});
+  const autosaveInFlightRef = useRef<boolean>(false);
+  const autosavedRef = useRef<boolean>(false);
+  const autosaveSeqRef = useRef<number>(parseInt(localStorage.getItem(`exam_autosave_seq_${studentId}`) || "0"));
+
+  // Subject pages requested so far (prefetched or current), by URL
+  const subjectPagesRef = useRef<{ [url: string]: Promise<SubjectPage> }>({});
+
+  // One server-side draft per exam attempt; the key is fixed when the exam starts
+  const paperKeyStorageKey = `exam_paper_key_${studentId}`;
+  if (examSession) {
+    localStorage.setItem(paperKeyStorageKey, examSession.slice(0, 64));
+  } else if (studentId && !localStorage.getItem(paperKeyStorageKey)) {
+    localStorage.setItem(paperKeyStorageKey, `${subjectIds.join("-")}-${Date.now()}`.slice(-64));
+  }
+  const paperKey = localStorage.getItem(paperKeyStorageKey) || "";
 
   // Load stored exam state from localStorage on initial load
   useEffect(() => {
@@ -90,12 +144,33 @@ const OMRPage: React.FC = () => {
         
         setLoading(false);
       } else {
-        // No saved state, fetch new questions
-        fetchQuestions(subjectIds);
+        // No saved state on this device: resume the server-side draft if there is one
+        // (the device the exam started on died), otherwise start a new paper
+        restoreDraft().then((draftSession) => fetchQuestions(subjectIds, draftSession));
       }
     }
   }, [studentId, subjectIdsParam]);
 
+  // Adopt the student's open draft: its paper key, answers and autosave sequence.
+  // Returns the draft's exam session for seeded papers, so the same paper is rebuilt.
+  const restoreDraft = async (): Promise<string | undefined> => {
+    try {
+      const response = await axios.get(`${API_BASE}/api/drafts/${studentId}/`, {
+        params: examSession ? { paper_key: examSession } : {},
+      });
+      const draft = response.data;
+      localStorage.setItem(paperKeyStorageKey, draft.paper_key);
+      autosaveSeqRef.current = draft.seq;
+      localStorage.setItem(`exam_autosave_seq_${studentId}`, String(draft.seq));
+      autosavedRef.current = true;
+      setAnswers(draft.answers || {});
+      return draft.exam_session || undefined;
+    } catch (err) {
+      // 404: nothing to resume
+      return undefined;
+    }
+  };
+
   // Save current exam state to localStorage whenever it changes
   useEffect(() => {
     if (studentId && questionsBySubject.length > 0) {
@@ -137,19 +212,87 @@ const OMRPage: React.FC = () => {
     }
   }, [showSubjectSelection, subjectIds]);
 
-  const fetchQuestions = async (subjectIdsToFetch: string[]): Promise<void> => {
+  // Follow a response's prefetch hints: the next subject's page is requested now and
+  // kept for when the student gets there, its images go to the browser's prefetch queue
+  const applyPrefetchHints = (linkHeader?: string): void => {
+    parsePrefetchLinks(linkHeader).forEach(({ url, as }) => {
+      if (as === "image") {
+        const href = `${API_BASE}${url}`;
+        if (!document.head.querySelector(`link[rel="prefetch"][href="${href}"]`)) {
+          const link = document.createElement("link");
+          link.rel = "prefetch";
+          link.as = "image";
+          link.href = href;
+          document.head.appendChild(link);
+        }
+      } else {
+        loadSubjectPage(url).catch(() => {
+          // Only a hint; the page is requested again when it is needed
+          delete subjectPagesRef.current[url];
+        });
+      }
+    });
+  };
+
+  const loadSubjectPage = (url: string): Promise<SubjectPage> => {
+    if (!subjectPagesRef.current[url]) {
+      subjectPagesRef.current[url] = axios.get<SubjectPage>(`${API_BASE}${url}`).then((response) => {
+        applyPrefetchHints(response.headers["link"]);
+        return response.data;
+      });
+    }
+    return subjectPagesRef.current[url];
+  };
+
+  // Paged papers: load the current subject's questions when the student reaches it
+  useEffect(() => {
+    const subject = questionsBySubject[currentSubjectIndex];
+    if (!subject || !subject.url || subject.loaded !== false) return;
+    const index = currentSubjectIndex;
+    loadSubjectPage(subject.url)
+      .then((page) => {
+        setQuestionsBySubject((prev) =>
+          prev.map((s, i) => (i === index ? { ...s, questions: page.questions, levelCounts: page.level_counts, loaded: true } : s))
+        );
+      })
+      .catch((err) => {
+        delete subjectPagesRef.current[subject.url as string];
+        console.error("Error fetching subject questions:", err);
+        alert("Failed to load questions.");
+      });
+  }, [currentSubjectIndex, questionsBySubject]);
+
+  const fetchQuestions = async (subjectIdsToFetch: string[], session: string | undefined = examSession || undefined): Promise<void> => {
     if (!studentId || subjectIdsToFetch.length === 0) {
       setLoading(false);
       return;
     }
     
     try {
-      const response = await axios.post("http://127.0.0.1:8000/api/get_random_questions/", {
+      // Paged delivery: the paper is fixed now, but only the first subject comes with it
+      const response = await axios.post(`${API_BASE}/api/get_random_questions/`, {
         subject_ids: subjectIdsToFetch,
-        student_id: parseInt(studentId)
+        student_id: parseInt(studentId),
+        exam_session: session,
+        paged: true
       });
 
       console.log("API response:", response.data);
+
+      if (response.data.paged) {
+        const first: SubjectPage | null = response.data.first;
+        setQuestionsBySubject(
+          (response.data.subjects as PagedSubject[]).map((s) => ({
+            subject: s.subject,
+            questions: first && s.id === first.id ? first.questions : [],
+            levelCounts: s.level_counts,
+            url: s.url,
+            loaded: !!first && s.id === first.id,
+          }))
+        );
+        applyPrefetchHints(response.headers["link"]);
+        return;
+      }
       
       // Handle both data formats: new format (with questions property) and old format
       const formatted = Object.entries(response.data).map(([subject, data]: [string, any]) => {
@@ -176,8 +319,52 @@ const OMRPage: React.FC = () => {
 
   const handleAnswerChange = (questionId: number, selectedOption: string): void => {
     setAnswers((prev) => ({ ...prev, [questionId]: selectedOption }));
+    pendingAnswersRef.current[questionId] = selectedOption;
   };
 
+  // Push unsynced answer changes as one small batch. Only one request is in flight at a
+  // time; entries are dropped from the pending set once the server acknowledges them.
+  const flushAutosave = async (): Promise<void> => {
+    const batch = { ...pendingAnswersRef.current };
+    if (!studentId || !paperKey || autosaveInFlightRef.current || Object.keys(batch).length === 0) {
+      return;
+    }
+
+    autosaveInFlightRef.current = true;
+    const seq = autosaveSeqRef.current + 1;
+    try {
+      const response = await axios.post("http://127.0.0.1:8000/api/autosave_answers/", {
+        student_id: parseInt(studentId),
+        paper_key: paperKey,
+        seq,
+        answers: batch,
+      });
+
+      // A stale response means the server already has a newer seq (e.g. another device);
+      // adopt it so the next flush goes through.
+      autosaveSeqRef.current = response.data.stale ? response.data.seq : seq;
+      localStorage.setItem(`exam_autosave_seq_${studentId}`, autosaveSeqRef.current.toString());
+
+      if (!response.data.stale) {
+        autosavedRef.current = true;
+        Object.entries(batch).forEach(([questionId, option]) => {
+          if (pendingAnswersRef.current[questionId] === option) {
+            delete pendingAnswersRef.current[questionId];
+          }
+        });
+      }
+    } catch (err) {
+      console.error("Autosave failed, will retry:", err);
+    } finally {
+      autosaveInFlightRef.current = false;
+    }
+  };
+
+  useEffect(() => {
+    const timer = setInterval(flushAutosave, AUTOSAVE_INTERVAL_MS);
+    return () => clearInterval(timer);
+  }, [studentId, paperKey]);
+
   const handleNextSubject = (): void => {
     if (currentSubjectIndex < questionsBySubject.length - 1) {
       // Show the subject complete alert
@@ -220,10 +407,12 @@ const OMRPage: React.FC = () => {
     }
     
     try {
+      // Once the draft holds the answers, only the unsynced changes need to be sent
       const payload = {
         student_id: parseInt(studentId),
         subject_ids: subjectIds,
-        answers: answers,
+        paper_key: paperKey,
+        answers: autosavedRef.current ? pendingAnswersRef.current : answers,
       };
 
       const response = await axios.post("http://127.0.0.1:8000/api/submit_answers/", payload);
@@ -244,6 +433,9 @@ const OMRPage: React.FC = () => {
       localStorage.removeItem(`exam_subject_index_${studentId}`);
       localStorage.removeItem(`exam_question_index_${studentId}`);
       localStorage.removeItem(`exam_subject_ids_${studentId}`);
+      localStorage.removeItem(paperKeyStorageKey);
+      localStorage.removeItem(`exam_autosave_seq_${studentId}`);
+      pendingAnswersRef.current = {};
       
       // Navigate home after 6 seconds
       setTimeout(() => {
@@ -288,7 +480,8 @@ const OMRPage: React.FC = () => {
     try {
       const response = await axios.post("http://127.0.0.1:8000/api/get_random_questions/", {
         subject_ids: selectedExtraSubjects,
-        student_id: parseInt(studentId)
+        student_id: parseInt(studentId),
+        exam_session: examSession || undefined
       });
       
       // Format the new questions
@@ -349,6 +542,20 @@ const OMRPage: React.FC = () => {
   }
 
   const currentSubject = questionsBySubject[currentSubjectIndex];
+
+  if (currentSubject && currentSubject.loaded === false) {
+    return (
+      <div className="min-h-screen flex justify-center items-center bg-gradient-to-b from-[#01acef] to-white">
+        <div className="bg-white p-8 rounded-xl shadow-xl">
+          <div className="flex flex-col items-center">
+            <div className="w-16 h-16 border-4 border-blue-600 border-t-transparent rounded-full animate-spin"></div>
+            <p className="mt-4 text-lg font-medium text-gray-700">Loading {currentSubject.subject}...</p>
+          </div>
+        </div>
+      </div>
+    );
+  }
+
   const currentQuestion = currentSubject?.questions[currentQuestionIndex];
   const totalQuestions = currentSubject?.questions.length || 0;
   
@@ -31,6 +31,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'omr_app.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'ils_project.urls'
@@ -59,6 +60,8 @@ CORS_ALLOW_METHODS = ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
 CORS_ALLOW_HEADERS = ["*"]
 CORS_ALLOW_CREDENTIALS = True
 CORS_ORIGIN_ALLOW_ALL = True
+# The exam page reads the prefetch hints of paged question delivery
+CORS_EXPOSE_HEADERS = ["Link"]
 
 DATABASES = {
     'default': {
@@ -90,6 +93,76 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Published question bank snapshots (read-only, memory-mapped by workers)
+OMR_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'snapshots')
+
+# Compressed partition files of archived submissions (see omr_app/archive.py)
+OMR_ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive')
+
+# Seconds subject lists and question pools stay cached for the exam-start endpoints
+OMR_EXAM_CACHE_TTL = 60
+
+# Seconds browsers may cache a subject page of a paged paper (omr_app/delivery.py)
+OMR_PAPER_PAGE_MAX_AGE = 3 * 3600
+
+# Offline exam bundles (omr_app/offline.py): where archives are written, and the box images are downsized to
+OMR_BUNDLE_DIR = os.path.join(BASE_DIR, 'bundles')
+OMR_BUNDLE_IMAGE_SIZE = (800, 800)
+
+# Edge node sync (see omr_app/sync.py). On an edge node: node_id, upstream (the central
+# server's base URL) and token; on the central server: nodes, {node_id: token}.
+OMR_SYNC = {
+    'node_id': '',
+    'upstream': '',
+    'token': '',
+    'batch_size': 500,
+    'nodes': {},
+}
+
+# Rescoring after answer key corrections (omr_app/rescoring.py): submissions per batch,
+# whether jobs run in a background thread of the process that saved the correction, and
+# after how many seconds without a finished batch a running job counts as dead
+OMR_RESCORE = {'batch_size': 1000, 'background': True, 'stale_after': 600}
+
+# Adaptive papers (see omr_app/adaptive.py for the defaults and what each limit means)
+OMR_ADAPTIVE = {'min_items': 5, 'max_items': 20, 'target_se': 0.5, 'randomesque': 3, 'table_ttl': 3600}
+
+# Question search backend (dotted path); unset picks SQLite FTS5 or plain lookups by database (see omr_app/search.py)
+OMR_SEARCH_BACKEND = None
+
+# Estimated text similarity above which questions count as near-duplicates (see omr_app/similarity.py)
+OMR_DUPLICATE_THRESHOLD = 0.8
+
+# Sampling profiler for slow requests, off by default (see omr_app/profiling.py). Safe to
+# leave on during exams: fast requests are never sampled unless picked by sample_rate.
+OMR_PROFILER = {
+    'enabled': False,
+    'sample_rate': 0.001,
+    'slow_ms': 5000,
+    'watch_after_ms': 500,
+    'interval_ms': 10,
+    'keep': 500,
+    'dir': os.path.join(BASE_DIR, 'profiles'),
+}
+
+# Seconds between database resyncs of the live exam-session dashboards (see omr_app/live.py)
+OMR_LIVE_RESYNC = 30
+
+# Render reports with the compact PDF profile (downsampled logos, shared XObjects)
+OMR_PDF_COMPACT = True
+
+# Seconds a submission's results payload stays cached; edits to what it shows drop it sooner (omr_app/reports.py)
+OMR_REPORT_CACHE_TTL = 3600
+
+# PDF renders at least this slow (ms) are logged with their stage timings (omr_app/tracing.py)
+OMR_REPORT_SLOW_MS = 2000
+
+# Per-endpoint admission limits (see omr_app/admission.py for the defaults)
+OMR_ADMISSION = {
+    'get_random_questions': {'rate': 50, 'burst': 200, 'max_concurrent': 16, 'max_queue': 400, 'queue_timeout': 15},
+    'generate_pdf': {'rate': 2, 'burst': 10, 'max_concurrent': 2, 'max_queue': 20, 'queue_timeout': 30},
+}
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # fhr
@@ -0,0 +1,200 @@
+"""
+Computerized adaptive testing.
+
+In adaptive mode a paper is served one question at a time. Each answer updates a Rasch
+(1PL) ability estimate, the next question is the most informative unseen one at that
+estimate, and the paper stops once the estimate is precise enough (or max_items is hit).
+
+Item difficulties come from Question.difficulty once calibrate_questions has run, and
+from the question's level until then. Per subject, an ItemTable precomputes on a fixed
+ability grid:
+
+* each item's log P(correct) and log P(wrong), so an answer updates the posterior
+  with one pass over the grid, and
+* the items ranked by information at every grid point, truncated to the few a paper can
+  ever need, so choosing the next question is a lookup instead of a scan of the bank.
+  Items of equal information (e.g. every question of a level in an uncalibrated bank)
+  form one tier that is never cut, and ties are broken at random per question served,
+  so exposure spreads over the whole tier instead of its lowest ids.
+
+Tables live in the Django cache like the exam pools. A paper's state (questions served,
+log posterior, estimate) is kept in its ExamDraft, so any worker can continue it.
+"""
+import math
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .admission import single_flight
+from .models import Question
+
+LEVEL_DIFFICULTY = {1: -1.5, 2: -0.5, 3: 0.5, 4: 1.5}
+GRID_STEP = 0.25
+THETA_GRID = tuple(-4 + GRID_STEP * i for i in range(33))
+DEFAULTS = {
+    # min_items / max_items: paper length bounds, target_se: stop once the standard error
+    # is this small (0.5 is about what the fixed 5-per-level paper achieves for an average
+    # student), randomesque: pick randomly among the best few items (exposure control),
+    # table_ttl: seconds an item table stays cached
+    'min_items': 5, 'max_items': 20, 'target_se': 0.5, 'randomesque': 3, 'table_ttl': 3600,
+}
+
+
+def adaptive_settings():
+    return {**DEFAULTS, **getattr(settings, 'OMR_ADAPTIVE', {})}
+
+
+def item_difficulty(level, difficulty=None):
+    return difficulty if difficulty is not None else LEVEL_DIFFICULTY.get(level, 0.0)
+
+
+class ItemTable:
+    def __init__(self, subject_id, items, depth):
+        """items: (question id, level, correct option, difficulty) tuples."""
+        self.subject_id = subject_id
+        self.key = {}
+        self.level = {}
+        self.log_likelihood = {}  # question id: (log P(correct), log P(wrong)) per grid point
+        information = {}
+        for qid, level, correct_option, b in items:
+            p = [1 / (1 + math.exp(b - theta)) for theta in THETA_GRID]
+            self.key[qid] = correct_option
+            self.level[qid] = level
+            self.log_likelihood[qid] = (tuple(math.log(x) for x in p), tuple(math.log(1 - x) for x in p))
+            information[qid] = [x * (1 - x) for x in p]
+        # ranked[g]: tiers of equally informative items at THETA_GRID[g], most informative
+        # first. A paper never serves more than max_items, so tiers holding depth items
+        # always have enough unseen ones.
+        self.ranked = []
+        for g in range(len(THETA_GRID)):
+            tiers = {}
+            for qid in information:
+                tiers.setdefault(round(information[qid][g], 9), []).append(qid)
+            kept, count = [], 0
+            for value in sorted(tiers, reverse=True):
+                if count >= depth:
+                    break
+                kept.append(tuple(tiers[value]))
+                count += len(tiers[value])
+            self.ranked.append(tuple(kept))
+
+    def __len__(self):
+        return len(self.key)
+
+
+def build_item_table(subject_id):
+    config = adaptive_settings()
+    items = [
+        (qid, level, correct_option, item_difficulty(level, difficulty))
+        for qid, level, correct_option, difficulty in Question.objects.filter(subject_id=subject_id)
+        .values_list('id', 'level', 'correct_option', 'difficulty')
+    ]
+    return ItemTable(subject_id, items, depth=config['max_items'] + config['randomesque'])
+
+
+def _table_key(subject_id):
+    # Versioned with the ItemTable layout, so tables cached by older code are never read
+    return f"omr:adaptive:v2:{subject_id}"
+
+
+def item_table(subject_id):
+    """The subject's cached ItemTable; concurrent misses share one build."""
+    key = _table_key(subject_id)
+    table = cache.get(key)
+    if table is None:
+        def fill():
+            result = build_item_table(subject_id)
+            cache.set(key, result, adaptive_settings()['table_ttl'])
+            return result
+        table = single_flight.do(key, fill)
+    return table
+
+
+def invalidate_item_table(subject_id):
+    cache.delete(_table_key(subject_id))
+
+
+def new_state():
+    """Selection state of one subject on an adaptive paper (stored in ExamDraft.adaptive)."""
+    return {
+        'served': [],
+        'pending': None,  # Served question awaiting its answer
+        'answered': 0,
+        'correct': 0,
+        'log_posterior': [-theta * theta / 2 for theta in THETA_GRID],  # Standard normal prior
+        'theta': 0.0,
+        'se': 1.0,
+        'done': False,
+    }
+
+
+def estimate(log_posterior):
+    """Expected a posteriori ability and its posterior standard deviation over the grid."""
+    top = max(log_posterior)
+    weights = [math.exp(lp - top) for lp in log_posterior]
+    total = sum(weights)
+    theta = sum(w * t for w, t in zip(weights, THETA_GRID)) / total
+    se = math.sqrt(sum(w * (t - theta) ** 2 for w, t in zip(weights, THETA_GRID)) / total)
+    return theta, se
+
+
+def record_answer(state, table, question_id, option):
+    """Score the pending question and update the estimate. Returns whether it was correct."""
+    correct = option == table.key.get(question_id)
+    if question_id in table.log_likelihood:
+        log_correct, log_wrong = table.log_likelihood[question_id]
+        state['log_posterior'] = [
+            lp + (a if correct else b) for lp, a, b in zip(state['log_posterior'], log_correct, log_wrong)
+        ]
+    state['pending'] = None
+    state['answered'] += 1
+    state['correct'] += correct
+    state['theta'], state['se'] = estimate(state['log_posterior'])
+    state['done'] = should_stop(state, table)
+    return correct
+
+
+def should_stop(state, table):
+    config = adaptive_settings()
+    return (
+        state['answered'] >= config['max_items']
+        or (state['answered'] >= config['min_items'] and state['se'] <= config['target_se'])
+        or len(state['served']) >= len(table)
+    )
+
+
+def next_question(state, table, rng=random):
+    """Pick and mark as pending the next question id, or None if the paper is finished."""
+    if state['done']:
+        return None
+    g = min(max(round((state['theta'] - THETA_GRID[0]) / GRID_STEP), 0), len(THETA_GRID) - 1)
+    served = set(state['served'])
+    size = adaptive_settings()['randomesque']
+    candidates = []
+    for tier in table.ranked[g]:
+        unseen = [qid for qid in tier if qid not in served]
+        if len(candidates) + len(unseen) > size:
+            # The tier straddles the cut: which of its items make it is random
+            unseen = rng.sample(unseen, size - len(candidates))
+        candidates += unseen
+        if len(candidates) == size:
+            break
+    if not candidates:
+        state['done'] = True
+        return None
+    question_id = rng.choice(candidates)
+    state['served'].append(question_id)
+    state['pending'] = question_id
+    return question_id
+
+
+def progress(state):
+    return {
+        'answered': state['answered'],
+        'correct': state['correct'],
+        'ability': round(state['theta'], 3),
+        'standard_error': round(state['se'], 3),
+        'max_items': adaptive_settings()['max_items'],
+        'done': state['done'],
+    }
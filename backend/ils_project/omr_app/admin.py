@@ -1,15 +1,57 @@
-from django.contrib import admin
-from django.urls import path
+from django.contrib import admin, messages
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.urls import path, reverse
+from django.utils.functional import cached_property
 from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
 from django.utils.html import format_html
 from django.http import HttpResponse
 from django import forms
-from .models import StudentSubmission, Question, Student, Subject,StudentSavedQuestions
-from .pdf_utils import generate_student_performance_pdf
+from .models import StudentSubmission, Question, Student, Subject,StudentSavedQuestions, ExamDraft, QuestionBankSnapshot, SubmissionArchive, OfflineBundle, SyncBatch, SyncCheckpoint, RescoreJob, AnswerKeyCorrection
+from .papers import publish_snapshot
+from .reports import report_data_for
+from .rescoring import archived_submissions, claimable, correct_key, start_job
+from .search import get_backend
+from .similarity import duplicate_groups, find_similar
+from .warming import warm_exam
 import json
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that doesn't COUNT(*) a huge unfiltered table. When the changelist isn't
+    filtered it uses the planner's row estimate on PostgreSQL. Without an estimate it
+    counts with a LIMIT, so at most OMR_ADMIN_EXACT_COUNT_LIMIT rows are scanned and
+    pages past that are reached by filtering or searching.
+    Filtered changelists are counted exactly, they are usually small.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.is_sliced:
+            limit = getattr(settings, 'OMR_ADMIN_EXACT_COUNT_LIMIT', 100000)
+            estimate = self._estimated_count()
+            if estimate is not None and estimate > limit:
+                return estimate
+            if estimate is None:
+                return self.object_list[:limit].count()
+        return super().count
+
+    def _estimated_count(self):
+        model = self.object_list.model
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples is -1 (or 0) until the table has been analyzed
+        return row[0] if row and row[0] > 0 else None
+
+
 # --- Custom PDF Form ---
 class PDFEditForm(forms.Form):
     title = forms.CharField(label="Report Title", initial="Student Performance Report", required=False)
@@ -23,6 +65,20 @@ class PDFEditForm(forms.Form):
 @admin.register(StudentSubmission)
 class StudentSubmissionAdmin(admin.ModelAdmin):
     list_display = ('student', 'score', 'submitted_at', 'view_performance', 'view_answers', 'customize_pdf')
+    list_select_related = ('student',)
+    # All filter fields are indexed
+    list_filter = ('student__school', 'student__classLevel', 'subjects__board')
+    # Case-sensitive lookups so the search can use the name, phone and session indexes
+    # (the case-insensitive ^ and = prefixes wrap the column in UPPER())
+    search_fields = ('student__name__startswith', 'student__phone__exact', 'exam_session__exact')
+    date_hierarchy = 'submitted_at'
+    ordering = ('-submitted_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('student', 'snapshot')
+    # Answers are stored packed; they are shown decoded and edited through the exam flow only
+    exclude = ('answers_json',)
+    readonly_fields = ('answers',)
 
     def view_performance(self, obj):
         return format_html(
@@ -55,42 +111,32 @@ class StudentSubmissionAdmin(admin.ModelAdmin):
         return custom_urls + urls
 
     def answer_analysis_view(self, request, submission_id):
-        submission = get_object_or_404(StudentSubmission, id=submission_id)
+        submission = get_object_or_404(StudentSubmission.objects.select_related('student'), id=submission_id)
         student = submission.student
-        answers = submission.answers or {}
-        
-        # Get all subjects in this submission
-        subjects = submission.subjects.all()
+        # All answered questions come back from one bulk query, already scored and aggregated
+        report = report_data_for(submission)
+        level_names = dict(Question._meta.get_field('level').choices)
+
         questions_by_subject = {}
-        
-        for subject in subjects:
-            # Filter questions to only include those that were answered (part of the random selection)
-            questions = Question.objects.filter(
-                subject=subject, 
-                id__in=[int(qid) for qid in answers.keys()]
-            )
-            
-            question_data = []
-            
-            for question in questions:
-                question_id = str(question.id)
-                student_answer = answers.get(question_id, None)
-                is_correct = (student_answer == question.correct_option)
-                
-                question_data.append({
-                    'id': question.id,
-                    'text': question.question_text,
-                    'question': question.question_text,
-                    'level': question.level,
-                    'level_display': question.get_level_display(),
-                    'student_answer': student_answer,
-                    'correct_answer': question.correct_option,
-                    'is_correct': is_correct,
-                })
-            
+        grouped = report.questions_by_subject()
+        for subject in report.subjects:
+            question_data = [{
+                'id': question.question_id,
+                'text': question.text,
+                'question': question.text,
+                'level': question.level,
+                'level_display': level_names.get(question.level, question.level),
+                'student_answer': question.student_answer,
+                'correct_answer': question.correct_answer,
+                'is_correct': question.is_correct,
+            } for question in grouped[subject.subject_id]]
+
             questions_by_subject[subject.name] = {
                 'questions': question_data,
-                'level_counts': {}  # We'll calculate this from the actual questions
+                'correct': subject.correct,
+                'total': subject.total,
+                'percentage': subject.percentage,
+                'levels': [level for level in subject.levels if level.total],
             }
         
         context = {
@@ -105,54 +151,22 @@ class StudentSubmissionAdmin(admin.ModelAdmin):
         return TemplateResponse(request, 'omr_app/answer_analysis.html', context)
 
     def chart_view(self, request, submission_id):
-        submission = get_object_or_404(StudentSubmission, id=submission_id)
+        submission = get_object_or_404(StudentSubmission.objects.select_related('student'), id=submission_id)
         student = submission.student
-        subjects = submission.subjects.all()
-        answers = submission.answers or {}
+        report = report_data_for(submission)
 
-        subject_data = []
-        level_choices = dict(Question._meta.get_field('level').choices).keys()
+        # Only questions that were actually presented to the student (the answered ones) count
         level_data = {}
-
-        for subject in subjects:
-            # We need to identify which questions were actually part of the random selection
-            # These are the questions that have IDs in the answers dictionary
-            subject_questions = Question.objects.filter(subject=subject, id__in=[int(qid) for qid in answers.keys()])
-            
-            # Now we're only counting questions that were actually presented to the student
-            total_questions = subject_questions.count()
-            correct = 0
-            level_totals = {level: 0 for level in level_choices}
-            level_correct = {level: 0 for level in level_choices}
-
-            for q in subject_questions:
-                qid_str = str(q.id)
-                level_totals[q.level] += 1
-                if qid_str in answers and answers[qid_str] == q.correct_option:
-                    correct += 1
-                    level_correct[q.level] += 1
-
-            subject_data.append({
-                'name': subject.name,
-                'correct': correct,
-                'total': total_questions
-            })
-
-            level_data[subject.name] = {
-                'level1_correct': level_correct[1],
-                'level1_total': level_totals[1],
-                'level2_correct': level_correct[2],
-                'level2_total': level_totals[2],
-                'level3_correct': level_correct[3],
-                'level3_total': level_totals[3],
-                'level4_correct': level_correct[4],
-                'level4_total': level_totals[4],
-            }
+        for subject in report.subjects:
+            level_data[subject.name] = {}
+            for level in subject.levels:
+                level_data[subject.name][f'level{level.level}_correct'] = level.correct
+                level_data[subject.name][f'level{level.level}_total'] = level.total
 
         chart_data = {
-            'subjects': json.dumps([s['name'] for s in subject_data]),
-            'scores': json.dumps([s['correct'] for s in subject_data]),
-            'totals': json.dumps([s['total'] for s in subject_data]),
+            'subjects': json.dumps([s.name for s in report.subjects]),
+            'scores': json.dumps([s.correct for s in report.subjects]),
+            'totals': json.dumps([s.total for s in report.subjects]),
             'level_data': json.dumps(level_data),
         }
 
@@ -182,6 +196,8 @@ class StudentSubmissionAdmin(admin.ModelAdmin):
                 logo_file = request.FILES.get('logo')
                 logo_bytes = logo_file.read() if logo_file else None
 
+                from .pdf_utils import generate_student_performance_pdf
+
                 buffer = generate_student_performance_pdf(
                     student_id=submission.student.id,
                     title=title,
@@ -189,7 +205,8 @@ class StudentSubmissionAdmin(admin.ModelAdmin):
                     footer=footer,
                     include_chart=include_chart,
                     logo_bytes=logo_bytes,
-                    signature=signature
+                    signature=signature,
+                    submission_id=submission.id
                 )
                 filename = f"{submission.student.name.replace(' ', '_')}_custom_report.pdf"
                 response = HttpResponse(buffer, content_type='application/pdf')
@@ -207,6 +224,217 @@ class StudentSubmissionAdmin(admin.ModelAdmin):
         return TemplateResponse(request, 'omr_app/edit_pdf_form.html', context)
 
 
+@admin.register(QuestionBankSnapshot)
+class QuestionBankSnapshotAdmin(admin.ModelAdmin):
+    """Published snapshots are immutable; the only way to change one is to publish the next version."""
+    list_display = ('board', 'class_level', 'version', 'question_count', 'file', 'created_at')
+    list_filter = ('board', 'class_level')
+    readonly_fields = ('board', 'class_level', 'version', 'question_count', 'file', 'checksum', 'pools', 'created_at')
+    actions = ['publish_next_version']
+
+    def has_add_permission(self, request):
+        return False
+
+    def publish_next_version(self, request, queryset):
+        for board, class_level in queryset.values_list('board', 'class_level').distinct():
+            snapshot = publish_snapshot(board, class_level)
+            self.message_user(request, f"Published {snapshot} ({snapshot.question_count} questions)")
+    publish_next_version.short_description = 'Publish next version of the selected question banks'
+
+
+@admin.register(Subject)
+class SubjectAdmin(admin.ModelAdmin):
+    list_display = ('name', 'board', 'class_level')
+    list_filter = ('board', 'class_level')
+    actions = ['warm_exam_caches']
+
+    def warm_exam_caches(self, request, queryset):
+        # Runs in this web worker, so its in-process caches are warmed too (see warming.py)
+        levels = {}
+        for subject_id, board, class_level in queryset.values_list('id', 'board', 'class_level'):
+            levels.setdefault(board, (set(), []))
+            levels[board][0].add(class_level)
+            levels[board][1].append(subject_id)
+        for board, (class_levels, subject_ids) in sorted(levels.items()):
+            trace = warm_exam(board, class_levels, subject_ids, request=request)
+            steps = ', '.join(f"{span['stage']} {span['ms']:.0f} ms" for span in trace.spans)
+            self.message_user(request, f"Warmed {board} class {', '.join(map(str, sorted(class_levels)))}: {steps}")
+    warm_exam_caches.short_description = 'Warm exam caches for the selected subjects'
+
+
+@admin.register(OfflineBundle)
+class OfflineBundleAdmin(admin.ModelAdmin):
+    """Built by the build_offline_bundle command; results are uploaded to api/offline/import/."""
+    list_display = ('centre', 'exam_session', 'board', 'class_level', 'student_count', 'size', 'created_at', 'imported_at', 'download')
+    list_filter = ('board', 'class_level')
+    search_fields = ('centre', 'exam_session')
+    readonly_fields = [field.name for field in OfflineBundle._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def student_count(self, obj):
+        return len(obj.student_ids)
+    student_count.short_description = 'Students'
+
+    def download(self, obj):
+        url = reverse('offline_bundle_download', args=[obj.checksum])
+        return format_html('<a href="{}">Download</a>', url)
+
+
+@admin.register(SyncBatch)
+class SyncBatchAdmin(admin.ModelAdmin):
+    """Change sets received from edge nodes (see sync.py)."""
+    list_display = ('node', 'batch', 'received', 'students', 'submissions', 'bytes', 'received_at')
+    list_filter = ('node',)
+    readonly_fields = [field.name for field in SyncBatch._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(SyncCheckpoint)
+class SyncCheckpointAdmin(admin.ModelAdmin):
+    """Push progress of this edge node; moved by the sync_node command."""
+    list_display = ('upstream', 'student_id', 'submission_id', 'batches', 'pushed_at')
+    readonly_fields = ('upstream', 'batches', 'pushed_at')
+
+
+@admin.register(RescoreJob)
+class RescoreJobAdmin(admin.ModelAdmin):
+    """Queued when a question's answer key is corrected (see rescoring.py); archived submissions are not rescored."""
+    list_display = ('id', 'question_ids', 'status', 'progress_display', 'processed', 'total', 'changed', 'started_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = [field.name for field in RescoreJob._meta.fields]
+    actions = ['resume_jobs']
+
+    def has_add_permission(self, request):
+        return False
+
+    def progress_display(self, obj):
+        return f"{obj.progress}%"
+    progress_display.short_description = 'Progress'
+
+    @admin.action(description="Resume selected jobs in the background")
+    def resume_jobs(self, request, queryset):
+        jobs = list(queryset.filter(claimable()).values_list('id', flat=True))
+        for job_id in jobs:
+            start_job(job_id)
+        self.message_user(request, f"Resumed {len(jobs)} job(s); running jobs are left alone.")
+
+
+@admin.register(AnswerKeyCorrection)
+class AnswerKeyCorrectionAdmin(admin.ModelAdmin):
+    """Recorded when an admin saves a question as an answer key correction."""
+    list_display = ('question', 'previous_option', 'correct_option', 'corrected_at')
+    readonly_fields = ('question', 'previous_option', 'correct_option', 'corrected_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(SubmissionArchive)
+class SubmissionArchiveAdmin(admin.ModelAdmin):
+    """Written by the archive_submissions command; the files are read-only."""
+    list_display = ('kind', 'partition', 'record_count', 'min_record_id', 'max_record_id', 'first_at', 'last_at', 'file')
+    list_filter = ('kind',)
+    search_fields = ('partition',)
+    readonly_fields = [field.name for field in SubmissionArchive._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+class QuestionAdminForm(forms.ModelForm):
+    correct_key = forms.BooleanField(
+        label="Answer key correction", required=False,
+        help_text=(
+            "The previous correct option was wrong: rescore the submissions that answered this question, "
+            "including papers issued from snapshots. Leave unticked when the options were only reordered."
+        ),
+    )
+
+    class Meta:
+        model = Question
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('correct_key') and 'correct_option' not in self.changed_data:
+            self.add_error('correct_key', "Change the correct option to correct the key.")
+        return cleaned_data
+
+
+@admin.register(Question)
+class QuestionAdmin(admin.ModelAdmin):
+    """
+    Searches through the full-text index (see search.py), warns about near-duplicates on
+    save and lists duplicate clusters (see similarity.py).
+    """
+    list_display = ('__str__', 'subject', 'level', 'correct_option')
+    list_filter = ('subject__board', 'subject__class_level', 'level')
+    list_select_related = ('subject',)
+    search_fields = ('question_text',)  # Only enables the search box; matching uses the full-text index
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    form = QuestionAdminForm
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return get_backend().filter_queryset(queryset, search_term), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and form.cleaned_data.get('correct_key'):
+            job = correct_key(obj, form.initial['correct_option'])
+            url = reverse('admin:omr_app_rescorejob_change', args=[job.id])
+            self.message_user(request, format_html(
+                'The answer key changed: submissions that answered this question are being rescored (<a href="{}">job {}</a>).',
+                url, job.id,
+            ))
+            archived = archived_submissions()
+            if archived:
+                self.message_user(request, (
+                    f"{archived} archived submissions are not rescored: archive files keep the answer key "
+                    f"they were scored with."
+                ), level=messages.WARNING)
+        elif change and 'correct_option' in form.changed_data:
+            self.message_user(request, (
+                "The correct option changed without an answer key correction: papers issued from snapshots "
+                "and past submissions keep the key they were served with."
+            ), level=messages.WARNING)
+        matches = find_similar(obj.question_text, (obj.option_a, obj.option_b, obj.option_c, obj.option_d),
+                               exclude_id=obj.id, limit=5)
+        if matches:
+            ids = ', '.join(f"#{qid} ({score:.0%})" for qid, score in matches)
+            self.message_user(request, f"Possible duplicates of this question: {ids}", level=messages.WARNING)
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('duplicates/', self.admin_site.admin_view(self.duplicates_view), name='question-duplicates'),
+        ]
+        return custom_urls + urls
+
+    def duplicates_view(self, request):
+        groups = duplicate_groups(limit=200)
+        questions = Question.objects.select_related('subject').in_bulk(
+            [qid for group in groups for qid, _score in group]
+        )
+        clusters = [
+            [(questions[qid], score) for qid, score in group if qid in questions]
+            for group in groups
+        ]
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            clusters=clusters,
+            title='Near-duplicate questions',
+        )
+        return TemplateResponse(request, 'omr_app/question_duplicates.html', context)
+
+
 # Optional PDF Preview View (can wire this up later)
 def preview_pdf_view(request, submission_id):
     submission = get_object_or_404(StudentSubmission, id=submission_id)
@@ -214,6 +442,7 @@ def preview_pdf_view(request, submission_id):
     if form.is_valid():
         data = form.cleaned_data
         logo_file = request.FILES.get('logo')
+        from .pdf_utils import generate_student_performance_pdf
         buffer = generate_student_performance_pdf(
             student_id=submission.student.id,
             title=data.get('title'),
@@ -221,7 +450,8 @@ def preview_pdf_view(request, submission_id):
             footer=data.get('footer'),
             include_chart=data.get('include_chart', False),
             signature=data.get('signature'),
-            logo_bytes=logo_file.read() if logo_file else None
+            logo_bytes=logo_file.read() if logo_file else None,
+            submission_id=submission.id
         )
         return HttpResponse(buffer, content_type='application/pdf')
     else:
@@ -230,6 +460,5 @@ def preview_pdf_view(request, submission_id):
 
 # Register other models
 admin.site.register(StudentSavedQuestions)
+admin.site.register(ExamDraft)
 admin.site.register(Student)
-admin.site.register(Subject)
-admin.site.register(Question)
\ No newline at end of file
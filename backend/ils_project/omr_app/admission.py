@@ -0,0 +1,228 @@
+"""
+Admission control and request coalescing for exam-start stampedes.
+
+When an invigilator says "start", every student hits the same few endpoints within
+seconds. Two tools keep that from collapsing the database:
+
+* SingleFlight: concurrent identical computations (same cache key) share one run.
+* AdmissionGate: a token bucket plus a bounded wait queue in front of expensive
+  endpoints. Requests over the limit get 429/503 with a Retry-After header instead of
+  piling up.
+
+Both work per worker process. Gates are configured per endpoint with the
+OMR_ADMISSION setting, e.g. {'generate_pdf': {'rate': 2, 'burst': 5, 'max_concurrent': 2}}.
+"""
+import functools
+import math
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+from .metrics import register_source
+
+DEFAULT_GATES = {
+    # rate: tokens per second, burst: bucket size, max_concurrent: requests running at once,
+    # max_queue: requests allowed to wait for a slot, queue_timeout: seconds a request may wait
+    'get_random_questions': {'rate': 50, 'burst': 200, 'max_concurrent': 16, 'max_queue': 400, 'queue_timeout': 15},
+    'generate_pdf': {'rate': 2, 'burst': 10, 'max_concurrent': 2, 'max_queue': 20, 'queue_timeout': 30},
+}
+
+
+class SingleFlight:
+    """Run one computation per key at a time; concurrent callers wait for and share its result."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = 0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0  # Callers that reused another caller's result
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = self._Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Take one token. Returns (allowed, seconds until a token is available)."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True, 0.0
+            return False, (1 - self.tokens) / self.rate
+
+
+class AdmissionGate:
+    def __init__(self, name, rate, burst, max_concurrent, max_queue, queue_timeout):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting_seen = 0
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_queue = 0
+        self.avg_service_s = 0.0
+
+    def _retry_after_queue(self):
+        # Rough time for the current queue to drain, never less than a second
+        per_slot = self.avg_service_s or 1.0
+        return max(1.0, per_slot * (self.waiting + 1) / self.max_concurrent)
+
+    def acquire(self):
+        """Returns (admitted, status_code, retry_after_seconds)."""
+        allowed, wait = self.bucket.take()
+        if not allowed:
+            with self._cond:
+                self.rejected_rate += 1
+            return False, status.HTTP_429_TOO_MANY_REQUESTS, wait
+
+        with self._cond:
+            if self.active >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    self.rejected_queue += 1
+                    return False, status.HTTP_503_SERVICE_UNAVAILABLE, self._retry_after_queue()
+                self.waiting += 1
+                self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self.active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected_queue += 1
+                            return False, status.HTTP_503_SERVICE_UNAVAILABLE, self._retry_after_queue()
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            return True, None, 0.0
+
+    def release(self, service_s):
+        with self._cond:
+            self.active -= 1
+            # Exponentially weighted average, used to estimate Retry-After
+            self.avg_service_s = service_s if not self.avg_service_s else 0.8 * self.avg_service_s + 0.2 * service_s
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'max_queue_depth_seen': self.max_waiting_seen,
+                'admitted': self.admitted,
+                'rejected_rate_limited': self.rejected_rate,
+                'rejected_queue_full': self.rejected_queue,
+                'avg_service_ms': round(self.avg_service_s * 1000, 1),
+                'limits': {
+                    'rate': self.bucket.rate,
+                    'burst': self.bucket.capacity,
+                    'max_concurrent': self.max_concurrent,
+                    'max_queue': self.max_queue,
+                    'queue_timeout': self.queue_timeout,
+                },
+            }
+
+
+single_flight = SingleFlight()
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def get_gate(name):
+    with _gates_lock:
+        gate = _gates.get(name)
+        if gate is None:
+            config = {**DEFAULT_GATES.get(name, DEFAULT_GATES['get_random_questions']),
+                      **getattr(settings, 'OMR_ADMISSION', {}).get(name, {})}
+            gate = _gates[name] = AdmissionGate(name, **config)
+        return gate
+
+
+def admission_controlled(name):
+    """
+    Put a DRF view function behind the named admission gate. Place it under @api_view
+    so rejected requests get a normal DRF Response.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            gate = get_gate(name)
+            admitted, status_code, retry_after = gate.acquire()
+            if not admitted:
+                return Response(
+                    {"error": "The server is busy, please retry shortly", "retry_after": math.ceil(retry_after)},
+                    status=status_code,
+                    headers={'Retry-After': str(math.ceil(retry_after))},
+                )
+            start = time.monotonic()
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                gate.release(time.monotonic() - start)
+        return wrapped
+    return decorator
+
+
+def stats():
+    with _gates_lock:
+        gates = dict(_gates)
+    return {
+        'gates': {name: gate.stats() for name, gate in gates.items()},
+        'single_flight': {'in_flight': single_flight.in_flight(), 'shared_results': single_flight.shared},
+    }
+
+
+register_source('admission', stats)
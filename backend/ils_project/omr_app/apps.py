@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class OmrAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'omr_app'
+
+    def ready(self):
+        # Signal receivers defined outside models.py, registered whether or not the
+        # views that use these modules were imported (management commands, shells)
+        from . import live, rescoring, search, similarity  # noqa: F401
@@ -0,0 +1,251 @@
+"""
+Hot/cold archival of old submissions.
+
+Submissions older than a cutoff, or from closed exam sessions, are moved out of the live
+tables into compressed, read-only partition files (one per exam session or month) under
+OMR_ARCHIVE_DIR, with a SubmissionArchive manifest row per file. Old StudentSavedQuestions
+rows are archived the same way.
+
+A partition file is a series of gzip members ("blocks") of up to BLOCK_SIZE records
+each, one JSON object per line, sorted by id. Together the blocks form a plain .gz file
+that any tool can read. The manifest stores each block's id range and byte offset,
+so looking up one submission only decompresses one block.
+
+Archived submissions keep their full report (questions, answers, answer key used), so
+results and PDFs no longer depend on the live question bank. build_report_data() falls
+back to archived_report_data() for ids that are no longer in the live table.
+"""
+from bisect import bisect_right
+from functools import lru_cache
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ExamDraft, StudentSavedQuestions, StudentSubmission, SubmissionArchive
+from .reports import ReportData, report_data_for_many
+
+BLOCK_SIZE = 256
+
+
+def archive_dir():
+    return getattr(settings, 'OMR_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive'))
+
+
+def _safe_filename(text):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', text)
+
+
+def submission_partition(exam_session, submitted_at, by='session'):
+    """Seeded papers go to one partition per exam session, everything else per month."""
+    if by == 'session' and exam_session:
+        return f"session-{exam_session}"
+    return submitted_at.strftime('%Y-%m')
+
+
+class PartitionWriter:
+    """Writes records (sorted by id) to a new partition file in compressed blocks."""
+
+    def __init__(self, kind, partition):
+        self.kind = kind
+        self.partition = partition
+        os.makedirs(archive_dir(), exist_ok=True)
+        self.tmp_path = os.path.join(archive_dir(), f".{kind}-{_safe_filename(partition)}-{os.getpid()}.tmp")
+        self._fh = open(self.tmp_path, 'wb')
+        self._digest = hashlib.sha256()
+        self._pending = []
+        self.blocks = []
+        self.count = 0
+        self.first_at = self.last_at = None
+
+    def add(self, record_id, record, at=None):
+        self._pending.append((record_id, json.dumps(dict(record, id=record_id), separators=(',', ':'))))
+        self.count += 1
+        if at is not None:
+            self.first_at = min(self.first_at or at, at)
+            self.last_at = max(self.last_at or at, at)
+        if len(self._pending) >= BLOCK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        data = gzip.compress(('\n'.join(line for _id, line in self._pending) + '\n').encode('utf-8'), mtime=0)
+        self.blocks.append([self._pending[0][0], self._pending[-1][0], self._fh.tell(), len(data)])
+        self._fh.write(data)
+        self._digest.update(data)
+        self._pending = []
+
+    def close(self):
+        """Move the file into place and return an unsaved manifest row for it."""
+        self._flush()
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._fh.close()
+        if not self.blocks:
+            os.remove(self.tmp_path)
+            return None
+        filename = f"{self.kind}-{_safe_filename(self.partition)}-{self.blocks[0][0]}-{self.blocks[-1][1]}.jsonl.gz"
+        os.replace(self.tmp_path, os.path.join(archive_dir(), filename))
+        return SubmissionArchive(
+            kind=self.kind,
+            partition=self.partition,
+            file=filename,
+            checksum=self._digest.hexdigest(),
+            record_count=self.count,
+            min_record_id=self.blocks[0][0],
+            max_record_id=self.blocks[-1][1],
+            first_at=self.first_at,
+            last_at=self.last_at,
+            blocks=self.blocks,
+        )
+
+    def abort(self):
+        self._fh.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def _submission_record(submission, report):
+    return {
+        'report': report.to_dict(),
+        'answers': submission.answers,
+        'subject_scores': submission.subject_scores,
+        'exam_session': submission.exam_session,
+        'snapshot_id': submission.snapshot_id,
+    }
+
+
+def archive_submissions(queryset, by='session', batch_size=1000, dry_run=False):
+    """
+    Move the submissions in queryset into partition files. Each partition is written
+    and fsynced before its rows are deleted, in one transaction with its manifest row.
+    Returns {partition: submission count}.
+    """
+    partitions = {}
+    for submission_id, exam_session, submitted_at in queryset.order_by('id').values_list('id', 'exam_session', 'submitted_at'):
+        partitions.setdefault(submission_partition(exam_session, submitted_at, by), []).append(submission_id)
+    if dry_run:
+        return {partition: len(ids) for partition, ids in partitions.items()}
+
+    for partition, ids in partitions.items():
+        writer = PartitionWriter('submission', partition)
+        try:
+            for start in range(0, len(ids), batch_size):
+                submissions = list(
+                    StudentSubmission.objects.filter(id__in=ids[start:start + batch_size])
+                    .select_related('student').prefetch_related('subjects').order_by('id')
+                )
+                for submission, report in zip(submissions, report_data_for_many(submissions)):
+                    writer.add(submission.id, _submission_record(submission, report), submission.submitted_at)
+            manifest = writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        _commit(manifest, _delete_submissions, ids, batch_size)
+    return {partition: len(ids) for partition, ids in partitions.items()}
+
+
+def archive_saved_questions(queryset, batch_size=1000, dry_run=False):
+    """Move StudentSavedQuestions rows into monthly partition files (by last update)."""
+    partitions = {}
+    for row_id, updated_at in queryset.order_by('id').values_list('id', 'updated_at'):
+        partitions.setdefault(updated_at.strftime('%Y-%m'), []).append(row_id)
+    if dry_run:
+        return {partition: len(ids) for partition, ids in partitions.items()}
+
+    for partition, ids in partitions.items():
+        writer = PartitionWriter('saved_questions', partition)
+        try:
+            for start in range(0, len(ids), batch_size):
+                rows = StudentSavedQuestions.objects.filter(id__in=ids[start:start + batch_size]).order_by('id')
+                for row in rows:
+                    writer.add(row.id, {
+                        'student_id': row.student_id,
+                        'subject_id': row.subject_id,
+                        'question_ids': row.question_ids,
+                        'created_at': row.created_at.isoformat(),
+                        'updated_at': row.updated_at.isoformat(),
+                    }, row.updated_at)
+            manifest = writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        _commit(manifest, lambda chunk: StudentSavedQuestions.objects.filter(id__in=chunk).delete(), ids, batch_size)
+    return {partition: len(ids) for partition, ids in partitions.items()}
+
+
+def _delete_submissions(ids):
+    # Drafts of archived papers go too: their answers are in the archive
+    ExamDraft.objects.filter(submission_id__in=ids).delete()
+    StudentSubmission.objects.filter(id__in=ids).delete()
+
+
+def _commit(manifest, delete, ids, batch_size):
+    """Save the manifest and delete the archived rows together; drop the file if that fails."""
+    path = os.path.join(archive_dir(), manifest.file)
+    try:
+        with transaction.atomic():
+            manifest.save()
+            for start in range(0, len(ids), batch_size):
+                delete(ids[start:start + batch_size])
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+# --- Reading ---
+
+@lru_cache(maxsize=64)
+def _read_block(filename, offset, length):
+    with open(os.path.join(archive_dir(), filename), 'rb') as fh:
+        fh.seek(offset)
+        data = gzip.decompress(fh.read(length))
+    return tuple(json.loads(line) for line in data.decode('utf-8').splitlines())
+
+
+def _find(kind, record_id):
+    manifests = SubmissionArchive.objects.filter(kind=kind, min_record_id__lte=record_id, max_record_id__gte=record_id)
+    for manifest in manifests:
+        i = bisect_right([block[0] for block in manifest.blocks], record_id) - 1
+        if i < 0 or record_id > manifest.blocks[i][1]:
+            continue
+        _first, _last, offset, length = manifest.blocks[i]
+        for record in _read_block(manifest.file, offset, length):
+            if record['id'] == record_id:
+                return record
+    return None
+
+
+def archived_submission(submission_id):
+    """The archived record of a submission (report, answers, scores, session), or None."""
+    return _find('submission', int(submission_id))
+
+
+def archived_report_data(submission_id):
+    record = archived_submission(submission_id)
+    return ReportData.from_dict(record['report']) if record is not None else None
+
+
+def iter_archived(kind='submission', partition=None):
+    """Every archived record of a kind, optionally for one partition, file by file."""
+    manifests = SubmissionArchive.objects.filter(kind=kind)
+    if partition:
+        manifests = manifests.filter(partition=partition)
+    for manifest in manifests:
+        with gzip.open(os.path.join(archive_dir(), manifest.file), 'rt', encoding='utf-8') as fh:
+            for line in fh:
+                yield json.loads(line)
+
+
+def verify_archive(manifest):
+    """True if the partition file still matches the checksum recorded when it was written."""
+    digest = hashlib.sha256()
+    with open(os.path.join(archive_dir(), manifest.file), 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest() == manifest.checksum
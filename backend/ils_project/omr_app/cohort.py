@@ -0,0 +1,186 @@
+"""
+Cohort (class / school) analytics.
+
+Submissions matching a filter are bulk-loaded once into a students x questions answer
+matrix (1 correct, 0 wrong, -1 not answered) and every statistic is computed with
+NumPy over that matrix instead of per-submission ORM loops.
+
+This module imports NumPy, so views import it lazily to keep it out of exam workers.
+"""
+import numpy as np
+
+from .models import Question
+from .packed_answers import PackedAnswers
+
+LEVELS = (1, 2, 3, 4)
+SCORE_BINS = np.arange(0, 101, 10)
+MIN_RESPONSES = 5  # Questions answered fewer times are left out of difficulty rankings
+WEAKEST_COUNT = 10
+
+
+def load_answer_matrix(cohort_filter):
+    """
+    Returns (submission_ids, schools, questions, matrix) where questions is a dict of
+    column arrays (id, subject_id, level) and matrix[i, j] is 1/0/-1 for submission i
+    and question j.
+    """
+    subjects = dict(cohort_filter.subjects().values_list('id', 'name'))
+    rows = list(
+        Question.objects.filter(subject_id__in=list(subjects))
+        .order_by('subject_id', 'level', 'id')
+        .values_list('id', 'subject_id', 'level', 'correct_option')
+    )
+    questions = {
+        'id': np.array([r[0] for r in rows], dtype=np.int64),
+        'subject_id': np.array([r[1] for r in rows], dtype=np.int64),
+        'level': np.array([r[2] for r in rows], dtype=np.int8),
+        'subjects': subjects,
+    }
+    column = {r[0]: j for j, r in enumerate(rows)}
+    key = [r[3] for r in rows]
+    # Question ids in sorted order and their matrix columns, for searchsorted lookups
+    order = np.argsort(questions['id'], kind='stable')
+    sorted_ids = questions['id'][order]
+
+    submission_ids, schools, matrix_rows = [], [], []
+    submissions = cohort_filter.submissions(list(subjects)).values_list(
+        'id', 'student__school', 'answers_packed', 'answers_json'
+    )
+    for submission_id, school, packed, answers in submissions.iterator(chunk_size=2000):
+        row = np.full(len(rows), -1, dtype=np.int8)
+        if packed is not None:
+            # Correctness comes straight from the packed bitmap
+            packed = PackedAnswers(packed)
+            ids = np.array(packed.question_ids, dtype=np.int64)
+            pos = np.minimum(np.searchsorted(sorted_ids, ids), max(len(sorted_ids) - 1, 0))
+            found = sorted_ids[pos] == ids if len(sorted_ids) else np.zeros(len(ids), dtype=bool)
+            row[order[pos[found]]] = np.array(packed.correct_flags(), dtype=np.int8)[found]
+        else:
+            for qid, option in (answers or {}).items():
+                j = column.get(int(qid)) if str(qid).isdigit() else None
+                if j is not None:
+                    row[j] = option == key[j]
+        submission_ids.append(submission_id)
+        schools.append(school)
+        matrix_rows.append(row)
+
+    matrix = np.vstack(matrix_rows) if matrix_rows else np.empty((0, len(rows)), dtype=np.int8)
+    return submission_ids, schools, questions, matrix
+
+
+def _ratio(numerator, denominator):
+    """Elementwise numerator / denominator as percentages, 0 where nothing was answered."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, np.round(100.0 * numerator / np.maximum(denominator, 1), 2), 0.0)
+
+
+def build_cohort_report(cohort_filter):
+    submission_ids, schools, questions, matrix = load_answer_matrix(cohort_filter)
+    answered = matrix >= 0
+    correct = matrix == 1
+
+    # Students: score distribution over the questions each one answered
+    student_answered = answered.sum(axis=1)
+    student_correct = correct.sum(axis=1)
+    student_pct = _ratio(student_correct, student_answered)
+    histogram, _ = np.histogram(student_pct, bins=SCORE_BINS)
+
+    # Questions: difficulty (share correct) and discrimination (point-biserial vs total)
+    q_answered = answered.sum(axis=0)
+    q_correct = correct.sum(axis=0)
+    q_pct = _ratio(q_correct, q_answered)
+    discrimination = np.zeros(matrix.shape[1])
+    if len(submission_ids) > 1:
+        # Each item over the students it was served to only: students see a sample of the
+        # bank, and an unserved question is not a wrong answer
+        mask = answered.astype(np.float64)
+        item = correct.astype(np.float64)
+        total = student_pct.astype(np.float64)
+        n = np.maximum(q_answered, 1)
+        item_mean = q_correct / n
+        total_mean = total @ mask / n
+        covariance = (total @ item) - n * item_mean * total_mean
+        item_var = q_correct - n * item_mean ** 2
+        total_var = (total ** 2) @ mask - n * total_mean ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            discrimination = covariance / np.sqrt(item_var * total_var)
+        discrimination[q_answered < 2] = 0
+        discrimination = np.nan_to_num(np.round(discrimination, 3))
+
+    # Subjects x levels mastery heatmap
+    subjects = questions['subjects']
+    heatmap, subject_summary = [], []
+    for subject_id, name in subjects.items():
+        in_subject = questions['subject_id'] == subject_id
+        levels = []
+        for level in LEVELS:
+            cols = in_subject & (questions['level'] == level)
+            levels.append({
+                'level': level,
+                'answered': int(q_answered[cols].sum()),
+                'correct': int(q_correct[cols].sum()),
+                'mastery': float(_ratio(q_correct[cols].sum(), q_answered[cols].sum())),
+            })
+        heatmap.append({'subject_id': subject_id, 'name': name, 'levels': levels})
+        sub_answered = answered[:, in_subject].sum(axis=1)
+        took = sub_answered > 0
+        sub_pct = _ratio(correct[:, in_subject].sum(axis=1), sub_answered)[took]
+        subject_summary.append({
+            'subject_id': subject_id,
+            'name': name,
+            'students': int(took.sum()),
+            'mean_percentage': round(float(sub_pct.mean()), 2) if took.any() else 0,
+            'median_percentage': round(float(np.median(sub_pct)), 2) if took.any() else 0,
+        })
+
+    # Schools
+    school_summary = []
+    if schools:
+        school_names = np.array(schools, dtype=object)
+        for school in sorted(set(schools)):
+            mask = school_names == school
+            school_summary.append({
+                'school': school,
+                'students': int(mask.sum()),
+                'mean_percentage': round(float(student_pct[mask].mean()), 2),
+            })
+
+    def question_stat(j):
+        return {
+            'question_id': int(questions['id'][j]),
+            'subject': subjects[int(questions['subject_id'][j])],
+            'level': int(questions['level'][j]),
+            'answered': int(q_answered[j]),
+            'percentage_correct': float(q_pct[j]),
+            'discrimination': float(discrimination[j]),
+        }
+
+    # Hardest questions: lowest share correct among those with enough responses
+    ranked = np.where(q_answered >= MIN_RESPONSES)[0]
+    ranked = ranked[np.argsort(q_pct[ranked], kind='stable')]
+    weakest_topics = sorted(
+        ({'subject': row['name'], 'level': level['level'], 'mastery': level['mastery'], 'answered': level['answered']}
+         for row in heatmap for level in row['levels'] if level['answered'] >= MIN_RESPONSES),
+        key=lambda topic: topic['mastery'],
+    )[:WEAKEST_COUNT]
+
+    return {
+        'filter': cohort_filter.describe(),
+        'students': len(submission_ids),
+        'questions': int((q_answered > 0).sum()),
+        'score_distribution': {
+            'bins': [f"{lo}-{hi}%" for lo, hi in zip(SCORE_BINS[:-1], SCORE_BINS[1:])],
+            'counts': histogram.tolist(),
+            'mean': round(float(student_pct.mean()), 2) if len(submission_ids) else 0,
+            'median': round(float(np.median(student_pct)), 2) if len(submission_ids) else 0,
+            'std': round(float(student_pct.std()), 2) if len(submission_ids) else 0,
+            'p10': round(float(np.percentile(student_pct, 10)), 2) if len(submission_ids) else 0,
+            'p90': round(float(np.percentile(student_pct, 90)), 2) if len(submission_ids) else 0,
+        },
+        'subjects': subject_summary,
+        'schools': school_summary,
+        'mastery_heatmap': heatmap,
+        'weakest_topics': weakest_topics,
+        'hardest_questions': [question_stat(j) for j in ranked[:WEAKEST_COUNT]],
+        'question_difficulty': [question_stat(j) for j in np.where(q_answered > 0)[0]],
+    }
@@ -0,0 +1,204 @@
+"""
+Paged question delivery.
+
+get_random_questions returns every subject's full paper at once. In paged mode
+("paged": true) it fixes the whole paper up front the same way, but only returns the
+first subject's questions plus a manifest of the subjects in exam order; the other
+subjects are fetched one at a time from api/paper/<student>/subjects/<subject>/ when
+the student reaches them.
+
+Every response carries Link: rel=prefetch hints for the next subject's page and its
+images, and the pages are privately cacheable, so the exam page can fetch the next
+subject while the student works on the current one. The total bytes are the same;
+the first question just arrives sooner.
+
+Seeded papers are rebuilt from the exam session's pinned snapshot, other papers are
+read from StudentSavedQuestions, so a page can be fetched again (another device, a
+reload) and returns the same questions.
+"""
+import random
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import Http404
+from django.urls import reverse
+
+from .admission import single_flight
+from .exam_cache import level_pool_ids
+from .models import ExamDraft, Question, StudentSavedQuestions, Subject
+from .papers import LEVELS, QUESTIONS_PER_LEVEL, build_paper, current_snapshot, question_payloads, snapshot_reader
+
+
+def page_max_age():
+    return getattr(settings, 'OMR_PAPER_PAGE_MAX_AGE', 3 * 3600)
+
+
+def seeded_papers(student_id, subjects, exam_session):
+    """
+    Pin the student's draft for the session to a snapshot (publishing the first one if
+    needed) and rebuild the seeded paper of each subject: (snapshot, {subject: paper}).
+    """
+    draft, _ = ExamDraft.objects.get_or_create(student_id=student_id, paper_key=exam_session)
+    if draft.snapshot is None:
+        # If no snapshot exists yet, the first request publishes it while the rest wait
+        board, class_level = subjects[0].board, subjects[0].class_level
+        draft.snapshot = single_flight.do(
+            ('snapshot', board, class_level), lambda: current_snapshot(board, class_level)
+        )
+        draft.save(update_fields=['snapshot', 'updated_at'])
+    snapshot = draft.snapshot
+
+    papers = {}
+    for subject in subjects:
+        if (subject.board, subject.class_level) != (snapshot.board, snapshot.class_level):
+            raise ValueError(f"{subject} is not part of question bank snapshot {snapshot}")
+        papers[subject] = build_paper(snapshot.id, student_id, subject.id, exam_session)
+    return snapshot, papers
+
+
+def saved_papers(student_id, subjects):
+    """
+    Unseeded papers: the questions saved for the student per subject, drawn from the
+    level pools and saved for the subjects that have none yet. {subject: {level: ids}}
+    """
+    saved = dict(
+        StudentSavedQuestions.objects.filter(student_id=student_id, subject__in=subjects)
+        .values_list('subject_id', 'question_ids')
+    )
+    levels = dict(
+        Question.objects.filter(id__in=[qid for ids in saved.values() for qid in ids]).values_list('id', 'level')
+    )
+    papers = {}
+    for subject in subjects:
+        paper = {}
+        if subject.id in saved:
+            for qid in saved[subject.id]:
+                if qid in levels:
+                    paper.setdefault(levels[qid], []).append(qid)
+        else:
+            pools = level_pool_ids(subject.id)
+            for level in LEVELS:
+                if pools.get(level):
+                    paper[level] = random.sample(pools[level], min(QUESTIONS_PER_LEVEL, len(pools[level])))
+            StudentSavedQuestions.objects.update_or_create(
+                student_id=student_id, subject_id=subject.id,
+                defaults={'question_ids': [qid for ids in paper.values() for qid in ids]},
+            )
+        papers[subject] = paper
+    return papers
+
+
+def page_url(student_id, subject_id, subject_ids, exam_session=None):
+    """The canonical URL of a subject page; the manifest and the prefetch hints use the same one."""
+    params = {'subjects': ','.join(str(sid) for sid in subject_ids)}
+    if exam_session:
+        params['exam_session'] = exam_session
+    return f"{reverse('paper_subject', args=[student_id, subject_id])}?{urlencode(params)}"
+
+
+def paper_question_ids(student_id, subject_id, exam_session=None):
+    """
+    (snapshot id, question ids) of one subject of a paper fixed by start_paged_paper();
+    Http404 if the paper wasn't started.
+    """
+    if exam_session:
+        draft = ExamDraft.objects.filter(student_id=student_id, paper_key=exam_session).only('snapshot_id').first()
+        if draft is None or draft.snapshot_id is None:
+            raise Http404("No paper has been started for this exam session")
+        paper = build_paper(draft.snapshot_id, student_id, subject_id, exam_session)
+        return draft.snapshot_id, [qid for ids in paper.values() for qid in ids]
+    question_ids = (
+        StudentSavedQuestions.objects.filter(student_id=student_id, subject_id=subject_id)
+        .values_list('question_ids', flat=True).first()
+    )
+    if question_ids is None:
+        raise Http404("No paper has been started for this subject")
+    return None, question_ids
+
+
+def subject_page(student_id, subject, subject_ids, exam_session=None):
+    """
+    One subject of a paper fixed by start_paged_paper(), as
+    {subject, id, questions, level_counts, next}; Http404 if the paper wasn't started.
+    """
+    snapshot_id, question_ids = paper_question_ids(student_id, subject.id, exam_session)
+    questions = question_payloads(snapshot_id, question_ids)
+    level_counts = {}
+    for question in questions:
+        level_counts[question['level']] = level_counts.get(question['level'], 0) + 1
+    return {
+        'subject': subject.name,
+        'id': subject.id,
+        'questions': questions,
+        'level_counts': level_counts,
+        'next': next_subject_id(subject.id, subject_ids),
+    }
+
+
+def next_subject_id(subject_id, subject_ids):
+    if subject_id in subject_ids:
+        position = subject_ids.index(subject_id)
+        if position + 1 < len(subject_ids):
+            return subject_ids[position + 1]
+    return None
+
+
+def start_paged_paper(student_id, subject_ids, exam_session=None):
+    """
+    Fix the student's paper for every subject and return the manifest with the first
+    subject's page inline: {paged, subjects: [{id, subject, level_counts, url}], first}.
+    """
+    subject_ids = [int(sid) for sid in subject_ids]
+    by_id = Subject.objects.in_bulk(subject_ids)
+    subjects = [by_id[sid] for sid in dict.fromkeys(subject_ids) if sid in by_id]
+    if not subjects:
+        return {'paged': True, 'subjects': [], 'first': None}
+    subject_ids = [subject.id for subject in subjects]
+
+    if exam_session:
+        _snapshot, papers = seeded_papers(student_id, subjects, exam_session)
+    else:
+        papers = saved_papers(student_id, subjects)
+
+    manifest = [
+        {
+            'id': subject.id,
+            'subject': subject.name,
+            'level_counts': {level: len(ids) for level, ids in papers[subject].items()},
+            'url': page_url(student_id, subject.id, subject_ids, exam_session),
+        }
+        for subject in subjects
+    ]
+    return {
+        'paged': True,
+        'subjects': manifest,
+        'first': subject_page(student_id, subjects[0], subject_ids, exam_session),
+    }
+
+
+def question_images(snapshot_id, question_ids):
+    """Image URLs of some questions, in order and without repeats, as their payloads give them."""
+    reader = snapshot_reader(snapshot_id) if snapshot_id else None
+    if reader is not None:
+        images = [reader.payload(qid).get('question_image') for qid in question_ids if qid in reader]
+    else:
+        names = dict(
+            Question.objects.filter(id__in=question_ids).exclude(question_image='').values_list('id', 'question_image')
+        )
+        storage = Question._meta.get_field('question_image').storage
+        images = [storage.url(names[qid]) for qid in question_ids if names.get(qid)]
+    return list(dict.fromkeys(image for image in images if image))
+
+
+def prefetch_links(student_id, page, subject_ids, exam_session=None):
+    """Link header value hinting the page after `page` and that page's images."""
+    next_id = page['next']
+    if next_id is None:
+        return ''
+    links = [f"<{page_url(student_id, next_id, subject_ids, exam_session)}>; rel=prefetch; as=fetch"]
+    try:
+        snapshot_id, question_ids = paper_question_ids(student_id, next_id, exam_session)
+    except Http404:
+        return links[0]
+    links += [f"<{image}>; rel=prefetch; as=image" for image in question_images(snapshot_id, question_ids)]
+    return ', '.join(links)
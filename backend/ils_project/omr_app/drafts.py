@@ -0,0 +1,60 @@
+"""
+Autosave batches merged into ExamDraft with one statement.
+
+merge_batch() is a single INSERT ... ON CONFLICT (student, paper_key) DO UPDATE: the
+first batch of a paper creates the draft, later ones merge their delta into the stored
+answers inside the database (JSON merge patch, where a null removes the answer). The
+update only applies when the batch's seq is newer than the draft's and the paper hasn't
+been submitted, so retried and out-of-order batches are no-ops. The unknown-student
+case surfaces as the foreign key's IntegrityError rather than costing a lookup per batch.
+"""
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ExamDraft
+
+_SQL = """
+    INSERT INTO {table} (student_id, paper_key, answers, last_seq, adaptive, created_at, updated_at)
+    VALUES (%s, %s, {insert_answers}, %s, {empty}, %s, %s)
+    ON CONFLICT (student_id, paper_key) DO UPDATE SET
+        answers = {merged_answers},
+        last_seq = excluded.last_seq,
+        updated_at = excluded.updated_at
+    WHERE {table}.last_seq < excluded.last_seq AND {table}.submission_id IS NULL
+    RETURNING answers
+"""
+
+
+def _statement(delta, seq, student_id, paper_key, now):
+    table = connection.ops.quote_name(ExamDraft._meta.db_table)
+    kept = {str(qid): option for qid, option in delta.items() if option is not None}
+    cleared = [str(qid) for qid, option in delta.items() if option is None]
+    if connection.vendor == 'postgresql':
+        sql = _SQL.format(
+            table=table, insert_answers='%s::jsonb', empty="'{}'::jsonb",
+            merged_answers=f"({table}.answers || %s::jsonb) - %s::text[]",
+        )
+        params = [student_id, paper_key, json.dumps(kept), seq, now, now, json.dumps(kept), cleared]
+    else:
+        # SQLite's json_patch is RFC 7396: null members remove the key
+        sql = _SQL.format(table=table, insert_answers='%s', empty="'{}'", merged_answers=f"json_patch({table}.answers, %s)")
+        params = [student_id, paper_key, json.dumps(kept), seq, now, now, json.dumps(delta)]
+    return sql, params
+
+
+def merge_batch(student_id, paper_key, seq, delta):
+    """
+    Apply one autosave batch ({question id: option or None}). Returns the number of
+    saved answers, or None when the batch wasn't applied (stale seq or submitted paper).
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    sql, params = _statement({str(qid): option for qid, option in delta.items()}, seq, student_id, paper_key, now)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    answers = row[0]
+    return len(json.loads(answers) if isinstance(answers, (str, bytes)) else answers)
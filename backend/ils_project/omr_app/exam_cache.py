@@ -0,0 +1,64 @@
+"""
+Cached lookups behind the exam-start endpoints.
+
+Entries live for OMR_EXAM_CACHE_TTL seconds in the default Django cache. Misses go
+through the single-flight layer so a stampede of identical requests costs one query.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .admission import single_flight
+from .models import AnswerKeyCorrection, Question, Subject, normalize_board
+from .serializers import SubjectSerializer
+
+LEVELS = (1, 2, 3, 4)
+
+
+def cache_ttl():
+    return getattr(settings, 'OMR_EXAM_CACHE_TTL', 60)
+
+
+def _cached(key, compute):
+    value = cache.get(key)
+    if value is None:
+        def fill():
+            result = compute()
+            cache.set(key, result, cache_ttl())
+            return result
+        value = single_flight.do(key, fill)
+    return value
+
+
+def subject_list_data(request, class_level=None, board=None):
+    """Serialized subjects for a class level and board, as returned by api/subjects/."""
+    # Image URLs are absolute, so the host is part of the key
+    key = f"omr:subjects:{request.build_absolute_uri('/')}:{class_level or ''}:{normalize_board(board)}"
+
+    def compute():
+        subjects = Subject.objects.all()
+        if class_level:
+            subjects = subjects.filter(class_level=class_level)
+        if board:
+            subjects = subjects.filter(board=normalize_board(board))
+        return SubjectSerializer(subjects, many=True, context={'request': request}).data
+
+    return _cached(key, compute)
+
+
+def level_pool_ids(subject_id):
+    """{level: [question ids]} for a subject's live question bank."""
+    def compute():
+        pools = {level: [] for level in LEVELS}
+        for level, question_id in Question.objects.filter(subject_id=subject_id).values_list('level', 'id'):
+            pools.setdefault(level, []).append(question_id)
+        return pools
+
+    return _cached(f"omr:pools:{subject_id}", compute)
+
+
+KEY_CORRECTIONS_KEY = 'omr:key_corrections'
+
+
+def key_corrections():
+    """{question id: corrected option} of every corrected answer key (see rescoring.py)."""
+    return _cached(KEY_CORRECTIONS_KEY, lambda: dict(AnswerKeyCorrection.objects.values_list('question_id', 'correct_option')))
@@ -0,0 +1,195 @@
+"""
+Streaming results export.
+
+Rows are produced from a server-side iterator over the submissions matching a
+CohortFilter and encoded chunk by chunk, so memory stays flat however many rows there
+are: only the question bank of the selected subjects and one chunk of rows are held.
+
+Formats: CSV and JSON Lines always; Parquet when pyarrow is installed, written one
+row group per chunk.
+"""
+import csv
+import io
+import json
+
+from .models import Question
+from .packed_answers import PackedAnswers
+
+CHUNK_SIZE = 2000
+LEVELS = (1, 2, 3, 4)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+BASE_COLUMNS = [
+    'submission_id', 'submitted_at', 'student_id', 'student_name', 'school', 'class_level',
+    'exam_session', 'score', 'answered', 'percentage',
+]
+STRING_COLUMNS = {'submitted_at', 'student_name', 'school', 'class_level', 'exam_session'}
+
+
+class ExportError(Exception):
+    pass
+
+
+class ResultsExport:
+    def __init__(self, cohort_filter, include_questions=False, chunk_size=CHUNK_SIZE):
+        self.cohort_filter = cohort_filter
+        self.include_questions = include_questions
+        self.chunk_size = chunk_size
+        self.subjects = list(cohort_filter.subjects().order_by('id').values_list('id', 'name'))
+        # question id -> (subject id, level, correct option) for the selected subjects
+        self.questions = {
+            qid: (subject_id, level, correct_option)
+            for qid, subject_id, level, correct_option in Question.objects
+            .filter(subject_id__in=[sid for sid, _name in self.subjects])
+            .order_by('subject_id', 'level', 'id')
+            .values_list('id', 'subject_id', 'level', 'correct_option')
+        }
+        # Subject names repeat across boards and class levels, so columns carry the id too
+        self.subject_labels = {subject_id: f"{name} (#{subject_id})" for subject_id, name in self.subjects}
+        self.columns = list(BASE_COLUMNS)
+        for subject_id, _name in self.subjects:
+            label = self.subject_labels[subject_id]
+            self.columns.append(f"{label} score")
+            for level in LEVELS:
+                self.columns += [f"{label} L{level} correct", f"{label} L{level} total"]
+        self.question_columns = [f"q{qid}" for qid in self.questions] if include_questions else []
+        self.columns += self.question_columns
+
+    def rows(self):
+        """Yields one dict per submission, in submission id order."""
+        submissions = self.cohort_filter.submissions([sid for sid, _name in self.subjects]).order_by('id').values_list(
+            'id', 'submitted_at', 'student_id', 'student__name', 'student__school', 'student__classLevel',
+            'exam_session', 'score', 'subject_scores', 'answers_packed', 'answers_json',
+        )
+        for (submission_id, submitted_at, student_id, name, school, class_level, exam_session, score,
+             subject_scores, packed, answers) in submissions.iterator(chunk_size=self.chunk_size):
+            if packed is not None:
+                packed = PackedAnswers(packed)
+                answered = list(zip(packed.question_ids, packed.options, packed.correct_flags()))
+            else:
+                answered = [
+                    (int(qid), option, option == self.questions.get(int(qid), (None, None, None))[2])
+                    for qid, option in (answers or {}).items() if str(qid).isdigit()
+                ]
+
+            levels, answered_subjects = {}, set()
+            for qid, _option, is_correct in answered:
+                if qid in self.questions:
+                    counts = levels.setdefault(self.questions[qid][:2], [0, 0])
+                    counts[0] += is_correct
+                    counts[1] += 1
+                    answered_subjects.add(self.questions[qid][0])
+
+            row = {
+                'submission_id': submission_id,
+                'submitted_at': submitted_at.isoformat(),
+                'student_id': student_id,
+                'student_name': name,
+                'school': school,
+                'class_level': class_level,
+                'exam_session': exam_session,
+                'score': score,
+                'answered': len(answered),
+                'percentage': round(score / len(answered) * 100, 2) if answered else 0,
+            }
+            for subject_id, subject_name in self.subjects:
+                label = self.subject_labels[subject_id]
+                # subject_scores is keyed by name: it only belongs to this subject id if the
+                # paper had questions of it (a same-named subject of another class doesn't)
+                row[f"{label} score"] = (
+                    (subject_scores or {}).get(subject_name) if subject_id in answered_subjects else None
+                )
+                for level in LEVELS:
+                    correct, total = levels.get((subject_id, level), (0, 0))
+                    row[f"{label} L{level} correct"] = correct
+                    row[f"{label} L{level} total"] = total
+            if self.include_questions:
+                chosen = {qid: option for qid, option, _is_correct in answered}
+                for qid in self.questions:
+                    row[f"q{qid}"] = chosen.get(qid)
+            yield row
+
+    def stream(self, output):
+        """Yields the encoded export in chunks (bytes)."""
+        if output == 'csv':
+            return self._csv()
+        if output == 'jsonl':
+            return self._jsonl()
+        if output == 'parquet':
+            return self._parquet()
+        raise ExportError(f"Unknown export format {output!r}, expected one of {', '.join(FORMATS)}")
+
+    def _csv(self):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.columns)
+        writer.writeheader()
+        for i, row in enumerate(self.rows(), start=1):
+            writer.writerow(row)
+            if i % 200 == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    def _jsonl(self):
+        lines = []
+        for row in self.rows():
+            lines.append(json.dumps(row, separators=(',', ':')))
+            if len(lines) >= 200:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+                lines = []
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def _parquet(self):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ExportError("Parquet export needs pyarrow installed")
+
+        strings = STRING_COLUMNS | set(self.question_columns)
+        schema = pa.schema([
+            (column, pa.string() if column in strings else pa.float64() if column == 'percentage' else pa.int64())
+            for column in self.columns
+        ])
+        sink = _DrainableSink()
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        batch = []
+        for row in self.rows():
+            batch.append(row)
+            if len(batch) >= self.chunk_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+                yield sink.drain()
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        writer.close()
+        yield sink.drain()
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object whose contents are handed out (and forgotten) as they arrive."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
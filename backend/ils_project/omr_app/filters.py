@@ -0,0 +1,67 @@
+"""
+Submission filters shared by the cohort report and the results export.
+
+CohortFilter is built from query parameters (school, class_level, board, subjects,
+date_from, date_to) and turns them into subject and submission querysets.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import StudentSubmission, Subject, normalize_board
+
+
+def _start_of_day(day):
+    start = datetime.combine(day, time.min)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+@dataclass
+class CohortFilter:
+    school: Optional[str] = None
+    class_level: Optional[str] = None
+    board: Optional[str] = None
+    subject_ids: Optional[List[int]] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+    @classmethod
+    def from_query_params(cls, params):
+        subject_ids = [int(sid) for sid in params.get('subjects', '').split(',') if sid.strip().isdigit()]
+        return cls(
+            school=params.get('school') or None,
+            class_level=params.get('class_level') or None,
+            board=params.get('board') or None,
+            subject_ids=subject_ids or None,
+            date_from=date.fromisoformat(params['date_from']) if params.get('date_from') else None,
+            date_to=date.fromisoformat(params['date_to']) if params.get('date_to') else None,
+        )
+
+    def describe(self):
+        return {k: (v.isoformat() if isinstance(v, date) else v) for k, v in self.__dict__.items() if v}
+
+    def subjects(self):
+        subjects = Subject.objects.all()
+        if self.subject_ids:
+            subjects = subjects.filter(id__in=self.subject_ids)
+        if self.board:
+            subjects = subjects.filter(board=normalize_board(self.board))
+        if self.class_level:
+            subjects = subjects.filter(class_level=self.class_level)
+        return subjects
+
+    def submissions(self, subject_ids):
+        submissions = StudentSubmission.objects.filter(subjects__in=subject_ids)
+        if self.school:
+            submissions = submissions.filter(student__school__iexact=self.school)
+        if self.class_level:
+            submissions = submissions.filter(student__classLevel=self.class_level)
+        # Plain datetime ranges (not __date) so the submitted_at index can be used
+        if self.date_from:
+            submissions = submissions.filter(submitted_at__gte=_start_of_day(self.date_from))
+        if self.date_to:
+            submissions = submissions.filter(submitted_at__lt=_start_of_day(self.date_to + timedelta(days=1)))
+        return submissions.distinct()
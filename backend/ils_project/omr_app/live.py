@@ -0,0 +1,300 @@
+"""
+Live exam-session monitoring.
+
+Each watched exam session has a board of in-memory counters: papers issued, drafts in
+progress, submissions received, a running score distribution and the latest
+submissions. Signals update the boards incrementally. Every change bumps the board's
+version, and the board is encoded once per version however many screens watch it.
+
+A board is either a seeded exam session (papers issued are the session's drafts, see
+delivery.seeded_papers) or a day of unseeded papers, "day:YYYY-MM-DD": papers issued
+are the students who got StudentSavedQuestions that day, and submissions are the ones
+made that day without an exam session.
+
+Boards only exist for sessions someone is watching. A board is loaded from the
+database when first opened and resynced every OMR_LIVE_RESYNC seconds, which also
+picks up events handled by other worker processes.
+
+The dashboard page listens to the api/live/<session>/events/ SSE stream. A stream stays
+on one worker, so a screen follows one board; polls could reach a different worker's
+board each time and the counts would jump between them until the next resync. Each open
+stream holds a server thread for as long as it is open: serve it behind a threaded or
+async server (e.g. gunicorn --worker-class gthread with enough --threads, or an ASGI
+server), never with a few synchronous WSGI workers. api/live/<session>/ returns the
+same board once (with an ETag, so an unchanged board is a 304) for scripts.
+"""
+from collections import deque
+from datetime import date, datetime, time as day_time, timedelta
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .admission import single_flight
+from .metrics import register_source
+from .models import ExamDraft, StudentSavedQuestions, StudentSubmission
+from .packed_answers import PackedAnswers
+
+SCORE_BINS = 10
+RECENT_SUBMISSIONS = 20
+
+
+def resync_interval():
+    return getattr(settings, 'OMR_LIVE_RESYNC', 30)
+
+
+def _score_bin(score, answered):
+    percentage = 100 * score / answered if answered else 0
+    return min(int(percentage // (100 / SCORE_BINS)), SCORE_BINS - 1)
+
+
+def _answered(submission):
+    packed = submission.packed_answers()
+    return len(packed) if packed is not None else len(submission.answers)
+
+
+def day_session(day):
+    """Board name of the unseeded papers of a day."""
+    return f"day:{day.isoformat()}"
+
+
+def _session_day(session):
+    if session.startswith('day:'):
+        try:
+            return date.fromisoformat(session[len('day:'):])
+        except ValueError:
+            pass
+    return None
+
+
+def _day_range(day):
+    start = datetime.combine(day, day_time.min)
+    if settings.USE_TZ:
+        start = timezone.make_aware(start)
+    return start, start + timedelta(days=1)
+
+
+class SessionBoard:
+    def __init__(self, session):
+        self.session = session
+        self.day = _session_day(session)
+        self.version = 0
+        self.synced_at = 0.0
+        self._encoded = (None, '', '')
+        self._reset()
+
+    def _reset(self):
+        self.papers_issued = 0
+        self.in_progress = 0
+        self.submitted = 0
+        self.score_total = 0
+        self.distribution = [0] * SCORE_BINS
+        self.recent = deque(maxlen=RECENT_SUBMISSIONS)
+        # Day boards: a student's saved question sets are one paper (one row per subject)
+        self.issued_students = set()
+        self.submitted_students = set()
+
+    def load(self):
+        """Recount everything from the database (a few queries, however many viewers)."""
+        if self.day is None:
+            drafts = ExamDraft.objects.filter(paper_key=self.session)
+            issued, in_progress, saved_students = drafts.count(), drafts.filter(submission__isnull=True).count(), set()
+            submissions = StudentSubmission.objects.filter(exam_session=self.session)
+        else:
+            start, end = _day_range(self.day)
+            saved_students = set(
+                StudentSavedQuestions.objects.filter(created_at__gte=start, created_at__lt=end)
+                .values_list('student_id', flat=True).distinct()
+            )
+            issued = in_progress = 0
+            submissions = StudentSubmission.objects.filter(exam_session='', submitted_at__gte=start, submitted_at__lt=end)
+        self._reset()
+        self.papers_issued, self.in_progress = issued, in_progress
+        for student_id in saved_students:
+            self.paper_issued(student_id)
+        for submission_id, student_id, name, score, packed, answers, submitted_at in submissions.order_by('id').values_list(
+            'id', 'student_id', 'student__name', 'score', 'answers_packed', 'answers_json', 'submitted_at'
+        ).iterator():
+            answered = len(PackedAnswers(packed)) if packed is not None else len(answers or {})
+            self.add_submission(submission_id, student_id, name, score, answered, submitted_at)
+        self.synced_at = time.monotonic()
+
+    def paper_issued(self, student_id=None):
+        """Count a new paper; on day boards only a student's first saved question set counts."""
+        if self.day is not None:
+            if student_id in self.issued_students:
+                return
+            self.issued_students.add(student_id)
+        self.papers_issued += 1
+        self.in_progress += 1
+
+    def add_submission(self, submission_id, student_id, name, score, answered, submitted_at):
+        if self.day is not None and student_id not in self.submitted_students:
+            # Seeded boards close papers when the draft is claimed (draft_saved)
+            if student_id in self.issued_students:
+                self.in_progress = max(self.in_progress - 1, 0)
+            else:
+                self.issued_students.add(student_id)
+                self.papers_issued += 1
+            self.submitted_students.add(student_id)
+        self.submitted += 1
+        self.score_total += score
+        self.distribution[_score_bin(score, answered)] += 1
+        self.recent.appendleft({
+            'submission_id': submission_id,
+            'student': name,
+            'score': score,
+            'answered': answered,
+            'submitted_at': submitted_at.isoformat(),
+        })
+
+    def snapshot(self):
+        return {
+            'session': self.session,
+            'version': self.version,
+            'papers_issued': self.papers_issued,
+            'in_progress': self.in_progress,
+            'submitted': self.submitted,
+            'average_score': round(self.score_total / self.submitted, 2) if self.submitted else 0,
+            'distribution': {
+                'bins': [f"{i * 100 // SCORE_BINS}-{(i + 1) * 100 // SCORE_BINS}%" for i in range(SCORE_BINS)],
+                'counts': list(self.distribution),
+            },
+            'recent': list(self.recent),
+        }
+
+    def encoded(self):
+        """(JSON snapshot, ETag), encoded once per version and shared by every viewer."""
+        version, data, etag = self._encoded
+        if version != self.version:
+            data = json.dumps(self.snapshot(), separators=(',', ':'))
+            etag = f'"{hashlib.sha1(data.encode()).hexdigest()}"'
+            self._encoded = (self.version, data, etag)
+        return data, etag
+
+
+class LiveHub:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._boards = {}
+        self.listeners = 0
+        self.events = 0
+
+    def board(self, session):
+        """The session's board, loaded or resynced from the database when due."""
+        with self._cond:
+            board = self._boards.get(session)
+        if board is None or time.monotonic() - board.synced_at > resync_interval():
+            single_flight.do(('live', session), lambda: self._load(session))
+            with self._cond:
+                board = self._boards[session]
+        return board
+
+    def _load(self, session):
+        fresh = SessionBoard(session)
+        fresh.load()
+        with self._cond:
+            current = self._boards.get(session)
+            if current is not None and current.snapshot() == dict(fresh.snapshot(), version=current.version):
+                current.synced_at = fresh.synced_at
+                return
+            fresh.version = current.version + 1 if current is not None else 1
+            self._boards[session] = fresh
+            self._cond.notify_all()
+
+    def watching(self, session):
+        with self._cond:
+            return session in self._boards
+
+    def update(self, session, change):
+        """Apply change(board) to a watched session and wake its listeners. Unwatched sessions cost nothing."""
+        with self._cond:
+            board = self._boards.get(session)
+            if board is None:
+                return
+            change(board)
+            board.version += 1
+            self.events += 1
+            self._cond.notify_all()
+
+    def wait(self, session, version, timeout):
+        """Block until the session's board is newer than version, or timeout. Returns the board."""
+        board = self.board(session)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                board = self._boards[session]
+                remaining = deadline - time.monotonic()
+                if board.version != version or remaining <= 0:
+                    return board
+                self._cond.wait(remaining)
+
+    def stats(self):
+        with self._cond:
+            return {'sessions': sorted(self._boards), 'listeners': self.listeners, 'events': self.events}
+
+
+hub = LiveHub()
+
+
+def event_stream(session, heartbeat=15, min_interval=1.0):
+    """
+    Server-Sent Events for a session: an "update" event with the board snapshot on
+    every change (at most one per min_interval, so bursts are coalesced) and a
+    comment line as keep-alive. Holds the serving thread while the client is connected
+    (see the module docstring).
+    """
+    with hub._cond:
+        hub.listeners += 1
+    try:
+        version = None
+        while True:
+            board = hub.wait(session, version, heartbeat)
+            if board.version != version:
+                version = board.version
+                yield f"id: {version}\nevent: update\ndata: {board.encoded()[0]}\n\n"
+                time.sleep(min_interval)
+            else:
+                yield ": keep-alive\n\n"
+    finally:
+        with hub._cond:
+            hub.listeners -= 1
+
+
+@receiver(post_save, sender=ExamDraft)
+def draft_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        hub.update(instance.paper_key, lambda board: board.paper_issued())
+    elif update_fields and 'submission' in update_fields and instance.submission_id:
+        def finished(board):
+            board.in_progress = max(board.in_progress - 1, 0)
+        hub.update(instance.paper_key, finished)
+
+
+@receiver(post_save, sender=StudentSubmission)
+def submission_saved(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    session = instance.exam_session or day_session(timezone.localdate(instance.submitted_at))
+    # Only watched sessions need the student's name
+    if not hub.watching(session):
+        return
+    name, answered = instance.student.name, _answered(instance)
+    hub.update(session, lambda board: board.add_submission(
+        instance.id, instance.student_id, name, instance.score, answered, instance.submitted_at,
+    ))
+
+
+@receiver(post_save, sender=StudentSavedQuestions)
+def saved_questions_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        session = day_session(timezone.localdate(instance.created_at))
+        hub.update(session, lambda board: board.paper_issued(instance.student_id))
+
+
+register_source('live', hub.stats)
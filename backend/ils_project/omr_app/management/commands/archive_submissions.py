@@ -0,0 +1,79 @@
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from omr_app.archive import archive_saved_questions, archive_submissions
+from omr_app.models import ExamDraft, StudentSavedQuestions, StudentSubmission
+
+
+class Command(BaseCommand):
+    help = (
+        "Move submissions older than a cutoff, or from closed exam sessions, into compressed "
+        "read-only partition files (one per session or month). Archived results stay readable "
+        "through omr_app.archive and the results/PDF endpoints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=date.fromisoformat, help="Archive submissions made before this date (YYYY-MM-DD)")
+        parser.add_argument('--older-than-days', type=int, help="Archive submissions older than this many days")
+        parser.add_argument('--session', action='append', default=[], help="Closed exam session to archive (repeatable)")
+        parser.add_argument('--by', choices=['session', 'month'], default='session',
+                            help="Partition seeded papers by exam session (default) or everything by month")
+        parser.add_argument('--saved-questions', action='store_true',
+                            help="Also archive StudentSavedQuestions rows not updated since the cutoff")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived")
+
+    def handle(self, *args, **options):
+        cutoff = self._cutoff(options)
+        if cutoff is None and not options['session']:
+            raise CommandError("Give a cutoff (--before or --older-than-days) and/or --session")
+
+        condition = Q()
+        if cutoff is not None:
+            condition |= Q(submitted_at__lt=cutoff)
+        if options['session']:
+            open_sessions = set(
+                ExamDraft.objects.filter(paper_key__in=options['session'], submission__isnull=True)
+                .values_list('paper_key', flat=True).distinct()
+            )
+            if open_sessions:
+                self.stdout.write(self.style.WARNING(
+                    f"Sessions with unsubmitted drafts (archived anyway): {', '.join(sorted(open_sessions))}"
+                ))
+            condition |= Q(exam_session__in=options['session'])
+
+        archived = archive_submissions(
+            StudentSubmission.objects.filter(condition), by=options['by'],
+            batch_size=options['batch_size'], dry_run=options['dry_run'],
+        )
+        self._report("submissions", archived, options['dry_run'])
+
+        if options['saved_questions']:
+            if cutoff is None:
+                raise CommandError("--saved-questions needs a cutoff")
+            archived = archive_saved_questions(
+                StudentSavedQuestions.objects.filter(updated_at__lt=cutoff),
+                batch_size=options['batch_size'], dry_run=options['dry_run'],
+            )
+            self._report("saved question sets", archived, options['dry_run'])
+
+    def _cutoff(self, options):
+        if options['before']:
+            cutoff = datetime.combine(options['before'], time.min)
+            return timezone.make_aware(cutoff) if settings.USE_TZ else cutoff
+        if options['older_than_days'] is not None:
+            return timezone.now() - timedelta(days=options['older_than_days'])
+        return None
+
+    def _report(self, label, archived, dry_run):
+        verb = "Would archive" if dry_run else "Archived"
+        if not archived:
+            self.stdout.write(f"No {label} to archive")
+            return
+        for partition, count in archived.items():
+            self.stdout.write(f"  {partition:<40} {count:>8}")
+        self.stdout.write(self.style.SUCCESS(f"{verb} {sum(archived.values())} {label} in {len(archived)} partition(s)"))
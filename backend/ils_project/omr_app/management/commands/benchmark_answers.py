@@ -0,0 +1,67 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from omr_app.models import StudentSubmission
+from omr_app.packed_answers import PackedAnswers
+from omr_app.seeding import Rollback, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare storage size and decode speed of JSON and packed submission answers over "
+        "a seeded dataset. The dataset is created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--subjects', type=int, default=4)
+        parser.add_argument('--per-level', type=int, default=5, help="Answered questions per level and subject")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                seed_dataset(seed=options['seed'], students=options['students'], subjects=options['subjects'],
+                             per_level=options['per_level'])
+                rows = list(StudentSubmission.objects.values_list('answers_packed', flat=True))
+                raise Rollback
+        except Rollback:
+            pass
+
+        packed = [bytes(data) for data in rows]
+        dicts = [PackedAnswers(data).to_dict() for data in packed]
+        encoded = [json.dumps(answers) for answers in dicts]
+        answered = statistics.mean(len(answers) for answers in dicts)
+
+        json_bytes = sum(len(text.encode('utf-8')) for text in encoded)
+        packed_bytes = sum(len(data) for data in packed)
+        self.stdout.write(f"{len(packed)} submissions, {answered:.0f} answers each")
+        self.stdout.write(f"{'Encoding':<28} {'Bytes/row':>10} {'Decode (us/row)':>16}")
+        self.stdout.write(f"{'JSON':<28} {json_bytes / len(packed):>10.0f} {self._time(encoded, json.loads):>16.1f}")
+        self.stdout.write(
+            f"{'packed, as dict':<28} {packed_bytes / len(packed):>10.0f} "
+            f"{self._time(packed, lambda data: PackedAnswers(data).to_dict()):>16.1f}"
+        )
+        self.stdout.write(
+            f"{'packed, ids + options':<28} {packed_bytes / len(packed):>10.0f} "
+            f"{self._time(packed, self._arrays):>16.1f}"
+        )
+        self.stdout.write(
+            f"{'packed, correct count only':<28} {packed_bytes / len(packed):>10.0f} "
+            f"{self._time(packed, lambda data: PackedAnswers(data).correct_count):>16.1f}"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Packed answers are {100 * (1 - packed_bytes / json_bytes):.1f}% smaller"))
+
+    def _arrays(self, data):
+        answers = PackedAnswers(data)
+        return answers.question_ids, answers.options
+
+    def _time(self, values, decode):
+        start = time.perf_counter()
+        for value in values:
+            decode(value)
+        return (time.perf_counter() - start) * 1e6 / len(values)
@@ -0,0 +1,71 @@
+import random
+import statistics
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from omr_app.pdf_utils import render_student_performance_pdf
+from omr_app.reports import build_report_data
+from omr_app.seeding import Rollback, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare PDF size and render time of the full and compact report profiles over a "
+        "seeded dataset. The dataset is created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reports', type=int, default=20, help="Number of reports to render per profile")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--logo-size', type=int, default=1000,
+                            help="Width in pixels of a synthetic uploaded logo (0 for no logo)")
+
+    def handle(self, *args, **options):
+        logo_bytes = self._synthetic_logo(options['logo_size']) if options['logo_size'] else None
+        try:
+            with transaction.atomic():
+                _subjects, submissions = seed_dataset(seed=options['seed'], students=options['reports'])
+                reports = [build_report_data(submission.id) for submission in submissions]
+                results = {profile: self._run(reports, logo_bytes, profile == 'compact', options['seed'])
+                           for profile in ('full', 'compact')}
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"{len(reports)} reports, logo: {len(logo_bytes) // 1024 if logo_bytes else 0} KB")
+        self.stdout.write(f"{'Profile':<10} {'Avg size (KB)':>14} {'Avg time (ms)':>14} {'p95 time (ms)':>14}")
+        for profile, (sizes, times) in results.items():
+            p95 = sorted(times)[max(0, int(len(times) * 0.95) - 1)]
+            self.stdout.write(
+                f"{profile:<10} {statistics.mean(sizes) / 1024:>14.1f} {statistics.mean(times):>14.1f} {p95:>14.1f}"
+            )
+        full_size = statistics.mean(results['full'][0])
+        compact_size = statistics.mean(results['compact'][0])
+        self.stdout.write(self.style.SUCCESS(f"Compact output is {100 * (1 - compact_size / full_size):.1f}% smaller"))
+
+    def _run(self, reports, logo_bytes, compact, seed):
+        # Reports pick random quotes and tips, so both profiles get the same sequence
+        random.seed(seed)
+        sizes, times = [], []
+        for report in reports:
+            start = time.perf_counter()
+            buffer = render_student_performance_pdf(
+                report, "Student Performance Report", notes="Benchmark", footer="Benchmark",
+                include_chart=True, logo_bytes=logo_bytes, signature="Principal", compact=compact,
+            )
+            times.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(buffer.getvalue()))
+        return sizes, times
+
+    def _synthetic_logo(self, width):
+        from PIL import Image
+
+        # A noisy photo-like image, similar in weight to a scanned school logo
+        size = (width, width * 2 // 3)
+        img = Image.merge('RGB', [Image.effect_noise(size, sigma) for sigma in (40, 60, 80)])
+        out = BytesIO()
+        img.save(out, format='PNG')
+        return out.getvalue()
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from omr_app.offline import BundleError, build_bundle
+
+
+class Command(BaseCommand):
+    help = (
+        "Build a signed offline exam bundle for a centre: the seeded papers of its roster, the question "
+        "payloads and downsized images in one archive. Results come back through api/offline/import/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--centre', required=True, help="School name of the students sitting at the centre")
+        parser.add_argument('--session', required=True, help="Exam session the papers are seeded with")
+        parser.add_argument('--board', required=True)
+        parser.add_argument('--class-level', type=int, required=True)
+        parser.add_argument('--subjects', default='', help="Comma separated subject ids (default: all of the board)")
+
+    def handle(self, *args, **options):
+        subject_ids = [int(sid) for sid in options['subjects'].split(',') if sid.strip().isdigit()]
+        try:
+            bundle = build_bundle(
+                options['centre'], options['session'], options['board'], options['class_level'], subject_ids,
+            )
+        except BundleError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"{bundle.file}: {len(bundle.student_ids)} students, {bundle.question_count} questions, "
+            f"{bundle.image_count} images, {bundle.size / 1024:.0f} KiB\n"
+            f"Content hash {bundle.checksum}"
+        )
@@ -0,0 +1,46 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from omr_app.adaptive import invalidate_item_table
+from omr_app.cohort import load_answer_matrix
+from omr_app.filters import CohortFilter
+from omr_app.models import Question, Subject
+
+
+class Command(BaseCommand):
+    help = (
+        "Estimate Rasch difficulties for questions from past submissions (PROX approximation) "
+        "and store them in Question.difficulty for adaptive papers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subjects', default='', help="Comma separated subject ids (default: all)")
+        parser.add_argument('--min-responses', type=int, default=30,
+                            help="Questions answered fewer times keep their level-based difficulty")
+
+    def handle(self, *args, **options):
+        subject_ids = [int(sid) for sid in options['subjects'].split(',') if sid.strip().isdigit()]
+        subjects = Subject.objects.filter(id__in=subject_ids) if subject_ids else Subject.objects.all()
+        for subject in subjects.order_by('id'):
+            _ids, _schools, questions, matrix = load_answer_matrix(CohortFilter(subject_ids=[subject.id]))
+            answered = matrix >= 0
+            correct = (matrix == 1).sum(axis=1)
+            attempted = answered.sum(axis=1)
+
+            # Student ability from their raw score, then item difficulty from the abilities
+            # of the students who answered it and how many of them got it right
+            r = np.clip(correct, 0.5, np.maximum(attempted - 0.5, 0.5))
+            ability = np.log(r / np.maximum(attempted - r, 0.5))
+            responses = answered.sum(axis=0)
+            right = (matrix == 1).sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean_ability = (ability[:, None] * answered).sum(axis=0) / np.maximum(responses, 1)
+            difficulty = mean_ability + np.log((responses - right + 0.5) / (right + 0.5))
+
+            calibrated = [
+                Question(id=int(qid), difficulty=round(float(b), 4))
+                for qid, b, n in zip(questions['id'], difficulty, responses) if n >= options['min_responses']
+            ]
+            Question.objects.bulk_update(calibrated, ['difficulty'], batch_size=1000)
+            invalidate_item_table(subject.id)
+            self.stdout.write(f"{subject}: calibrated {len(calibrated)} of {len(questions['id'])} questions")
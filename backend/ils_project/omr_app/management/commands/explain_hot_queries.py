@@ -0,0 +1,105 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from omr_app.models import Question, Student, StudentSavedQuestions, StudentSubmission, Subject
+from omr_app.seeding import Rollback, seed_dataset
+
+# (model, indexed columns) of every index in the plan, composite and single column
+INDEX_PLAN = [
+    (Subject, ['class_level', 'board']),
+    (Subject, ['board']),
+    (Question, ['subject_id', 'level', 'id']),
+    (StudentSubmission, ['student_id', 'submitted_at']),
+    (StudentSubmission, ['submitted_at']),
+    (Student, ['school']),
+    (Student, ['classLevel']),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query plan and timing of the omr_app hot queries on a seeded dataset, "
+        "with the index plan in place and with it dropped. Everything, including the "
+        "dropped indexes, is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=5000)
+        parser.add_argument('--subjects', type=int, default=8)
+        parser.add_argument('--questions-per-level', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=200, help="Runs per query when timing")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--no-explain', action='store_true', help="Only print timings")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.stdout.write("Seeding...")
+                subjects, submissions = seed_dataset(
+                    seed=options['seed'], students=options['students'], subjects=options['subjects'],
+                    questions_per_level=options['questions_per_level'],
+                )
+                # Other class levels, so the subject lookup has something to skip
+                for class_level in range(1, 10):
+                    seed_dataset(seed=class_level, students=0, subjects=options['subjects'],
+                                 questions_per_level=1, class_level=class_level)
+                self._analyze()
+                queries = self._hot_queries(subjects[0], submissions[len(submissions) // 2])
+
+                with_indexes = self._run(queries, options, "With index plan")
+                self._drop_index_plan()
+                self._analyze()
+                without_indexes = self._run(queries, options, "Without index plan")
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"\n{'Query':<34} {'Indexed (ms)':>13} {'Dropped (ms)':>13} {'Speedup':>9}")
+        for name in with_indexes:
+            indexed, dropped = with_indexes[name], without_indexes[name]
+            self.stdout.write(f"{name:<34} {indexed:>13.3f} {dropped:>13.3f} {dropped / indexed if indexed else 0:>8.1f}x")
+
+    def _hot_queries(self, subject, submission):
+        return {
+            'subjects by class+board': Subject.objects.filter(class_level=subject.class_level, board='CBSE'),
+            'subjects by board__iexact': Subject.objects.filter(class_level=subject.class_level, board__iexact='cbse'),
+            'question pools of a subject': Question.objects.filter(subject_id=subject.id).values_list('level', 'id'),
+            'questions by subject+level': Question.objects.filter(subject_id=subject.id, level=3).values_list('id', flat=True),
+            'latest submission of student': StudentSubmission.objects.filter(
+                student_id=submission.student_id).order_by('-submitted_at').values_list('id', flat=True)[:1],
+            'saved questions of student': StudentSavedQuestions.objects.filter(
+                student_id=submission.student_id, subject_id=subject.id),
+            'admin changelist page': StudentSubmission.objects.select_related('student').order_by('-submitted_at')[:100],
+        }
+
+    def _run(self, queries, options, label):
+        if not options['no_explain']:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label}"))
+        timings = {}
+        for name, queryset in queries.items():
+            if not options['no_explain']:
+                self.stdout.write(f"\n-- {name}\n{queryset.explain()}")
+            runs = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                list(queryset.all())
+                runs.append((time.perf_counter() - start) * 1000)
+            timings[name] = statistics.median(runs)
+        return timings
+
+    def _drop_index_plan(self):
+        with connection.cursor() as cursor:
+            for model, columns in INDEX_PLAN:
+                table = model._meta.db_table
+                constraints = connection.introspection.get_constraints(cursor, table)
+                for name, info in constraints.items():
+                    if info['index'] and not info['unique'] and info['columns'] == columns:
+                        cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+
+    def _analyze(self):
+        # Fresh planner statistics for the seeded rows
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
@@ -0,0 +1,45 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from omr_app.export import CHUNK_SIZE, FORMATS, ExportError, ResultsExport
+from omr_app.filters import CohortFilter
+
+
+class Command(BaseCommand):
+    help = "Stream results for a cohort to a CSV, JSON Lines or Parquet file (or stdout) in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', choices=list(FORMATS), default='csv')
+        parser.add_argument('--file', help="Destination path (default: stdout)")
+        parser.add_argument('--questions', action='store_true', help="One column per question with the chosen option")
+        parser.add_argument('--school')
+        parser.add_argument('--class-level')
+        parser.add_argument('--board')
+        parser.add_argument('--subjects', default='', help="Comma separated subject ids")
+        parser.add_argument('--date-from', help="YYYY-MM-DD")
+        parser.add_argument('--date-to', help="YYYY-MM-DD")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            cohort_filter = CohortFilter.from_query_params({
+                key: options[key] or '' for key in ('school', 'class_level', 'board', 'subjects', 'date_from', 'date_to')
+            })
+        except ValueError as e:
+            raise CommandError(f"Invalid filter: {e}")
+
+        export = ResultsExport(cohort_filter, include_questions=options['questions'], chunk_size=options['chunk_size'])
+        out = open(options['file'], 'wb') if options['file'] else sys.stdout.buffer
+        written = 0
+        try:
+            for chunk in export.stream(options['output']):
+                out.write(chunk)
+                written += len(chunk)
+        except ExportError as e:
+            raise CommandError(str(e))
+        finally:
+            if options['file']:
+                out.close()
+        if options['file']:
+            self.stderr.write(f"Wrote {written / 1024:.1f} KB to {options['file']}")
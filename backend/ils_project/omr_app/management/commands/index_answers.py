@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from omr_app.rescoring import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the question -> submission index that rescoring uses to find the submissions "
+        "affected by an answer key correction (needed after bulk loads that skip the save signal)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(f"Indexed {count} submissions in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from omr_app.similarity import duplicate_groups, rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the MinHash/LSH similarity index of the question bank (needed after bulk "
+        "imports, which skip the save signal) and report near-duplicate clusters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--threshold', type=float, help="Similarity for duplicates (default OMR_DUPLICATE_THRESHOLD)")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(f"Indexed {count} questions in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        groups = duplicate_groups(threshold=options['threshold'])
+        self.stdout.write(
+            f"{len(groups)} near-duplicate clusters ({sum(len(group) for group in groups)} questions) "
+            f"found in {time.perf_counter() - start:.1f}s"
+        )
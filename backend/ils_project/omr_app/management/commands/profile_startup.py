@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules an exam-serving worker loads, in the order a real worker would load them
+DEFAULT_MODULES = [
+    'ils_project.wsgi',
+    'ils_project.urls',
+    'omr_app.views',
+    'omr_app.admin',
+]
+
+# Runs in a fresh interpreter so nothing is already imported by this command
+PROBE = r'''
+import importlib, json, os, sys, time
+
+def rss_kb():
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+steps = []
+def measure(name, func):
+    rss, start = rss_kb(), time.perf_counter()
+    func()
+    steps.append({'step': name, 'ms': (time.perf_counter() - start) * 1000, 'rss_kb': rss_kb(), 'rss_delta_kb': rss_kb() - rss})
+
+steps.append({'step': 'interpreter', 'ms': 0.0, 'rss_kb': rss_kb(), 'rss_delta_kb': 0})
+import django
+measure('django.setup()', django.setup)
+for module in sys.argv[1:]:
+    measure(f'import {module}', lambda: importlib.import_module(module))
+
+heavy = sorted({name.split('.')[0] for name in sys.modules if name.split('.')[0] in ('reportlab', 'PIL', 'numpy', 'pyarrow')})
+print('@@PROBE@@' + json.dumps({'steps': steps, 'heavy': heavy}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Report cold-start import time and RSS for a fresh worker process, step by step. "
+        "Use it to check that exam-serving workers don't pull in the PDF subsystem."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', help="Modules to import after django.setup() (default: a typical worker)")
+        parser.add_argument('--top', type=int, default=0, help="Also list the N slowest individual imports (python -X importtime)")
+
+    def handle(self, *args, **options):
+        modules = options['modules'] or DEFAULT_MODULES
+        cmd = [sys.executable]
+        if options['top']:
+            cmd += ['-X', 'importtime']
+        cmd += ['-c', PROBE, *modules]
+
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'ils_project.settings')
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+        proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+        marker = next((line for line in proc.stdout.splitlines() if line.startswith('@@PROBE@@')), None)
+        if proc.returncode != 0 or marker is None:
+            raise CommandError(f"Startup probe failed:\n{proc.stderr[-2000:]}")
+        result = json.loads(marker[len('@@PROBE@@'):])
+
+        self.stdout.write(f"{'Step':<40} {'Time (ms)':>10} {'RSS (MB)':>10} {'+RSS (MB)':>10}")
+        for step in result['steps']:
+            self.stdout.write(
+                f"{step['step']:<40} {step['ms']:>10.1f} {step['rss_kb'] / 1024:>10.1f} {step['rss_delta_kb'] / 1024:>10.1f}"
+            )
+        total_ms = sum(step['ms'] for step in result['steps'])
+        self.stdout.write(f"{'Total':<40} {total_ms:>10.1f} {result['steps'][-1]['rss_kb'] / 1024:>10.1f}")
+
+        if result['heavy']:
+            self.stdout.write(self.style.WARNING(f"Heavy packages loaded at startup: {', '.join(result['heavy'])}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("No heavy optional packages (reportlab, PIL, numpy, pyarrow) loaded at startup"))
+
+        if options['top']:
+            self._print_slowest_imports(proc.stderr, options['top'])
+
+    def _print_slowest_imports(self, stderr, top):
+        # Lines look like: "import time:   self [us] | cumulative | imported package"
+        rows = []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            _self_us, cumulative_us, package = [part.strip() for part in line[len('import time:'):].split('|')]
+            rows.append((int(cumulative_us), package))
+        self.stdout.write("\nSlowest imports (cumulative):")
+        for cumulative_us, package in sorted(rows, reverse=True)[:top]:
+            self.stdout.write(f"  {cumulative_us / 1000:>8.1f} ms  {package}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from omr_app.models import Subject
+from omr_app.papers import publish_snapshot
+
+
+class Command(BaseCommand):
+    help = "Publish a new immutable question bank snapshot for seeded papers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--board', help="Only publish this board (default: every board)")
+        parser.add_argument('--class-level', type=int, help="Only publish this class level")
+
+    def handle(self, *args, **options):
+        subjects = Subject.objects.all()
+        if options['board']:
+            subjects = subjects.filter(board__iexact=options['board'])
+        if options['class_level'] is not None:
+            subjects = subjects.filter(class_level=options['class_level'])
+
+        targets = subjects.values_list('board', 'class_level').distinct().order_by('board', 'class_level')
+        for board, class_level in targets:
+            snapshot = publish_snapshot(board, class_level)
+            self.stdout.write(f"Published {snapshot} ({snapshot.question_count} questions) to {snapshot.file}")
@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from omr_app.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the question full-text search index (needed after bulk imports, which skip signals)."
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        start = time.perf_counter()
+        backend.rebuild()
+        self.stdout.write(f"Rebuilt {type(backend).__name__} index in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from omr_app.models import RescoreJob
+from omr_app.rescoring import run_job, unfinished_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Rescore the submissions that answered some questions against the current answer keys, "
+        "or (--resume) finish the rescoring jobs that didn't complete, e.g. after a restart. Archived "
+        "submissions keep the key they were scored with."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', default='', help="Comma separated question ids")
+        parser.add_argument('--resume', action='store_true', help="Run every queued or failed job, and running ones whose process died (see OMR_RESCORE['stale_after'])")
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            jobs = list(unfinished_jobs())
+        else:
+            try:
+                question_ids = [int(qid) for qid in options['questions'].split(',') if qid.strip()]
+            except ValueError:
+                raise CommandError("--questions must be comma separated ids")
+            if not question_ids:
+                raise CommandError("Give --questions or --resume")
+            jobs = [RescoreJob.objects.create(question_ids=question_ids)]
+
+        for job in jobs:
+            start = time.perf_counter()
+
+            def progress(job):
+                self.stdout.write(f"  job {job.id}: {job.processed}/{job.total} ({job.progress}%), {job.changed} changed")
+
+            job = run_job(job.id, batch_size=options['batch_size'], progress=progress)
+            if job.status == 'failed':
+                raise CommandError(f"Job {job.id} failed: {job.error}")
+            self.stdout.write(
+                f"Job {job.id} (questions {', '.join(map(str, job.question_ids))}): {job.processed} submissions "
+                f"rescored, {job.changed} changed, in {time.perf_counter() - start:.1f}s"
+            )
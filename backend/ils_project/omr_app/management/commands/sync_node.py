@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from omr_app.sync import SyncError, checkpoint, pending, pull_bank, push, sync_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Sync an edge node with its upstream server (OMR_SYNC): 'pull' copies the current question bank "
+        "snapshot of a board and class levels, 'push' sends the students and submissions taken on the node, "
+        "'status' shows the checkpoint and what is waiting to be sent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['pull', 'push', 'status'])
+        parser.add_argument('--board', default='CBSE', help="Board to pull")
+        parser.add_argument('--class-levels', default='', help="Comma separated class levels to pull")
+        parser.add_argument('--max-batches', type=int, default=None, help="Stop a push after this many batches")
+
+    def handle(self, *args, **options):
+        try:
+            getattr(self, options['action'])(options)
+        except SyncError as e:
+            raise CommandError(str(e))
+
+    def pull(self, options):
+        try:
+            class_levels = [int(level) for level in options['class_levels'].split(',') if level.strip()]
+        except ValueError:
+            raise CommandError("--class-levels must be comma separated numbers")
+        if not class_levels:
+            raise CommandError("pull needs --class-levels")
+        for level in class_levels:
+            summary = pull_bank(options['board'], level)
+            self.stdout.write(
+                f"{options['board']} class {level}: snapshot v{summary['version']} "
+                f"({summary['downloaded'] / 1024:.0f} KiB downloaded), {summary['subjects']} subjects, "
+                f"{summary['questions']} questions, {summary['images']} new images"
+            )
+
+    def push(self, options):
+        summary = push(max_batches=options['max_batches'])
+        self.stdout.write(
+            f"{summary['batches']} batches: {summary['students']} students, {summary['submissions']} submissions, "
+            f"{summary['bytes'] / 1024:.1f} KiB sent"
+        )
+        self.status(options)
+
+    def status(self, options):
+        point = checkpoint()
+        waiting = pending()
+        last = point.pushed_at.isoformat() if point.pushed_at else 'never'
+        self.stdout.write(
+            f"Node {sync_settings()['node_id'] or '(not configured)'} -> {point.upstream or '(no upstream)'}: "
+            f"acknowledged up to student {point.student_id}, submission {point.submission_id} "
+            f"({point.batches} batches, last {last}); waiting: {waiting['students']} students, "
+            f"{waiting['submissions']} submissions"
+        )
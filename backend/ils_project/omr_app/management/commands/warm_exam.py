@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from omr_app.models import Student
+from omr_app.warming import warm_exam
+
+
+class Command(BaseCommand):
+    help = (
+        "Warm the exam-start caches for a board and class levels before an exam window: subject lists, "
+        "question pools, snapshot payloads and answer keys, images and, with --session, the roster's papers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--board', required=True)
+        parser.add_argument('--class-levels', required=True, help="Comma separated class levels")
+        parser.add_argument('--subjects', default='', help="Comma separated subject ids (default: all of the board)")
+        parser.add_argument('--session', default='', help="Exam session to prepare seeded papers for")
+        parser.add_argument('--school', default='', help="The school whose students sit the exam (needed with --session)")
+        parser.add_argument('--host', default='localhost', help="Host the subject list image URLs are built for")
+
+    def handle(self, *args, **options):
+        try:
+            class_levels = [int(level) for level in options['class_levels'].split(',') if level.strip()]
+        except ValueError:
+            raise CommandError("--class-levels must be comma separated numbers")
+        subject_ids = [int(sid) for sid in options['subjects'].split(',') if sid.strip().isdigit()]
+        if options['session'] and not options['school']:
+            raise CommandError("--session needs --school: students have no board, so the roster must be given")
+        students = None
+        if options['school']:
+            students = Student.objects.filter(
+                school=options['school'], classLevel__in=[str(level) for level in class_levels]
+            )
+
+        trace = warm_exam(
+            options['board'], class_levels, subject_ids, options['session'] or None, students, host=options['host'],
+        )
+        for span in trace.spans:
+            counts = ', '.join(f"{key} {value}" for key, value in span.items() if key not in ('stage', 'ms'))
+            self.stdout.write(f"{span['stage']:<14} {span['ms']:>9.1f} ms  {counts}")
+        self.stdout.write(f"Warmed in {trace.total_ms:.0f} ms")
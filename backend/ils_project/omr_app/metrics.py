@@ -0,0 +1,21 @@
+"""
+In-process metrics surface.
+
+Subsystems register a callable that returns a JSON-serializable dict of their current
+numbers; api/metrics/ collects them all. Values are per worker process.
+"""
+import threading
+
+_sources = {}
+_lock = threading.Lock()
+
+
+def register_source(name, collect):
+    with _lock:
+        _sources[name] = collect
+
+
+def collect_all():
+    with _lock:
+        sources = dict(_sources)
+    return {name: collect() for name, collect in sorted(sources.items())}
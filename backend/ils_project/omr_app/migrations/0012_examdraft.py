@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0011_studentsavedquestions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamDraft',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paper_key', models.CharField(max_length=64)),
+                ('answers', models.JSONField(default=dict)),
+                ('last_seq', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='omr_app.student')),
+                ('submission', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='omr_app.studentsubmission')),
+            ],
+            options={
+                'verbose_name': 'Exam Draft',
+                'verbose_name_plural': 'Exam Drafts',
+                'unique_together': {('student', 'paper_key')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0012_examdraft'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentsubmission',
+            name='exam_session',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='QuestionBankSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=20)),
+                ('class_level', models.IntegerField()),
+                ('version', models.PositiveIntegerField()),
+                ('pools', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Question Bank Snapshot',
+                'verbose_name_plural': 'Question Bank Snapshots',
+                'ordering': ['board', 'class_level', '-version'],
+                'unique_together': {('board', 'class_level', 'version')},
+            },
+        ),
+        migrations.AddField(
+            model_name='examdraft',
+            name='snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='omr_app.questionbanksnapshot'),
+        ),
+        migrations.AddField(
+            model_name='studentsubmission',
+            name='snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='omr_app.questionbanksnapshot'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0013_question_bank_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questionbanksnapshot',
+            name='checksum',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='questionbanksnapshot',
+            name='file',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='questionbanksnapshot',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
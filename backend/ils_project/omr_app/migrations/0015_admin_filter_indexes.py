@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0014_snapshot_file'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='student',
+            name='classLevel',
+            field=models.CharField(db_index=True, max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='school',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='studentsubmission',
+            name='submitted_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='subject',
+            name='board',
+            field=models.CharField(choices=[('CBSE', 'CBSE'), ('STATE', 'STATE')], db_index=True, default='CBSE', max_length=20),
+        ),
+    ]
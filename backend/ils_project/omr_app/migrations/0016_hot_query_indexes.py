@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:11
+
+from django.db import migrations, models
+from django.db.models.functions import Trim, Upper
+
+
+def normalize_boards(apps, schema_editor):
+    # Boards are looked up with exact matches from now on
+    Subject = apps.get_model('omr_app', 'Subject')
+    Subject.objects.update(board=Upper(Trim('board')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0015_admin_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_boards, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['subject', 'level', 'id'], name='question_subject_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentsubmission',
+            index=models.Index(fields=['student', '-submitted_at'], name='submission_student_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(fields=['class_level', 'board'], name='subject_class_board_idx'),
+        ),
+    ]
@@ -0,0 +1,158 @@
+"""
+Packs the existing JSON answers. The packed format (version 1) and the snapshot file
+layout are copied from omr_app/packed_answers.py and omr_app/snapshots.py as they
+were when this migration was written, so later changes there don't change what it does.
+"""
+import json
+import os
+import struct
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+PACKED_VERSION = 1
+OPTIONS = 'ABCD'
+HEADER = struct.Struct('<BBII')
+OPTION_CODES = {option: code for code, option in enumerate(OPTIONS)}
+SNAPSHOT_MAGIC = b'OMRSNAP1'
+
+
+def pack_answers(answers, key):
+    """{question_id: option} scored against key, packed; None when it can't be packed."""
+    items = []
+    for qid, option in answers.items():
+        if not str(qid).isdigit() or option not in OPTION_CODES:
+            return None
+        items.append((int(qid), option))
+    items.sort()
+    if any(a[0] == b[0] for a, b in zip(items, items[1:])) or (items and items[-1][0] > 0xFFFFFFFF):
+        return None
+    ids = [qid for qid, _option in items]
+    deltas = [b - a for a, b in zip(ids, ids[1:])]
+    width, code = (2, 'H') if all(d <= 0xFFFF for d in deltas) else (4, 'I')
+    options = bytearray((len(items) + 3) // 4)
+    correct = bytearray((len(items) + 7) // 8)
+    for i, (qid, option) in enumerate(items):
+        options[i // 4] |= OPTION_CODES[option] << (i % 4 * 2)
+        if key.get(qid) == option:
+            correct[i // 8] |= 1 << (i % 8)
+    return b''.join((
+        HEADER.pack(PACKED_VERSION, width, len(ids), ids[0] if ids else 0),
+        struct.pack(f'<{len(deltas)}{code}', *deltas),
+        bytes(options),
+        bytes(correct),
+    ))
+
+
+def unpack_answers(data):
+    """Packed answers back to {"<question_id>": option}."""
+    data = bytes(data)
+    _version, width, count, first_id = HEADER.unpack_from(data)
+    if not count:
+        return {}
+    deltas = struct.unpack_from(f'<{count - 1}{"H" if width == 2 else "I"}', data, HEADER.size)
+    options = data[HEADER.size + (count - 1) * width:]
+    return {
+        str(qid): OPTIONS[options[i // 4] >> (i % 4 * 2) & 3]
+        for i, qid in enumerate(accumulate(deltas, initial=first_id))
+    }
+
+
+def _read_snapshot_key(path):
+    """{question id: correct option} from the head of a snapshot file; payloads aren't read."""
+    with open(path, 'rb') as fh:
+        if fh.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            return None
+        (header_len,) = struct.unpack('<I', fh.read(4))
+        count = json.loads(fh.read(header_len))['count']
+        ids = struct.unpack(f'<{count}q', fh.read(count * 8))
+        key = fh.read(count).decode('ascii')
+    return dict(zip(ids, key))
+
+
+def _snapshot_key(snapshot, cache):
+    """Answer key of a snapshot file, or None if the file is gone."""
+    if snapshot.id not in cache:
+        directory = getattr(settings, 'OMR_SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'snapshots'))
+        path = os.path.join(directory, snapshot.file) if snapshot.file else ''
+        cache[snapshot.id] = _read_snapshot_key(path) if path and os.path.exists(path) else None
+    return cache[snapshot.id]
+
+
+def pack_existing(apps, schema_editor):
+    StudentSubmission = apps.get_model('omr_app', 'StudentSubmission')
+    Question = apps.get_model('omr_app', 'Question')
+    keys = {}
+
+    submissions = StudentSubmission.objects.filter(answers_packed__isnull=True).select_related('snapshot').order_by('id')
+    batch = []
+    for submission in submissions.iterator(chunk_size=BATCH_SIZE):
+        answers = submission.answers_json or {}
+        question_ids = [int(qid) for qid in answers if str(qid).isdigit()]
+        snapshot_key = _snapshot_key(submission.snapshot, keys) if submission.snapshot_id else None
+        if snapshot_key is not None:
+            key = {qid: snapshot_key[qid] for qid in question_ids if qid in snapshot_key}
+        else:
+            key = dict(Question.objects.filter(id__in=question_ids).values_list('id', 'correct_option'))
+        packed = pack_answers(answers, key)
+        if packed is not None:
+            submission.answers_packed, submission.answers_json = packed, None
+            batch.append(submission)
+        if len(batch) >= BATCH_SIZE:
+            StudentSubmission.objects.bulk_update(batch, ['answers_packed', 'answers_json'])
+            batch = []
+    if batch:
+        StudentSubmission.objects.bulk_update(batch, ['answers_packed', 'answers_json'])
+
+
+def unpack_existing(apps, schema_editor):
+    StudentSubmission = apps.get_model('omr_app', 'StudentSubmission')
+    batch = []
+    for submission in StudentSubmission.objects.filter(answers_packed__isnull=False).iterator(chunk_size=BATCH_SIZE):
+        submission.answers_json, submission.answers_packed = unpack_answers(submission.answers_packed), None
+        batch.append(submission)
+        if len(batch) >= BATCH_SIZE:
+            StudentSubmission.objects.bulk_update(batch, ['answers_packed', 'answers_json'])
+            batch = []
+    if batch:
+        StudentSubmission.objects.bulk_update(batch, ['answers_packed', 'answers_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0016_hot_query_indexes'),
+    ]
+
+    operations = [
+        # Same column, new attribute name: `answers` is now a property on the model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='studentsubmission',
+                    old_name='answers',
+                    new_name='answers_json',
+                ),
+                migrations.AlterField(
+                    model_name='studentsubmission',
+                    name='answers_json',
+                    field=models.JSONField(blank=True, db_column='answers', null=True),
+                ),
+            ],
+            database_operations=[
+                migrations.AlterField(
+                    model_name='studentsubmission',
+                    name='answers',
+                    field=models.JSONField(blank=True, null=True),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='studentsubmission',
+            name='answers_packed',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(pack_existing, unpack_existing),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0017_packed_answers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('submission', 'Submissions'), ('saved_questions', 'Saved questions')], default='submission', max_length=20)),
+                ('partition', models.CharField(db_index=True, max_length=100)),
+                ('file', models.CharField(max_length=255, unique=True)),
+                ('checksum', models.CharField(max_length=64)),
+                ('record_count', models.PositiveIntegerField()),
+                ('min_record_id', models.BigIntegerField()),
+                ('max_record_id', models.BigIntegerField()),
+                ('first_at', models.DateTimeField(null=True)),
+                ('last_at', models.DateTimeField(null=True)),
+                ('blocks', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['kind', 'partition', 'min_record_id'],
+                'indexes': [models.Index(fields=['kind', 'min_record_id', 'max_record_id'], name='archive_record_range_idx')],
+            },
+        ),
+    ]
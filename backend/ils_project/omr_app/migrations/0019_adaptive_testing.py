@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0018_submission_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examdraft',
+            name='adaptive',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='difficulty',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from omr_app.search import CREATE_FTS_SQL, POPULATE_FTS_SQL
+
+    # Other databases use a search backend without a table of its own
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(CREATE_FTS_SQL)
+        schema_editor.execute(POPULATE_FTS_SQL)
+
+
+def drop_index(apps, schema_editor):
+    from omr_app.search import DROP_FTS_SQL
+
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(DROP_FTS_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0020_question_similarity_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
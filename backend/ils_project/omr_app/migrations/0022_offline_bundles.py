@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0021_question_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfflineBundle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('centre', models.CharField(db_index=True, max_length=100)),
+                ('exam_session', models.CharField(max_length=64)),
+                ('board', models.CharField(max_length=20)),
+                ('class_level', models.IntegerField()),
+                ('subject_ids', models.JSONField(default=list)),
+                ('file', models.CharField(max_length=255, unique=True)),
+                ('checksum', models.CharField(max_length=64, unique=True)),
+                ('signature', models.CharField(max_length=128)),
+                ('student_ids', models.JSONField(default=list)),
+                ('question_count', models.PositiveIntegerField()),
+                ('image_count', models.PositiveIntegerField()),
+                ('size', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('imported_at', models.DateTimeField(blank=True, null=True)),
+                ('import_summary', models.JSONField(blank=True, default=dict)),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='omr_app.questionbanksnapshot')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
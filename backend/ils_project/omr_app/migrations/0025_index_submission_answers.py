@@ -0,0 +1,53 @@
+import struct
+from itertools import accumulate
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+# Packed answers header (version 1, see 0017): version, id width, count, first id
+HEADER = struct.Struct('<BBII')
+
+
+def packed_question_ids(data):
+    """Sorted question ids of packed answers: the first id plus its delta-encoded successors."""
+    data = bytes(data)
+    _version, width, count, first_id = HEADER.unpack_from(data)
+    if not count:
+        return []
+    deltas = struct.unpack_from(f'<{count - 1}{"H" if width == 2 else "I"}', data, HEADER.size)
+    return list(accumulate(deltas, initial=first_id))
+
+
+def index_existing(apps, schema_editor):
+    """Index the submissions saved before 0024, which the save signal never saw."""
+    StudentSubmission = apps.get_model('omr_app', 'StudentSubmission')
+    SubmissionAnswer = apps.get_model('omr_app', 'SubmissionAnswer')
+
+    submissions = (
+        StudentSubmission.objects.filter(answer_index__isnull=True).order_by('id')
+        .only('id', 'answers_json', 'answers_packed')
+    )
+    rows = []
+    for submission in submissions.iterator(chunk_size=BATCH_SIZE):
+        if submission.answers_packed is not None:
+            question_ids = packed_question_ids(submission.answers_packed)
+        else:
+            question_ids = sorted({int(qid) for qid in (submission.answers_json or {}) if str(qid).isdigit()})
+        rows += [SubmissionAnswer(question_id=qid, submission_id=submission.id) for qid in question_ids]
+        if len(rows) >= BATCH_SIZE:
+            SubmissionAnswer.objects.bulk_create(rows)
+            rows = []
+    if rows:
+        SubmissionAnswer.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0024_rescoring'),
+    ]
+
+    operations = [
+        # The index is dropped with its table when 0024 is reversed
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
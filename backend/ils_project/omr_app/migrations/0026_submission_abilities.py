@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0025_index_submission_answers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentsubmission',
+            name='abilities',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0026_submission_abilities'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='student',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='phone',
+            field=models.CharField(db_index=True, max_length=15),
+        ),
+        migrations.AlterField(
+            model_name='studentsubmission',
+            name='exam_session',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,91 @@
+"""
+Indexes the questions that existed before the similarity tables (0020): the post_save
+signal only covers questions saved since. The MinHash parameters are copied from
+omr_app/similarity.py as they were when this migration was written; they must not
+change there either, or stored signatures stop being comparable.
+"""
+import hashlib
+import random
+import re
+import struct
+import zlib
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+SHINGLE = 5
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+MASK64 = (1 << 64) - 1
+OPTION_TAG = 1 << (8 * SHINGLE)
+EMPTY = (0xFFFFFFFF,) * NUM_PERM
+
+
+def _permutations():
+    rng = random.Random(20240601)
+    perm_a = [rng.randrange(1, 1 << 64) | 1 for _ in range(NUM_PERM)]
+    perm_b = [rng.randrange(0, 1 << 64) for _ in range(NUM_PERM)]
+    return list(zip(perm_a, perm_b))
+
+
+def _normalise(text):
+    return ' '.join(re.findall(r'\w+', (text or '').lower()))
+
+
+def _signature(permutations, text, options):
+    data = _normalise(text).encode('utf-8')
+    values = {int.from_bytes(data[i:i + SHINGLE], 'little') for i in range(len(data) - SHINGLE + 1)}
+    if 0 < len(data) < SHINGLE:
+        values.add(int.from_bytes(data, 'little'))
+    values.update(OPTION_TAG | zlib.crc32(option.encode('utf-8')) for option in map(_normalise, options) if option)
+    if not values:
+        return EMPTY
+    return tuple(min(((a * x + b) & MASK64) >> 32 for x in values) for a, b in permutations)
+
+
+def _band_buckets(values):
+    return [
+        int.from_bytes(
+            hashlib.blake2b(struct.pack(f'<B{ROWS}I', band, *values[band * ROWS:(band + 1) * ROWS]),
+                            digest_size=8).digest(),
+            'little', signed=True,
+        )
+        for band in range(BANDS)
+    ]
+
+
+def index_existing(apps, schema_editor):
+    Question = apps.get_model('omr_app', 'Question')
+    QuestionSignature = apps.get_model('omr_app', 'QuestionSignature')
+    QuestionLSHBucket = apps.get_model('omr_app', 'QuestionLSHBucket')
+    permutations = _permutations()
+
+    rows = (
+        Question.objects.filter(signature__isnull=True).order_by('id')
+        .values_list('id', 'question_text', 'option_a', 'option_b', 'option_c', 'option_d')
+    )
+    signatures, buckets = [], []
+    for question_id, text, *options in rows.iterator(chunk_size=BATCH_SIZE):
+        values = _signature(permutations, text, options)
+        signatures.append(QuestionSignature(question_id=question_id, signature=struct.pack(f'<{NUM_PERM}I', *values)))
+        if values != EMPTY:
+            buckets += [QuestionLSHBucket(question_id=question_id, band=band, bucket=bucket)
+                        for band, bucket in enumerate(_band_buckets(values))]
+        if len(signatures) >= BATCH_SIZE:
+            QuestionSignature.objects.bulk_create(signatures)
+            QuestionLSHBucket.objects.bulk_create(buckets)
+            signatures, buckets = [], []
+    QuestionSignature.objects.bulk_create(signatures)
+    QuestionLSHBucket.objects.bulk_create(buckets)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0027_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
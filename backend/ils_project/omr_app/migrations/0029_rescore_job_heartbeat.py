@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('omr_app', '0028_backfill_question_similarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rescorejob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,29 +1,54 @@
 from django.db import models
 from django.contrib.postgres.fields import JSONField
-from django.db.models.signals import pre_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
+from .packed_answers import PackedAnswers, pack_answers
+
 class Student(models.Model):
-    name = models.CharField(max_length=100)
-    school = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
+    school = models.CharField(max_length=100, db_index=True)
     fatherName = models.CharField(max_length=100)
     motherName = models.CharField(max_length=100)
     address = models.TextField()
     favouriteSubject = models.CharField(max_length=100)
-    classLevel = models.CharField(max_length=10)
+    classLevel = models.CharField(max_length=10, db_index=True)
     stream = models.CharField(max_length=20)
     fatherOccupation = models.CharField(max_length=100)
     motherOccupation = models.CharField(max_length=100)
-    phone = models.CharField(max_length=15)
+    phone = models.CharField(max_length=15, db_index=True)
+    # Records synced from an edge node (see sync.py): the node and the record's id there
+    origin = models.CharField(max_length=64, blank=True, default='')
+    origin_id = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['origin', 'origin_id'], condition=~models.Q(origin=''), name='student_origin_uniq'),
+        ]
     
     def __str__(self):
         return self.name
     
+def normalize_board(board):
+    """Boards are stored upper case, so lookups can be exact matches that use the index."""
+    return (board or '').strip().upper()
+
+
 class Subject(models.Model):
     name = models.CharField(max_length=100)
     image = models.ImageField(upload_to='subject_images/', blank=True, null=True)
-    board = models.CharField(max_length=20, default='CBSE', choices=[('CBSE', 'CBSE'), ('STATE', 'STATE')])
+    board = models.CharField(max_length=20, default='CBSE', choices=[('CBSE', 'CBSE'), ('STATE', 'STATE')], db_index=True)
     class_level = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            # api/subjects/?class_level=&board=
+            models.Index(fields=['class_level', 'board'], name='subject_class_board_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.board = normalize_board(self.board)
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.name} - Class {self.class_level} ({self.board})"
@@ -54,36 +79,176 @@ class Question(models.Model):
         ],
         default=1
     )
+    # Rasch difficulty calibrated from past responses (calibrate_questions); None until then
+    difficulty = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Question pools by subject and level; id is included so pool lookups are index-only
+            models.Index(fields=['subject', 'level', 'id'], name='question_subject_level_idx'),
+        ]
     
     def __str__(self):
         return f"{self.subject.name} (Level {self.level}) - Q: {self.question_text[:30]}"
 
+class QuestionBankSnapshot(models.Model):
+    """
+    Immutable, versioned copy of the question pools for one board and class level.
+    Seeded papers are drawn from a snapshot, so the same paper can be rebuilt later
+    from (student, subject, exam session, snapshot version) alone.
+
+    The pools, answer key and pre-rendered question payloads are also written to a
+    read-only file (see snapshots.py) that workers memory-map to serve exams. Admin
+    edits to questions only show up in the next published version.
+    """
+    board = models.CharField(max_length=20)
+    class_level = models.IntegerField()
+    version = models.PositiveIntegerField()
+    pools = models.JSONField(default=dict)  # subject_id: {level: [sorted question ids]}
+    file = models.CharField(max_length=255, blank=True, default='')  # Relative to OMR_SNAPSHOT_DIR
+    checksum = models.CharField(max_length=64, blank=True, default='')  # sha256 of the file
+    question_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('board', 'class_level', 'version')
+        ordering = ['board', 'class_level', '-version']
+        verbose_name = 'Question Bank Snapshot'
+        verbose_name_plural = 'Question Bank Snapshots'
+
+    def __str__(self):
+        return f"{self.board} Class {self.class_level} - v{self.version}"
+
+
 class StudentSubmission(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     subjects = models.ManyToManyField(Subject)
-    answers = models.JSONField()  # question_id: selected_option
+    # question_id: selected_option, read and written through the `answers` property.
+    # Stored packed (see packed_answers.py); the JSON column only holds answers that can't be packed.
+    answers_json = models.JSONField(db_column='answers', null=True, blank=True)
+    answers_packed = models.BinaryField(null=True, blank=True, editable=False)
     score = models.IntegerField()
     subject_scores = models.JSONField(null=True, blank=True)  # Add this
-    submitted_at = models.DateTimeField(auto_now_add=True)
+    # Adaptive papers: subject id: {ability, standard_error, served} (see adaptive.py)
+    abilities = models.JSONField(null=True, blank=True)
+    submitted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Set for seeded papers: together with the student they are enough to rebuild the paper
+    exam_session = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    snapshot = models.ForeignKey(QuestionBankSnapshot, on_delete=models.PROTECT, null=True, blank=True)
+    # Records synced from an edge node (see sync.py): the node and the record's id there
+    origin = models.CharField(max_length=64, blank=True, default='')
+    origin_id = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # A student's latest submission (PDF reports) and per-student history
+            models.Index(fields=['student', '-submitted_at'], name='submission_student_recent_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['origin', 'origin_id'], condition=~models.Q(origin=''), name='submission_origin_uniq'),
+        ]
     
     def __str__(self):
         return f"{self.student.name} - {self.score} Marks"
 
+    @property
+    def answers(self):
+        if '_answers' not in self.__dict__:
+            packed = self.packed_answers()
+            self._answers = packed.to_dict() if packed is not None else (self.answers_json or {})
+        return self._answers
+
+    @answers.setter
+    def answers(self, value):
+        # Packed again against the answer key when the submission is scored
+        self._answers = dict(value or {})
+        self.answers_json = self._answers
+        self.answers_packed = None
+
+    def packed_answers(self):
+        """PackedAnswers view for readers that can work on the arrays directly, or None."""
+        return PackedAnswers(self.answers_packed) if self.answers_packed is not None else None
+
+    def unread_packed_answers(self):
+        """
+        The packed answers if they weren't read as a dict, which callers may have edited
+        in place; None otherwise. Scoring works on these arrays directly.
+        """
+        return self.packed_answers() if '_answers' not in self.__dict__ else None
+
+    def encode_answers(self, key):
+        """
+        Store the answers packed, marking each one correct or not against key
+        ({question_id: correct_option}). Returns the number of correct answers.
+        """
+        packed = self.unread_packed_answers()
+        if packed is not None:
+            self.answers_packed = packed.with_key(key)
+            return PackedAnswers(self.answers_packed).correct_count
+        answers = self.answers
+        packed = pack_answers(answers, key)
+        if packed is None:
+            self.answers_json, self.answers_packed = answers, None
+            return sum(1 for qid, selected in answers.items() if str(qid).isdigit() and selected == key.get(int(qid)))
+        self.answers_json, self.answers_packed = None, packed
+        return PackedAnswers(packed).correct_count
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop('_answers', None)
+        super().refresh_from_db(*args, **kwargs)
+
 # Define the signal handler at the bottom after all models are defined
 @receiver(pre_save, sender=StudentSubmission)
 def calculate_score(sender, instance, **kwargs):
-    from omr_app.models import Question
+    from omr_app.papers import answer_key
+
+    # Seeded papers are scored against the snapshot they were drawn from
+    packed = instance.unread_packed_answers()
+    if packed is not None:
+        question_ids = packed.question_ids
+    else:
+        question_ids = [int(qid) for qid in instance.answers.keys() if str(qid).isdigit()]
+    key = answer_key(question_ids, snapshot_id=instance.snapshot_id)
 
-    correct = 0
-    for qid, selected in instance.answers.items():
-        try:
-            q = Question.objects.get(id=int(qid))
-            # Compare against correct_option key (e.g., 'A')
-            if selected == q.correct_option:
-                correct += 1
-        except:
-            pass
-    instance.score = correct
+    # Compare against correct_option key (e.g., 'A'); the result is kept in the packed answers
+    instance.score = instance.encode_answers(key)
+
+
+@receiver([post_save, post_delete], sender=StudentSubmission)
+def invalidate_cached_report(sender, instance, **kwargs):
+    from django.core.cache import cache
+    from omr_app.reports import report_cache_key
+
+    cache.delete(report_cache_key(instance.id))
+
+
+# Reports also show question text, subject names, the key and student details; an edit
+# to any of those drops the cached reports that show it (the TTL catches the rest)
+@receiver([post_save, pre_delete], sender=Question)
+def invalidate_question_reports(sender, instance, raw=False, **kwargs):
+    if not raw:
+        from omr_app.reports import drop_cached_reports
+
+        drop_cached_reports(SubmissionAnswer.objects.filter(question_id=instance.id).values_list('submission_id', flat=True))
+
+
+@receiver(post_save, sender=Subject)
+def invalidate_subject_reports(sender, instance, raw=False, **kwargs):
+    if not raw:
+        from omr_app.reports import drop_cached_reports
+
+        drop_cached_reports(
+            StudentSubmission.subjects.through.objects.filter(subject_id=instance.id)
+            .values_list('studentsubmission_id', flat=True)
+        )
+
+
+@receiver(post_save, sender=Student)
+def invalidate_student_reports(sender, instance, raw=False, created=False, **kwargs):
+    if not (raw or created):
+        from omr_app.reports import drop_cached_reports
+
+        drop_cached_reports(StudentSubmission.objects.filter(student_id=instance.id).values_list('id', flat=True))
 
 
 
@@ -105,3 +270,212 @@ class StudentSavedQuestions(models.Model):
 
     def __str__(self):
         return f"{self.student.name} - {self.subject.name} Questions"
+
+
+class ExamDraft(models.Model):
+    """
+    Server-side copy of a student's in-progress answers for one paper.
+    The exam page autosaves small batches of changed answers here, so a dead device
+    doesn't lose the exam and the final submit can reference the draft by paper_key.
+    """
+    student = models.ForeignKey('Student', on_delete=models.CASCADE)
+    paper_key = models.CharField(max_length=64)  # Chosen by the client, or the exam session for seeded papers
+    answers = models.JSONField(default=dict)  # question_id: selected_option
+    last_seq = models.PositiveIntegerField(default=0)  # Sequence number of the last merged batch
+    snapshot = models.ForeignKey(QuestionBankSnapshot, on_delete=models.PROTECT, null=True, blank=True)  # Seeded papers only
+    submission = models.OneToOneField('StudentSubmission', on_delete=models.SET_NULL, null=True, blank=True)
+    adaptive = models.JSONField(default=dict, blank=True)  # Adaptive papers: subject_id: selection state (see adaptive.py)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('student', 'paper_key')
+        verbose_name = 'Exam Draft'
+        verbose_name_plural = 'Exam Drafts'
+
+    def __str__(self):
+        return f"{self.student.name} - Draft {self.paper_key}"
+
+
+class SubmissionArchive(models.Model):
+    """
+    Manifest entry for one compressed, read-only partition file of archived records
+    (see archive.py). Records in a file have been removed from the live tables.
+    """
+    KIND_CHOICES = [('submission', 'Submissions'), ('saved_questions', 'Saved questions')]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='submission')
+    partition = models.CharField(max_length=100, db_index=True)  # "2025-03" or "session-<exam session>"
+    file = models.CharField(max_length=255, unique=True)  # Relative to OMR_ARCHIVE_DIR
+    checksum = models.CharField(max_length=64)  # sha256 of the file
+    record_count = models.PositiveIntegerField()
+    min_record_id = models.BigIntegerField()
+    max_record_id = models.BigIntegerField()
+    first_at = models.DateTimeField(null=True)  # Submission time (or last update) of the oldest record
+    last_at = models.DateTimeField(null=True)
+    blocks = models.JSONField(default=list)  # [first id, last id, byte offset, byte length] per compressed block
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['kind', 'partition', 'min_record_id']
+        indexes = [
+            models.Index(fields=['kind', 'min_record_id', 'max_record_id'], name='archive_record_range_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.partition} ({self.record_count})"
+
+
+
+class OfflineBundle(models.Model):
+    """
+    An exported offline exam bundle for one centre (see offline.py): the file is named
+    by its content hash, and the signature over that hash lets results uploaded from
+    the centre be matched to a bundle this server issued.
+    """
+    centre = models.CharField(max_length=100, db_index=True)  # Student.school
+    exam_session = models.CharField(max_length=64)
+    board = models.CharField(max_length=20)
+    class_level = models.IntegerField()
+    snapshot = models.ForeignKey(QuestionBankSnapshot, on_delete=models.PROTECT)
+    subject_ids = models.JSONField(default=list)
+    file = models.CharField(max_length=255, unique=True)  # Relative to OMR_BUNDLE_DIR
+    checksum = models.CharField(max_length=64, unique=True)  # Content hash of the archive entries
+    signature = models.CharField(max_length=128)
+    student_ids = models.JSONField(default=list)  # The roster the papers were built for
+    question_count = models.PositiveIntegerField()
+    image_count = models.PositiveIntegerField()
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    imported_at = models.DateTimeField(null=True, blank=True)  # Last results upload
+    import_summary = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.centre} {self.exam_session} ({len(self.student_ids)} students)"
+
+
+class SyncCheckpoint(models.Model):
+    """
+    Edge node side of the sync (see sync.py): the last Student and StudentSubmission ids
+    the upstream server has acknowledged, so an interrupted push resumes where it stopped.
+    """
+    upstream = models.CharField(max_length=255, unique=True)
+    student_id = models.BigIntegerField(default=0)
+    submission_id = models.BigIntegerField(default=0)
+    batches = models.PositiveIntegerField(default=0)
+    pushed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Sync to {self.upstream}: students {self.student_id}, submissions {self.submission_id}"
+
+
+class SyncBatch(models.Model):
+    """Upstream side of the sync: one change set received from an edge node."""
+    node = models.CharField(max_length=64, db_index=True)
+    batch = models.CharField(max_length=100)  # Table and id range on the node, e.g. "submission:101-600"
+    students = models.PositiveIntegerField(default=0)  # Records created (replays create none)
+    submissions = models.PositiveIntegerField(default=0)
+    received = models.PositiveIntegerField(default=0)  # Records in the change set
+    bytes = models.PositiveIntegerField(default=0)  # Compressed size
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('node', 'batch')
+        ordering = ['-received_at']
+
+    def __str__(self):
+        return f"{self.node} {self.batch}"
+
+
+class SubmissionAnswer(models.Model):
+    """
+    Question -> submission index: one row per answer of a submission, so the submissions
+    that answered a question are an indexed lookup (see rescoring.py). No foreign key to
+    Question: answers may refer to questions deleted since.
+    """
+    question_id = models.BigIntegerField()
+    submission = models.ForeignKey(StudentSubmission, on_delete=models.CASCADE, related_name='answer_index')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['question_id', 'submission'], name='submission_answer_question_idx'),
+        ]
+
+    def __str__(self):
+        return f"Submission {self.submission_id} answered question {self.question_id}"
+
+
+class AnswerKeyCorrection(models.Model):
+    """
+    A corrected answer key. It also overrides the key frozen in question bank snapshots,
+    so seeded papers are scored with the corrected key too (papers.answer_key).
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='key_correction')
+    correct_option = models.CharField(max_length=1)
+    previous_option = models.CharField(max_length=1)
+    corrected_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Question {self.question_id}: {self.previous_option} -> {self.correct_option}"
+
+
+class RescoreJob(models.Model):
+    """Rescoring of the submissions that answered some questions, after a key correction (see rescoring.py)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    question_ids = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    total = models.PositiveIntegerField(default=0)  # Submissions to rescore, counted when the job starts
+    processed = models.PositiveIntegerField(default=0)
+    changed = models.PositiveIntegerField(default=0)  # Submissions whose score or subject scores changed
+    cursor = models.BigIntegerField(default=0)  # Last submission id done: a restarted job resumes after it
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Saved with every batch: a running job without one for OMR_RESCORE['stale_after'] seconds has died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def progress(self):
+        return round(self.processed / self.total * 100, 1) if self.total else (100.0 if self.status == 'done' else 0.0)
+
+    def __str__(self):
+        return f"Rescore of questions {', '.join(map(str, self.question_ids))} ({self.status})"
+
+
+class QuestionSignature(models.Model):
+    """MinHash signature of a question's text and options (see similarity.py)."""
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    signature = models.BinaryField()  # NUM_PERM little-endian uint32 minima
+
+    def __str__(self):
+        return f"Signature of question {self.question_id}"
+
+
+class QuestionLSHBucket(models.Model):
+    """
+    One LSH band of a question's signature. Questions sharing a bucket are duplicate
+    candidates; the bucket hash includes the band number, so buckets are global.
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='lsh_buckets')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bucket', 'question'], name='question_lsh_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"Question {self.question_id} band {self.band}"
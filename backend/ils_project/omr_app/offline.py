@@ -0,0 +1,288 @@
+"""
+Offline exam bundles for centres with unreliable connectivity.
+
+build_bundle() prepares the seeded papers of a centre's roster (one pinned ExamDraft
+per student, as warm_exam does) and packages everything the exam needs into one zip
+archive in OMR_BUNDLE_DIR:
+
+* bundle.json: centre, exam session, subjects, students, each student's paper as
+  {student id: {subject id: [question ids]}} and every question's payload once
+  (question_image rewritten to the image's path inside the archive). Answer keys are
+  not included; scoring stays on the server.
+* images/<hash>.<ext>: question images downsized to OMR_BUNDLE_IMAGE_SIZE.
+* signature.json: the content hash (sha256 over every entry's name and sha256) and
+  its signature with the server's key.
+
+The archive is deterministic (sorted entries, fixed timestamps) and named after the
+content hash, so rebuilding an unchanged bundle gives the same file.
+
+Results collected offline come back in one upload (import_results):
+
+    {"bundle": "<content hash>", "signature": "<from signature.json>",
+     "results": [{"student_id": 1, "answers": {"<question id>": "A", ...}}, ...]}
+
+optionally gzip-compressed. The signature must match a bundle this server issued, and
+every result is scored through the normal pipeline (scoring.record_submission) against
+the student's pinned draft. Students already submitted are skipped, so an upload can
+safely be sent again.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import zipfile
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ExamDraft, OfflineBundle, Question, Student, Subject, normalize_board
+from .papers import build_paper, current_snapshot, question_payloads
+from .scoring import AlreadySubmitted, record_submission
+from .warming import prepare_papers
+
+FORMAT_VERSION = 1
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+SIGNING_SALT = 'omr_app.offline_bundle'
+
+
+class BundleError(ValueError):
+    pass
+
+
+def bundle_dir():
+    return getattr(settings, 'OMR_BUNDLE_DIR', os.path.join(settings.BASE_DIR, 'bundles'))
+
+
+def image_size():
+    return getattr(settings, 'OMR_BUNDLE_IMAGE_SIZE', (800, 800))
+
+
+def _safe_filename(text):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', text)
+
+
+def downsize_image(data):
+    """(bytes, extension) of an image shrunk to fit image_size(); the original if it can't be read."""
+    from PIL import Image as PILImage
+
+    try:
+        with PILImage.open(io.BytesIO(data)) as img:
+            img.thumbnail(image_size())
+            out = io.BytesIO()
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img.save(out, format='PNG', optimize=True)
+                return out.getvalue(), 'png'
+            img.convert('RGB').save(out, format='JPEG', quality=80, optimize=True)
+            return out.getvalue(), 'jpg'
+    except (OSError, ValueError):
+        return data, 'bin'
+
+
+def content_hash(entries):
+    """sha256 over the sorted (name, sha256 of data) of the archive entries."""
+    digest = hashlib.sha256()
+    for name in sorted(entries):
+        digest.update(f"{name}\0{hashlib.sha256(entries[name]).hexdigest()}\n".encode())
+    return digest.hexdigest()
+
+
+def sign(checksum):
+    return signing.Signer(salt=SIGNING_SALT).sign(checksum).rsplit(':', 1)[1]
+
+
+def verify_signature(checksum, signature):
+    try:
+        signing.Signer(salt=SIGNING_SALT).unsign(f"{checksum}:{signature}")
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _bundle_images(question_ids):
+    """{question id: archive path} and {archive path: bytes} for the questions' images."""
+    paths, files, by_source = {}, {}, {}
+    for question in Question.objects.filter(id__in=question_ids).exclude(question_image='').exclude(question_image=None).only('id', 'question_image'):
+        name = question.question_image.name
+        if name not in by_source:
+            try:
+                with question.question_image.storage.open(name, 'rb') as fh:
+                    data, ext = downsize_image(fh.read())
+            except OSError:
+                by_source[name] = None  # Missing file: the question goes without its image
+                continue
+            path = f"images/{hashlib.sha256(data).hexdigest()[:20]}.{ext}"
+            files[path] = data
+            by_source[name] = path
+        if by_source[name]:
+            paths[question.id] = by_source[name]
+    return paths, files
+
+
+def build_bundle(centre, exam_session, board, class_level, subject_ids=None, students=None):
+    """
+    Prepare the papers of a centre's roster (default: its students at the class level)
+    and write the bundle. Returns the OfflineBundle; an identical existing bundle is
+    returned as is.
+    """
+    board = normalize_board(board)
+    exam_session = str(exam_session)[:64]
+    subjects = Subject.objects.filter(board=board, class_level=class_level).order_by('id')
+    if subject_ids:
+        subjects = subjects.filter(id__in=subject_ids)
+    subjects = list(subjects)
+    if not subjects:
+        raise BundleError(f"No {board} subjects for class {class_level}")
+    if students is None:
+        students = Student.objects.filter(school=centre, classLevel=str(class_level))
+    roster = dict(students.order_by('id').values_list('id', 'name'))
+    if not roster:
+        raise BundleError(f"No students at {centre} for class {class_level}")
+
+    snapshot = current_snapshot(board, class_level)
+    prepare_papers(exam_session, subjects, {class_level: snapshot}, Student.objects.filter(id__in=roster))
+    # Students who already had a draft for the session keep the snapshot it is pinned to
+    pinned = dict(
+        ExamDraft.objects.filter(paper_key=exam_session, student_id__in=roster).values_list('student_id', 'snapshot_id')
+    )
+
+    papers, by_snapshot = {}, {}
+    for student_id in roster:
+        snapshot_id = pinned.get(student_id) or snapshot.id
+        paper = {}
+        for subject in subjects:
+            ids = [qid for level_ids in build_paper(snapshot_id, student_id, subject.id, exam_session).values() for qid in level_ids]
+            paper[str(subject.id)] = ids
+            by_snapshot.setdefault(snapshot_id, set()).update(ids)
+        papers[str(student_id)] = paper
+
+    questions = {}
+    for snapshot_id, ids in by_snapshot.items():
+        for payload in question_payloads(snapshot_id, sorted(ids)):
+            questions[str(payload['id'])] = payload
+    image_paths, entries = _bundle_images([int(qid) for qid in questions])
+    for qid, payload in questions.items():
+        payload['question_image'] = image_paths.get(int(qid))
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'centre': centre,
+        'exam_session': exam_session,
+        'board': board,
+        'class_level': class_level,
+        'subjects': [{'id': subject.id, 'name': subject.name} for subject in subjects],
+        'students': [{'id': student_id, 'name': name} for student_id, name in roster.items()],
+        'papers': papers,
+        'questions': questions,
+    }
+    entries['bundle.json'] = json.dumps(manifest, sort_keys=True, separators=(',', ':')).encode()
+    checksum = content_hash(entries)
+    existing = OfflineBundle.objects.filter(checksum=checksum).first()
+    if existing is not None:
+        return existing
+    signature = sign(checksum)
+    entries['signature.json'] = json.dumps({'bundle': checksum, 'signature': signature}).encode()
+
+    filename = f"{_safe_filename(centre)}-{_safe_filename(exam_session)}-{checksum[:16]}.zip"
+    os.makedirs(bundle_dir(), exist_ok=True)
+    path = os.path.join(bundle_dir(), filename)
+    tmp = f"{path}.tmp"
+    with zipfile.ZipFile(tmp, 'w') as archive:
+        for name in sorted(entries):
+            info = zipfile.ZipInfo(name, date_time=ZIP_DATE)
+            # Images are already compressed
+            info.compress_type = zipfile.ZIP_STORED if name.startswith('images/') else zipfile.ZIP_DEFLATED
+            archive.writestr(info, entries[name], compresslevel=9)
+    os.replace(tmp, path)
+
+    return OfflineBundle.objects.create(
+        centre=centre,
+        exam_session=exam_session,
+        board=board,
+        class_level=class_level,
+        snapshot=snapshot,
+        subject_ids=[subject.id for subject in subjects],
+        file=filename,
+        checksum=checksum,
+        signature=signature,
+        student_ids=list(roster),
+        question_count=len(questions),
+        image_count=len(set(image_paths.values())),
+        size=os.path.getsize(path),
+    )
+
+
+def parse_results(data):
+    """A results upload (JSON, optionally gzip-compressed) as a dict."""
+    if data[:2] == b'\x1f\x8b':
+        try:
+            data = gzip.decompress(data)
+        except (OSError, EOFError) as e:
+            raise BundleError(f"Unreadable gzip upload: {e}")
+    try:
+        upload = json.loads(data)
+    except ValueError as e:
+        raise BundleError(f"Results are not valid JSON: {e}")
+    if not isinstance(upload, dict):
+        raise BundleError("Results must be a JSON object")
+    return upload
+
+
+def import_results(upload):
+    """
+    Score and store the results of an offline bundle. Returns a summary with the
+    number submitted, skipped as already submitted, and the rejected results with why.
+    """
+    checksum, signature = str(upload.get('bundle', '')), str(upload.get('signature', ''))
+    bundle = OfflineBundle.objects.filter(checksum=checksum).first()
+    if bundle is None or not verify_signature(checksum, signature):
+        raise BundleError("Unknown bundle or invalid signature")
+    results = upload.get('results')
+    if not isinstance(results, list):
+        raise BundleError("'results' must be a list")
+
+    roster = set(bundle.student_ids)
+    student_ids = [r.get('student_id') for r in results if isinstance(r, dict)]
+    students = Student.objects.in_bulk([sid for sid in student_ids if isinstance(sid, int) and sid in roster])
+    drafts = {
+        draft.student_id: draft
+        for draft in ExamDraft.objects.filter(paper_key=bundle.exam_session, student_id__in=students)
+    }
+
+    summary = {'submitted': 0, 'already_submitted': 0, 'rejected': [], 'score_total': 0}
+    with transaction.atomic():
+        for result in results:
+            student_id = result.get('student_id') if isinstance(result, dict) else None
+            answers = result.get('answers') if isinstance(result, dict) else None
+            draft = drafts.get(student_id) if isinstance(student_id, int) else None
+            if not isinstance(student_id, int) or student_id not in students:
+                reason = 'not on the roster'
+            elif not isinstance(answers, dict):
+                reason = "'answers' must be an object"
+            elif draft is None or draft.snapshot_id is None:
+                reason = 'no paper was prepared for this student'
+            elif draft.submission_id:
+                summary['already_submitted'] += 1
+                continue
+            else:
+                answers = {str(qid): str(option) for qid, option in answers.items()}
+                try:
+                    submission, _total = record_submission(
+                        students[student_id], bundle.subject_ids, {**draft.answers, **answers}, draft,
+                    )
+                except AlreadySubmitted:
+                    # Submitted online since the drafts were loaded
+                    summary['already_submitted'] += 1
+                    continue
+                summary['submitted'] += 1
+                summary['score_total'] += submission.score
+                continue
+            summary['rejected'].append({'student_id': student_id, 'reason': reason})
+
+        bundle.imported_at = timezone.now()
+        bundle.import_summary = summary
+        bundle.save(update_fields=['imported_at', 'import_summary'])
+    return summary
@@ -0,0 +1,146 @@
+"""
+Compact binary encoding of a submission's answers.
+
+JSON answers ({"1234": "B", ...}) cost about 12 bytes per answer and a full parse on
+every read. The packed form keeps the question ids sorted and delta-encoded, the chosen
+options at 2 bits each and whether each answer was correct at 1 bit each. Layout, all
+integers little-endian:
+
+    version (uint8) | id width (uint8) | count (uint32) | first id (uint32)
+    deltas    gaps between consecutive sorted ids, uint16 or uint32   (count - 1)
+    options   2 bits per answer, A=0 B=1 C=2 D=3, lowest bits first  (ceil(count / 4) bytes)
+    correct   1 bit per answer, lowest bit first                       (ceil(count / 8) bytes)
+
+The correct bits record the answer key the submission was scored against (the live
+bank or its snapshot), so readers don't need the key to know what was right.
+"""
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+import struct
+import sys
+
+VERSION = 1
+OPTIONS = 'ABCD'
+HEADER = struct.Struct('<BBII')
+_OPTION_CODES = {option: code for code, option in enumerate(OPTIONS)}
+
+# Byte -> the four options / eight flags it holds, so decoding is a table lookup per byte
+_OPTION_TABLE = [''.join(OPTIONS[(byte >> shift) & 3] for shift in (0, 2, 4, 6)) for byte in range(256)]
+_FLAG_TABLE = [tuple(bool(byte >> bit & 1) for bit in range(8)) for byte in range(256)]
+
+
+def _id_array(typecode, values):
+    data = array(typecode, values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+def pack_answers(answers, key):
+    """
+    Encode {question_id: option} scored against key ({int question_id: correct option}).
+    Returns None when the answers can't be packed (non-numeric ids, options outside A-D);
+    such submissions keep their JSON.
+    """
+    items = []
+    for qid, option in answers.items():
+        if not str(qid).isdigit() or option not in _OPTION_CODES:
+            return None
+        items.append((int(qid), option))
+    items.sort()
+    if any(a[0] == b[0] for a, b in zip(items, items[1:])) or (items and items[-1][0] > 0xFFFFFFFF):
+        return None
+
+    ids = [qid for qid, _option in items]
+    deltas = [b - a for a, b in zip(ids, ids[1:])]
+    width, typecode = (2, 'H') if all(d <= 0xFFFF for d in deltas) else (4, 'I')
+
+    options = bytearray((len(items) + 3) // 4)
+    correct = bytearray((len(items) + 7) // 8)
+    for i, (qid, option) in enumerate(items):
+        options[i // 4] |= _OPTION_CODES[option] << (i % 4 * 2)
+        if key.get(qid) == option:
+            correct[i // 8] |= 1 << (i % 8)
+
+    return b''.join((
+        HEADER.pack(VERSION, width, len(ids), ids[0] if ids else 0),
+        _id_array(typecode, deltas),
+        bytes(options),
+        bytes(correct),
+    ))
+
+
+class PackedAnswers:
+    """Read-only view of packed answers. Arrays are decoded on first use."""
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        version, self.id_width, self.count, self._first_id = HEADER.unpack_from(self.data)
+        if version != VERSION:
+            raise ValueError(f"Unknown packed answers version {version}")
+        self._ids_end = HEADER.size + max(self.count - 1, 0) * self.id_width
+        self._options_end = self._ids_end + (self.count + 3) // 4
+        self._question_ids = None
+        self._options = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def question_ids(self):
+        """Sorted question ids."""
+        if self._question_ids is None:
+            if not self.count:
+                self._question_ids = []
+            else:
+                deltas = array('H' if self.id_width == 2 else 'I')
+                deltas.frombytes(self.data[HEADER.size:self._ids_end])
+                if sys.byteorder != 'little':
+                    deltas.byteswap()
+                self._question_ids = list(accumulate(deltas, initial=self._first_id))
+        return self._question_ids
+
+    @property
+    def options(self):
+        """Chosen options as a string, aligned with question_ids."""
+        if self._options is None:
+            packed = self.data[self._ids_end:self._options_end]
+            self._options = ''.join(map(_OPTION_TABLE.__getitem__, packed))[:self.count]
+        return self._options
+
+    def correct_flags(self):
+        """Whether each answer was correct, aligned with question_ids."""
+        flags = []
+        for byte in self.data[self._options_end:]:
+            flags.extend(_FLAG_TABLE[byte])
+        return flags[:self.count]
+
+    @property
+    def correct_count(self):
+        return int.from_bytes(self.data[self._options_end:], 'little').bit_count()
+
+    def items(self):
+        return zip(self.question_ids, self.options)
+
+    def get(self, question_id, default=None):
+        ids = self.question_ids
+        i = bisect_left(ids, int(question_id))
+        if i < len(ids) and ids[i] == int(question_id):
+            return self.options[i]
+        return default
+
+    def to_dict(self):
+        """The original {"<question_id>": option} mapping."""
+        return {str(qid): option for qid, option in self.items()}
+
+    def with_key(self, key):
+        """
+        The same answers with the correct bits recomputed against key ({int question_id:
+        correct option}), without decoding to a dict and packing again.
+        """
+        correct = bytearray((self.count + 7) // 8)
+        for i, (qid, option) in enumerate(self.items()):
+            if key.get(qid) == option:
+                correct[i >> 3] |= 1 << (i & 7)
+        return self.data[:self._options_end] + bytes(correct)
@@ -0,0 +1,145 @@
+"""
+Deterministic, seeded paper generation.
+
+Instead of storing a question list per student and subject, a paper is drawn with a
+seeded PRNG from an immutable QuestionBankSnapshot. The seed is derived from the
+student, subject and exam session, so only the session and snapshot version need to
+be stored and the paper can be rebuilt on demand.
+
+Published snapshots are also written to a memory-mapped file (snapshots.py); papers,
+answer keys and question payloads are served from it when available.
+"""
+import hashlib
+import random
+from functools import lru_cache
+
+from django.db import IntegrityError, transaction
+
+from .exam_cache import key_corrections
+from .models import Question, QuestionBankSnapshot, normalize_board
+from .serializers import QuestionSerializer
+from .snapshots import open_snapshot_file, write_snapshot_file
+
+LEVELS = (1, 2, 3, 4)
+QUESTIONS_PER_LEVEL = 5
+
+
+def publish_snapshot(board, class_level):
+    """
+    Freeze the current question bank for a board and class level as a new version:
+    pools, answer key and pre-rendered payloads, written to an immutable file.
+    """
+    board = normalize_board(board)
+    questions = list(
+        Question.objects
+        .filter(subject__board=board, subject__class_level=class_level)
+        .order_by('id')
+    )
+    pools = {}
+    for q in questions:
+        pools.setdefault(str(q.subject_id), {}).setdefault(str(q.level), []).append(q.id)
+    payloads = QuestionSerializer(questions, many=True).data
+    entries = [(q.id, q.correct_option, payload) for q, payload in zip(questions, payloads)]
+
+    # Two concurrent publishes may pick the same version; the unique constraint decides.
+    for _attempt in range(3):
+        latest = QuestionBankSnapshot.objects.filter(board=board, class_level=class_level).first()
+        try:
+            with transaction.atomic():
+                snapshot = QuestionBankSnapshot.objects.create(
+                    board=board,
+                    class_level=class_level,
+                    version=(latest.version + 1) if latest else 1,
+                    pools=pools,
+                    question_count=len(questions),
+                )
+                snapshot.file = f"{board}-{class_level}-v{snapshot.version}.omrsnap"
+                snapshot.checksum = write_snapshot_file(
+                    snapshot.file,
+                    {'board': board, 'class_level': class_level, 'version': snapshot.version},
+                    entries,
+                    pools,
+                )
+                snapshot.save(update_fields=['file', 'checksum'])
+                return snapshot
+        except IntegrityError:
+            continue
+    raise RuntimeError(f"Could not publish a snapshot for {board} class {class_level}")
+
+
+def current_snapshot(board, class_level):
+    """Latest snapshot for a board and class level, publishing the first one if none exists."""
+    snapshot = QuestionBankSnapshot.objects.filter(board=board, class_level=class_level).first()
+    return snapshot or publish_snapshot(board, class_level)
+
+
+@lru_cache(maxsize=64)
+def snapshot_reader(snapshot_id):
+    """
+    Memory-mapped file of a snapshot, or None for snapshots published before snapshot
+    files existed. Snapshots never change once written, so this is cached forever.
+    """
+    filename = QuestionBankSnapshot.objects.values_list('file', flat=True).get(id=snapshot_id)
+    return open_snapshot_file(filename) if filename else None
+
+
+@lru_cache(maxsize=64)
+def _snapshot_pools(snapshot_id):
+    reader = snapshot_reader(snapshot_id)
+    if reader is not None:
+        return reader.pools
+    return QuestionBankSnapshot.objects.values_list('pools', flat=True).get(id=snapshot_id)
+
+
+def paper_seed(student_id, subject_id, exam_session):
+    digest = hashlib.sha256(f"{exam_session}:{student_id}:{subject_id}".encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def build_paper(snapshot_id, student_id, subject_id, exam_session, per_level=QUESTIONS_PER_LEVEL):
+    """
+    Rebuild a student's paper for one subject.
+    Returns {level: [question ids]} for every level that has questions in the snapshot.
+    """
+    subject_pools = _snapshot_pools(snapshot_id).get(str(subject_id), {})
+    rng = random.Random(paper_seed(student_id, subject_id, exam_session))
+    paper = {}
+    for level in LEVELS:
+        pool = subject_pools.get(str(level), [])
+        if pool:
+            paper[level] = rng.sample(pool, min(per_level, len(pool)))
+    return paper
+
+
+def paper_question_ids(snapshot_id, student_id, subject_ids, exam_session):
+    """Flat list of question ids across the given subjects of a seeded paper."""
+    question_ids = []
+    for subject_id in subject_ids:
+        for ids in build_paper(snapshot_id, student_id, subject_id, exam_session).values():
+            question_ids.extend(ids)
+    return question_ids
+
+
+def answer_key(question_ids, snapshot_id=None):
+    """
+    {question_id: correct_option} for the given questions. Seeded papers use the key
+    frozen in their snapshot, with later key corrections applied; everything else reads
+    the live Question table.
+    """
+    reader = snapshot_reader(snapshot_id) if snapshot_id else None
+    if reader is None:
+        return dict(Question.objects.filter(id__in=question_ids).values_list('id', 'correct_option'))
+    corrections = key_corrections()
+    return {qid: corrections.get(qid) or reader.correct_option(qid) for qid in question_ids if qid in reader}
+
+
+def question_payloads(snapshot_id, question_ids):
+    """
+    Serialized questions in the given order, read from the snapshot file when there is
+    one so exam serving doesn't touch the Question table (no snapshot: the live table).
+    """
+    reader = snapshot_reader(snapshot_id) if snapshot_id else None
+    if reader is not None:
+        return [reader.payload(qid) for qid in question_ids if qid in reader]
+    questions = Question.objects.in_bulk(question_ids)
+    return QuestionSerializer([questions[qid] for qid in question_ids if qid in questions], many=True).data
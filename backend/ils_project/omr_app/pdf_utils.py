@@ -1,4 +1,6 @@
 from io import BytesIO
+from functools import lru_cache
+import hashlib
 import random
 from reportlab.platypus import (
     SimpleDocTemplate,
@@ -19,9 +21,14 @@ from reportlab.graphics.charts.barcharts import VerticalBarChart
 from reportlab.graphics.charts.piecharts import Pie
 from reportlab.graphics.charts.legends import Legend
 from reportlab.lib.enums import TA_CENTER
+from reportlab.pdfgen.canvas import Canvas
 import datetime
+import time
+from django.conf import settings
 
-from .models import StudentSubmission, Question  # Adjust as needed
+from .models import StudentSubmission
+from .reports import LEVEL_LABELS, build_report_data
+from .tracing import Trace
 
 # --- Helper functions and classes ---
 
@@ -77,14 +84,7 @@ class WaterMark(Flowable):
         self.angle = angle
         
     def draw(self):
-        canvas = self.canv
-        canvas.saveState()
-        canvas.setFont('Helvetica', 70)
-        canvas.setFillColor(colors.Color(0.9, 0.9, 0.9))
-        canvas.translate(A4[0]/2, A4[1]/2)
-        canvas.rotate(self.angle)
-        canvas.drawCentredString(0, 0, self.text)
-        canvas.restoreState()
+        draw_watermark(self.canv, self.text, self.angle)
 
 class MotivationalBox(Flowable):
     def __init__(self, content, width=400, height=80):
@@ -106,6 +106,33 @@ class MotivationalBox(Flowable):
         canvas.circle(15, 15, 8, stroke=0, fill=1)
         canvas.restoreState()
 
+class TimedFlowable(Flowable):
+    """Draws a flowable unchanged and adds the time it took to a trace (charts render at layout time)."""
+    def __init__(self, flowable, trace, stage):
+        Flowable.__init__(self)
+        self.flowable = flowable
+        self.trace = trace
+        self.stage = stage
+        self.hAlign = getattr(flowable, 'hAlign', 'LEFT')
+
+    def wrap(self, availWidth, availHeight):
+        self.width, self.height = self.flowable.wrap(availWidth, availHeight)
+        return self.width, self.height
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        start = time.perf_counter()
+        self.flowable.drawOn(canvas, x, y, _sW)
+        self.trace.add(self.stage, time.perf_counter() - start)
+
+def traced_canvas(trace):
+    """A canvasmaker whose save() (writing out the PDF) is recorded as the serialize stage."""
+    class TracedCanvas(Canvas):
+        def save(self):
+            start = time.perf_counter()
+            super().save()
+            trace.add('serialize', time.perf_counter() - start)
+    return TracedCanvas
+
 def create_page_footer(canvas, doc, footer_text=""):
     canvas.saveState()
     footer = f"Page {doc.page} | {footer_text} | Generated on {datetime.datetime.now().strftime('%Y-%m-%d')}"
@@ -135,7 +162,58 @@ def create_page_decoration(canvas, doc):
         canvas.circle(x, y, size, fill=1, stroke=0)
     canvas.restoreState()
 
+def draw_watermark(canvas, text, angle=45):
+    canvas.saveState()
+    canvas.setFont('Helvetica', 70)
+    canvas.setFillColor(colors.Color(0.9, 0.9, 0.9))
+    canvas.translate(A4[0]/2, A4[1]/2)
+    canvas.rotate(angle)
+    canvas.drawCentredString(0, 0, text)
+    canvas.restoreState()
+
+def draw_shared_form(canvas, name, draw):
+    """
+    Draw `draw(canvas)` once into a form XObject and reference it from every page that
+    uses it, instead of repeating the drawing operators on each page.
+    """
+    if not canvas.hasForm(name):
+        canvas.beginForm(name)
+        draw(canvas)
+        canvas.endForm()
+    canvas.doForm(name)
+
+# --- Compact profile helpers ---
+_logo_cache = {}  # sha256 of the uploaded logo -> downsampled image bytes
+LOGO_CACHE_SIZE = 32
+LOGO_MAX_PIXELS = (300, 200)  # 2x the 150x100pt box the logo is drawn in
+
+def compact_logo(logo_bytes):
+    """Downsample an uploaded logo to what the report can show, cached by content hash."""
+    digest = hashlib.sha256(logo_bytes).hexdigest()
+    cached = _logo_cache.get(digest)
+    if cached is None:
+        from PIL import Image as PILImage
+
+        with PILImage.open(BytesIO(logo_bytes)) as img:
+            img.thumbnail(LOGO_MAX_PIXELS)
+            out = BytesIO()
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img.save(out, format='PNG', optimize=True)
+            else:
+                img.convert('RGB').save(out, format='JPEG', quality=85, optimize=True)
+        cached = out.getvalue()
+        if len(_logo_cache) >= LOGO_CACHE_SIZE:
+            _logo_cache.pop(next(iter(_logo_cache)))
+        _logo_cache[digest] = cached
+    return cached
+
+def striped_table_style(commands, row_count, stripe_color):
+    """One TableStyle with the base commands plus a background on every odd row."""
+    stripes = [('BACKGROUND', (0, i), (-1, i), stripe_color) for i in range(1, row_count) if i % 2 == 1]
+    return TableStyle(commands + stripes)
+
 def add_random_content_to_page(story):
+    styles = get_styles()
     content_type = random.choice(["quote", "tip", "fact", "decoration"])
     if content_type == "quote":
         quote = get_random_quote()
@@ -181,45 +259,90 @@ def add_random_content_to_page(story):
     return story
 
 # --- Styles ---
-styles = getSampleStyleSheet()
-styles.add(ParagraphStyle(
-    name='ReportTitle',
-    parent=styles['Title'],
-    textColor=colors.HexColor("#2E7D32"),
-    fontSize=24,
-    spaceAfter=12
-))
-styles.add(ParagraphStyle(
-    name='ReportHeading1',
-    parent=styles['Heading1'],
-    textColor=colors.HexColor("#2E7D32"),
-    fontSize=18,
-    spaceAfter=10
-))
-styles.add(ParagraphStyle(
-    name='ReportHeading2',
-    parent=styles['Heading2'],
-    textColor=colors.HexColor("#388E3C"),
-    fontSize=16,
-    spaceAfter=8
-))
-styles.add(ParagraphStyle(
-    name='ReportNormal',
-    parent=styles['Normal'],
-    textColor=colors.HexColor("#333333"),
-    fontSize=11,
-    spaceAfter=6
-))
-styles.add(ParagraphStyle(
-    name='ReportItalic',
-    parent=styles['Normal'],
-    fontName='Helvetica-Oblique',
-    fontSize=11,
-    textColor=colors.HexColor("#555555")
-))
+@lru_cache(maxsize=None)
+def get_styles():
+    """Report stylesheet, built on first use rather than at import time."""
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(
+        name='ReportTitle',
+        parent=styles['Title'],
+        textColor=colors.HexColor("#2E7D32"),
+        fontSize=24,
+        spaceAfter=12
+    ))
+    styles.add(ParagraphStyle(
+        name='ReportHeading1',
+        parent=styles['Heading1'],
+        textColor=colors.HexColor("#2E7D32"),
+        fontSize=18,
+        spaceAfter=10
+    ))
+    styles.add(ParagraphStyle(
+        name='ReportHeading2',
+        parent=styles['Heading2'],
+        textColor=colors.HexColor("#388E3C"),
+        fontSize=16,
+        spaceAfter=8
+    ))
+    styles.add(ParagraphStyle(
+        name='ReportNormal',
+        parent=styles['Normal'],
+        textColor=colors.HexColor("#333333"),
+        fontSize=11,
+        spaceAfter=6
+    ))
+    styles.add(ParagraphStyle(
+        name='ReportItalic',
+        parent=styles['Normal'],
+        fontName='Helvetica-Oblique',
+        fontSize=11,
+        textColor=colors.HexColor("#555555")
+    ))
+    return styles
 
 # --- Main PDF Generation Function ---
-def generate_student_performance_pdf(student_id, title, notes="", footer="", include_chart=True, logo_bytes=None, signature=None):
+def generate_student_performance_pdf(student_id, title, notes="", footer="", include_chart=True, logo_bytes=None, signature=None, submission_id=None, compact=None, trace=None):
+    """Fetch the report data for a submission (the student's latest if not given) and render it."""
+    own_trace = trace is None
+    if own_trace:
+        trace = Trace('student_pdf')
+    with trace.span('fetch'):
+        if submission_id is None:
+            submission_id = StudentSubmission.objects.filter(student__id=student_id).latest('submitted_at').id
+        report = build_report_data(submission_id)
+    buffer = render_student_performance_pdf(report, title, notes, footer, include_chart, logo_bytes, signature, compact, trace)
+    if own_trace:
+        trace.finish()
+    return buffer
+
+
+def render_student_performance_pdf(report, title, notes="", footer="", include_chart=True, logo_bytes=None, signature=None, compact=None, trace=None):
+    """
+    Lay out a ReportData as a PDF. No database access happens here.
+
+    The compact profile (default: settings.OMR_PDF_COMPACT) produces smaller files that
+    render faster: the logo is downsampled and the watermark and page decoration are
+    drawn once as shared form XObjects. Page streams are compressed in both profiles
+    (ReportLab's default, rl_config.pageCompression).
+
+    Each stage is recorded on `trace` (see tracing.py): the story sections with their
+    flowable counts, each chart, the page callbacks, layout and serialization. A trace
+    is created and finished here when the caller doesn't pass one.
+    """
+    own_trace = trace is None
+    if own_trace:
+        trace = Trace('student_pdf')
+    trace.skip()
+    flowables = 0
+
+    def section(stage, label=None, **counts):
+        nonlocal flowables
+        trace.lap(stage, label, flowables=len(story) - flowables, **counts)
+        flowables = len(story)
+
+    if compact is None:
+        compact = getattr(settings, 'OMR_PDF_COMPACT', False)
+    styles = get_styles()
     buffer = BytesIO()
     doc = SimpleDocTemplate(
         buffer,
@@ -227,14 +350,15 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
         leftMargin=30*mm,
         rightMargin=30*mm,
         topMargin=20*mm,
-        bottomMargin=20*mm
+        bottomMargin=20*mm,
     )
     story = []
 
     # Cover Page
-    story.append(WaterMark("CONFIDENTIAL"))
+    if not compact:
+        story.append(WaterMark("CONFIDENTIAL"))
     if logo_bytes:
-        img = Image(BytesIO(logo_bytes), width=150, height=100)
+        img = Image(BytesIO(compact_logo(logo_bytes) if compact else logo_bytes), width=150, height=100)
         img.hAlign = 'CENTER'
         story.append(img)
     story.append(Spacer(1, 30))
@@ -278,6 +402,8 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
     story.append(Paragraph(f'"{get_random_quote()}"', quote_style))
     story.append(PageBreak())
 
+    section('story.cover')
+
     # Introduction Page
     story.append(Paragraph("Introduction", styles['ReportHeading1']))
     add_random_content_to_page(story)
@@ -296,11 +422,9 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
     add_random_content_to_page(story)
     story.append(PageBreak())
 
-    # Fetch data
-    submission = StudentSubmission.objects.get(student__id=student_id)
-    student = submission.student
-    answers = submission.answers or {}
-    question_ids = [int(qid) for qid in answers.keys()]
+    student = report.student
+
+    section('story.introduction')
 
     # Student Info Page
     info_heading = ParagraphStyle(
@@ -317,7 +441,7 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
     story.append(Spacer(1, 12))
     info_data = [
         ["Student Name:", student.name],
-        ["Class:", student.classLevel],
+        ["Class:", student.class_level],
         ["School:", student.school],
         ["Report Date:", datetime.datetime.now().strftime("%B %d, %Y")]
     ]
@@ -333,10 +457,12 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
     story.append(Spacer(1, 24))
     add_random_content_to_page(story)
 
+    section('story.student_info')
+
     # Overall Score
-    total_correct = submission.score
-    total_questions = len(answers) if answers else 0
-    overall_percentage = round((total_correct / total_questions) * 100, 2) if total_questions > 0 else 0
+    total_correct = report.score
+    total_questions = report.answered
+    overall_percentage = report.overall_percentage
     story.append(Paragraph("Overall Performance", styles['ReportHeading2']))
     drawing = Drawing(400, 80)
     drawing.add(Rect(0, 30, 300, 30, fillColor=colors.HexColor("#EEEEEE"), strokeColor=None))
@@ -377,28 +503,21 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
     add_random_content_to_page(story)
     story.append(PageBreak())
 
+    section('story.overall')
+
     # Subject Summary Page
     story.append(Paragraph("Subject Performance Summary", styles['ReportHeading1']))
     story.append(Spacer(1, 12))
     table_data = [["Subject", "Correct Answers", "Total Questions", "Percentage"]]
-    for subject in submission.subjects.all():
-        subject_name = subject.name
-        subject_questions = Question.objects.filter(subject=subject, id__in=question_ids)
-        total_subject_questions = subject_questions.count()
-        correct_answers = 0
-        for q in subject_questions:
-            qid_str = str(q.id)
-            if qid_str in answers and answers[qid_str] == q.correct_option:
-                correct_answers += 1
-        subject_percentage = round((correct_answers / total_subject_questions) * 100, 2) if total_subject_questions > 0 else 0
+    for subject in report.subjects:
         table_data.append([
-            subject_name,
-            str(correct_answers),
-            str(total_subject_questions),
-            f"{subject_percentage}%"
+            subject.name,
+            str(subject.correct),
+            str(subject.total),
+            f"{subject.percentage}%"
         ])
     t = Table(table_data, repeatRows=1)
-    t.setStyle(TableStyle([
+    t.setStyle(striped_table_style([
         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4CAF50")),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -409,15 +528,14 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
         ('LINEBELOW', (0, 0), (-1, 0), 1.5, colors.HexColor("#388E3C")),
         ('TOPPADDING', (0, 0), (-1, -1), 6),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    for i in range(1, len(table_data)):
-        if i % 2 == 1:
-            t.setStyle(TableStyle([('BACKGROUND', (0, i), (-1, i), colors.HexColor("#F1F8E9"))]))
+    ], len(table_data), colors.HexColor("#F1F8E9")))
     story.append(t)
     story.append(Spacer(1, 24))
     add_random_content_to_page(story)
     story.append(PageBreak())
 
+    section('story.subject_summary', subjects=len(report.subjects))
+
     # Level-based charts per subject
     if include_chart:
         subject_colors = [
@@ -430,25 +548,11 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
             colors.HexColor("#795548"),
             colors.HexColor("#607D8B"),
         ]
-        all_subjects = list(submission.subjects.all())
-        for subject_index, subject in enumerate(all_subjects):
+        for subject_index, subject in enumerate(report.subjects):
             subject_name = subject.name
-            questions = Question.objects.filter(subject=subject, id__in=question_ids)
-            level_total = [0, 0, 0, 0]
-            level_correct = [0, 0, 0, 0]
-            for q in questions:
-                qid_str = str(q.id)
-                level_index = q.level - 1
-                level_total[level_index] += 1
-                if qid_str in answers and answers[qid_str] == q.correct_option:
-                    level_correct[level_index] += 1
-            level_percentages = []
-            for i in range(4):
-                if level_total[i] > 0:
-                    percentage = round((level_correct[i] / level_total[i]) * 100, 2)
-                else:
-                    percentage = 0
-                level_percentages.append(percentage)
+            level_total = [level.total for level in subject.levels]
+            level_correct = [level.correct for level in subject.levels]
+            level_percentages = [level.percentage for level in subject.levels]
             drawing = Drawing(450, 250)
             subject_color = subject_colors[subject_index % len(subject_colors)]
             drawing.add(String(100, 230, f"{subject_name} Performance by Level",
@@ -485,9 +589,10 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
             legend.fontName = 'Helvetica'
             legend.fontSize = 8
             drawing.add(bc)
-            story.append(drawing)
+            story.append(TimedFlowable(drawing, trace, 'chart.draw'))
+            section('chart', subject_name, bars=sum(len(series) for series in bc.data))
             level_table_data = [["Level", "Correct", "Total", "Percentage", "Performance"]]
-            perf_labels = ["Basic", "Intermediate", "Advanced", "Expert"]
+            perf_labels = [LEVEL_LABELS[level.level] for level in subject.levels]
             for i in range(4):
                 if level_percentages[i] >= 80:
                     performance = "Excellent"
@@ -505,7 +610,8 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
                     performance
                 ])
             level_table = Table(level_table_data, repeatRows=1)
-            level_table.setStyle(TableStyle([
+            light_subject_color = colors.Color(*subject_color.rgb(), alpha=0.1)
+            level_table.setStyle(striped_table_style([
                 ('BACKGROUND', (0, 0), (-1, 0), subject_color),
                 ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
                 ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -513,15 +619,7 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
                 ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
                 ('TOPPADDING', (0, 0), (-1, -1), 6),
                 ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ]))
-            for i in range(1, len(level_table_data)):
-                if i % 2 == 1:
-                    light_subject_color = colors.Color(
-                        *subject_color.rgb(), alpha=0.1
-                    )
-                    level_table.setStyle(TableStyle([
-                        ('BACKGROUND', (0, i), (-1, i), light_subject_color)
-                    ]))
+            ], len(level_table_data), light_subject_color))
             story.append(Spacer(1, 20))
             story.append(level_table)
             story.append(Spacer(1, 20))
@@ -543,6 +641,7 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
             story.append(Spacer(1, 12))
             add_random_content_to_page(story)
             story.append(PageBreak())
+            section('story.subject_section', subject_name)
 
     # Notes and Signature
     if notes:
@@ -560,6 +659,8 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
     add_random_content_to_page(story)
     story.append(PageBreak())
 
+    section('story.notes')
+
     # Signature
     story.append(Paragraph("Authentication", styles['ReportHeading1']))
     story.append(Spacer(1, 40))
@@ -592,14 +693,120 @@ def generate_student_performance_pdf(student_id, title, notes="", footer="", inc
         textColor=colors.HexColor("#558B2F")
     )
     story.append(Paragraph(f'"{final_quote}"', quote_style))
+    section('story.signature')
 
     # Page layout
     def page_layout(canvas, doc):
+        start = time.perf_counter()
+        if compact and doc.page == 1:
+            draw_shared_form(canvas, 'Watermark', lambda c: draw_watermark(c, "CONFIDENTIAL"))
         if doc.page > 1:
-            create_page_decoration(canvas, doc)
+            if compact:
+                draw_shared_form(canvas, 'PageDecoration', lambda c: create_page_decoration(c, doc))
+            else:
+                create_page_decoration(canvas, doc)
             create_page_header(canvas, doc, title)
         footer_text = footer if footer else "Confidential Student Assessment Report"
         create_page_footer(canvas, doc, footer_text)
+        trace.add('page_callbacks', time.perf_counter() - start)
+
+    # doc.build also runs the page callbacks, chart drawing and serialization, which record
+    # their own spans; the layout span is the rest of it
+    flowables = len(story)  # doc.build consumes the story
+    start = time.perf_counter()
+    doc.build(story, onFirstPage=page_layout, onLaterPages=page_layout, canvasmaker=traced_canvas(trace))
+    nested = trace.ms('page_callbacks', 'chart.draw', 'serialize') / 1000
+    trace.record('layout', time.perf_counter() - start - nested, flowables=flowables, pages=doc.page, bytes=buffer.tell())
+    buffer.seek(0)
+    if own_trace:
+        trace.finish()
+    return buffer
+
+
+def mastery_color(percentage):
+    """Heatmap cell colour: red below 50%, amber below 75%, green above."""
+    if percentage >= 75:
+        return colors.HexColor("#C8E6C9")
+    if percentage >= 50:
+        return colors.HexColor("#FFF9C4")
+    return colors.HexColor("#FFCDD2")
+
+def render_cohort_report_pdf(report, title="Cohort Performance Report", footer=""):
+    """Lay out a cohort report dict from cohort.build_cohort_report(). No database access happens here."""
+    styles = get_styles()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=20*mm, rightMargin=20*mm,
+                            topMargin=20*mm, bottomMargin=20*mm, pageCompression=1)
+    header_style = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4CAF50")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#BDBDBD")),
+    ]
+    story = [Paragraph(title, styles['ReportTitle'])]
+    filters = ", ".join(f"{k.replace('_', ' ')}: {v}" for k, v in report['filter'].items()) or "all submissions"
+    story.append(Paragraph(f"Filter: {filters}", styles['ReportItalic']))
+    distribution = report['score_distribution']
+    story.append(Paragraph(
+        f"{report['students']} students, {report['questions']} questions. Mean score {distribution['mean']}%, "
+        f"median {distribution['median']}%, 10th-90th percentile {distribution['p10']}-{distribution['p90']}%.",
+        styles['ReportNormal']))
+
+    # Score distribution
+    story.append(Paragraph("Score Distribution", styles['ReportHeading2']))
+    drawing = Drawing(440, 180)
+    chart = VerticalBarChart()
+    chart.x, chart.y, chart.width, chart.height = 40, 30, 380, 130
+    chart.data = [distribution['counts']]
+    chart.categoryAxis.categoryNames = distribution['bins']
+    chart.categoryAxis.labels.fontSize = 7
+    chart.valueAxis.valueMin = 0
+    chart.bars[0].fillColor = colors.HexColor("#4CAF50")
+    drawing.add(chart)
+    story.append(drawing)
+
+    # Mastery heatmap: subjects x levels
+    story.append(Paragraph("Mastery by Subject and Level", styles['ReportHeading2']))
+    rows = [["Subject"] + [f"{LEVEL_LABELS[level]} (L{level})" for level in sorted(LEVEL_LABELS)]]
+    cell_styles = []
+    for i, subject in enumerate(report['mastery_heatmap'], start=1):
+        rows.append([subject['name']] + [f"{level['mastery']}%" if level['answered'] else "-" for level in subject['levels']])
+        cell_styles += [('BACKGROUND', (j, i), (j, i), mastery_color(level['mastery']))
+                        for j, level in enumerate(subject['levels'], start=1) if level['answered']]
+    table = Table(rows, repeatRows=1)
+    table.setStyle(TableStyle(header_style + cell_styles))
+    story.append(table)
+
+    # Subjects and schools
+    if report['schools']:
+        story.append(Paragraph("Schools", styles['ReportHeading2']))
+        rows = [["School", "Students", "Mean %"]] + [[s['school'], s['students'], s['mean_percentage']] for s in report['schools']]
+        table = Table(rows, repeatRows=1)
+        table.setStyle(striped_table_style(header_style, len(rows), colors.HexColor("#F1F8E9")))
+        story.append(table)
+
+    story.append(Paragraph("Weakest Topics", styles['ReportHeading2']))
+    rows = [["Subject", "Level", "Mastery %", "Responses"]] + [
+        [t['subject'], LEVEL_LABELS.get(t['level'], t['level']), t['mastery'], t['answered']] for t in report['weakest_topics']
+    ]
+    table = Table(rows, repeatRows=1)
+    table.setStyle(striped_table_style(header_style, len(rows), colors.HexColor("#F1F8E9")))
+    story.append(table)
+
+    story.append(Paragraph("Hardest Questions", styles['ReportHeading2']))
+    rows = [["Question", "Subject", "Level", "Responses", "Correct %", "Discrimination"]] + [
+        [q['question_id'], q['subject'], q['level'], q['answered'], q['percentage_correct'], q['discrimination']]
+        for q in report['hardest_questions']
+    ]
+    table = Table(rows, repeatRows=1)
+    table.setStyle(striped_table_style(header_style, len(rows), colors.HexColor("#F1F8E9")))
+    story.append(table)
+
+    def page_layout(canvas, doc):
+        create_page_header(canvas, doc, "Cohort Report")
+        create_page_footer(canvas, doc, footer or "ILS Assessment System")
 
     doc.build(story, onFirstPage=page_layout, onLaterPages=page_layout)
     buffer.seek(0)
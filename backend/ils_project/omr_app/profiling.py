@@ -0,0 +1,279 @@
+"""
+Opt-in sampling profiler for slow requests.
+
+ProfilingMiddleware registers every request with one shared sampler thread per process.
+Every interval_ms the thread reads the stacks of the requests it is watching
+(sys._current_frames) and counts them as collapsed stacks. A request is watched from the
+start if it was picked by sample_rate, otherwise only once it has run for watch_after_ms.
+Fast requests therefore cost a dictionary insert and nothing else, and the sampler sleeps
+while no request is being watched.
+
+When a watched request ends, its profile is kept if it took slow_ms or longer, or if it
+was sampled. Kept profiles are JSON files in the profile directory with the view, params,
+status, timing, query count and the stacks. Only the newest `keep` files are kept.
+Staff can list them at /profiles/ and open a flamegraph of each.
+
+Configured with OMR_PROFILER; disabled unless 'enabled' is true.
+"""
+from collections import Counter
+from functools import lru_cache
+import html
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import zlib
+
+from django.conf import settings
+from django.db import connection
+from django.urls import resolve, Resolver404
+
+from .metrics import register_source
+
+DEFAULTS = {
+    'enabled': False,
+    'sample_rate': 0.0,  # Share of requests profiled from the start and always kept
+    'slow_ms': 5000,  # Profiles of requests at least this slow are kept
+    'watch_after_ms': 500,  # Unsampled requests are only sampled once they have run this long
+    'interval_ms': 10,
+    'keep': 500,
+    'dir': None,  # Default: BASE_DIR/profiles
+}
+MAX_DEPTH = 128
+
+
+def profiler_settings():
+    config = {**DEFAULTS, **getattr(settings, 'OMR_PROFILER', {})}
+    config['dir'] = config['dir'] or os.path.join(settings.BASE_DIR, 'profiles')
+    return config
+
+
+@lru_cache(maxsize=8192)
+def _frame_label(code):
+    path = code.co_filename
+    for prefix in sorted({str(settings.BASE_DIR), *sys.path}, key=len, reverse=True):
+        if prefix and path.startswith(prefix + os.sep):
+            path = path[len(prefix) + 1:]
+            break
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class _Watched:
+    __slots__ = ('thread_id', 'root', 'started', 'sampled', 'stacks', 'samples')
+
+    def __init__(self, thread_id, root, sampled):
+        self.thread_id = thread_id
+        self.root = root  # The middleware's frame: only frames below it are recorded
+        self.started = time.monotonic()
+        self.sampled = sampled
+        self.stacks = Counter()
+        self.samples = 0
+
+
+class Sampler:
+    """One background thread sampling the stacks of the requests registered with it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._requests = {}
+        self._thread = None
+        self.saved = 0
+        self.samples = 0
+
+    def register(self, watched):
+        with self._lock:
+            self._requests[watched.thread_id] = watched
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='omr-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def unregister(self, watched):
+        with self._lock:
+            self._requests.pop(watched.thread_id, None)
+
+    def _run(self):
+        while True:
+            config = profiler_settings()
+            now = time.monotonic()
+            # Sampling holds the lock, so a finished request's stacks don't change while it is saved
+            with self._lock:
+                due = [w for w in self._requests.values()
+                       if w.sampled or (now - w.started) * 1000 >= config['watch_after_ms']]
+                idle = not self._requests
+                if due:
+                    frames = sys._current_frames()
+                    for watched in due:
+                        self._sample(watched, frames.get(watched.thread_id))
+                    del frames
+            if idle:
+                self._wake.clear()
+                self._wake.wait()
+            else:
+                time.sleep(config['interval_ms'] / 1000)
+
+    def _sample(self, watched, frame):
+        stack = []
+        while frame is not None and frame is not watched.root and len(stack) < MAX_DEPTH:
+            stack.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        if stack:
+            watched.stacks[';'.join(reversed(stack))] += 1
+            watched.samples += 1
+            self.samples += 1
+
+
+sampler = Sampler()
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = profiler_settings()
+        if not config['enabled']:
+            return self.get_response(request)
+
+        watched = _Watched(threading.get_ident(), sys._getframe(), random.random() < config['sample_rate'])
+        queries = {'count': 0, 'ms': 0.0}
+
+        def count_queries(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries['count'] += 1
+                queries['ms'] += (time.perf_counter() - start) * 1000
+
+        sampler.register(watched)
+        status = 500
+        try:
+            with connection.execute_wrapper(count_queries):
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            sampler.unregister(watched)
+            duration_ms = (time.monotonic() - watched.started) * 1000
+            if watched.samples and (watched.sampled or duration_ms >= config['slow_ms']):
+                save_profile(config, request, watched, status, duration_ms, queries)
+
+
+def _view_name(request):
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return '', {}
+    return match.url_name or match.view_name, match.kwargs
+
+
+def save_profile(config, request, watched, status, duration_ms, queries):
+    view, kwargs = _view_name(request)
+    profile = {
+        'view': view,
+        'method': request.method,
+        'path': request.path,
+        # Query string and URL kwargs only; request bodies (answers, uploads) are never stored
+        'params': {**{k: str(v) for k, v in kwargs.items()}, **{k: request.GET.get(k) for k in request.GET}},
+        'status': status,
+        'reason': 'sampled' if watched.sampled else 'slow',
+        'duration_ms': round(duration_ms, 1),
+        'queries': queries['count'],
+        'query_ms': round(queries['ms'], 1),
+        'interval_ms': config['interval_ms'],
+        'samples': watched.samples,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'stacks': dict(watched.stacks.most_common()),
+    }
+    os.makedirs(config['dir'], exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{view or 'unknown'}-{uuid.uuid4().hex[:8]}.json"
+    tmp = os.path.join(config['dir'], f".{name}.tmp")
+    with open(tmp, 'w') as fh:
+        json.dump(profile, fh)
+    os.replace(tmp, os.path.join(config['dir'], name))
+    sampler.saved += 1
+    _prune(config)
+
+
+def _prune(config):
+    names = sorted(name for name in os.listdir(config['dir']) if name.endswith('.json'))
+    for name in names[:-config['keep']]:
+        os.remove(os.path.join(config['dir'], name))
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first."""
+    config = profiler_settings()
+    if not os.path.isdir(config['dir']):
+        return []
+    summaries = []
+    for name in sorted((n for n in os.listdir(config['dir']) if n.endswith('.json')), reverse=True):
+        profile = load_profile(name)
+        if profile is not None:
+            profile.pop('stacks')
+            summaries.append(dict(profile, name=name))
+    return summaries
+
+
+def load_profile(name):
+    """A stored profile by file name, or None (names from outside the directory are refused)."""
+    if os.path.basename(name) != name or not name.endswith('.json'):
+        return None
+    try:
+        with open(os.path.join(profiler_settings()['dir'], name)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def flamegraph_svg(stacks, width=1200, row_height=18, min_width=0.5):
+    """An SVG flamegraph (root at the top) of collapsed stacks {"a;b;c": count}."""
+    root = {'children': {}, 'count': 0}
+    for stack, count in stacks.items():
+        node = root
+        node['count'] += count
+        for frame in stack.split(';'):
+            node = node['children'].setdefault(frame, {'children': {}, 'count': 0})
+            node['count'] += count
+    total = root['count'] or 1
+
+    rects = []
+    depth = 0
+
+    def layout(node, x, level):
+        nonlocal depth
+        for label, child in sorted(node['children'].items()):
+            w = child['count'] / total * width
+            if w >= min_width:
+                depth = max(depth, level + 1)
+                color = zlib.crc32(label.split(' (')[-1].encode()) % 60
+                share = 100 * child['count'] / total
+                y = level * row_height
+                text = html.escape(label)
+                rects.append(
+                    f'<g><title>{text} - {child["count"]} samples ({share:.1f}%)</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+                    f'fill="hsl({10 + color}, 80%, 60%)" rx="2"/>'
+                    + (f'<text x="{x + 3:.1f}" y="{y + row_height - 5}" font-size="11" font-family="monospace">'
+                       f'{html.escape(label[:int(w / 7)])}</text>' if w > 30 else '')
+                    + '</g>'
+                )
+                layout(child, x, level + 1)
+            x += w
+
+    layout(root, 0.0, 0)
+    height = max(depth, 1) * row_height
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">{"".join(rects)}</svg>')
+
+
+register_source('profiler', lambda: {
+    'enabled': profiler_settings()['enabled'],
+    'saved': sampler.saved,
+    'samples': sampler.samples,
+})
@@ -0,0 +1,274 @@
+"""
+Report data model for student performance reports.
+
+build_report_data() fetches everything a report needs in a fixed number of queries and
+precomputes the per-subject and per-level aggregates. The result is a plain, typed,
+serializable object: the PDF renderer, the admin charts and the JSON API all consume it
+instead of querying and scoring on their own.
+"""
+from dataclasses import asdict, dataclass, field
+import hashlib
+from itertools import islice
+import json
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from .models import Question, StudentSubmission
+from .papers import answer_key
+
+LEVELS = (1, 2, 3, 4)
+LEVEL_LABELS = {1: "Basic", 2: "Intermediate", 3: "Advanced", 4: "Expert"}
+
+
+def percentage(correct, total):
+    return round((correct / total) * 100, 2) if total > 0 else 0
+
+
+@dataclass
+class LevelResult:
+    level: int
+    correct: int = 0
+    total: int = 0
+
+    @property
+    def percentage(self):
+        return percentage(self.correct, self.total)
+
+
+@dataclass
+class SubjectResult:
+    subject_id: int
+    name: str
+    levels: List[LevelResult] = field(default_factory=lambda: [LevelResult(level) for level in LEVELS])
+
+    @property
+    def correct(self):
+        return sum(level.correct for level in self.levels)
+
+    @property
+    def total(self):
+        return sum(level.total for level in self.levels)
+
+    @property
+    def percentage(self):
+        return percentage(self.correct, self.total)
+
+    def level(self, level):
+        return self.levels[level - 1]
+
+
+@dataclass
+class QuestionResult:
+    question_id: int
+    subject_id: int
+    level: int
+    text: str
+    student_answer: Optional[str]
+    correct_answer: str
+
+    @property
+    def is_correct(self):
+        return self.student_answer == self.correct_answer
+
+
+@dataclass
+class StudentInfo:
+    id: int
+    name: str
+    class_level: str
+    school: str
+
+
+@dataclass
+class ReportData:
+    submission_id: int
+    submitted_at: str
+    student: StudentInfo
+    score: int
+    answered: int
+    subjects: List[SubjectResult]
+    questions: List[QuestionResult]
+
+    @property
+    def overall_percentage(self):
+        return percentage(self.score, self.answered)
+
+    def questions_by_subject(self) -> Dict[int, List[QuestionResult]]:
+        grouped = {subject.subject_id: [] for subject in self.subjects}
+        for question in self.questions:
+            if question.subject_id in grouped:
+                grouped[question.subject_id].append(question)
+        return grouped
+
+    def to_dict(self):
+        """Plain JSON-serializable dict, with the derived totals filled in; from_dict() rebuilds the object."""
+        data = asdict(self)
+        data['overall_percentage'] = self.overall_percentage
+        for subject, subject_data in zip(self.subjects, data['subjects']):
+            subject_data.update(correct=subject.correct, total=subject.total, percentage=subject.percentage)
+            for level, level_data in zip(subject.levels, subject_data['levels']):
+                level_data['percentage'] = level.percentage
+        for question, question_data in zip(self.questions, data['questions']):
+            question_data['is_correct'] = question.is_correct
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            submission_id=data['submission_id'],
+            submitted_at=data['submitted_at'],
+            student=StudentInfo(**data['student']),
+            score=data['score'],
+            answered=data['answered'],
+            subjects=[
+                SubjectResult(
+                    subject_id=subject['subject_id'],
+                    name=subject['name'],
+                    levels=[LevelResult(level['level'], level['correct'], level['total']) for level in subject['levels']],
+                )
+                for subject in data['subjects']
+            ],
+            questions=[
+                QuestionResult(
+                    question_id=question['question_id'],
+                    subject_id=question['subject_id'],
+                    level=question['level'],
+                    text=question['text'],
+                    student_answer=question['student_answer'],
+                    correct_answer=question['correct_answer'],
+                )
+                for question in data['questions']
+            ],
+        )
+
+
+def build_report_data(submission_id):
+    """
+    Load a submission and aggregate its results in a fixed number of queries: the
+    submission with its student, its subjects, and every answered question.
+    Archived submissions are read from their partition file instead.
+    """
+    submission = StudentSubmission.objects.select_related('student').filter(id=submission_id).first()
+    if submission is None:
+        from .archive import archived_report_data
+
+        report = archived_report_data(submission_id)
+        if report is None:
+            raise Http404("No submission matches the given query.")
+        return report
+    return report_data_for(submission)
+
+
+def _answers_by_id(submission):
+    """{question_id: option} with int ids, read from the packed arrays when possible."""
+    packed = submission.packed_answers()
+    if packed is not None:
+        # Ids are already ints and sorted, no JSON to parse
+        return dict(zip(packed.question_ids, packed.options))
+    return {int(qid): option for qid, option in (submission.answers or {}).items() if str(qid).isdigit()}
+
+
+def _question_rows(question_ids):
+    return (
+        Question.objects
+        .filter(id__in=question_ids)
+        .order_by('subject_id', 'level', 'id')
+        .values_list('id', 'subject_id', 'level', 'question_text', 'correct_option')
+    )
+
+
+def report_data_for(submission):
+    """Same as build_report_data() for an already loaded submission (with its student)."""
+    answers = _answers_by_id(submission)
+    subjects = list(submission.subjects.order_by('id').values_list('id', 'name'))
+    rows = list(_question_rows(list(answers)))
+    # Seeded papers are scored against the answer key frozen in their snapshot
+    key = answer_key(list(answers), snapshot_id=submission.snapshot_id) if submission.snapshot_id else {}
+    return _assemble(submission, answers, subjects, rows, key)
+
+
+def report_data_for_many(submissions):
+    """
+    report_data_for() over a batch of submissions loaded with their student and
+    prefetched subjects, sharing one question query for the whole batch.
+    """
+    answers = {submission.id: _answers_by_id(submission) for submission in submissions}
+    all_ids = sorted({qid for by_id in answers.values() for qid in by_id})
+    rows_by_id = {row[0]: row for row in _question_rows(all_ids)}
+    keys = {}
+    for submission in submissions:
+        if submission.snapshot_id and submission.snapshot_id not in keys:
+            keys[submission.snapshot_id] = answer_key(all_ids, snapshot_id=submission.snapshot_id)
+
+    reports = []
+    for submission in submissions:
+        mine = answers[submission.id]
+        subjects = sorted((subject.id, subject.name) for subject in submission.subjects.all())
+        rows = sorted((rows_by_id[qid] for qid in mine if qid in rows_by_id), key=lambda row: (row[1], row[2], row[0]))
+        reports.append(_assemble(submission, mine, subjects, rows, keys.get(submission.snapshot_id, {})))
+    return reports
+
+
+def _assemble(submission, answers, subjects, rows, key):
+    student = submission.student
+    results = {subject_id: SubjectResult(subject_id, name) for subject_id, name in subjects}
+    questions = []
+    for question_id, subject_id, level, text, correct_option in rows:
+        question = QuestionResult(
+            question_id=question_id,
+            subject_id=subject_id,
+            level=level,
+            text=text,
+            student_answer=answers.get(question_id),
+            correct_answer=key.get(question_id, correct_option),
+        )
+        questions.append(question)
+        if subject_id in results and level in LEVELS:
+            level_result = results[subject_id].level(level)
+            level_result.total += 1
+            level_result.correct += int(question.is_correct)
+
+    return ReportData(
+        submission_id=submission.id,
+        submitted_at=submission.submitted_at.isoformat(),
+        student=StudentInfo(student.id, student.name, student.classLevel, student.school),
+        score=submission.score,
+        answered=len(answers),
+        subjects=list(results.values()),
+        questions=questions,
+    )
+
+
+def report_cache_key(submission_id):
+    return f"omr:report:{submission_id}"
+
+
+def report_cache_ttl():
+    return getattr(settings, 'OMR_REPORT_CACHE_TTL', 3600)
+
+
+def drop_cached_reports(submission_ids, chunk_size=1000):
+    """Forget the cached results of some submissions (any iterable of ids, e.g. a values_list)."""
+    submission_ids = iter(submission_ids)
+    while chunk := list(islice(submission_ids, chunk_size)):
+        cache.delete_many([report_cache_key(submission_id) for submission_id in chunk])
+
+
+def cached_report_payload(submission_id):
+    """
+    (payload dict, etag) for a submission's results. Saving the submission, or a question,
+    subject or student it shows, drops the cached copy; anything else (e.g. archived
+    submissions) is picked up within OMR_REPORT_CACHE_TTL seconds. The ETag is a hash
+    of the payload, so it changes whenever results do.
+    """
+    key = report_cache_key(submission_id)
+    cached = cache.get(key)
+    if cached is None:
+        payload = build_report_data(submission_id).to_dict()
+        etag = hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+        cached = (payload, f'"{etag}"')
+        cache.set(key, cached, report_cache_ttl())
+    return cached
@@ -0,0 +1,265 @@
+"""
+Rescoring after an answer key correction.
+
+A submission's score, subject scores and the correct bits of its packed answers are
+computed once, against the answer key of the day. When a question's correct_option is
+corrected, every submission that answered it is stale:
+
+* SubmissionAnswer indexes submissions by the questions they answered. A signal keeps
+  it current for saved submissions; bulk loads that skip signals (seeding, edge sync)
+  index their rows themselves, migration 0025 indexed the submissions saved before
+  the index existed, and the index_answers command rebuilds it.
+* A correction is explicit: the "answer key correction" box of the question admin form
+  (or correct_key()) records an AnswerKeyCorrection, which also overrides the key frozen
+  in snapshots so seeded papers pick it up, and queues a RescoreJob for it. Saving a
+  different correct_option without it, e.g. after reordering the options, only changes
+  the live bank: papers issued from snapshots keep the key they were served with.
+* run_job() walks the affected submissions in id order, OMR_RESCORE['batch_size'] at a
+  time: each is scored again against its key (snapshot or live bank), its answers
+  re-packed with the new correct bits and its subject scores recounted, the changed
+  rows are written with one bulk_update and their cached reports dropped. Progress is
+  saved after every batch, so a job that stopped resumes after its last batch.
+
+The corrections are cached like the other exam-start lookups: the job runs in the
+process that recorded the correction and sees it at once, other processes within
+OMR_EXAM_CACHE_TTL seconds (or at once with a shared cache backend).
+
+Jobs run in a background thread of the process that saved the correction, after the
+transaction commits (OMR_RESCORE['background']). A run claims its job with a
+conditional UPDATE, so a job never runs twice at once. The rescore_submissions command
+runs jobs in the foreground and picks up queued and failed ones, and running ones whose
+process died (no batch for OMR_RESCORE['stale_after'] seconds), e.g. after a restart.
+
+Archived submissions (archive.py) are not rescored: their partition files are read-only
+and keep the answer key they were scored with, so their results and reports stay as
+issued. The admin says so when a correction is saved while archives exist.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Prefetch, Q, Sum
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .adaptive import invalidate_item_table
+from .exam_cache import KEY_CORRECTIONS_KEY
+from .models import (
+    AnswerKeyCorrection, Question, RescoreJob, StudentSubmission, Subject, SubmissionAnswer, SubmissionArchive,
+)
+from .papers import answer_key
+from .reports import report_cache_key
+
+logger = logging.getLogger(__name__)
+
+ANSWER_FIELDS = {'answers_json', 'answers_packed'}
+
+
+def rescore_settings():
+    config = {'batch_size': 1000, 'background': True, 'stale_after': 600}
+    config.update(getattr(settings, 'OMR_RESCORE', {}))
+    return config
+
+
+# --- Question -> submission index ---
+
+def answered_ids(submission):
+    packed = submission.packed_answers()
+    if packed is not None:
+        return packed.question_ids
+    return sorted({int(qid) for qid in (submission.answers_json or {}) if str(qid).isdigit()})
+
+
+def index_submissions(submissions, replace=True):
+    """Write the index rows of some submissions (replacing their old ones unless new)."""
+    rows = [
+        SubmissionAnswer(question_id=qid, submission_id=submission.id)
+        for submission in submissions for qid in answered_ids(submission)
+    ]
+    with transaction.atomic():
+        if replace:
+            SubmissionAnswer.objects.filter(submission_id__in=[submission.id for submission in submissions]).delete()
+        SubmissionAnswer.objects.bulk_create(rows, batch_size=5000)
+    return len(rows)
+
+
+def rebuild_index(batch_size=2000):
+    """Index every submission from scratch. Returns the number of submissions indexed."""
+    count = 0
+    with transaction.atomic():
+        SubmissionAnswer.objects.all().delete()
+        batch = []
+        submissions = StudentSubmission.objects.order_by('id').only('id', 'answers_json', 'answers_packed')
+        for submission in submissions.iterator(chunk_size=batch_size):
+            batch.append(submission)
+            if len(batch) >= batch_size:
+                index_submissions(batch, replace=False)
+                count += len(batch)
+                batch = []
+        if batch:
+            index_submissions(batch, replace=False)
+            count += len(batch)
+    return count
+
+
+@receiver(post_save, sender=StudentSubmission)
+def submission_answers_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not raw and (update_fields is None or ANSWER_FIELDS & set(update_fields)):
+        index_submissions([instance], replace=not created)
+
+
+# --- Key corrections ---
+
+def correct_key(question, previous_option):
+    """
+    Record a corrected key (question.correct_option, already saved) and queue the
+    rescoring of the submissions that answered the question.
+    """
+    AnswerKeyCorrection.objects.update_or_create(
+        question=question, defaults={'correct_option': question.correct_option, 'previous_option': previous_option},
+    )
+    transaction.on_commit(lambda: cache.delete(KEY_CORRECTIONS_KEY))
+    # Adaptive item statistics count correct answers against the key
+    transaction.on_commit(lambda: invalidate_item_table(question.subject_id))
+    job = RescoreJob.objects.create(question_ids=[question.id])
+    transaction.on_commit(lambda: start_job(job.id))
+    return job
+
+
+# --- Jobs ---
+
+def start_job(job_id):
+    if not rescore_settings()['background']:
+        return run_job(job_id)
+    threading.Thread(target=_run_in_thread, args=(job_id,), name=f'omr-rescore-{job_id}', daemon=True).start()
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        connections.close_all()
+
+
+def archived_submissions():
+    """Number of archived submissions, which rescoring doesn't reach."""
+    return SubmissionArchive.objects.filter(kind='submission').aggregate(n=Sum('record_count'))['n'] or 0
+
+
+def claimable():
+    """Jobs a run may take: queued, failed, or running without a batch for OMR_RESCORE['stale_after'] seconds."""
+    stale = timezone.now() - timedelta(seconds=rescore_settings()['stale_after'])
+    return Q(status__in=('queued', 'failed')) | Q(status='running', heartbeat_at__lt=stale)
+
+
+def unfinished_jobs():
+    return RescoreJob.objects.filter(claimable()).order_by('id')
+
+
+def run_job(job_id, batch_size=None, progress=None):
+    """
+    Rescore the submissions of a job from its cursor on. `progress(job)` is called after
+    every batch. Returns the job; a failure is recorded on it and logged. A job that is
+    done or running elsewhere is returned as it is.
+    """
+    batch_size = batch_size or rescore_settings()['batch_size']
+    now = timezone.now()
+    claimed = RescoreJob.objects.filter(claimable(), id=job_id).update(status='running', error='', heartbeat_at=now)
+    job = RescoreJob.objects.get(id=job_id)
+    if not claimed:
+        return job
+    affected = (
+        SubmissionAnswer.objects.filter(question_id__in=job.question_ids)
+        .order_by('submission_id').values_list('submission_id', flat=True).distinct()
+    )
+    if job.started_at is None:
+        job.total = affected.count()
+        job.started_at = now
+        job.save(update_fields=['total', 'started_at'])
+
+    try:
+        while True:
+            ids = list(affected.filter(submission_id__gt=job.cursor)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                job.changed += rescore_submissions(ids)
+                job.processed += len(ids)
+                job.cursor = ids[-1]
+                job.heartbeat_at = timezone.now()
+                job.save(update_fields=['processed', 'changed', 'cursor', 'heartbeat_at'])
+            if progress:
+                progress(job)
+    except Exception as e:
+        logger.exception("Rescore job %s failed", job.id)
+        job.status, job.error, job.finished_at = 'failed', f"{type(e).__name__}: {e}", timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+
+    job.status, job.finished_at = 'done', timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    return job
+
+
+def count_subject_scores(answers, key, names, subject_of, previous=None):
+    """
+    Correct answers per subject name. `names` maps the submission's subject ids to their
+    names and `subject_of` question ids to subject ids; subjects of `previous` (the old
+    subject scores) stay in the result, at 0 if nothing counts for them any more.
+    """
+    subject_scores = {name: 0 for name in previous or {}}
+    subject_scores.update((name, 0) for name in names.values())
+    for qid, option in answers.items():
+        if str(qid).isdigit():
+            name = names.get(subject_of.get(int(qid)))
+            if name is not None and option == key.get(int(qid)):
+                subject_scores[name] += 1
+    return subject_scores
+
+
+def rescore_submissions(submission_ids):
+    """
+    Score submissions again against their current keys and write the changed ones.
+    Returns the number whose score or subject scores changed.
+    """
+    submissions = list(
+        StudentSubmission.objects.filter(id__in=submission_ids)
+        .only('id', 'answers_json', 'answers_packed', 'score', 'subject_scores', 'snapshot_id')
+        .prefetch_related(Prefetch('subjects', queryset=Subject.objects.only('id', 'name')))
+    )
+    answered = {submission.id: answered_ids(submission) for submission in submissions}
+    question_ids = sorted({qid for ids in answered.values() for qid in ids})
+    subject_of = dict(Question.objects.filter(id__in=question_ids).values_list('id', 'subject_id'))
+    keys = {}
+    for submission in submissions:
+        if submission.snapshot_id not in keys:
+            keys[submission.snapshot_id] = answer_key(question_ids, snapshot_id=submission.snapshot_id)
+
+    updated, changed = [], 0
+    for submission in submissions:
+        before = (submission.score, submission.subject_scores, submission.answers_packed, submission.answers_json)
+        key = keys[submission.snapshot_id]
+        packed = submission.packed_answers()
+        answers = dict(packed.items()) if packed is not None else submission.answers
+        submission.score = submission.encode_answers(key)
+
+        names = {subject.id: subject.name for subject in submission.subjects.all()}
+        if submission.subject_scores is not None or names:
+            submission.subject_scores = count_subject_scores(
+                answers, key, names, subject_of, previous=submission.subject_scores,
+            )
+
+        after = (submission.score, submission.subject_scores, submission.answers_packed, submission.answers_json)
+        if after != before:
+            updated.append(submission)
+            changed += (after[:2] != before[:2])
+    StudentSubmission.objects.bulk_update(
+        updated, ['score', 'subject_scores', 'answers_packed', 'answers_json'], batch_size=500,
+    )
+    # bulk_update skips the save signal that drops cached reports
+    cache.delete_many([report_cache_key(submission.id) for submission in updated])
+    return changed
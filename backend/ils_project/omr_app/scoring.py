@@ -0,0 +1,96 @@
+"""
+Scoring of submitted papers, shared by submit_answers and the offline results import.
+
+Seeded papers (a draft pinned to a snapshot) are scored on the questions of the paper
+with the snapshot's answer key, adaptive papers on the questions they served (and keep
+the ability estimate of each subject); anything else against every question of its
+subjects.
+"""
+from django.db import transaction
+
+from .models import ExamDraft, Question, StudentSubmission, Subject
+from .papers import answer_key, paper_question_ids
+
+
+class AlreadySubmitted(Exception):
+    """The draft was closed by another submission (e.g. a concurrent double submit)."""
+
+    def __init__(self, submission_id):
+        super().__init__(f"Paper already submitted as submission {submission_id}")
+        self.submission_id = submission_id
+
+
+def score_answers(student, subject_ids, answers, draft=None):
+    """(score, total, {subject name: correct}) for answers {question id (str): option}."""
+    score = 0
+    total = 0
+    subject_scores = {}
+    adaptive_states = draft.adaptive if draft is not None else {}
+    for subject in Subject.objects.filter(id__in=subject_ids):
+        if adaptive_states:
+            # Adaptive papers: the questions served, whether answered or not
+            served = (adaptive_states.get(str(subject.id)) or {}).get('served', [])
+            key = dict(Question.objects.filter(id__in=served).values_list('id', 'correct_option'))
+        elif draft is not None and draft.snapshot_id:
+            # Seeded papers: only questions on the paper count, scored with the snapshot's key
+            paper_ids = paper_question_ids(draft.snapshot_id, student.id, [subject.id], draft.paper_key)
+            key = answer_key(paper_ids, snapshot_id=draft.snapshot_id)
+        else:
+            key = dict(Question.objects.filter(subject=subject).values_list('id', 'correct_option'))
+        correct = 0
+        for qid, correct_option in key.items():
+            if answers.get(str(qid)) == correct_option:
+                correct += 1
+        score += correct
+        total += len(key)
+        subject_scores[subject.name] = correct
+    return score, total, subject_scores
+
+
+def adaptive_abilities(draft):
+    """{subject id (str): ability estimate} of an adaptive draft's subjects, or None."""
+    if draft is None or not draft.adaptive:
+        return None
+    return {
+        subject_id: {
+            'ability': round(state['theta'], 3),
+            'standard_error': round(state['se'], 3),
+            'served': len(state['served']),
+        }
+        for subject_id, state in draft.adaptive.items()
+    }
+
+
+def record_submission(student, subject_ids, answers, draft=None):
+    """
+    Score a paper and store it as a StudentSubmission (closing the draft). Returns
+    (submission, total).
+
+    The draft is claimed with a conditional UPDATE inside the same transaction, so of two
+    concurrent submits of one paper only the first stores a submission; the other rolls
+    back and raises AlreadySubmitted.
+    """
+    score, total, subject_scores = score_answers(student, subject_ids, answers, draft)
+    with transaction.atomic():
+        submission = StudentSubmission.objects.create(
+            student=student,
+            answers=answers,
+            score=score,
+            subject_scores=subject_scores,
+            exam_session=draft.paper_key if draft is not None and draft.snapshot_id else '',
+            snapshot_id=draft.snapshot_id if draft is not None else None,
+            abilities=adaptive_abilities(draft),
+        )
+        submission.subjects.set(subject_ids)
+
+        if draft is not None:
+            claimed = ExamDraft.objects.filter(id=draft.id, submission__isnull=True).update(submission=submission)
+            if not claimed:
+                raise AlreadySubmitted(
+                    ExamDraft.objects.filter(id=draft.id).values_list('submission_id', flat=True).first()
+                )
+            draft.answers = answers
+            draft.submission = submission
+            # Saved again so the draft's signals (live dashboard) still see the submission
+            draft.save(update_fields=['answers', 'submission', 'updated_at'])
+    return submission, total
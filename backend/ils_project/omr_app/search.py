@@ -0,0 +1,199 @@
+"""
+Full-text search over the question bank.
+
+Searches go through a backend chosen with OMR_SEARCH_BACKEND (a dotted path), or by
+database vendor when unset:
+
+* SQLiteFTSBackend: an FTS5 virtual table (omr_question_fts, rowid = question id) with
+  the question text, the options and the subject, level and board to filter on. Results
+  are ranked with bm25 (text weighted above options), and the last search term matches
+  as a prefix, so typing "photosyn" finds "photosynthesis".
+* DatabaseBackend: unindexed icontains lookups, for databases without a full-text
+  backend here.
+
+The index follows Question and Subject saves and deletes through signals. Bulk inserts
+skip signals, so run rebuild_search_index after them (the migration builds it once).
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Question, Subject, normalize_board
+
+FTS_TABLE = 'omr_question_fts'
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "question_text, options, subject_id UNINDEXED, level UNINDEXED, board UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+DROP_FTS_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+POPULATE_FTS_SQL = (
+    f"INSERT INTO {FTS_TABLE} (rowid, question_text, options, subject_id, level, board) "
+    "SELECT q.id, q.question_text, "
+    "q.option_a || ' ' || q.option_b || ' ' || q.option_c || ' ' || q.option_d, "
+    "q.subject_id, q.level, s.board "
+    "FROM omr_app_question q JOIN omr_app_subject s ON s.id = q.subject_id"
+)
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query or '')
+
+
+class SearchBackend:
+    """What a search backend provides. Results are dicts with id, rank and snippet, best first."""
+
+    def search(self, query, subject_ids=None, levels=None, board=None, limit=20, offset=0):
+        raise NotImplementedError
+
+    def filter_queryset(self, queryset, query):
+        """Narrow a Question queryset to matches (the admin changelist applies its own ordering)."""
+        raise NotImplementedError
+
+    def index(self, question):
+        pass
+
+    def remove(self, question_id):
+        pass
+
+    def subject_changed(self, subject):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class DatabaseBackend(SearchBackend):
+    FIELDS = ('question_text', 'option_a', 'option_b', 'option_c', 'option_d')
+
+    def _matches(self, queryset, query):
+        for term in search_terms(query):
+            condition = Q()
+            for field in self.FIELDS:
+                condition |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def filter_queryset(self, queryset, query):
+        return self._matches(queryset, query)
+
+    def search(self, query, subject_ids=None, levels=None, board=None, limit=20, offset=0):
+        if not search_terms(query):
+            return []
+        questions = Question.objects.all()
+        if subject_ids:
+            questions = questions.filter(subject_id__in=subject_ids)
+        if levels:
+            questions = questions.filter(level__in=levels)
+        if board:
+            questions = questions.filter(subject__board=normalize_board(board))
+        ids = self._matches(questions, query).order_by('id').values_list('id', flat=True)[offset:offset + limit]
+        return [{'id': qid, 'rank': 0.0, 'snippet': None} for qid in ids]
+
+
+class SQLiteFTSBackend(SearchBackend):
+    @property
+    def connection(self):
+        return connections[router.db_for_write(Question)]
+
+    def match_expression(self, query):
+        """User text to an FTS5 query: every term quoted (no operator injection), the last one as a prefix."""
+        terms = ['"%s"' % term.replace('"', '') for term in search_terms(query)]
+        if terms:
+            terms[-1] += '*'
+        return ' '.join(terms)
+
+    def filter_queryset(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset
+        return queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression]))
+
+    def search(self, query, subject_ids=None, levels=None, board=None, limit=20, offset=0):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        where, params = [f"{FTS_TABLE} MATCH %s"], [expression]
+        if subject_ids:
+            where.append(f"subject_id IN ({', '.join(['%s'] * len(subject_ids))})")
+            params += list(subject_ids)
+        if levels:
+            where.append(f"level IN ({', '.join(['%s'] * len(levels))})")
+            params += list(levels)
+        if board:
+            where.append("board = %s")
+            params.append(normalize_board(board))
+        sql = (
+            f"SELECT rowid, bm25({FTS_TABLE}, 10.0, 1.0), "
+            f"snippet({FTS_TABLE}, 0, '[', ']', '...', 16) "
+            f"FROM {FTS_TABLE} WHERE {' AND '.join(where)} ORDER BY 2 LIMIT %s OFFSET %s"
+        )
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit, offset])
+            # bm25 is lower for better matches; flip it so higher rank means better
+            return [{'id': qid, 'rank': round(-score, 4), 'snippet': snippet} for qid, score, snippet in cursor.fetchall()]
+
+    def index(self, question):
+        options = ' '.join([question.option_a, question.option_b, question.option_c, question.option_d])
+        board = Subject.objects.filter(id=question.subject_id).values_list('board', flat=True).first()
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [question.id])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, question_text, options, subject_id, level, board) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                [question.id, question.question_text, options, question.subject_id, question.level, board],
+            )
+
+    def remove(self, question_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [question_id])
+
+    def subject_changed(self, subject):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {FTS_TABLE} SET board = %s WHERE subject_id = %s", [subject.board, subject.id])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(DROP_FTS_SQL)
+            cursor.execute(CREATE_FTS_SQL)
+            cursor.execute(POPULATE_FTS_SQL)
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'OMR_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connections[router.db_for_write(Question)].vendor == 'sqlite':
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = DatabaseBackend()
+    return _backend
+
+
+@receiver(post_save, sender=Question)
+def question_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted(sender, instance, **kwargs):
+    get_backend().remove(instance.id)
+
+
+@receiver(post_save, sender=Subject)
+def subject_saved(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        get_backend().subject_changed(instance)
@@ -0,0 +1,84 @@
+"""
+Synthetic datasets for benchmarks.
+
+seed_dataset() bulk-creates a question bank, students and scored submissions from a
+seeded RNG, so benchmark runs are reproducible. Benchmark commands call it inside a
+transaction they roll back, leaving the real data untouched.
+"""
+import random
+
+from .models import Question, Student, StudentSubmission, Subject
+from .rescoring import index_submissions
+
+OPTIONS = 'ABCD'
+
+
+class Rollback(Exception):
+    """Raised at the end of a benchmark to roll back its seeded data."""
+
+
+def seed_dataset(seed=0, students=100, subjects=4, questions_per_level=25,
+                 board='CBSE', class_level=10, schools=5, per_level=5):
+    """
+    Create `subjects` subjects with `questions_per_level` questions on each of the four
+    levels, and one submission per student answering `per_level` random questions per
+    level of every subject. Returns (subjects, submissions).
+    """
+    rng = random.Random(seed)
+    subject_objs = Subject.objects.bulk_create([
+        Subject(name=f"Bench Subject {i + 1}", board=board, class_level=class_level) for i in range(subjects)
+    ])
+    questions = Question.objects.bulk_create([
+        Question(
+            subject=subject,
+            question_text=f"Benchmark question {subject.id}-{level}-{n} " + " ".join(
+                rng.choice(('force', 'energy', 'cell', 'atom', 'ratio', 'graph', 'plant', 'acid')) for _ in range(8)
+            ),
+            option_a="Option A", option_b="Option B", option_c="Option C", option_d="Option D",
+            correct_option=rng.choice(OPTIONS),
+            level=level,
+        )
+        for subject in subject_objs for level in (1, 2, 3, 4) for n in range(questions_per_level)
+    ])
+
+    pools = {}
+    for q in questions:
+        pools.setdefault((q.subject_id, q.level), []).append(q)
+
+    student_objs = Student.objects.bulk_create([
+        Student(
+            name=f"Bench Student {i + 1}", school=f"School {i % schools + 1}", fatherName="F", motherName="M",
+            address="Benchmark", favouriteSubject="Maths", classLevel=str(class_level), stream="Science",
+            fatherOccupation="-", motherOccupation="-", phone="0000000000",
+        )
+        for i in range(students)
+    ])
+
+    key = {q.id: q.correct_option for q in questions}
+    submissions = []
+    for student in student_objs:
+        # Stronger students get more right, so distributions look realistic
+        ability = rng.random()
+        answers, subject_scores, score = {}, {}, 0
+        for subject in subject_objs:
+            correct = 0
+            for level in (1, 2, 3, 4):
+                for q in rng.sample(pools[(subject.id, level)], min(per_level, questions_per_level)):
+                    right = rng.random() < ability * (1.1 - level * 0.15)
+                    answers[str(q.id)] = q.correct_option if right else rng.choice(OPTIONS)
+                    correct += answers[str(q.id)] == q.correct_option
+            subject_scores[subject.name] = correct
+            score += correct
+        submission = StudentSubmission(student=student, answers=answers, score=score, subject_scores=subject_scores)
+        submission.encode_answers(key)
+        submissions.append(submission)
+    # bulk_create skips the pre_save scoring signal; scores are computed above
+    submissions = StudentSubmission.objects.bulk_create(submissions)
+
+    through = StudentSubmission.subjects.through
+    through.objects.bulk_create([
+        through(studentsubmission_id=submission.id, subject_id=subject.id)
+        for submission in submissions for subject in subject_objs
+    ])
+    index_submissions(submissions, replace=False)
+    return subject_objs, submissions
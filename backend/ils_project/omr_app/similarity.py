@@ -0,0 +1,330 @@
+"""
+Near-duplicate question detection with MinHash and locality-sensitive hashing.
+
+A question's text and options are normalised and cut into shingles (5-character
+slices of the text, so a small edit only changes a few of them, plus each option as a
+whole). NUM_PERM hash permutations of the shingle set
+give its MinHash signature: the share of equal positions in two signatures estimates
+the Jaccard similarity of the two questions.
+
+The signature is split into BANDS bands of ROWS values. Each band is hashed into a
+QuestionLSHBucket row. Questions that share any bucket are duplicate candidates; with
+8 bands of 8 rows, pairs above ~0.8 similarity almost always collide and pairs below
+~0.5 almost never do. Candidates are then checked against their signatures. Finding
+the duplicates of one question is an indexed lookup rather than a comparison with every
+other question.
+
+Signatures are kept up to date by a post_save signal; migration 0028 indexed the
+questions saved before it. The index_questions command rebuilds them all (with NumPy)
+after bulk imports, which skip signals.
+"""
+import hashlib
+import random
+import re
+import struct
+import zlib
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Question, QuestionLSHBucket, QuestionSignature
+
+SHINGLE = 5
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+MASK64 = (1 << 64) - 1
+OPTION_TAG = 1 << (8 * SHINGLE)  # Keeps option shingles apart from text slices
+_rng = random.Random(20240601)  # Fixed (and copied in migration 0028): stored signatures must stay comparable
+PERM_A = [_rng.randrange(1, 1 << 64) | 1 for _ in range(NUM_PERM)]
+PERM_B = [_rng.randrange(0, 1 << 64) for _ in range(NUM_PERM)]
+EMPTY = (0xFFFFFFFF,) * NUM_PERM
+
+
+def duplicate_threshold():
+    return getattr(settings, 'OMR_DUPLICATE_THRESHOLD', 0.8)
+
+
+def _normalise(text):
+    return ' '.join(re.findall(r'\w+', (text or '').lower()))
+
+
+def _option_shingles(options):
+    return [OPTION_TAG | zlib.crc32(option.encode('utf-8')) for option in map(_normalise, options) if option]
+
+
+def shingles(text, options=()):
+    """
+    Integer shingles of a question: every SHINGLE-byte slice of the normalised text read
+    as a little-endian number (the whole text if shorter), plus a crc32 per option.
+    """
+    data = _normalise(text).encode('utf-8')
+    values = [int.from_bytes(data[i:i + SHINGLE], 'little') for i in range(len(data) - SHINGLE + 1)]
+    if 0 < len(data) < SHINGLE:
+        values.append(int.from_bytes(data, 'little'))
+    return values + _option_shingles(options)
+
+
+def signature(text, options=()):
+    """MinHash signature (NUM_PERM ints) of a question's text and options."""
+    values = set(shingles(text, options))
+    if not values:
+        return EMPTY
+    # Multiply-shift hashing: the top 32 bits of a * x + b modulo 2**64
+    return tuple(min(((a * x + b) & MASK64) >> 32 for x in values) for a, b in zip(PERM_A, PERM_B))
+
+
+def signatures_numpy(texts, chunk_size=500):
+    """signature() for many (text, options) pairs; same values, computed with array operations."""
+    import numpy as np
+
+    result = []
+    for start in range(0, len(texts), chunk_size):
+        result.extend(_signature_chunk(np, texts[start:start + chunk_size]))
+    return result
+
+
+def _signature_chunk(np, texts):
+    datas = [_normalise(text).encode('utf-8') for text, _options in texts]
+    lengths = np.array([len(data) for data in datas], dtype=np.int64)
+    total = int(lengths.sum())
+
+    # Every SHINGLE-byte window of the concatenated texts, kept where it lies inside one text
+    buffer = np.frombuffer(b''.join(datas) + bytes(SHINGLE), dtype=np.uint8).astype(np.uint64)
+    windows = np.zeros(total, dtype=np.uint64)
+    for j in range(SHINGLE):
+        windows |= buffer[j:j + total] << np.uint64(8 * j)
+    owner = np.repeat(np.arange(len(texts)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    inside = np.arange(total) - offsets[owner] <= lengths[owner] - SHINGLE
+
+    # Short texts and options are few; they are added from Python
+    extra_values, extra_owner = [], []
+    for k, (data, (_text, options)) in enumerate(zip(datas, texts)):
+        values = _option_shingles(options)
+        if 0 < len(data) < SHINGLE:
+            values.append(int.from_bytes(data, 'little'))
+        extra_values += values
+        extra_owner += [k] * len(values)
+
+    values = np.concatenate([windows[inside], np.array(extra_values, dtype=np.uint64)])
+    owner = np.concatenate([owner[inside], np.array(extra_owner, dtype=np.int64)])
+    order = np.argsort(owner, kind='stable')
+    values, owner = values[order], owner[order]
+    present, starts = np.unique(owner, return_index=True)
+
+    a = np.array(PERM_A, dtype=np.uint64)
+    b = np.array(PERM_B, dtype=np.uint64)
+    # One row per permutation, so the per-question minimum runs over contiguous memory
+    hashed = (a[:, None] * values + b[:, None]) >> np.uint64(32)  # uint64 arithmetic wraps modulo 2**64
+    minima = np.minimum.reduceat(hashed, starts, axis=1).T if len(values) else hashed.T
+
+    result = [EMPTY] * len(texts)
+    for k, row in zip(present.tolist(), minima.tolist()):
+        result[k] = tuple(row)
+    return result
+
+
+def question_signature(question):
+    return signature(question.question_text, _options(question))
+
+
+def _options(question):
+    return (question.option_a, question.option_b, question.option_c, question.option_d)
+
+
+def pack_signature(values):
+    return struct.pack(f'<{NUM_PERM}I', *values)
+
+
+def unpack_signature(data):
+    return struct.unpack(f'<{NUM_PERM}I', bytes(data))
+
+
+def band_buckets(values):
+    """The signed 64-bit bucket hash of each band (band number included)."""
+    return [
+        int.from_bytes(
+            hashlib.blake2b(struct.pack(f'<B{ROWS}I', band, *values[band * ROWS:(band + 1) * ROWS]),
+                            digest_size=8).digest(),
+            'little', signed=True,
+        )
+        for band in range(BANDS)
+    ]
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures."""
+    if first == EMPTY or second == EMPTY:
+        return 0.0
+    return sum(x == y for x, y in zip(first, second)) / NUM_PERM
+
+
+def _bucket_rows(question_id, values):
+    if values == EMPTY:
+        return []
+    return [QuestionLSHBucket(question_id=question_id, band=band, bucket=bucket)
+            for band, bucket in enumerate(band_buckets(values))]
+
+
+def index_question(question):
+    """Store a question's signature and replace its LSH buckets."""
+    values = question_signature(question)
+    with transaction.atomic():
+        QuestionSignature.objects.update_or_create(question_id=question.id, defaults={'signature': pack_signature(values)})
+        QuestionLSHBucket.objects.filter(question_id=question.id).delete()
+        QuestionLSHBucket.objects.bulk_create(_bucket_rows(question.id, values))
+    return values
+
+
+def rebuild_index(batch_size=2000):
+    """Recompute every question's signature and bucket rows. Returns the number indexed."""
+    count = 0
+    with transaction.atomic():
+        QuestionLSHBucket.objects.all().delete()
+        QuestionSignature.objects.all().delete()
+        rows = Question.objects.order_by('id').values_list(
+            'id', 'question_text', 'option_a', 'option_b', 'option_c', 'option_d'
+        )
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                count += _index_batch(batch)
+                batch = []
+        if batch:
+            count += _index_batch(batch)
+    return count
+
+
+def _index_batch(rows):
+    values = signatures_numpy([(text, options) for _qid, text, *options in rows])
+    _insert(QuestionSignature, ['question_id', 'signature'], [
+        (row[0], pack_signature(v)) for row, v in zip(rows, values)
+    ])
+    _insert(QuestionLSHBucket, ['question_id', 'band', 'bucket'], [
+        (row[0], band, bucket)
+        for row, v in zip(rows, values) if v != EMPTY
+        for band, bucket in enumerate(band_buckets(v))
+    ])
+    return len(rows)
+
+
+def _insert(model, columns, rows):
+    """Plain executemany INSERT; a full rebuild writes ~9 rows per question and model instances dominate otherwise."""
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {quote(model._meta.db_table)} ({', '.join(map(quote, columns))}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _signatures(question_ids):
+    return {
+        qid: unpack_signature(data)
+        for qid, data in QuestionSignature.objects.filter(question_id__in=question_ids).values_list('question_id', 'signature')
+    }
+
+
+def _bank_matches(values, threshold, exclude_id=None, limit=10):
+    if values == EMPTY:
+        return []
+    candidates = set(
+        QuestionLSHBucket.objects.filter(bucket__in=band_buckets(values)).values_list('question_id', flat=True)
+    )
+    candidates.discard(exclude_id)
+    matches = [(qid, similarity(values, other)) for qid, other in _signatures(candidates).items()]
+    matches = [(qid, round(score, 3)) for qid, score in matches if score >= threshold]
+    return sorted(matches, key=lambda match: (-match[1], match[0]))[:limit]
+
+
+def find_similar(text, options=(), threshold=None, exclude_id=None, limit=10):
+    """Indexed questions similar to the given text and options, best first, as (question id, similarity) pairs."""
+    threshold = duplicate_threshold() if threshold is None else threshold
+    return _bank_matches(signature(text, options), threshold, exclude_id, limit)
+
+
+def check_import(rows, threshold=None):
+    """
+    Duplicate check for questions about to be imported: rows are dicts with
+    question_text and option_a..option_d. For each row, returns its near-duplicates
+    in the bank and earlier rows of the same batch it duplicates.
+    """
+    threshold = duplicate_threshold() if threshold is None else threshold
+    seen = {}  # bucket: indexes of earlier rows
+    signatures = []
+    results = []
+    for index, row in enumerate(rows):
+        values = signature(row.get('question_text'), [row.get(f'option_{x}') for x in 'abcd'])
+        signatures.append(values)
+        earlier = set()
+        for bucket in (band_buckets(values) if values != EMPTY else []):
+            earlier.update(seen.get(bucket, ()))
+            seen.setdefault(bucket, []).append(index)
+        batch_matches = sorted(
+            (other, round(similarity(values, signatures[other]), 3)) for other in earlier
+            if similarity(values, signatures[other]) >= threshold
+        )
+        results.append({
+            'index': index,
+            'matches': [{'question_id': qid, 'similarity': score} for qid, score in _bank_matches(values, threshold)],
+            'batch_matches': [{'index': other, 'similarity': score} for other, score in batch_matches],
+        })
+    return results
+
+
+def duplicate_groups(threshold=None, limit=None):
+    """
+    Clusters of near-duplicate questions across the bank, largest first, as lists of
+    (question id, similarity to the cluster's first question). Only buckets shared by
+    several questions are read; members are checked against the bucket's first question.
+    """
+    threshold = duplicate_threshold() if threshold is None else threshold
+    shared = (
+        QuestionLSHBucket.objects.values('bucket').annotate(n=Count('id')).filter(n__gt=1).values('bucket')
+    )
+    buckets = {}
+    for bucket, question_id in QuestionLSHBucket.objects.filter(bucket__in=shared).order_by('bucket', 'question_id') \
+            .values_list('bucket', 'question_id'):
+        buckets.setdefault(bucket, []).append(question_id)
+
+    signatures = _signatures({qid for members in buckets.values() for qid in members})
+    parent = {}
+
+    def find(qid):
+        while parent.get(qid, qid) != qid:
+            qid = parent[qid]
+        return qid
+
+    for members in buckets.values():
+        first = members[0]
+        for other in members[1:]:
+            if similarity(signatures[first], signatures[other]) >= threshold:
+                a, b = find(first), find(other)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+
+    clusters = {}
+    for qid in parent:
+        clusters.setdefault(find(qid), set()).add(qid)
+    groups = []
+    for root, members in clusters.items():
+        members.add(root)
+        groups.append([(qid, round(similarity(signatures[root], signatures[qid]), 3)) for qid in sorted(members)])
+    groups.sort(key=lambda group: (-len(group), group[0][0]))
+    return groups[:limit] if limit else groups
+
+
+TEXT_FIELDS = {'question_text', 'option_a', 'option_b', 'option_c', 'option_d'}
+
+
+@receiver(post_save, sender=Question)
+def question_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and (update_fields is None or TEXT_FIELDS & set(update_fields)):
+        index_question(instance)
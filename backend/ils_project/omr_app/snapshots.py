@@ -0,0 +1,153 @@
+"""
+Compact on-disk question bank snapshots.
+
+A published snapshot is written once and never modified, so workers can memory-map it
+and serve exams (pools, answer key and pre-rendered question payloads) without touching
+the Question table. Layout, all integers little-endian int64:
+
+    magic (8 bytes) | header length (uint32) | JSON header
+    ids       sorted question ids                       (count)
+    key       correct option per id, one ASCII byte     (count bytes, padded to 8)
+    pools     question ids of every (subject, level)    (header["pools"] gives offset/length)
+    offsets   start of each payload in the blob         (count + 1)
+    payloads  concatenated UTF-8 JSON question payloads
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+
+from django.conf import settings
+
+MAGIC = b'OMRSNAP1'
+ITEM = array('q').itemsize
+
+
+def snapshot_dir():
+    return getattr(settings, 'OMR_SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'snapshots'))
+
+
+def _int_array(values):
+    data = array('q', values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+def write_snapshot_file(filename, meta, questions, pools):
+    """
+    Write a snapshot file atomically and return its sha256 checksum.
+
+    questions: iterable of (question_id, correct_option, payload dict)
+    pools: {subject_id: {level: [sorted question ids]}}
+    """
+    questions = sorted(questions, key=lambda q: q[0])
+    ids = [q[0] for q in questions]
+    key = ''.join(q[1] or '-' for q in questions).encode('ascii')
+    key += b'\0' * (-len(key) % ITEM)
+
+    pool_index = {}
+    pool_ids = []
+    for subject_id, levels in pools.items():
+        for level, level_ids in levels.items():
+            pool_index.setdefault(str(subject_id), {})[str(level)] = [len(pool_ids), len(level_ids)]
+            pool_ids.extend(level_ids)
+
+    blob = bytearray()
+    offsets = [0]
+    for _qid, _option, payload in questions:
+        blob += json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        offsets.append(len(blob))
+
+    header = dict(meta, count=len(ids), pools=pool_index, pool_size=len(pool_ids))
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-(len(MAGIC) + 4 + len(header_bytes)) % ITEM)
+
+    path = os.path.join(snapshot_dir(), filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as fh:
+        for chunk in (
+            MAGIC,
+            struct.pack('<I', len(header_bytes)),
+            header_bytes,
+            _int_array(ids),
+            key,
+            _int_array(pool_ids),
+            _int_array(offsets),
+            bytes(blob),
+        ):
+            fh.write(chunk)
+            digest.update(chunk)
+    os.replace(tmp_path, path)
+    return digest.hexdigest()
+
+
+class SnapshotFile:
+    """Read-only, memory-mapped view of a snapshot file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC or sys.byteorder != 'little':
+            raise ValueError(f"{path} is not a readable question bank snapshot")
+
+        (header_len,) = struct.unpack_from('<I', self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(bytes(self._mmap[start:start + header_len]))
+        count = self.header['count']
+
+        view = memoryview(self._mmap)
+        pos = start + header_len
+        self.ids = view[pos:pos + count * ITEM].cast('q')
+        pos += count * ITEM
+        self._key = view[pos:pos + count]
+        pos += count + (-count % ITEM)
+        pool_ids = view[pos:pos + self.header['pool_size'] * ITEM].cast('q')
+        pos += self.header['pool_size'] * ITEM
+        self._offsets = view[pos:pos + (count + 1) * ITEM].cast('q')
+        pos += (count + 1) * ITEM
+        self._payloads = view[pos:]
+
+        # Pools are zero-copy slices of the mapped file
+        self.pools = {
+            subject_id: {level: pool_ids[offset:offset + length] for level, (offset, length) in levels.items()}
+            for subject_id, levels in self.header['pools'].items()
+        }
+
+    def _index(self, question_id):
+        i = bisect_left(self.ids, question_id)
+        if i < len(self.ids) and self.ids[i] == question_id:
+            return i
+        raise KeyError(question_id)
+
+    def __contains__(self, question_id):
+        try:
+            self._index(question_id)
+        except KeyError:
+            return False
+        return True
+
+    def correct_option(self, question_id):
+        i = self._index(int(question_id))
+        return chr(self._key[i])
+
+    def payload_bytes(self, question_id):
+        i = self._index(int(question_id))
+        return bytes(self._payloads[self._offsets[i]:self._offsets[i + 1]])
+
+    def payload(self, question_id):
+        return json.loads(self.payload_bytes(question_id))
+
+
+@lru_cache(maxsize=32)
+def open_snapshot_file(filename):
+    # Files are immutable, so one mapping per process is shared by every request.
+    return SnapshotFile(os.path.join(snapshot_dir(), filename))
@@ -0,0 +1,498 @@
+"""
+Edge node sync.
+
+An edge node is a full install of this app at an exam centre with its own database.
+It holds a copy of the question bank and takes student registrations and submissions
+locally, so the exam doesn't depend on the link to the central server. OMR_SYNC
+configures both sides:
+
+    edge:    {'node_id': 'centre-12', 'upstream': 'https://omr.example.org/', 'token': '...'}
+    central: {'nodes': {'centre-12': '...'}}
+
+pull_bank() copies the current QuestionBankSnapshot of a board and class level from
+upstream: the snapshot file itself (gzip on the wire, checked against its sha256), the
+subjects and questions rebuilt from it with the same ids, and their images. Papers on
+the edge are then drawn from the same snapshot version as upstream, and submissions
+refer to the same question ids.
+
+push() sends the Student and StudentSubmission rows created on the edge since the last
+acknowledged ones, in batches of OMR_SYNC['batch_size'] rows (students first: a
+submission only goes once its student has). Each batch is one gzip-compressed JSON
+change set named after its table and id range. The central server stores it with
+bulk_create in one transaction (ingest()); rows carry (origin, origin_id), which is
+unique, so a batch sent twice creates nothing the second time. The SyncCheckpoint only
+moves past a batch once upstream has acknowledged it, so an interrupted push resumes
+from the last acknowledged batch.
+
+Submissions are rescored upstream (score and subject scores) against upstream's copy of
+the snapshot, with its key corrections; the edge's figures are not trusted. Only new
+rows are synced: later edits of an edge row are not sent again.
+"""
+import gzip
+import hashlib
+import json
+import os
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin, urlparse
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+from .models import (
+    Question, QuestionBankSnapshot, Student, StudentSubmission, Subject, SyncBatch, SyncCheckpoint, normalize_board,
+)
+from .papers import answer_key
+from .rescoring import count_subject_scores, index_submissions
+from .snapshots import SnapshotFile, snapshot_dir
+
+STUDENT_FIELDS = [
+    'name', 'school', 'fatherName', 'motherName', 'address', 'favouriteSubject', 'classLevel', 'stream',
+    'fatherOccupation', 'motherOccupation', 'phone',
+]
+QUESTION_FIELDS = [
+    'subject', 'question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'question_image', 'correct_option', 'level',
+]
+
+
+class SyncError(Exception):
+    pass
+
+
+def sync_settings():
+    config = {
+        'node_id': '',
+        'upstream': '',
+        'token': '',
+        'transport': 'omr_app.sync.HTTPTransport',
+        'batch_size': 500,
+        'timeout': 30,
+        'nodes': {},
+    }
+    config.update(getattr(settings, 'OMR_SYNC', {}))
+    return config
+
+
+class HTTPTransport:
+    """Requests to the upstream server, authenticated with the node's token."""
+
+    def __init__(self, upstream, node_id, token, timeout=30):
+        self.upstream = upstream if upstream.endswith('/') else f"{upstream}/"
+        self.headers = {'Authorization': f"Bearer {token}", 'X-OMR-Node': node_id}
+        self.timeout = timeout
+
+    def _open(self, request):
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return response.read()
+        except HTTPError as e:
+            raise SyncError(f"{request.full_url}: HTTP {e.code} {e.read()[:500].decode(errors='replace')}")
+        except URLError as e:
+            raise SyncError(f"{request.full_url}: {e.reason}")
+
+    def get(self, path, params=None):
+        url = urljoin(self.upstream, path)
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        return self._open(Request(url, headers=self.headers))
+
+    def post(self, path, body, content_type='application/json', encoding='gzip'):
+        headers = {**self.headers, 'Content-Type': content_type, 'Content-Encoding': encoding}
+        return self._open(Request(urljoin(self.upstream, path), data=body, headers=headers, method='POST'))
+
+
+def get_transport():
+    config = sync_settings()
+    if not (config['upstream'] and config['node_id']):
+        raise SyncError("OMR_SYNC needs 'upstream' and 'node_id' on an edge node")
+    return import_string(config['transport'])(
+        config['upstream'], config['node_id'], config['token'], config['timeout'],
+    )
+
+
+def _json(data):
+    try:
+        return json.loads(data)
+    except ValueError as e:
+        raise SyncError(f"Invalid response from upstream: {e}")
+
+
+# --- Edge: question bank ---
+
+def _media_name(url):
+    """Storage name of a payload's question_image URL ("/media/questions/x.png" -> "questions/x.png")."""
+    if not url:
+        return ''
+    path = urlparse(url).path
+    return path[len(settings.MEDIA_URL):] if path.startswith(settings.MEDIA_URL) else path.lstrip('/')
+
+
+def _write_snapshot(filename, data):
+    os.makedirs(snapshot_dir(), exist_ok=True)
+    path = os.path.join(snapshot_dir(), filename)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def pull_bank(board, class_level, transport=None):
+    """
+    Copy upstream's current snapshot of a board and class level, with its subjects,
+    questions and images. Returns a summary; a snapshot the node already has is not
+    downloaded again.
+    """
+    transport = transport or get_transport()
+    board = normalize_board(board)
+    params = {'board': board, 'class_level': class_level}
+    bank = _json(transport.get('api/sync/bank/', params))
+    meta = bank['snapshot']
+    summary = {'version': meta['version'], 'downloaded': 0, 'subjects': 0, 'questions': 0, 'images': 0}
+
+    local = QuestionBankSnapshot.objects.filter(board=board, class_level=class_level, version=meta['version']).first()
+    if local is not None and local.checksum != meta['checksum']:
+        raise SyncError(f"Local {local} differs from upstream; was it published on this node?")
+    path = os.path.join(snapshot_dir(), meta['file'])
+    if local is None or not os.path.exists(path):
+        data = gzip.decompress(transport.get('api/sync/bank/file/', {**params, 'version': meta['version']}))
+        if hashlib.sha256(data).hexdigest() != meta['checksum']:
+            raise SyncError(f"Checksum mismatch for {meta['file']}")
+        path = _write_snapshot(meta['file'], data)
+        summary['downloaded'] = len(data)
+    reader = SnapshotFile(path)
+
+    subjects = [
+        Subject(id=s['id'], name=s['name'], board=s['board'], class_level=s['class_level'], image=s['image'] or None)
+        for s in bank['subjects']
+    ]
+    questions = []
+    for subject_id, levels in reader.pools.items():
+        for ids in levels.values():
+            for qid in ids:
+                payload = reader.payload(qid)
+                questions.append(Question(
+                    id=qid,
+                    subject_id=int(subject_id),
+                    question_text=payload['question_text'],
+                    option_a=payload['options']['A'],
+                    option_b=payload['options']['B'],
+                    option_c=payload['options']['C'],
+                    option_d=payload['options']['D'],
+                    question_image=_media_name(payload['question_image']) or None,
+                    correct_option=reader.correct_option(qid),
+                    level=payload['level'],
+                ))
+    with transaction.atomic():
+        Subject.objects.bulk_create(
+            subjects, update_conflicts=True, unique_fields=['id'], update_fields=['name', 'board', 'class_level', 'image'],
+        )
+        # bulk_create skips the search index signals; rebuild_search_index covers the edge if needed
+        Question.objects.bulk_create(
+            questions, batch_size=500, update_conflicts=True, unique_fields=['id'], update_fields=QUESTION_FIELDS,
+        )
+        if local is None:
+            QuestionBankSnapshot.objects.create(
+                board=board,
+                class_level=class_level,
+                version=meta['version'],
+                pools={s: {level: list(ids) for level, ids in levels.items()} for s, levels in reader.pools.items()},
+                file=meta['file'],
+                checksum=meta['checksum'],
+                question_count=meta['question_count'],
+            )
+    summary['subjects'], summary['questions'] = len(subjects), len(questions)
+
+    names = {subject.image.name for subject in subjects if subject.image}
+    names |= {question.question_image.name for question in questions if question.question_image}
+    for name in sorted(names):
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(transport.get('api/sync/media/', {'name': name})))
+            summary['images'] += 1
+    return summary
+
+
+# --- Edge: pushing changes ---
+
+def checkpoint():
+    checkpoint, _ = SyncCheckpoint.objects.get_or_create(upstream=sync_settings()['upstream'])
+    return checkpoint
+
+
+def student_rows(students):
+    return [{'id': student.id, **{field: getattr(student, field) for field in STUDENT_FIELDS}} for student in students]
+
+
+def submission_rows(submissions):
+    return [
+        {
+            'id': submission.id,
+            'student': submission.student_id,
+            'subjects': sorted(subject.id for subject in submission.subjects.all()),
+            'answers': submission.answers,
+            'subject_scores': submission.subject_scores,
+            'submitted_at': submission.submitted_at.isoformat(),
+            'exam_session': submission.exam_session,
+            'snapshot': (
+                [submission.snapshot.board, submission.snapshot.class_level, submission.snapshot.version]
+                if submission.snapshot_id else None
+            ),
+        }
+        for submission in submissions
+    ]
+
+
+def next_batch(checkpoint, batch_size):
+    """The next change set after the checkpoint, or None when everything was acknowledged."""
+    students = list(
+        Student.objects.filter(id__gt=checkpoint.student_id, origin='').order_by('id')[:batch_size]
+    )
+    if students:
+        rows = student_rows(students)
+        kind = 'student'
+    else:
+        # Only submissions whose student upstream already has
+        submissions = list(
+            StudentSubmission.objects
+            .filter(id__gt=checkpoint.submission_id, student_id__lte=checkpoint.student_id, origin='')
+            .select_related('snapshot').prefetch_related('subjects')
+            .order_by('id')[:batch_size]
+        )
+        if not submissions:
+            return None
+        rows = submission_rows(submissions)
+        kind = 'submission'
+    return {
+        'node': sync_settings()['node_id'],
+        'batch': f"{kind}:{rows[0]['id']}-{rows[-1]['id']}",
+        f"{kind}s": rows,
+    }
+
+
+def push(transport=None, max_batches=None):
+    """Send every change set after the checkpoint, one acknowledged batch at a time."""
+    transport = transport or get_transport()
+    config = sync_settings()
+    point = checkpoint()
+    summary = {'batches': 0, 'students': 0, 'submissions': 0, 'bytes': 0}
+    while max_batches is None or summary['batches'] < max_batches:
+        change_set = next_batch(point, config['batch_size'])
+        if change_set is None:
+            break
+        body = gzip.compress(json.dumps(change_set, separators=(',', ':')).encode(), 6)
+        ack = _json(transport.post('api/sync/push/', body))
+        if ack.get('batch') != change_set['batch']:
+            raise SyncError(f"Upstream acknowledged {ack.get('batch')!r} instead of {change_set['batch']!r}")
+
+        point.student_id = max(point.student_id, ack['student_id'])
+        point.submission_id = max(point.submission_id, ack['submission_id'])
+        point.batches += 1
+        point.pushed_at = timezone.now()
+        point.save()
+        summary['batches'] += 1
+        summary['students'] += len(change_set.get('students', []))
+        summary['submissions'] += len(change_set.get('submissions', []))
+        summary['bytes'] += len(body)
+    return summary
+
+
+def pending():
+    """Rows on the edge not yet acknowledged upstream."""
+    point = checkpoint()
+    return {
+        'students': Student.objects.filter(id__gt=point.student_id, origin='').count(),
+        'submissions': StudentSubmission.objects.filter(id__gt=point.submission_id, origin='').count(),
+    }
+
+
+# --- Central server ---
+
+def authenticate_node(request):
+    """The node id of a request carrying a node's token, or None."""
+    node = request.headers.get('X-OMR-Node', '')
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    expected = sync_settings()['nodes'].get(node)
+    if scheme != 'Bearer' or not expected or not constant_time_compare(token, expected):
+        return None
+    return node
+
+
+def parse_change_set(data, encoding=''):
+    if encoding == 'gzip' or data[:2] == b'\x1f\x8b':
+        try:
+            data = gzip.decompress(data)
+        except (OSError, EOFError) as e:
+            raise SyncError(f"Unreadable gzip change set: {e}")
+    try:
+        change_set = json.loads(data)
+    except ValueError as e:
+        raise SyncError(f"Change set is not valid JSON: {e}")
+    if not isinstance(change_set, dict) or not isinstance(change_set.get('batch'), str):
+        raise SyncError("A change set is an object with a 'batch' name")
+    return change_set
+
+
+def _ack(batch, students, submissions):
+    return {
+        'batch': batch,
+        'student_id': max((row['id'] for row in students), default=0),
+        'submission_id': max((row['id'] for row in submissions), default=0),
+    }
+
+
+def ingest(node, change_set, size=0):
+    """
+    Store a change set from an edge node in one transaction. Returns the
+    acknowledgement: the batch and the highest student and submission ids it covered.
+    """
+    batch = change_set['batch'][:100]
+    students = change_set.get('students') or []
+    submissions = change_set.get('submissions') or []
+    try:
+        student_ids = [int(row['id']) for row in students]
+        submission_ids = [int(row['id']) for row in submissions]
+    except (KeyError, TypeError, ValueError):
+        raise SyncError("Every row needs an integer 'id'")
+    ack = _ack(batch, students, submissions)
+    if _received(node, batch):
+        return {**ack, 'replayed': True}
+
+    try:
+        with transaction.atomic():
+            existing = set(
+                Student.objects.filter(origin=node, origin_id__in=student_ids).values_list('origin_id', flat=True)
+            )
+            Student.objects.bulk_create(
+                [
+                    Student(origin=node, origin_id=row['id'], **{field: row.get(field) or '' for field in STUDENT_FIELDS})
+                    for row in students if row['id'] not in existing
+                ],
+                batch_size=500, ignore_conflicts=True,
+            )
+            created_students = len(set(student_ids) - existing)
+            created_submissions = _ingest_submissions(node, submissions, submission_ids)
+            SyncBatch.objects.create(
+                node=node, batch=batch, students=created_students, submissions=created_submissions,
+                received=len(students) + len(submissions), bytes=size,
+            )
+    except IntegrityError:
+        # The node sent the batch again (a retry) while the first request was storing it
+        if _received(node, batch):
+            return {**ack, 'replayed': True}
+        raise
+    return {**ack, 'students': created_students, 'submissions': created_submissions}
+
+
+def _received(node, batch):
+    return SyncBatch.objects.filter(node=node, batch=batch).exists()
+
+
+def _ingest_submissions(node, rows, submission_ids):
+    if not rows:
+        return 0
+    existing = set(
+        StudentSubmission.objects.filter(origin=node, origin_id__in=submission_ids).values_list('origin_id', flat=True)
+    )
+    rows = [row for row in rows if row['id'] not in existing]
+    students = dict(
+        Student.objects.filter(origin=node, origin_id__in={row.get('student') for row in rows})
+        .values_list('origin_id', 'id')
+    )
+    snapshots = {}
+    for row in rows:
+        if row.get('snapshot'):
+            board, class_level, version = row['snapshot']
+            snapshots[(board, class_level, version)] = None
+    for snapshot in QuestionBankSnapshot.objects.filter(board__in={key[0] for key in snapshots}, version__in={key[2] for key in snapshots}):
+        if (snapshot.board, snapshot.class_level, snapshot.version) in snapshots:
+            snapshots[(snapshot.board, snapshot.class_level, snapshot.version)] = snapshot.id
+
+    # Subject scores are recounted against upstream's key, like the score
+    subject_names = dict(
+        Subject.objects.filter(id__in={sid for row in rows for sid in row.get('subjects') or []}).values_list('id', 'name')
+    )
+    subject_of = dict(
+        Question.objects.filter(id__in={
+            int(qid) for row in rows if isinstance(row.get('answers'), dict) for qid in row['answers'] if str(qid).isdigit()
+        }).values_list('id', 'subject_id')
+    )
+
+    objects, subject_ids = [], {}
+    for row in rows:
+        if row.get('student') not in students:
+            raise SyncError(f"Submission {row['id']} refers to student {row.get('student')}, which was not synced")
+        snapshot_id = snapshots[tuple(row['snapshot'])] if row.get('snapshot') else None
+        if row.get('snapshot') and snapshot_id is None:
+            raise SyncError(f"Submission {row['id']} uses snapshot {row['snapshot']}, which doesn't exist upstream")
+        if not isinstance(row.get('answers'), dict):
+            raise SyncError(f"Submission {row['id']} has no answers object")
+        submission = StudentSubmission(
+            student_id=students[row['student']],
+            exam_session=str(row.get('exam_session') or '')[:64],
+            snapshot_id=snapshot_id,
+            origin=node,
+            origin_id=row['id'],
+        )
+        submission.answers = row['answers']
+        # bulk_create skips the calculate_score signal: score against upstream's key here
+        answers = submission.answers
+        question_ids = [int(qid) for qid in answers if str(qid).isdigit()]
+        key = answer_key(question_ids, snapshot_id=snapshot_id)
+        submission.score = submission.encode_answers(key)
+        subject_ids[row['id']] = row.get('subjects') or []
+        names = {sid: subject_names[sid] for sid in subject_ids[row['id']] if sid in subject_names}
+        submission.subject_scores = count_subject_scores(answers, key, names, subject_of) if names else None
+        objects.append(submission)
+    StudentSubmission.objects.bulk_create(objects, batch_size=500, ignore_conflicts=True)
+
+    created = dict(
+        StudentSubmission.objects.filter(origin=node, origin_id__in=list(subject_ids)).values_list('origin_id', 'id')
+    )
+    # ignore_conflicts leaves the primary keys unset
+    for submission in objects:
+        submission.id = created[submission.origin_id]
+    Through = StudentSubmission.subjects.through
+    Through.objects.bulk_create(
+        [
+            Through(studentsubmission_id=created[origin_id], subject_id=subject_id)
+            for origin_id, ids in subject_ids.items() for subject_id in ids
+        ],
+        batch_size=1000, ignore_conflicts=True,
+    )
+    # submitted_at is auto_now_add, which bulk_create overwrites: keep the edge's times
+    submitted_at = {row['id']: parse_datetime(row.get('submitted_at') or '') for row in rows}
+    restored = [
+        StudentSubmission(id=created[origin_id], submitted_at=when)
+        for origin_id, when in submitted_at.items() if when is not None
+    ]
+    StudentSubmission.objects.bulk_update(restored, ['submitted_at'], batch_size=500)
+    index_submissions(objects)
+    return len(created)
+
+
+def bank_data(board, class_level):
+    """The current snapshot of a board and class level and its subjects, as served to edge nodes."""
+    from .papers import current_snapshot
+
+    snapshot = current_snapshot(normalize_board(board), class_level)
+    return {
+        'snapshot': {
+            'board': snapshot.board,
+            'class_level': snapshot.class_level,
+            'version': snapshot.version,
+            'file': snapshot.file,
+            'checksum': snapshot.checksum,
+            'question_count': snapshot.question_count,
+        },
+        'subjects': [
+            {'id': subject.id, 'name': subject.name, 'board': subject.board, 'class_level': subject.class_level,
+             'image': subject.image.name if subject.image else ''}
+            for subject in Subject.objects.filter(board=snapshot.board, class_level=snapshot.class_level).order_by('id')
+        ],
+    }
@@ -1,3 +1,2083 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import importlib
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from . import (
+    adaptive, admission, archive, delivery, offline, profiling, reports, rescoring, search, similarity, sync, tracing,
+)
+from .admin import EstimatedCountPaginator
+from .admission import AdmissionGate, SingleFlight, TokenBucket, admission_controlled
+from .archive import archive_submissions, verify_archive
+from .export import ExportError, ResultsExport
+from .filters import CohortFilter
+from .live import SessionBoard, day_session, hub, submission_saved
+from .models import (
+    AnswerKeyCorrection, ExamDraft, Question, QuestionLSHBucket, QuestionSignature, RescoreJob, Student,
+    StudentSavedQuestions, StudentSubmission, Subject, SubmissionAnswer, SubmissionArchive, SyncBatch, SyncCheckpoint,
+)
+from .packed_answers import PackedAnswers, pack_answers
+from .papers import _snapshot_pools, answer_key, build_paper, publish_snapshot, question_payloads, snapshot_reader
+from .pdf_utils import LOGO_MAX_PIXELS, compact_logo, render_student_performance_pdf, striped_table_style
+from .profiling import flamegraph_svg
+from .reports import ReportData, build_report_data, cached_report_payload, report_data_for_many
+from .scoring import AlreadySubmitted, record_submission
+from .seeding import seed_dataset
+from .serializers import QuestionSerializer
+from .snapshots import open_snapshot_file, snapshot_dir
+from .sync import SyncError
+from .tracing import Trace
+from .warming import warm_exam
+
+
+class SubmissionAdminQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        _subjects, cls.submissions = seed_dataset(seed=1, students=30, subjects=3, questions_per_level=6, schools=3)
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        url = '/admin/omr_app/studentsubmission/'
+        few = self.changelist_queries(url)
+        StudentSubmission.objects.filter(id__in=[s.id for s in self.submissions[10:]]).delete()
+        self.assertEqual(self.changelist_queries(url), few)
+
+    def test_filtered_changelist_query_count(self):
+        url = '/admin/omr_app/studentsubmission/?student__school=School+1&subjects__board=CBSE'
+        unfiltered = self.changelist_queries('/admin/omr_app/studentsubmission/')
+        # Filters only add their exact count, never per-row queries
+        self.assertLessEqual(self.changelist_queries(url), unfiltered + 1)
+
+    def test_search_uses_indexed_lookups(self):
+        submission = self.submissions[0]
+        student = submission.student
+        Student.objects.filter(pk=student.pk).update(name='Zubair Khan', phone='9000000001')
+        for q, expected in (('Zubair', True), ('Khan', False), ('9000000001', True), ('900000000', False)):
+            response = self.client.get('/admin/omr_app/studentsubmission/', {'q': q})
+            self.assertEqual(response.status_code, 200)
+            found = {row.id for row in response.context['cl'].result_list}
+            self.assertEqual(submission.id in found, expected, q)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/admin/omr_app/studentsubmission/', {'q': 'Zubair'})
+        self.assertFalse(any('UPPER(' in query['sql'] for query in queries))
+
+    def test_answer_analysis_uses_bulk_queries(self):
+        submission = self.submissions[0]
+        # session, user, submission with student, its subjects, every answered question
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/admin/omr_app/studentsubmission/{submission.id}/answers/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['questions_by_subject']), 3)
+
+    def test_chart_view_uses_bulk_queries(self):
+        submission = self.submissions[0]
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/admin/omr_app/studentsubmission/{submission.id}/charts/')
+        self.assertEqual(response.status_code, 200)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(seed=2, students=12, subjects=1, questions_per_level=5)
+
+    @override_settings(OMR_ADMIN_EXACT_COUNT_LIMIT=5)
+    def test_unfiltered_count_stops_at_the_limit_without_an_estimate(self):
+        paginator = EstimatedCountPaginator(StudentSubmission.objects.order_by('-id'), 5)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 5)
+        self.assertIn('LIMIT 5', queries[0]['sql'].upper())
+
+    @override_settings(OMR_ADMIN_EXACT_COUNT_LIMIT=20)
+    def test_count_is_not_inflated_by_deleted_rows(self):
+        # Archival deletes old submissions, which leaves the highest id well above the row count
+        ids = list(StudentSubmission.objects.order_by('id').values_list('id', flat=True))
+        StudentSubmission.objects.filter(id__in=ids[:8]).delete()
+        paginator = EstimatedCountPaginator(StudentSubmission.objects.order_by('-id'), 5)
+        self.assertEqual(paginator.count, 4)
+
+    def test_small_tables_are_counted_exactly(self):
+        paginator = EstimatedCountPaginator(StudentSubmission.objects.order_by('-id'), 5)
+        self.assertEqual(paginator.count, 12)
+
+    @override_settings(OMR_ADMIN_EXACT_COUNT_LIMIT=5)
+    def test_filtered_count_is_exact(self):
+        paginator = EstimatedCountPaginator(StudentSubmission.objects.filter(score__gte=0).order_by('-id'), 5)
+        self.assertEqual(paginator.count, 12)
+
+
+class AutosaveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(seed=3, students=2, subjects=1, questions_per_level=6)
+        cls.student = Student.objects.order_by('id').first()
+        cls.subject = Subject.objects.get()
+
+    def autosave(self, seq, answers, paper_key='paper-1'):
+        return self.client.post('/api/autosave_answers/', {
+            'student_id': self.student.id, 'paper_key': paper_key, 'seq': seq, 'answers': answers,
+        }, content_type='application/json')
+
+    def test_replacement_device_finds_the_open_draft(self):
+        self.assertEqual(self.client.get(f'/api/drafts/{self.student.id}/').status_code, 404)
+        self.autosave(1, {'11': 'B'})
+        self.autosave(1, {'12': 'C'}, paper_key='paper-2')
+        response = self.client.get(f'/api/drafts/{self.student.id}/', {'paper_key': 'paper-1'})
+        self.assertEqual(response.json()['answers'], {'11': 'B'})
+        self.assertEqual(response.json()['seq'], 1)
+        # Without a key: the most recently saved paper
+        self.assertEqual(self.client.get(f'/api/drafts/{self.student.id}/').json()['paper_key'], 'paper-2')
+
+    def test_batches_merge_in_seq_order(self):
+        self.assertEqual(self.autosave(1, {'11': 'B', '12': 'C'}).json()['saved'], 2)
+        self.assertEqual(self.autosave(2, {'12': None, '13': 'D'}).json()['saved'], 2)
+        # A retried or late batch with an old seq is rejected and changes nothing
+        response = self.autosave(2, {'11': 'A'})
+        self.assertEqual(response.json(), {'paper_key': 'paper-1', 'seq': 2, 'stale': True})
+        self.autosave(1, {'14': 'A'})
+        draft = ExamDraft.objects.get(student=self.student, paper_key='paper-1')
+        self.assertEqual(draft.answers, {'11': 'B', '13': 'D'})
+        self.assertEqual(draft.last_seq, 2)
+
+    def test_one_upsert_per_batch(self):
+        self.autosave(1, {'11': 'B'})
+        with CaptureQueriesContext(connection) as queries:
+            self.autosave(2, {'12': 'C'})
+        writes = [q['sql'] for q in queries if 'SAVEPOINT' not in q['sql'].upper()]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('ON CONFLICT', writes[0].upper())
+
+    def submit(self, paper_key='paper-1'):
+        return self.client.post('/api/submit_answers/', {
+            'student_id': self.student.id, 'subject_ids': [self.subject.id], 'paper_key': paper_key, 'answers': {},
+        }, content_type='application/json')
+
+    def test_paper_is_submitted_once(self):
+        existing = StudentSubmission.objects.count()
+        self.autosave(1, {'11': 'B'})
+        first = self.submit()
+        self.assertEqual(first.status_code, 200)
+        second = self.submit()
+        self.assertEqual(second.status_code, 409)
+        self.assertEqual(second.json()['submission_id'], first.json()['submission_id'])
+        self.assertEqual(StudentSubmission.objects.count(), existing + 1)
+        # Batches that arrive after the submit don't reopen the draft
+        self.assertEqual(self.autosave(2, {'12': 'C'}).status_code, 409)
+
+    def test_concurrent_submit_loses_the_draft_claim(self):
+        existing = StudentSubmission.objects.count()
+        self.autosave(1, {'11': 'B'})
+        # Both requests read the draft before either stored its submission
+        stale = ExamDraft.objects.get(student=self.student, paper_key='paper-1')
+        submission, _total = record_submission(self.student, [self.subject.id], stale.answers, stale)
+        late = ExamDraft.objects.get(pk=stale.pk)
+        late.submission_id = None
+        with self.assertRaises(AlreadySubmitted) as raised:
+            record_submission(self.student, [self.subject.id], late.answers, late)
+        self.assertEqual(raised.exception.submission_id, submission.id)
+        self.assertEqual(StudentSubmission.objects.count(), existing + 1)
+
+
+def use_snapshot_dir(test):
+    """Publish snapshots into a temporary directory and forget the files of earlier tests."""
+    directory = test.enterContext(tempfile.TemporaryDirectory())
+    test.enterContext(override_settings(OMR_SNAPSHOT_DIR=directory))
+    for cached in (open_snapshot_file, snapshot_reader, _snapshot_pools):
+        cached.cache_clear()
+    cache.clear()
+
+
+class SeededPaperTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects, _submissions = seed_dataset(seed=4, students=2, subjects=2, questions_per_level=8)
+        cls.student = Student.objects.order_by('id').first()
+
+    def setUp(self):
+        use_snapshot_dir(self)
+
+    def start(self, exam_session, student=None):
+        response = self.client.post('/api/get_random_questions/', {
+            'student_id': (student or self.student).id,
+            'subject_ids': [subject.id for subject in self.subjects],
+            'exam_session': exam_session,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return {name: [q['id'] for q in paper['questions']] for name, paper in response.json().items()}
+
+    def test_paper_is_rebuilt_from_the_session(self):
+        paper = self.start('mock-1')
+        self.assertEqual(self.start('mock-1'), paper)
+        self.assertEqual(sorted(paper), sorted(subject.name for subject in self.subjects))
+        self.assertTrue(all(len(ids) == 20 for ids in paper.values()))
+        self.assertNotEqual(self.start('mock-2'), paper)
+        self.assertNotEqual(self.start('mock-1', student=Student.objects.order_by('id').last()), paper)
+        # Only the pinned snapshot is recorded, no question lists
+        self.assertFalse(StudentSavedQuestions.objects.exists())
+        self.assertEqual(ExamDraft.objects.filter(paper_key='mock-1').exclude(snapshot=None).count(), 2)
+
+    def test_started_paper_keeps_its_snapshot(self):
+        paper = self.start('mock-1')
+        subject = self.subjects[0]
+        Question.objects.bulk_create([
+            Question(subject=subject, question_text=f"Late question {n}", option_a="A", option_b="B",
+                     option_c="C", option_d="D", correct_option='A', level=1)
+            for n in range(20)
+        ])
+        publish_snapshot(subject.board, subject.class_level)
+        self.assertEqual(self.start('mock-1'), paper)
+
+    def test_seeded_submission_is_scored_on_the_paper(self):
+        paper = self.start('mock-1')
+        ids = [qid for subject_ids in paper.values() for qid in subject_ids]
+        key = dict(Question.objects.filter(id__in=ids).values_list('id', 'correct_option'))
+        response = self.client.post('/api/submit_answers/', {
+            'student_id': self.student.id,
+            'subject_ids': [subject.id for subject in self.subjects],
+            'paper_key': 'mock-1',
+            'answers': {str(qid): option for qid, option in key.items()},
+        }, content_type='application/json')
+        self.assertEqual(response.json()['score'], 40)
+        self.assertEqual(response.json()['total'], 40)
+        submission = StudentSubmission.objects.get(id=response.json()['submission_id'])
+        self.assertEqual(submission.exam_session, 'mock-1')
+        self.assertIsNotNone(submission.snapshot_id)
+
+
+class SnapshotFileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects, _submissions = seed_dataset(seed=6, students=1, subjects=2, questions_per_level=3)
+
+    def setUp(self):
+        use_snapshot_dir(self)
+
+    def test_file_round_trip(self):
+        subject = self.subjects[0]
+        snapshot = publish_snapshot(subject.board, subject.class_level)
+        path = os.path.join(snapshot_dir(), snapshot.file)
+        with open(path, 'rb') as fh:
+            self.assertEqual(hashlib.sha256(fh.read()).hexdigest(), snapshot.checksum)
+
+        reader = open_snapshot_file(snapshot.file)
+        questions = Question.objects.filter(subject__in=self.subjects).order_by('id')
+        self.assertEqual(list(reader.ids), [q.id for q in questions])
+        for question in questions:
+            self.assertEqual(reader.correct_option(question.id), question.correct_option)
+            self.assertEqual(reader.payload(question.id), QuestionSerializer(question).data)
+            self.assertIn(question.id, list(reader.pools[str(question.subject_id)][str(question.level)]))
+        self.assertNotIn(questions.last().id + 1, reader)
+
+    def test_exam_serving_reads_the_file(self):
+        subject = self.subjects[0]
+        snapshot = publish_snapshot(subject.board, subject.class_level)
+        ids = [qid for level_ids in build_paper(snapshot.id, 1, subject.id, 'mock-1').values() for qid in level_ids]
+        # Warm the per-process file mapping and the cached key corrections
+        question_payloads(snapshot.id, ids[:1])
+        answer_key(ids[:1], snapshot_id=snapshot.id)
+        with self.assertNumQueries(0):
+            payloads = question_payloads(snapshot.id, ids)
+            key = answer_key(ids, snapshot_id=snapshot.id)
+        self.assertEqual([payload['id'] for payload in payloads], ids)
+        self.assertEqual(key, dict(Question.objects.filter(id__in=ids).values_list('id', 'correct_option')))
+
+    def test_bank_edits_need_a_new_version(self):
+        subject = self.subjects[0]
+        first = publish_snapshot(subject.board, subject.class_level)
+        question = Question.objects.filter(subject=subject).first()
+        Question.objects.filter(id=question.id).update(question_text="Edited after publishing")
+        self.assertNotEqual(question_payloads(first.id, [question.id])[0]['question_text'], "Edited after publishing")
+        second = publish_snapshot(subject.board, subject.class_level)
+        self.assertEqual(second.version, first.version + 1)
+        self.assertEqual(question_payloads(second.id, [question.id])[0]['question_text'], "Edited after publishing")
+
+
+class LazyPdfImportTests(TestCase):
+    def test_worker_startup_skips_reportlab(self):
+        out = StringIO()
+        call_command('profile_startup', stdout=out)
+        self.assertIn("No heavy optional packages", out.getvalue())
+
+    def test_pdf_renders_on_first_use(self):
+        _subjects, submissions = seed_dataset(seed=7, students=1, subjects=2, questions_per_level=5)
+        response = self.client.get(f'/api/generate_pdf/{submissions[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+
+class AdmissionTests(SimpleTestCase):
+    def test_token_bucket_allows_a_burst_then_refills(self):
+        with mock.patch('omr_app.admission.time.monotonic', return_value=100.0) as clock:
+            bucket = TokenBucket(rate=2, burst=3)
+            self.assertEqual([bucket.take()[0] for _ in range(4)], [True, True, True, False])
+            self.assertAlmostEqual(bucket.take()[1], 0.5)
+            clock.return_value = 100.5
+            self.assertEqual(bucket.take(), (True, 0.0))
+            self.assertFalse(bucket.take()[0])
+            clock.return_value = 200.0
+            # Refills up to the burst size, no further
+            self.assertEqual(sum(bucket.take()[0] for _ in range(5)), 3)
+
+    def test_gate_rejects_when_queue_is_full(self):
+        gate = AdmissionGate('test', rate=100, burst=100, max_concurrent=1, max_queue=0, queue_timeout=1)
+        self.assertEqual(gate.acquire(), (True, None, 0.0))
+        admitted, status_code, retry_after = gate.acquire()
+        self.assertFalse(admitted)
+        self.assertEqual(status_code, 503)
+        self.assertGreaterEqual(retry_after, 1.0)
+        gate.release(0.01)
+        self.assertTrue(gate.acquire()[0])
+        self.assertEqual(gate.stats()['rejected_queue_full'], 1)
+
+    def test_queued_request_gets_the_released_slot(self):
+        gate = AdmissionGate('test', rate=100, burst=100, max_concurrent=1, max_queue=1, queue_timeout=5)
+        gate.acquire()
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(gate.acquire()))
+        waiter.start()
+        while gate.stats()['queue_depth'] == 0:
+            time.sleep(0.001)
+        gate.release(0.01)
+        waiter.join(5)
+        self.assertEqual(results, [(True, None, 0.0)])
+
+    def test_rejected_request_gets_retry_after(self):
+        @api_view(['GET'])
+        @admission_controlled('test-view')
+        def view(request):
+            return Response({})
+
+        with mock.patch.dict(admission._gates, {'test-view': AdmissionGate('test-view', 1, 1, 1, 0, 1)}):
+            self.assertEqual(view(RequestFactory().get('/')).status_code, 200)
+            response = view(RequestFactory().get('/'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_single_flight_shares_one_run(self):
+        flight, calls, results = SingleFlight(), [], []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return 'paper'
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', compute))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while flight.shared < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['paper'] * 5)
+
+
+class ReportDataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects, cls.submissions = seed_dataset(seed=8, students=4, subjects=3, questions_per_level=6)
+
+    def test_fixed_number_of_queries(self):
+        # Submission with student, its subjects, every answered question
+        with self.assertNumQueries(3):
+            report = build_report_data(self.submissions[0].id)
+        submission = self.submissions[0]
+        self.assertEqual(report.score, submission.score)
+        self.assertEqual(report.answered, len(submission.answers))
+        self.assertEqual({subject.name: subject.correct for subject in report.subjects}, submission.subject_scores)
+        self.assertTrue(all(subject.total == 20 for subject in report.subjects))
+
+    def test_batch_matches_single_reports(self):
+        submissions = (
+            StudentSubmission.objects.select_related('student').prefetch_related('subjects').order_by('id')
+        )
+        batch = report_data_for_many(list(submissions))
+        self.assertEqual(
+            [report.to_dict() for report in batch],
+            [build_report_data(submission.id).to_dict() for submission in self.submissions],
+        )
+
+    def test_dict_round_trip(self):
+        report = build_report_data(self.submissions[1].id)
+        data = json.loads(json.dumps(report.to_dict()))
+        self.assertEqual(ReportData.from_dict(data), report)
+        self.assertEqual(data['overall_percentage'], report.overall_percentage)
+
+    def test_unknown_submission_is_404(self):
+        with self.assertRaises(Http404):
+            build_report_data(self.submissions[-1].id + 1000)
+
+
+def synthetic_logo(width):
+    from PIL import Image
+
+    img = Image.merge('RGB', [Image.effect_noise((width, width * 2 // 3), sigma) for sigma in (40, 60, 80)])
+    out = BytesIO()
+    img.save(out, format='PNG')
+    return out.getvalue()
+
+
+class CompactPdfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _subjects, submissions = seed_dataset(seed=9, students=1, subjects=2, questions_per_level=5)
+        cls.submission = submissions[0]
+
+    def render(self, compact, logo_bytes=None):
+        random.seed(0)
+        report = build_report_data(self.submission.id)
+        return render_student_performance_pdf(report, "Report", logo_bytes=logo_bytes, compact=compact).getvalue()
+
+    def test_logo_is_downsampled_once(self):
+        logo = synthetic_logo(1200)
+        small = compact_logo(logo)
+        self.assertIs(compact_logo(logo), small)
+        with PILImage.open(BytesIO(small)) as img:
+            self.assertLessEqual(img.size[0], LOGO_MAX_PIXELS[0])
+            self.assertLessEqual(img.size[1], LOGO_MAX_PIXELS[1])
+
+    def test_compact_profile_is_smaller(self):
+        logo = synthetic_logo(800)
+        full, compact = self.render(False, logo), self.render(True, logo)
+        self.assertTrue(compact.startswith(b'%PDF'))
+        self.assertLess(len(compact), len(full) / 2)
+
+    def test_striped_table_style(self):
+        style = striped_table_style([('GRID', (0, 0), (-1, -1), 1, 'black')], 5, 'grey')
+        backgrounds = [command[1][1] for command in style.getCommands() if command[0] == 'BACKGROUND']
+        self.assertEqual(backgrounds, [1, 3])
+
+
+class ReportCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects, submissions = seed_dataset(seed=10, students=2, subjects=2, questions_per_level=5)
+        cls.submission = submissions[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def payload(self):
+        return cached_report_payload(self.submission.id)[0]
+
+    @override_settings(OMR_REPORT_CACHE_TTL=120)
+    def test_payload_is_cached_with_a_ttl(self):
+        with mock.patch.object(reports.cache, 'set', wraps=reports.cache.set) as cache_set:
+            self.payload()
+        self.assertEqual(cache_set.call_args.args[2], 120)
+        with self.assertNumQueries(0):
+            self.payload()
+
+    def test_question_edit_drops_the_cached_report(self):
+        first = self.payload()['questions'][0]
+        question = Question.objects.get(id=first['question_id'])
+        question.question_text = "Reworded"
+        question.save()
+        self.assertEqual(self.payload()['questions'][0]['text'], "Reworded")
+
+    def test_subject_and_student_edits_drop_the_cached_report(self):
+        subject = Subject.objects.get(id=self.payload()['subjects'][0]['subject_id'])
+        subject.name = "Renamed subject"
+        subject.save()
+        self.assertEqual(self.payload()['subjects'][0]['name'], "Renamed subject")
+        student = self.submission.student
+        student.name = "Renamed student"
+        student.save()
+        self.assertEqual(self.payload()['student']['name'], "Renamed student")
+
+    def test_unrelated_edits_keep_the_cache(self):
+        self.payload()
+        other = Subject.objects.create(name="Other", board='CBSE', class_level=9)
+        other.name = "Still other"
+        other.save()
+        with self.assertNumQueries(0):
+            self.payload()
+
+
+class ResultsEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _subjects, submissions = seed_dataset(seed=11, students=1, subjects=2, questions_per_level=5)
+        cls.submission = submissions[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_results_json(self):
+        response = self.client.get(f'/api/results/{self.submission.id}/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['score'], self.submission.score)
+        self.assertEqual({subject['name']: subject['correct'] for subject in data['subjects']}, self.submission.subject_scores)
+        self.assertNotIn('questions', data)
+        questions = self.client.get(f'/api/results/{self.submission.id}/', {'questions': '1'}).json()['questions']
+        self.assertEqual(len(questions), len(self.submission.answers))
+
+    def test_conditional_get_is_not_modified(self):
+        etag = self.client.get(f'/api/results/{self.submission.id}/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/results/{self.submission.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # A new score means a new ETag
+        self.submission.answers = {}
+        self.submission.save()
+        response = self.client.get(f'/api/results/{self.submission.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_results_page_is_publicly_cacheable(self):
+        response = self.client.get(f'/results/{self.submission.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn(f'/api/results/{self.submission.id}/', response.content.decode())
+
+
+class CohortReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.subjects, cls.submissions = seed_dataset(seed=12, students=20, subjects=2, questions_per_level=4, schools=2)
+
+    def expected(self, submissions):
+        """The report's numbers computed the slow way, one submission at a time."""
+        key = dict(Question.objects.values_list('id', 'correct_option'))
+        answered, correct, percentages = {}, {}, {}
+        for submission in submissions:
+            answers = submission.answers
+            right = sum(option == key[int(qid)] for qid, option in answers.items())
+            percentages[submission.id] = round(100.0 * right / len(answers), 2)
+            for qid, option in answers.items():
+                answered[int(qid)] = answered.get(int(qid), 0) + 1
+                correct[int(qid)] = correct.get(int(qid), 0) + (option == key[int(qid)])
+        return answered, correct, percentages
+
+    def test_report_matches_per_submission_scoring(self):
+        from .cohort import build_cohort_report
+
+        report = build_cohort_report(CohortFilter())
+        answered, correct, percentages = self.expected(self.submissions)
+        self.assertEqual(report['students'], 20)
+        self.assertEqual(sum(report['score_distribution']['counts']), 20)
+        self.assertAlmostEqual(report['score_distribution']['mean'], sum(percentages.values()) / 20, places=1)
+        for stat in report['question_difficulty']:
+            qid = stat['question_id']
+            self.assertEqual(stat['answered'], answered[qid])
+            self.assertAlmostEqual(stat['percentage_correct'], round(100.0 * correct[qid] / answered[qid], 2))
+        school_1 = [s for s in self.submissions if s.student.school == 'School 1']
+        self.assertEqual(
+            {school['school']: school['students'] for school in report['schools']},
+            {'School 1': len(school_1), 'School 2': 20 - len(school_1)},
+        )
+
+    def test_discrimination_only_counts_students_served_the_question(self):
+        import numpy as np
+        from .cohort import build_cohort_report
+
+        # Half the students were never served the first question of each level
+        dropped = set(Question.objects.filter(subject=self.subjects[0]).order_by('level', 'id')
+                      .values_list('id', flat=True)[::4])
+        for submission in self.submissions[::2]:
+            answers = {qid: option for qid, option in submission.answers.items() if int(qid) not in dropped}
+            StudentSubmission.objects.filter(id=submission.id).update(answers_json=answers, answers_packed=None)
+        submissions = list(StudentSubmission.objects.all())
+        key = dict(Question.objects.values_list('id', 'correct_option'))
+        _answered, _correct, percentages = self.expected(submissions)
+
+        report = build_cohort_report(CohortFilter())
+        for stat in report['question_difficulty']:
+            qid = str(stat['question_id'])
+            served = [s for s in submissions if qid in s.answers]
+            items = [float(s.answers[qid] == key[int(qid)]) for s in served]
+            totals = [percentages[s.id] for s in served]
+            expected = np.corrcoef(items, totals)[0, 1] if len(set(items)) > 1 else 0.0
+            self.assertAlmostEqual(stat['discrimination'], round(float(expected), 3), places=3, msg=qid)
+
+    def test_legacy_json_rows_count_the_same(self):
+        from .cohort import build_cohort_report
+
+        packed = build_cohort_report(CohortFilter(school='School 1'))
+        for submission in self.submissions:
+            StudentSubmission.objects.filter(id=submission.id).update(answers_json=submission.answers, answers_packed=None)
+        self.assertEqual(build_cohort_report(CohortFilter(school='School 1')), packed)
+
+    def test_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/cohort_report/').status_code, 403)
+        self.client.force_login(self.admin_user)
+        response = self.client.get('/api/cohort_report/', {'school': 'School 2', 'subjects': str(self.subjects[0].id)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([subject['name'] for subject in response.json()['subjects']], [self.subjects[0].name])
+        self.assertEqual(self.client.get('/api/cohort_report/', {'date_from': 'soon'}).status_code, 400)
+        pdf = self.client.get('/api/cohort_report/', {'output': 'pdf'})
+        self.assertTrue(pdf.content.startswith(b'%PDF'))
+
+
+class HotQueryIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects, cls.submissions = seed_dataset(seed=13, students=5, subjects=2, questions_per_level=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_boards_are_stored_upper_case(self):
+        subject = Subject.objects.create(name="Maths", board=' state ', class_level=8)
+        self.assertEqual(Subject.objects.get(id=subject.id).board, 'STATE')
+        response = self.client.get('/api/subjects/', {'class_level': 8, 'board': 'State'})
+        self.assertEqual([s['name'] for s in response.json()], ["Maths"])
+
+    @skipUnless(connection.vendor == 'sqlite', "Plan text is SQLite's")
+    def test_hot_queries_use_the_index_plan(self):
+        subject, submission = self.subjects[0], self.submissions[0]
+        plans = {
+            'pools': Question.objects.filter(subject_id=subject.id).values_list('level', 'id').explain(),
+            'subjects': Subject.objects.filter(class_level=10, board='CBSE').explain(),
+            'latest': StudentSubmission.objects.filter(student_id=submission.student_id)
+            .order_by('-submitted_at').values_list('id', flat=True)[:1].explain(),
+        }
+        self.assertIn('COVERING INDEX question_subject_level_idx', plans['pools'])
+        self.assertIn('subject_class_board_idx', plans['subjects'])
+        self.assertIn('submission_student_recent_idx', plans['latest'])
+        self.assertNotIn('TEMP B-TREE', plans['latest'])
+
+    def test_explain_command_runs(self):
+        out = StringIO()
+        call_command('explain_hot_queries', students=5, subjects=1, questions_per_level=2, repeat=1,
+                     no_explain=True, stdout=out)
+        self.assertIn('question pools of a subject', out.getvalue())
+        # The seeded rows and dropped indexes are rolled back
+        self.assertEqual(Subject.objects.count(), 2)
+
+
+class PackedAnswersTests(SimpleTestCase):
+    def test_round_trip(self):
+        cases = [
+            {},
+            {'7': 'A'},
+            {'1': 'A', '2': 'B', '3': 'C', '4': 'D'},
+            # Odd lengths leave partly used option and flag bytes
+            {str(qid): 'ABCD'[qid % 4] for qid in range(10, 19)},
+            {str(qid): 'ABCD'[qid % 3] for qid in range(100, 105)},
+            # Gaps too wide for 16 bit deltas
+            {'5': 'B', '70000': 'C', '4000000000': 'D'},
+        ]
+        for answers in cases:
+            with self.subTest(count=len(answers)):
+                key = {int(qid): 'A' for qid in answers}
+                packed = PackedAnswers(pack_answers(answers, key))
+                self.assertEqual(packed.to_dict(), answers)
+                self.assertEqual(len(packed), len(answers))
+                self.assertEqual(packed.correct_count, list(answers.values()).count('A'))
+                self.assertEqual(packed.correct_flags(), [answers[str(qid)] == 'A' for qid in packed.question_ids])
+
+    def test_with_key_matches_packing_again(self):
+        answers = {str(qid): 'ABCD'[qid % 4] for qid in range(10, 29)}
+        packed = PackedAnswers(pack_answers(answers, {}))
+        for key in ({}, {int(qid): 'A' for qid in answers}, {int(qid): option for qid, option in answers.items()}):
+            self.assertEqual(packed.with_key(key), pack_answers(answers, key))
+
+    def test_lookup_and_sorting(self):
+        packed = PackedAnswers(pack_answers({'30': 'D', '4': 'B', '12': 'A'}, {}))
+        self.assertEqual(packed.question_ids, [4, 12, 30])
+        self.assertEqual(packed.options, 'BAD')
+        self.assertEqual(packed.get(12), 'A')
+        self.assertIsNone(packed.get(13))
+        self.assertEqual(packed.correct_count, 0)
+
+    def test_unpackable_answers_stay_json(self):
+        self.assertIsNone(pack_answers({'1': 'E'}, {}))
+        self.assertIsNone(pack_answers({'q1': 'A'}, {}))
+        self.assertIsNone(pack_answers({'1': None}, {}))
+        self.assertIsNone(pack_answers({str(2 ** 32): 'A'}, {}))
+
+
+class AnswersPropertyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _subjects, submissions = seed_dataset(seed=14, students=1, subjects=1, questions_per_level=5)
+        cls.submission = submissions[0]
+
+    def test_packed_rows(self):
+        submission = StudentSubmission.objects.get(id=self.submission.id)
+        self.assertIsNone(submission.answers_json)
+        self.assertEqual(submission.answers, self.submission.answers)
+        self.assertEqual(submission.packed_answers().correct_count, submission.score)
+
+    def test_legacy_json_rows(self):
+        answers = dict(self.submission.answers)
+        StudentSubmission.objects.filter(id=self.submission.id).update(answers_json=answers, answers_packed=None)
+        submission = StudentSubmission.objects.get(id=self.submission.id)
+        self.assertIsNone(submission.packed_answers())
+        self.assertEqual(submission.answers, answers)
+        # Saving scores and packs the row
+        submission.save()
+        submission.refresh_from_db()
+        self.assertIsNone(submission.answers_json)
+        self.assertEqual(submission.answers, answers)
+
+    def test_resaving_rescores_the_packed_arrays(self):
+        submission = StudentSubmission.objects.get(id=self.submission.id)
+        qid = submission.packed_answers().question_ids[0]
+        chosen = submission.packed_answers().options[0]
+        Question.objects.filter(id=qid).update(correct_option='D' if chosen != 'D' else 'A')
+        before = submission.score
+        was_correct = submission.packed_answers().correct_flags()[0]
+        submission.save()
+        self.assertNotIn('_answers', submission.__dict__)
+        self.assertEqual(submission.score, before - was_correct)
+        # Answers read as a dict may have been edited in place: those are packed again
+        submission.answers[str(qid)] = Question.objects.get(id=qid).correct_option
+        submission.save()
+        submission.refresh_from_db()
+        self.assertEqual(submission.score, before - was_correct + 1)
+
+    def test_setter_repacks_on_save(self):
+        submission = StudentSubmission.objects.get(id=self.submission.id)
+        qid, option = next(iter(submission.answers.items()))
+        submission.answers = {qid: option, 'bonus': 'A'}
+        self.assertEqual(submission.answers_json, {qid: option, 'bonus': 'A'})
+        submission.save()
+        submission.refresh_from_db()
+        # Non-numeric ids can't be packed, so the row keeps its JSON
+        self.assertIsNone(submission.answers_packed)
+        self.assertEqual(submission.answers, {qid: option, 'bonus': 'A'})
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Runs migrations back to `before` and forward to `after`; leaves the schema at the latest."""
+    before = after = None
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+class PackAnswersMigrationTests(MigrationTestCase):
+    before = [('omr_app', '0016_hot_query_indexes')]
+    after = [('omr_app', '0017_packed_answers')]
+
+    def test_existing_rows_are_packed(self):
+        apps = self.migrate(self.before)
+        Subject_, Question_ = apps.get_model('omr_app', 'Subject'), apps.get_model('omr_app', 'Question')
+        Student_, Submission = apps.get_model('omr_app', 'Student'), apps.get_model('omr_app', 'StudentSubmission')
+        subject = Subject_.objects.create(name="Physics", board='CBSE', class_level=10)
+        questions = [
+            Question_.objects.create(subject=subject, question_text=f"Q{n}", option_a="A", option_b="B", option_c="C",
+                                     option_d="D", correct_option='ABCD'[n], level=1)
+            for n in range(4)
+        ]
+        student = Student_.objects.create(
+            name="Old", school="School", fatherName="F", motherName="M", address="-", favouriteSubject="-",
+            classLevel="10", stream="-", fatherOccupation="-", motherOccupation="-", phone="0",
+        )
+        answers = {str(q.id): 'A' for q in questions}
+        packable = Submission.objects.create(student=student, answers=answers, score=1)
+        legacy = Submission.objects.create(student=student, answers={'note': 'A'}, score=0)
+
+        apps = self.migrate(self.after)
+        Submission = apps.get_model('omr_app', 'StudentSubmission')
+        row = Submission.objects.get(id=packable.id)
+        self.assertIsNone(row.answers_json)
+        packed = PackedAnswers(row.answers_packed)
+        self.assertEqual(packed.to_dict(), answers)
+        self.assertEqual(packed.correct_flags(), [True, False, False, False])
+        self.assertEqual(Submission.objects.get(id=legacy.id).answers_json, {'note': 'A'})
+
+        # And back: the reverse step restores the JSON column
+        apps = self.migrate(self.before)
+        Submission = apps.get_model('omr_app', 'StudentSubmission')
+        self.assertEqual(Submission.objects.get(id=packable.id).answers, answers)
+
+    def test_snapshot_keys_are_read_without_the_live_module(self):
+        use_snapshot_dir(self)
+        subject = Subject.objects.create(name="Physics", board='CBSE', class_level=10)
+        for n in range(6):
+            Question.objects.create(subject=subject, question_text=f"Q{n}", option_a="A", option_b="B", option_c="C",
+                                    option_d="D", correct_option='ABCD'[n % 4], level=n % 4 + 1)
+        snapshot = publish_snapshot('CBSE', 10)
+        migration = importlib.import_module('omr_app.migrations.0017_packed_answers')
+        reader = open_snapshot_file(snapshot.file)
+        self.assertEqual(migration._snapshot_key(snapshot, {}), {qid: reader.correct_option(qid) for qid in reader.ids})
+
+
+
+class IndexAnswersMigrationTests(MigrationTestCase):
+    before = [('omr_app', '0024_rescoring')]
+    after = [('omr_app', '0025_index_submission_answers')]
+
+    def test_existing_submissions_are_indexed(self):
+        apps = self.migrate(self.before)
+        Subject_, Question_ = apps.get_model('omr_app', 'Subject'), apps.get_model('omr_app', 'Question')
+        Student_, Submission = apps.get_model('omr_app', 'Student'), apps.get_model('omr_app', 'StudentSubmission')
+        SubmissionAnswer_ = apps.get_model('omr_app', 'SubmissionAnswer')
+        subject = Subject_.objects.create(name="Physics", board='CBSE', class_level=10)
+        ids = [
+            Question_.objects.create(subject=subject, question_text=f"Q{n}", option_a="A", option_b="B", option_c="C",
+                                     option_d="D", correct_option='A', level=1).id
+            for n in range(3)
+        ]
+        student = Student_.objects.create(
+            name="Old", school="School", fatherName="F", motherName="M", address="-", favouriteSubject="-",
+            classLevel="10", stream="-", fatherOccupation="-", motherOccupation="-", phone="0",
+        )
+        packed = Submission.objects.create(student=student, score=2, answers_packed=pack_answers(
+            {str(ids[0]): 'A', str(ids[1]): 'A'}, {qid: 'A' for qid in ids},
+        ))
+        legacy = Submission.objects.create(student=student, score=1, answers_json={str(ids[2]): 'A', 'note': 'B'})
+        # Saved after 0024: already indexed by the signal
+        indexed = Submission.objects.create(student=student, score=1, answers_json={str(ids[0]): 'A'})
+        SubmissionAnswer_.objects.create(submission=indexed, question_id=ids[0])
+
+        apps = self.migrate(self.after)
+        SubmissionAnswer_ = apps.get_model('omr_app', 'SubmissionAnswer')
+        rows = sorted(SubmissionAnswer_.objects.values_list('submission_id', 'question_id'))
+        self.assertEqual(rows, sorted([
+            (packed.id, ids[0]), (packed.id, ids[1]), (legacy.id, ids[2]), (indexed.id, ids[0]),
+        ]))
+
+
+class SimilarityBackfillMigrationTests(MigrationTestCase):
+    before = [('omr_app', '0027_admin_search_indexes')]
+    after = [('omr_app', '0028_backfill_question_similarity')]
+
+    def test_existing_questions_are_indexed(self):
+        apps = self.migrate(self.before)
+        Subject_, Question_ = apps.get_model('omr_app', 'Subject'), apps.get_model('omr_app', 'Question')
+        subject = Subject_.objects.create(name="Science", board='CBSE', class_level=10)
+        # Historical models send no signals, like questions saved before 0020
+        rows = [
+            ("Which gas do green plants absorb during photosynthesis?", ("Oxygen", "Carbon dioxide", "Nitrogen", "Hydrogen")),
+            ("Which gas do green plant absorb during photosynthesis?", ("Oxygen", "Carbon dioxide", "Nitrogen", "Hydrogen")),
+            ("", ("", "", "", "")),
+        ]
+        ids = [
+            Question_.objects.create(subject=subject, question_text=text, option_a=a, option_b=b, option_c=c,
+                                     option_d=d, correct_option='B', level=1).id
+            for text, (a, b, c, d) in rows
+        ]
+
+        self.migrate(self.after)
+        stored = {qid: similarity.unpack_signature(data)
+                  for qid, data in QuestionSignature.objects.values_list('question_id', 'signature')}
+        self.assertEqual(stored, {qid: similarity.signature(*row) for qid, row in zip(ids, rows)})
+        self.assertEqual(QuestionLSHBucket.objects.count(), 2 * similarity.BANDS)
+        self.assertEqual({qid for qid, _score in similarity.find_similar(*rows[0])}, set(ids[:2]))
+
+
+def use_archive_dir(test):
+    directory = test.enterContext(tempfile.TemporaryDirectory())
+    test.enterContext(override_settings(OMR_ARCHIVE_DIR=directory))
+    archive._read_block.cache_clear()
+    cache.clear()
+    return directory
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects, cls.submissions = seed_dataset(seed=15, students=300, subjects=1, questions_per_level=5)
+
+    def setUp(self):
+        self.directory = use_archive_dir(self)
+
+    def test_round_trip(self):
+        reports = {s.id: build_report_data(s.id).to_dict() for s in self.submissions[::37]}
+        archived = archive_submissions(StudentSubmission.objects.all())
+        month = self.submissions[0].submitted_at.strftime('%Y-%m')
+        self.assertEqual(archived, {month: 300})
+        self.assertFalse(StudentSubmission.objects.exists())
+
+        manifest = SubmissionArchive.objects.get()
+        self.assertEqual(len(manifest.blocks), 2)
+        self.assertTrue(verify_archive(manifest))
+        for submission_id, report in reports.items():
+            self.assertEqual(build_report_data(submission_id).to_dict(), report)
+        record = archive.archived_submission(self.submissions[5].id)
+        self.assertEqual(record['answers'], self.submissions[5].answers)
+        self.assertEqual(sorted(r['id'] for r in archive.iter_archived()), [s.id for s in self.submissions])
+        # Archived results are still served
+        response = self.client.get(f'/api/results/{self.submissions[-1].id}/')
+        self.assertEqual(response.json()['score'], self.submissions[-1].score)
+
+    @override_settings(OMR_RESCORE={'background': False})
+    def test_rescoring_leaves_archives_alone(self):
+        archive_submissions(StudentSubmission.objects.filter(id__lte=self.submissions[9].id))
+        reports = {s.id: build_report_data(s.id).to_dict() for s in self.submissions[:10]}
+        question = Question.objects.get(id=int(next(iter(self.submissions[0].answers))))
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/admin/omr_app/question/{question.id}/change/', {
+                'subject': question.subject_id, 'question_text': question.question_text,
+                'option_a': "A", 'option_b': "B", 'option_c': "C", 'option_d': "D",
+                'correct_option': 'D' if question.correct_option != 'D' else 'A', 'level': question.level,
+                'correct_key': 'on',
+            }, follow=True)
+        self.assertContains(response, "10 archived submissions are not rescored")
+        self.assertEqual(RescoreJob.objects.get().status, 'done')
+        for submission_id, report in reports.items():
+            cache.clear()
+            self.assertEqual(build_report_data(submission_id).to_dict(), report)
+
+    def test_seeded_papers_are_partitioned_by_session(self):
+        StudentSubmission.objects.filter(id__in=[s.id for s in self.submissions[:10]]).update(exam_session='mock-1')
+        archived = archive_submissions(StudentSubmission.objects.filter(id__lte=self.submissions[19].id))
+        self.assertEqual(archived['session-mock-1'], 10)
+        self.assertEqual(sum(archived.values()), 20)
+        self.assertEqual(StudentSubmission.objects.count(), 280)
+
+    def test_dry_run_changes_nothing(self):
+        call_command('archive_submissions', '--older-than-days', '-1', '--dry-run', stdout=StringIO())
+        self.assertEqual(StudentSubmission.objects.count(), 300)
+        self.assertFalse(os.listdir(self.directory))
+
+    def test_tampered_file_fails_verification(self):
+        archive_submissions(StudentSubmission.objects.filter(id=self.submissions[0].id))
+        manifest = SubmissionArchive.objects.get()
+        with open(os.path.join(self.directory, manifest.file), 'ab') as fh:
+            fh.write(b'x')
+        self.assertFalse(verify_archive(manifest))
+
+    def test_saved_questions_are_archived(self):
+        StudentSavedQuestions.objects.create(student=self.submissions[0].student, subject=self.subjects[0], question_ids=[1, 2])
+        call_command('archive_submissions', '--older-than-days', '-1', '--saved-questions', stdout=StringIO())
+        self.assertFalse(StudentSavedQuestions.objects.exists())
+        self.assertEqual([r['question_ids'] for r in archive.iter_archived('saved_questions')], [[1, 2]])
+
+
+class ResultsExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.subjects, cls.submissions = seed_dataset(seed=16, students=25, subjects=2, questions_per_level=4)
+
+    def export(self, **params):
+        self.client.force_login(self.admin_user)
+        response = self.client.get('/api/export_results/', params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_rows_match_the_submissions(self):
+        rows = list(csv.DictReader(StringIO(self.export(questions='1').decode())))
+        self.assertEqual([int(row['submission_id']) for row in rows], [s.id for s in self.submissions])
+        submission, row = self.submissions[3], rows[3]
+        self.assertEqual(int(row['score']), submission.score)
+        for subject in self.subjects:
+            label = f"{subject.name} (#{subject.id})"
+            self.assertEqual(int(row[f"{label} score"]), submission.subject_scores[subject.name])
+            self.assertEqual(sum(int(row[f"{label} L{level} total"]) for level in (1, 2, 3, 4)), 16)
+        self.assertEqual({k[1:]: v for k, v in row.items() if k.startswith('q') and v}, submission.answers)
+
+    def test_same_named_subjects_get_their_own_columns(self):
+        other, other_submissions = seed_dataset(seed=17, students=3, subjects=1, questions_per_level=4, class_level=9)
+        self.assertEqual(other[0].name, self.subjects[0].name)
+        export = ResultsExport(CohortFilter(subject_ids=[self.subjects[0].id, other[0].id]))
+        ten, nine = f"{self.subjects[0].name} (#{self.subjects[0].id})", f"{other[0].name} (#{other[0].id})"
+        self.assertIn(f"{ten} score", export.columns)
+        self.assertIn(f"{nine} score", export.columns)
+        rows = {row['submission_id']: row for row in export.rows()}
+        nine_row = rows[other_submissions[0].id]
+        self.assertEqual(nine_row[f"{nine} score"], other_submissions[0].subject_scores[other[0].name])
+        self.assertIsNone(nine_row[f"{ten} score"])
+        self.assertEqual(nine_row[f"{ten} L1 total"], 0)
+        ten_row = rows[self.submissions[0].id]
+        self.assertEqual(ten_row[f"{ten} score"], self.submissions[0].subject_scores[self.subjects[0].name])
+        self.assertIsNone(ten_row[f"{nine} score"])
+
+    def test_jsonl_and_parquet_carry_the_same_rows(self):
+        lines = [json.loads(line) for line in self.export(output='jsonl').splitlines()]
+        self.assertEqual(len(lines), 25)
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(BytesIO(self.export(output='parquet')))
+        self.assertEqual(table.to_pylist(), lines)
+
+    def test_rows_are_streamed_in_chunks(self):
+        export = ResultsExport(CohortFilter(), chunk_size=10)
+        chunks = list(export.stream('parquet'))
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(len(list(ResultsExport(CohortFilter(school='School 1')).rows())), 5)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get('/api/export_results/').status_code, 403)
+        self.client.force_login(self.admin_user)
+        self.assertEqual(self.client.get('/api/export_results/', {'output': 'xlsx'}).status_code, 400)
+        with self.assertRaises(ExportError):
+            ResultsExport(CohortFilter()).stream('xlsx')
+
+
+class LiveDashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.subjects, _submissions = seed_dataset(seed=18, students=3, subjects=2, questions_per_level=5)
+        cls.students = list(Student.objects.order_by('id'))
+
+    def setUp(self):
+        use_snapshot_dir(self)
+        self.enterContext(mock.patch.dict(hub._boards, clear=True))
+
+    def start(self, student, exam_session='mock-1'):
+        self.client.post('/api/get_random_questions/', {
+            'student_id': student.id, 'subject_ids': [s.id for s in self.subjects], 'exam_session': exam_session,
+        }, content_type='application/json')
+
+    def submit(self, student, paper_key='mock-1'):
+        return self.client.post('/api/submit_answers/', {
+            'student_id': student.id, 'subject_ids': [s.id for s in self.subjects], 'paper_key': paper_key, 'answers': {},
+        }, content_type='application/json')
+
+    def counters(self, board):
+        return board.papers_issued, board.in_progress, board.submitted
+
+    def test_seeded_session_counters(self):
+        self.start(self.students[0])
+        board = hub.board('mock-1')
+        self.assertEqual(self.counters(board), (1, 1, 0))
+        self.start(self.students[1])
+        self.submit(self.students[0])
+        self.assertEqual(self.counters(board), (2, 1, 1))
+        self.assertEqual(board.recent[0]['student'], self.students[0].name)
+        self.assertEqual(sum(board.distribution), 1)
+        # A reload from the database agrees with the incremental counters
+        fresh = SessionBoard('mock-1')
+        fresh.load()
+        self.assertEqual(fresh.snapshot(), dict(board.snapshot(), version=0))
+
+    def test_unseeded_papers_count_on_the_day_board(self):
+        session = day_session(timezone.localdate())
+        board = hub.board(session)
+        # The seeded submissions were made today without a session
+        self.assertEqual(self.counters(board), (3, 0, 3))
+        student = Student.objects.create(
+            name="Walk-in", school="School 1", fatherName="F", motherName="M", address="-", favouriteSubject="-",
+            classLevel="10", stream="-", fatherOccupation="-", motherOccupation="-", phone="0",
+        )
+        self.client.post('/api/get_random_questions/', {
+            'student_id': student.id, 'subject_ids': [s.id for s in self.subjects],
+        }, content_type='application/json')
+        # Two saved question sets, one paper
+        self.assertEqual(StudentSavedQuestions.objects.filter(student=student).count(), 2)
+        self.assertEqual(self.counters(board), (4, 1, 3))
+        answers = {str(Question.objects.filter(subject=self.subjects[0]).first().id): 'A'}
+        self.client.post('/api/submit_answers/', {
+            'student_id': student.id, 'subject_ids': [s.id for s in self.subjects], 'answers': answers,
+        }, content_type='application/json')
+        self.assertEqual(self.counters(board), (4, 0, 4))
+        # Saved question sets are deleted on submit; the recount still finds the paper
+        fresh = SessionBoard(session)
+        fresh.load()
+        self.assertEqual(self.counters(fresh), (4, 0, 4))
+
+    def test_unwatched_sessions_cost_no_queries(self):
+        submission = StudentSubmission(id=10 ** 6, student_id=self.students[0].id, score=0, exam_session='nobody-watching')
+        with self.assertNumQueries(0):
+            submission_saved(StudentSubmission, submission, created=True)
+
+    def test_polling_gets_304_until_the_board_changes(self):
+        self.client.force_login(self.admin_user)
+        first = self.client.get('/api/live/mock-1/')
+        self.assertEqual(first.json()['papers_issued'], 0)
+        unchanged = self.client.get('/api/live/mock-1/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+        self.start(self.students[0])
+        changed = self.client.get('/api/live/mock-1/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['papers_issued'], 1)
+
+
+    def test_dashboard_follows_the_event_stream(self):
+        self.client.force_login(self.admin_user)
+        page = self.client.get('/live/mock-1/')
+        self.assertContains(page, 'new EventSource("/api/live/mock-1/events/")')
+        self.start(self.students[0])
+        response = self.client.get('/api/live/mock-1/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        first = next(iter(response.streaming_content)).decode()
+        response.close()
+        self.assertTrue(first.startswith('id: ') and '\nevent: update\n' in first)
+        self.assertEqual(json.loads(first.split('data: ', 1)[1])['papers_issued'], 1)
+
+class SignalRegistrationTests(SimpleTestCase):
+    def test_receivers_are_registered_without_the_views(self):
+        # A fresh interpreter, as in a management command that never imports the URLconf;
+        # without the admin, whose autodiscovery imports most modules anyway
+        probe = (
+            "import django, sys; from ils_project import settings; "
+            "settings.INSTALLED_APPS.remove('django.contrib.admin'); django.setup(); "
+            "from django.db.models.signals import post_save; "
+            "print(sorted({r.__module__ for _key, ref, _async in post_save.receivers if (r := ref()) is not None "
+            "and r.__module__.startswith('omr_app.')}), 'omr_app.views' in sys.modules)"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='ils_project.settings')
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+        proc = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, env=env, check=True)
+        self.assertEqual(proc.stdout.strip(), str([
+            'omr_app.live', 'omr_app.models', 'omr_app.rescoring', 'omr_app.search', 'omr_app.similarity',
+        ]) + ' False')
+
+
+class AdaptiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects, _submissions = seed_dataset(seed=19, students=1, subjects=1, questions_per_level=20)
+        cls.subject = cls.subjects[0]
+        cls.student = Student.objects.get()
+
+    def setUp(self):
+        cache.clear()
+
+    def draw_paper(self, table, rng, ability):
+        """Serve a whole paper to a simulated student; returns the question ids served."""
+        state = adaptive.new_state()
+        while (qid := adaptive.next_question(state, table, rng)) is not None:
+            b = adaptive.item_difficulty(table.level[qid])
+            right = rng.random() < 1 / (1 + math.exp(b - ability))
+            adaptive.record_answer(state, table, qid, table.key[qid] if right else 'X')
+        return state
+
+    def test_ties_do_not_concentrate_exposure(self):
+        # Uncalibrated bank: every question of a level is equally informative
+        table = adaptive.item_table(self.subject.id)
+        rng = random.Random(0)
+        first = Counter(adaptive.next_question(adaptive.new_state(), table, rng) for _ in range(400))
+        # At ability 0, levels 2 and 3 are equally informative: all 40 items are candidates
+        self.assertEqual({table.level[qid] for qid in first}, {2, 3})
+        self.assertGreaterEqual(len(first), 35)
+        self.assertLess(max(first.values()), 30)
+
+        exposure = Counter()
+        for _ in range(200):
+            exposure.update(self.draw_paper(table, rng, rng.gauss(0, 1))['served'])
+        self.assertGreaterEqual(len(exposure), 60)
+        # No question is on more than half the papers
+        self.assertLess(max(exposure.values()), 100)
+
+    def test_stopping_rules(self):
+        table = adaptive.item_table(self.subject.id)
+        rng = random.Random(1)
+        with override_settings(OMR_ADAPTIVE={'min_items': 5, 'max_items': 8, 'target_se': 0.01}):
+            # Precision never reached: stops at max_items
+            self.assertEqual(self.draw_paper(table, rng, 0.0)['answered'], 8)
+        with override_settings(OMR_ADAPTIVE={'min_items': 3, 'max_items': 30, 'target_se': 0.9}):
+            # Precise enough once min_items are answered
+            state = self.draw_paper(table, rng, 0.0)
+            self.assertEqual(state['answered'], 3)
+            self.assertLessEqual(state['se'], 0.9)
+        small = adaptive.ItemTable(self.subject.id, [(1, 1, 'A', -1.5), (2, 4, 'B', 1.5)], depth=10)
+        with override_settings(OMR_ADAPTIVE={'min_items': 5, 'max_items': 20, 'target_se': 0.01}):
+            # Stops when the bank runs out
+            state = adaptive.new_state()
+            while (qid := adaptive.next_question(state, small, rng)) is not None:
+                adaptive.record_answer(state, small, qid, 'A')
+            self.assertEqual(sorted(state['served']), [1, 2])
+            self.assertTrue(state['done'])
+
+    def test_estimate_follows_the_answers(self):
+        table = adaptive.item_table(self.subject.id)
+        rng = random.Random(2)
+        strong, weak = self.draw_paper(table, rng, 3.0), self.draw_paper(table, rng, -3.0)
+        self.assertGreater(strong['theta'], 1.0)
+        self.assertLess(weak['theta'], -1.0)
+
+    def test_endpoint_serves_and_submits_a_paper(self):
+        payload = {'student_id': self.student.id, 'subject_id': self.subject.id, 'paper_key': 'cat-1'}
+        response = self.client.post('/api/adaptive/next_question/', payload, content_type='application/json').json()
+        served = 0
+        while response['question'] is not None:
+            served += 1
+            question = Question.objects.get(id=response['question']['id'])
+            response = self.client.post('/api/adaptive/next_question/', dict(
+                payload, question_id=question.id, option=question.correct_option,
+            ), content_type='application/json').json()
+        self.assertTrue(response['progress']['done'])
+        self.assertEqual(response['progress']['answered'], served)
+        result = self.client.post('/api/submit_answers/', {
+            'student_id': self.student.id, 'subject_ids': [self.subject.id], 'paper_key': 'cat-1', 'answers': {},
+        }, content_type='application/json').json()
+        # Scored on the questions served, out of the number served
+        self.assertEqual((result['score'], result['total']), (served, served))
+        ability = {
+            'ability': response['progress']['ability'], 'standard_error': response['progress']['standard_error'],
+            'served': served,
+        }
+        self.assertGreater(ability['ability'], 1.0)
+        self.assertEqual(result['abilities'], {str(self.subject.id): ability})
+        submission = StudentSubmission.objects.get(id=result['submission_id'])
+        self.assertEqual(submission.abilities, {str(self.subject.id): ability})
+        self.assertEqual(submission.subject_scores, {self.subject.name: served})
+
+    def test_unanswered_questions_count_against_the_total(self):
+        payload = {'student_id': self.student.id, 'subject_id': self.subject.id, 'paper_key': 'cat-2'}
+        for _ in range(3):
+            question = self.client.post('/api/adaptive/next_question/', payload,
+                                        content_type='application/json').json()['question']
+            wrong = next(option for option in 'ABCD' if option != Question.objects.get(id=question['id']).correct_option)
+            self.client.post('/api/adaptive/next_question/', dict(payload, question_id=question['id'], option=wrong),
+                             content_type='application/json')
+        # The fourth question was served but never answered
+        result = self.client.post('/api/submit_answers/', {
+            'student_id': self.student.id, 'subject_ids': [self.subject.id], 'paper_key': 'cat-2',
+        }, content_type='application/json').json()
+        self.assertEqual((result['score'], result['total']), (0, 4))
+        self.assertLess(result['abilities'][str(self.subject.id)]['ability'], 0)
+
+    def test_ids_must_be_integers(self):
+        for payload in ({'student_id': 'x', 'subject_id': self.subject.id}, {'student_id': self.student.id, 'subject_id': 'x'},
+                        {'subject_id': self.subject.id}):
+            response = self.client.post('/api/adaptive/next_question/', dict(payload, paper_key='cat-3'),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+
+class SimilarityTests(TestCase):
+    TEXT = "Which gas do green plants absorb from the atmosphere during photosynthesis in sunlight?"
+    OPTIONS = ("Oxygen", "Carbon dioxide", "Nitrogen", "Hydrogen")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.subject = Subject.objects.create(name="Science", class_level=10)
+        cls.original = cls.question(cls.TEXT, cls.OPTIONS)
+        cls.copy = cls.question(cls.TEXT.replace("green plants", "green plant"), cls.OPTIONS)
+        cls.other = cls.question("What is the value of the definite integral of x squared from zero to three?",
+                                 ("3", "6", "9", "27"))
+
+    @classmethod
+    def question(cls, text, options):
+        a, b, c, d = options
+        return Question.objects.create(subject=cls.subject, question_text=text, option_a=a, option_b=b,
+                                       option_c=c, option_d=d, correct_option='B')
+
+    def test_numpy_signatures_match_python(self):
+        texts = [(self.TEXT, self.OPTIONS), ("Tiny", ("A", "B")), ("", ()), ("x" * 300, ("Yes", "No"))]
+        self.assertEqual(similarity.signatures_numpy(texts, chunk_size=3), [similarity.signature(*row) for row in texts])
+
+    def test_near_duplicates_are_found_and_distinct_questions_are_not(self):
+        matches = dict(similarity.find_similar(self.TEXT, self.OPTIONS))
+        self.assertEqual(set(matches), {self.original.id, self.copy.id})
+        self.assertEqual(matches[self.original.id], 1.0)
+        self.assertGreaterEqual(matches[self.copy.id], 0.8)
+        self.assertEqual(similarity.find_similar(self.TEXT, self.OPTIONS, exclude_id=self.original.id)[0][0], self.copy.id)
+        groups = similarity.duplicate_groups()
+        self.assertEqual([[qid for qid, _score in group] for group in groups], [[self.original.id, self.copy.id]])
+
+    def test_save_signal_keeps_the_index_current(self):
+        self.copy.question_text = "Name the largest planet of the solar system and its most famous storm."
+        self.copy.save()
+        self.assertEqual(dict(similarity.find_similar(self.TEXT, self.OPTIONS)), {self.original.id: 1.0})
+        # Saves that leave the text alone don't re-index
+        with CaptureQueriesContext(connection) as queries:
+            Question.objects.get(id=self.other.id).save(update_fields=['correct_option'])
+        self.assertFalse([q for q in queries if 'questionsignature' in q['sql'] or 'questionlshbucket' in q['sql']])
+
+    def test_rebuild_covers_bulk_imports(self):
+        Question.objects.bulk_create([Question(
+            subject=self.subject, question_text=self.TEXT, option_a=self.OPTIONS[0], option_b=self.OPTIONS[1],
+            option_c=self.OPTIONS[2], option_d=self.OPTIONS[3], correct_option='B',
+        )])
+        self.assertEqual(len(similarity.find_similar(self.TEXT, self.OPTIONS)), 2)
+        out = StringIO()
+        call_command('index_questions', stdout=out)
+        self.assertIn("Indexed 4 questions", out.getvalue())
+        self.assertIn("1 near-duplicate clusters (3 questions)", out.getvalue())
+        self.assertEqual(len(similarity.find_similar(self.TEXT, self.OPTIONS)), 3)
+
+    def test_check_duplicates_endpoint(self):
+        rows = [
+            {'question_text': self.TEXT, 'option_a': "Oxygen", 'option_b': "Carbon dioxide",
+             'option_c': "Nitrogen", 'option_d': "Hydrogen"},
+            {'question_text': "Who wrote the national anthem of India and in which year was it first sung?",
+             'option_a': "Tagore", 'option_b': "Bankim", 'option_c': "Iqbal", 'option_d': "Naidu"},
+            {'question_text': "Who wrote the national anthem of India and in which year was it first sung?",
+             'option_a': "Tagore", 'option_b': "Bankim", 'option_c': "Iqbal", 'option_d': "Naidu"},
+        ]
+        url = '/api/questions/check_duplicates/'
+        self.assertEqual(self.client.post(url, {'questions': rows}, content_type='application/json').status_code, 403)
+        self.client.force_login(self.admin_user)
+        self.assertEqual(self.client.post(url, {'questions': 'x'}, content_type='application/json').status_code, 400)
+        results = self.client.post(url, {'questions': rows}, content_type='application/json').json()['results']
+        self.assertEqual({match['question_id'] for match in results[0]['matches']}, {self.original.id, self.copy.id})
+        self.assertEqual(results[1], {'index': 1, 'matches': [], 'batch_matches': []})
+        self.assertEqual(results[2]['batch_matches'], [{'index': 1, 'similarity': 1.0}])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.science = Subject.objects.create(name="Science", class_level=10)
+        cls.state_science = Subject.objects.create(name="Science", class_level=10, board='STATE')
+        cls.plants = cls.question(cls.science, "Photosynthesis in green plants needs sunlight", level=1)
+        cls.leaves = cls.question(cls.science, "Why are leaves green?", level=2, option_a="Photosynthesis pigment")
+        cls.state = cls.question(cls.state_science, "Where does photosynthesis happen in the cell?", level=1)
+        cls.other = cls.question(cls.science, "What is the boiling point of water?", level=1)
+
+    @classmethod
+    def question(cls, subject, text, level, option_a="A"):
+        return Question.objects.create(subject=subject, question_text=text, option_a=option_a, option_b="B",
+                                       option_c="C", option_d="D", correct_option='A', level=level)
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def search(self, **params):
+        response = self.client.get('/api/questions/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [result['id'] for result in response.json()['results']]
+
+    def test_ranked_prefix_search(self):
+        # The last term matches as a prefix; text matches rank above option matches
+        ids = self.search(q="photosyn")
+        self.assertEqual(set(ids), {self.plants.id, self.leaves.id, self.state.id})
+        self.assertEqual(ids[-1], self.leaves.id)
+        result = self.client.get('/api/questions/search/', {'q': "boiling"}).json()['results'][0]
+        self.assertEqual(result['snippet'], "What is the [boiling] point of water?")
+        self.assertEqual((result['subject'], result['board']), ("Science", 'CBSE'))
+        # Every term must match; FTS5 syntax in the query is plain text
+        self.assertEqual(self.search(q="green sunlight"), [self.plants.id])
+        self.assertEqual(self.search(q='water" OR "photosynthesis'), [])
+        self.assertEqual(self.search(q="  "), [])
+
+    def test_filters_and_paging(self):
+        self.assertEqual(set(self.search(q="photosynthesis", board='STATE')), {self.state.id})
+        self.assertEqual(set(self.search(q="photosynthesis", level='2')), {self.leaves.id})
+        self.assertEqual(set(self.search(q="photosynthesis", subject=f'{self.science.id}', level='1,2')),
+                         {self.plants.id, self.leaves.id})
+        everything = self.search(q="photosynthesis")
+        self.assertEqual(self.search(q="photosynthesis", limit=1, offset=1), everything[1:2])
+        self.assertEqual(self.client.get('/api/questions/search/', {'q': "x", 'level': "two"}).status_code, 400)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.other.question_text = "Photosynthesis releases which gas?"
+        self.other.save()
+        self.assertIn(self.other.id, self.search(q="photosynthesis"))
+        self.assertEqual(self.search(q="boiling"), [])
+        self.state_science.board = 'CBSE'
+        self.state_science.save()
+        self.assertIn(self.state.id, self.search(q="photosynthesis", board='CBSE'))
+        self.plants.delete()
+        self.assertNotIn(self.plants.id, self.search(q="photosynthesis"))
+
+    def test_rebuild_covers_bulk_imports(self):
+        Question.objects.bulk_create([Question(subject=self.science, question_text="Mitochondria make energy",
+                                               option_a="A", option_b="B", option_c="C", option_d="D",
+                                               correct_option='A')])
+        self.assertEqual(self.search(q="mitochondria"), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn("SQLiteFTSBackend", out.getvalue())
+        self.assertEqual(len(self.search(q="mitochondria")), 1)
+
+    def test_admin_search_and_database_backend(self):
+        response = self.client.get('/admin/omr_app/question/', {'q': "photosyn"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({q.id for q in response.context['cl'].result_list},
+                         {self.plants.id, self.leaves.id, self.state.id})
+        with mock.patch.object(search, '_backend', search.DatabaseBackend()):
+            self.assertEqual(self.search(q="photosynthesis", board='STATE'), [self.state.id])
+            self.assertEqual(self.search(q="green sunlight"), [self.plants.id])
+
+
+def slow_view(request, seconds=0.1):
+    time.sleep(seconds)
+    return Response({})
+
+
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.factory = RequestFactory()
+
+    def profile(self, seconds, **config):
+        config = {'enabled': True, 'interval_ms': 1, 'dir': self.dir, **config}
+        middleware = profiling.ProfilingMiddleware(lambda request: slow_view(request, seconds))
+        with override_settings(OMR_PROFILER=config):
+            response = middleware(self.factory.get('/api/subjects/', {'class_level': 10}))
+            self.assertEqual(response.status_code, 200)
+            return profiling.list_profiles()
+
+    def test_slow_and_sampled_requests_are_kept(self):
+        profiles = self.profile(0.15, slow_ms=50, watch_after_ms=10)
+        self.assertEqual(len(profiles), 1)
+        summary = profiles[0]
+        self.assertEqual((summary['view'], summary['reason'], summary['status']), ('subject-list', 'slow', 200))
+        self.assertEqual(summary['params'], {'class_level': '10'})
+        self.assertGreaterEqual(summary['duration_ms'], 150)
+        with override_settings(OMR_PROFILER={'dir': self.dir}):
+            stacks = profiling.load_profile(summary['name'])['stacks']
+        # Only frames below the middleware are recorded
+        self.assertTrue(all(stack.startswith('<lambda>') for stack in stacks))
+        self.assertTrue(any('slow_view' in stack for stack in stacks))
+
+        # File names only order profiles to the second
+        self.assertEqual(sorted(p['reason'] for p in self.profile(0.05, sample_rate=1.0)), ['sampled', 'slow'])
+
+    def test_fast_and_disabled_requests_are_not_kept(self):
+        self.assertEqual(self.profile(0.02, slow_ms=5000, watch_after_ms=10), [])
+        self.assertEqual(self.profile(0.05, enabled=False, sample_rate=1.0), [])
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_only_the_newest_profiles_are_kept(self):
+        for _ in range(3):
+            self.profile(0.02, sample_rate=1.0, keep=2)
+        self.assertEqual(len(os.listdir(self.dir)), 2)
+
+    def test_flamegraph(self):
+        svg = flamegraph_svg({'view (a.py:1);query (b.py:2)': 3, 'view (a.py:1);<render> (c.py:3)': 1})
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertIn('view (a.py:1) - 4 samples (100.0%)', svg)
+        self.assertIn('query (b.py:2) - 3 samples (75.0%)', svg)
+        self.assertIn('&lt;render&gt;', svg)
+
+    def test_profile_pages(self):
+        name = self.profile(0.02, sample_rate=1.0)[0]['name']
+        with override_settings(OMR_PROFILER={'dir': self.dir}):
+            self.assertEqual(self.client.get('/profiles/').status_code, 302)
+            self.client.force_login(self.admin_user)
+            listing = self.client.get('/profiles/')
+            self.assertContains(listing, name)
+            self.assertContains(self.client.get(f'/profiles/{name}/'), '<svg')
+            self.assertEqual(self.client.get(f'/profiles/{name}/', {'output': 'json'}).json()['view'], 'subject-list')
+            self.assertEqual(self.client.get('/profiles/..%2Fsettings.json/').status_code, 404)
+            self.assertEqual(self.client.get('/profiles/missing.json/').status_code, 404)
+
+
+class TracingTests(TestCase):
+    def setUp(self):
+        self.enterContext(mock.patch.dict(tracing._stats, clear=True))
+        self.enterContext(mock.patch.dict(tracing._totals, clear=True))
+
+    def test_spans(self):
+        trace = Trace('test')
+        trace.lap('story.cover', flowables=2)
+        with trace.span('chart', 'Maths') as counts:
+            counts['bars'] = 8
+        for _ in range(3):
+            trace.add('page_callbacks', 0.002, pages=1)
+        trace.lap('story.notes')
+        stages = [(span['stage'], span.get('label')) for span in trace.spans]
+        self.assertEqual(stages, [('story.cover', None), ('chart', 'Maths'), ('page_callbacks', None), ('story.notes', None)])
+        self.assertEqual(trace.spans[1]['bars'], 8)
+        self.assertEqual({k: trace.spans[2][k] for k in ('ms', 'calls', 'pages')}, {'ms': 6.0, 'calls': 3, 'pages': 3})
+        self.assertEqual(trace.ms('page_callbacks'), 6.0)
+        # A span nested in a lap doesn't move the lap mark
+        self.assertGreaterEqual(trace.spans[3]['ms'], trace.spans[1]['ms'])
+
+        trace.finish()
+        self.assertEqual(trace.to_dict()['total_ms'], trace.total_ms)
+        header = trace.server_timing()
+        self.assertIn('story-cover;dur=', header)
+        self.assertIn('page_callbacks;dur=6.0', header)
+        self.assertTrue(header.endswith(f'total;dur={trace.total_ms:.1f}'))
+
+    def test_finish_aggregates_and_logs_slow_renders(self):
+        for _ in range(2):
+            trace = Trace('test')
+            trace.record('layout', 0.010)
+            trace.finish()
+        stats = tracing.stats()['test']
+        self.assertEqual((stats['renders'], stats['slow']), (2, 0))
+        self.assertEqual(stats['stages']['layout'], {'spans': 2, 'mean_ms': 10.0, 'max_ms': 10.0})
+        with override_settings(OMR_REPORT_SLOW_MS=0), self.assertLogs('omr_app.tracing', 'WARNING') as logs:
+            Trace('test').finish()
+        self.assertIn("Slow test render", logs.output[0])
+        self.assertEqual(tracing.stats()['test']['slow'], 1)
+
+    def test_pdf_response_carries_server_timing(self):
+        _subjects, submissions = seed_dataset(seed=23, students=1, subjects=2, questions_per_level=3)
+        response = self.client.get(f'/api/generate_pdf/{submissions[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        stages = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        for stage in ('fetch', 'story-cover', 'chart', 'story-subject_section', 'layout', 'serialize', 'total'):
+            self.assertIn(stage, stages)
+        stats = tracing.stats()['student_pdf']
+        self.assertEqual(stats['renders'], 1)
+        self.assertEqual(stats['stages']['chart']['spans'], 2)
+
+
+class WarmExamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.subjects, _submissions = seed_dataset(seed=29, students=3, subjects=2, questions_per_level=8, schools=2)
+        cls.students = list(Student.objects.order_by('id'))
+
+    def setUp(self):
+        use_snapshot_dir(self)
+
+    def test_warming_prepares_the_roster_papers(self):
+        trace = warm_exam('cbse', [10], exam_session='mock-1', students=Student.objects.all())
+        self.assertIsNotNone(trace.total_ms)
+        spans = {span['stage']: span for span in trace.spans}
+        self.assertEqual(list(spans), ['subject_lists', 'pools', 'item_tables', 'snapshots', 'payloads',
+                                       'answer_keys', 'images', 'papers'])
+        self.assertEqual(spans['payloads']['payloads'], spans['pools']['questions'])
+        self.assertEqual({k: spans['papers'][k] for k in ('students', 'created', 'questions')},
+                         {'students': 3, 'created': 3, 'questions': 3 * 2 * 20})
+        self.assertEqual(ExamDraft.objects.filter(paper_key='mock-1').exclude(snapshot=None).count(), 3)
+
+        # The first request of the sitting only reads
+        student = self.students[0]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/get_random_questions/', {
+                'student_id': student.id, 'subject_ids': [subject.id for subject in self.subjects],
+                'exam_session': 'mock-1',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries if q['sql'].startswith(('INSERT', 'UPDATE'))])
+        snapshot_id = ExamDraft.objects.get(student=student, paper_key='mock-1').snapshot_id
+        expected = build_paper(snapshot_id, student.id, self.subjects[0].id, 'mock-1')
+        served = [q['id'] for q in response.json()[self.subjects[0].name]['questions']]
+        self.assertEqual(sorted(served), sorted(qid for ids in expected.values() for qid in ids))
+
+        # Warming again keeps the drafts students already have
+        again = warm_exam('CBSE', [10], exam_session='mock-1', students=Student.objects.all()).spans
+        self.assertEqual({span['stage']: span for span in again}['papers']['created'], 0)
+
+    def test_papers_need_an_explicit_roster(self):
+        # Students carry no board: a STATE student at class 10 must not get the CBSE snapshot
+        with self.assertRaises(ValueError):
+            warm_exam('CBSE', [10], exam_session='mock-1')
+        self.assertFalse(ExamDraft.objects.exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('warm_exam', '--board', 'CBSE', '--class-levels', '10', '--session', 'mock-2',
+                     '--school', self.students[0].school, stdout=out)
+        self.assertIn("Warmed in", out.getvalue())
+        self.assertEqual(list(ExamDraft.objects.filter(paper_key='mock-2').values_list('student__school', flat=True)),
+                         [self.students[0].school] * Student.objects.filter(school=self.students[0].school).count())
+        with self.assertRaises(CommandError):
+            call_command('warm_exam', '--board', 'CBSE', '--class-levels', 'ten')
+        with self.assertRaises(CommandError):
+            call_command('warm_exam', '--board', 'CBSE', '--class-levels', '10', '--session', 'mock-3')
+
+    def test_admin_action(self):
+        self.client.force_login(self.admin_user)
+        response = self.client.post('/admin/omr_app/subject/', {
+            'action': 'warm_exam_caches', '_selected_action': [self.subjects[0].id],
+        }, follow=True)
+        self.assertContains(response, "Warmed CBSE class 10")
+        self.assertFalse(ExamDraft.objects.exists())
+
+
+class PagedDeliveryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects, _submissions = seed_dataset(seed=31, students=1, subjects=3, questions_per_level=8)
+        cls.student = Student.objects.get()
+        # Exam order differs from id order
+        cls.order = [cls.subjects[2].id, cls.subjects[0].id, cls.subjects[1].id]
+
+    def setUp(self):
+        use_snapshot_dir(self)
+
+    def start(self, **extra):
+        return self.client.post('/api/get_random_questions/', {
+            'student_id': self.student.id, 'subject_ids': self.order, 'paged': True, **extra,
+        }, content_type='application/json')
+
+    def walk(self, response):
+        """Follow the manifest from the inline first page; {subject id: question ids}."""
+        manifest = response.json()
+        pages = {manifest['first']['id']: [q['id'] for q in manifest['first']['questions']]}
+        for entry in manifest['subjects'][1:]:
+            page = self.client.get(entry['url'])
+            self.assertEqual(page.status_code, 200)
+            self.assertEqual(page['Cache-Control'], 'private, max-age=10800')
+            pages[entry['id']] = [q['id'] for q in page.json()['questions']]
+        return pages
+
+    def test_seeded_paper_in_pages(self):
+        response = self.start(exam_session='mock-1')
+        manifest = response.json()
+        self.assertEqual([entry['id'] for entry in manifest['subjects']], self.order)
+        self.assertEqual(manifest['first']['next'], self.order[1])
+        self.assertEqual(response['Link'], f"<{manifest['subjects'][1]['url']}>; rel=prefetch; as=fetch")
+
+        pages = self.walk(response)
+        full = self.client.post('/api/get_random_questions/', {
+            'student_id': self.student.id, 'subject_ids': self.order, 'exam_session': 'mock-1',
+        }, content_type='application/json').json()
+        self.assertEqual(pages, {subject.id: [q['id'] for q in full[subject.name]['questions']] for subject in self.subjects})
+        last = self.client.get(manifest['subjects'][2]['url'])
+        self.assertIsNone(last.json()['next'])
+        self.assertFalse(last.has_header('Link'))
+
+    def test_unseeded_paper_is_saved_and_served_again(self):
+        first = self.walk(self.start())
+        self.assertEqual(StudentSavedQuestions.objects.filter(student=self.student).count(), 3)
+        self.assertEqual(self.walk(self.start()), first)
+        self.assertTrue(all(len(ids) == 20 for ids in first.values()))
+
+    def test_prefetch_hints_the_next_pages_images(self):
+        Question.objects.filter(subject_id=self.order[1]).update(question_image='questions/map.png')
+        image = f"<{settings.MEDIA_URL}questions/map.png>; rel=prefetch; as=image"
+        for extra in ({}, {'exam_session': 'mock-2'}):
+            response = self.start(**extra)
+            self.assertEqual(response['Link'].split(', ')[1:], [image])
+        # Only ids and image names are read for the hint, not the next page's questions
+        page = self.client.get(response.json()['subjects'][0]['url'])
+        self.assertEqual(page['Link'].split(', ')[1:], [image])
+        with CaptureQueriesContext(connection) as queries:
+            delivery.prefetch_links(self.student.id, {'next': self.order[1]}, self.order)
+        self.assertFalse([q for q in queries if 'question_text' in q['sql']])
+
+    def test_pages_of_unstarted_papers(self):
+        url = f'/api/paper/{self.student.id}/subjects/{self.order[1]}/'
+        self.assertEqual(self.client.get(url, {'exam_session': 'mock-1'}).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(f'/api/paper/{self.student.id}/subjects/0/').status_code, 404)
+
+
+class OfflineBundleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.subjects, _submissions = seed_dataset(seed=37, students=4, subjects=2, questions_per_level=6, schools=2)
+        cls.roster = list(Student.objects.filter(school="School 1").order_by('id'))
+
+    def setUp(self):
+        use_snapshot_dir(self)
+        self.bundles = self.enterContext(tempfile.TemporaryDirectory())
+        media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(OMR_BUNDLE_DIR=self.bundles, MEDIA_ROOT=media))
+        os.makedirs(os.path.join(media, 'questions'))
+        PILImage.new('RGB', (2000, 1000), (200, 40, 40)).save(os.path.join(media, 'questions', 'map.png'))
+        Question.objects.filter(subject=self.subjects[0], level=1).update(question_image='questions/map.png')
+
+    def build(self):
+        return offline.build_bundle("School 1", 'centre-1', 'cbse', 10)
+
+    def entries(self, bundle):
+        with zipfile.ZipFile(os.path.join(self.bundles, bundle.file)) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+
+    def test_bundle_is_signed_and_deterministic(self):
+        bundle = self.build()
+        entries = self.entries(bundle)
+        signature = json.loads(entries.pop('signature.json'))
+        self.assertEqual(offline.content_hash(entries), bundle.checksum)
+        self.assertEqual(signature, {'bundle': bundle.checksum, 'signature': bundle.signature})
+        self.assertTrue(offline.verify_signature(bundle.checksum, bundle.signature))
+
+        manifest = json.loads(entries['bundle.json'])
+        self.assertEqual([s['id'] for s in manifest['students']], [s.id for s in self.roster])
+        self.assertTrue(all(len(manifest['papers'][str(s.id)][str(self.subjects[0].id)]) == 20 for s in self.roster))
+        self.assertFalse(any('correct_option' in payload for payload in manifest['questions'].values()))
+        # One downsized copy of the shared image
+        self.assertEqual(bundle.image_count, 1)
+        [image] = [name for name in entries if name.startswith('images/')]
+        with PILImage.open(BytesIO(entries[image])) as img:
+            self.assertLessEqual(max(img.size), 800)
+
+        self.assertEqual(self.build().id, bundle.id)
+        self.assertEqual(len(os.listdir(self.bundles)), 1)
+
+    def test_tampered_bundles_do_not_verify(self):
+        bundle = self.build()
+        entries = self.entries(bundle)
+        del entries['signature.json']
+        manifest = json.loads(entries['bundle.json'])
+        manifest['papers'][str(self.roster[0].id)][str(self.subjects[0].id)].reverse()
+        entries['bundle.json'] = json.dumps(manifest).encode()
+        tampered = offline.content_hash(entries)
+        self.assertNotEqual(tampered, bundle.checksum)
+        self.assertFalse(offline.verify_signature(tampered, bundle.signature))
+        self.assertFalse(offline.verify_signature(bundle.checksum, bundle.signature[:-1] + 'x'))
+        with override_settings(SECRET_KEY='another-server'):
+            self.assertFalse(offline.verify_signature(bundle.checksum, bundle.signature))
+
+        self.client.force_login(self.admin_user)
+        for checksum, signature in ((bundle.checksum, 'forged'), (tampered, bundle.signature)):
+            response = self.client.post('/api/offline/import/', {
+                'bundle': checksum, 'signature': signature, 'results': [],
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        bundle.refresh_from_db()
+        self.assertIsNone(bundle.imported_at)
+
+    def test_import_scores_results_once(self):
+        bundle = self.build()
+        papers = json.loads(self.entries(bundle)['bundle.json'])['papers']
+        first, second = self.roster
+        ids = [qid for ids in papers[str(first.id)].values() for qid in ids]
+        key = dict(Question.objects.filter(id__in=ids).values_list('id', 'correct_option'))
+        outsider = Student.objects.exclude(school="School 1").first()
+        upload = {'bundle': bundle.checksum, 'signature': bundle.signature, 'results': [
+            {'student_id': first.id, 'answers': {str(qid): option for qid, option in key.items()}},
+            {'student_id': second.id, 'answers': {}},
+            {'student_id': outsider.id, 'answers': {}},
+        ]}
+        self.client.force_login(self.admin_user)
+        summary = self.client.post('/api/offline/import/', upload, content_type='application/json').json()
+        self.assertEqual((summary['submitted'], summary['already_submitted'], summary['score_total']), (2, 0, 40))
+        self.assertEqual(summary['rejected'], [{'student_id': outsider.id, 'reason': 'not on the roster'}])
+        submission = StudentSubmission.objects.get(student=first, exam_session='centre-1')
+        self.assertEqual((submission.score, submission.snapshot_id), (40, bundle.snapshot_id))
+
+        # The same upload again, gzip-compressed as a file
+        upload_file = BytesIO(gzip.compress(json.dumps(upload).encode()))
+        upload_file.name = 'results.json.gz'
+        again = self.client.post('/api/offline/import/', {'results': upload_file}).json()
+        self.assertEqual((again['submitted'], again['already_submitted']), (0, 2))
+        self.assertEqual(StudentSubmission.objects.filter(exam_session='centre-1').count(), 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('build_offline_bundle', '--centre', "School 1", '--session', 'centre-1', '--board', 'CBSE',
+                     '--class-level', '10', stdout=out)
+        self.assertIn(f"{len(self.roster)} students", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('build_offline_bundle', '--centre', "Nowhere", '--session', 'centre-1', '--board', 'CBSE',
+                         '--class-level', '10')
+
+
+class ClientTransport:
+    """sync.py's transport over the test client: the edge and the central server share the test database."""
+
+    def __init__(self, client, node_id='centre-1', token='edge-token'):
+        self.client = client
+        self.headers = {'Authorization': f"Bearer {token}", 'X-OMR-Node': node_id}
+        self.posts = 0
+
+    def _content(self, response):
+        if response.status_code >= 400:
+            raise SyncError(f"HTTP {response.status_code}")
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def get(self, path, params=None):
+        return self._content(self.client.get(f'/{path}', params or {}, headers=self.headers))
+
+    def post(self, path, body, content_type='application/json', encoding='gzip'):
+        self.posts += 1
+        return self._content(self.client.post(
+            f'/{path}', body, content_type=content_type, headers={**self.headers, 'Content-Encoding': encoding},
+        ))
+
+
+class LostAckTransport(ClientTransport):
+    """Delivers the nth change set, then fails as if the connection dropped before the acknowledgement."""
+
+    def __init__(self, client, lose):
+        super().__init__(client)
+        self.lose = lose
+
+    def post(self, *args, **kwargs):
+        ack = super().post(*args, **kwargs)
+        if self.posts == self.lose:
+            raise SyncError("connection reset")
+        return ack
+
+
+@override_settings(OMR_SYNC={
+    'node_id': 'centre-1', 'upstream': 'http://central.test/', 'token': 'edge-token', 'batch_size': 2,
+    'nodes': {'centre-1': 'edge-token'},
+})
+class SyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _subjects, cls.submissions = seed_dataset(seed=41, students=3, subjects=2, questions_per_level=4)
+
+    def synced(self):
+        return (Student.objects.filter(origin='centre-1').count(),
+                StudentSubmission.objects.filter(origin='centre-1').count())
+
+    def test_pushed_rows_are_ingested_once(self):
+        summary = sync.push(ClientTransport(self.client))
+        self.assertEqual((summary['batches'], summary['students'], summary['submissions']), (4, 3, 3))
+        self.assertEqual(self.synced(), (3, 3))
+        for submission in self.submissions:
+            copy = StudentSubmission.objects.get(origin='centre-1', origin_id=submission.id)
+            self.assertEqual((copy.score, copy.answers, copy.submitted_at),
+                             (submission.score, submission.answers, submission.submitted_at))
+            self.assertEqual(copy.student.origin_id, submission.student_id)
+        self.assertEqual(sync.pending(), {'students': 0, 'submissions': 0})
+        self.assertEqual(sync.push(ClientTransport(self.client))['batches'], 0)
+
+        # The same batch again is acknowledged without storing anything
+        batch = sync.next_batch(SyncCheckpoint(upstream='replay'), 2)
+        ack = json.loads(ClientTransport(self.client).post('api/sync/push/', gzip.compress(json.dumps(batch).encode())))
+        self.assertEqual((ack['batch'], ack['replayed']), (batch['batch'], True))
+        # Rows already received under another batch name are skipped by (origin, origin_id)
+        SyncCheckpoint.objects.update(student_id=0, submission_id=0)
+        with override_settings(OMR_SYNC=dict(settings.OMR_SYNC, batch_size=10)):
+            self.assertEqual(sync.push(ClientTransport(self.client))['batches'], 2)
+        self.assertEqual(self.synced(), (3, 3))
+        self.assertEqual(list(SyncBatch.objects.filter(batch__contains='-', received=3).values_list('students', 'submissions')),
+                         [(0, 0), (0, 0)])
+
+    def test_ingest_recounts_scores_and_cleans_rows(self):
+        submission = self.submissions[0]
+        batch = sync.next_batch(SyncCheckpoint(upstream='x'), 10)
+        students = [{**row, 'phone': None} for row in batch['students']]
+        student_batch = {'batch': 'student:1-3', 'students': students}
+        self.assertEqual(sync.ingest('centre-1', student_batch)['students'], 3)
+        self.assertEqual(set(Student.objects.filter(origin='centre-1').values_list('phone', flat=True)), {''})
+
+        rows = sync.submission_rows(StudentSubmission.objects.filter(id=submission.id))
+        rows[0].update(score=99, subject_scores={name: 99 for name in submission.subject_scores})
+        sync.ingest('centre-1', {'batch': 'submission:1-1', 'submissions': rows})
+        copy = StudentSubmission.objects.get(origin='centre-1', origin_id=submission.id)
+        self.assertEqual((copy.score, copy.subject_scores), (submission.score, submission.subject_scores))
+
+    def test_concurrent_replay_is_acknowledged(self):
+        batch = sync.next_batch(SyncCheckpoint(upstream='x'), 2)
+        SyncBatch.objects.create(node='centre-1', batch=batch['batch'])
+        # The other request stores the batch between the replay check and the insert
+        with mock.patch.object(sync, '_received', side_effect=[False, True]):
+            ack = sync.ingest('centre-1', batch)
+        self.assertTrue(ack['replayed'])
+        self.assertEqual(self.synced(), (0, 0))
+
+    def test_bank_file_needs_integer_parameters(self):
+        headers = {'Authorization': "Bearer edge-token", 'X-OMR-Node': 'centre-1'}
+        for params in ({'board': 'CBSE', 'class_level': 'ten', 'version': 1}, {'board': 'CBSE', 'class_level': 10}):
+            response = self.client.get('/api/sync/bank/file/', params, headers=headers)
+            self.assertEqual(response.status_code, 400)
+
+    def test_push_resumes_from_the_checkpoint(self):
+        sync.push(ClientTransport(self.client), max_batches=1)
+        point = SyncCheckpoint.objects.get()
+        students = sorted(student.id for student in Student.objects.filter(origin=''))
+        self.assertEqual((point.student_id, point.submission_id, point.batches), (students[1], 0, 1))
+        self.assertEqual(sync.pending(), {'students': 1, 'submissions': 3})
+
+        # The second batch is stored upstream but its acknowledgement never arrives
+        with self.assertRaises(SyncError):
+            sync.push(LostAckTransport(self.client, lose=2))
+        point.refresh_from_db()
+        self.assertEqual((point.student_id, point.submission_id, point.batches), (students[2], 0, 2))
+        self.assertEqual(self.synced(), (3, 2))
+
+        # Resuming sends that batch again; upstream recognises it
+        summary = sync.push(ClientTransport(self.client))
+        self.assertEqual(summary['batches'], 2)
+        self.assertEqual(self.synced(), (3, 3))
+        self.assertEqual(SyncBatch.objects.count(), 4)
+        self.assertEqual(sync.pending(), {'students': 0, 'submissions': 0})
+
+    def test_node_endpoints_need_the_node_token(self):
+        publish_snapshot('CBSE', 10)
+        bank = json.loads(ClientTransport(self.client).get('api/sync/bank/', {'board': 'CBSE', 'class_level': 10}))
+        snapshot = bank['snapshot']
+        body = gzip.compress(json.dumps(sync.next_batch(SyncCheckpoint(upstream='x'), 2)).encode())
+        requests = [
+            ('get', '/api/sync/bank/', {'board': 'CBSE', 'class_level': 10}),
+            ('get', '/api/sync/bank/file/', {'board': 'CBSE', 'class_level': 10, 'version': snapshot['version']}),
+            ('get', '/api/sync/media/', {'name': 'questions/none.png'}),
+            ('post', '/api/sync/push/', body),
+        ]
+        wrong = [
+            {},
+            {'Authorization': "Bearer edge-token"},
+            {'Authorization': "Bearer guessed", 'X-OMR-Node': 'centre-1'},
+            {'Authorization': "Token edge-token", 'X-OMR-Node': 'centre-1'},
+            {'Authorization': "Bearer edge-token", 'X-OMR-Node': 'centre-2'},
+        ]
+        client = self.client_class(enforce_csrf_checks=True)
+        for method, url, data in requests:
+            for headers in wrong:
+                if method == 'get':
+                    response = client.get(url, data, headers=headers)
+                else:
+                    response = client.post(url, data, content_type='application/json',
+                                           headers={**headers, 'Content-Encoding': 'gzip'})
+                self.assertEqual(response.status_code, 403, (url, headers))
+        self.assertEqual(self.synced(), (0, 0))
+        # With the token, the csrf-exempt push goes through without a CSRF token
+        response = client.post('/api/sync/push/', body, content_type='application/json', headers={
+            'Authorization': "Bearer edge-token", 'X-OMR-Node': 'centre-1', 'Content-Encoding': 'gzip',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.synced(), (2, 0))
+
+
+@override_settings(OMR_RESCORE={'background': False, 'batch_size': 4})
+class RescoringTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects, _submissions = seed_dataset(seed=43, students=20, subjects=2, questions_per_level=3)
+        # The most answered question
+        cls.question = Question.objects.get(id=Counter(
+            SubmissionAnswer.objects.values_list('question_id', flat=True)
+        ).most_common(1)[0][0])
+
+    def setUp(self):
+        cache.clear()
+
+    def state(self):
+        return {s.id: (s.score, s.subject_scores) for s in StudentSubmission.objects.all()}
+
+    def correct(self, option):
+        previous = self.question.correct_option
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.correct_option = option
+            self.question.save()
+            return rescoring.correct_key(self.question, previous)
+
+    def test_key_correction_moves_scores_once(self):
+        before = self.state()
+        old = self.question.correct_option
+        new = 'D' if old != 'D' else 'A'
+        answers = {s.id: s.answers.get(str(self.question.id)) for s in StudentSubmission.objects.all()}
+        expected = {}
+        for submission_id, (score, subject_scores) in before.items():
+            delta = (answers[submission_id] == new) - (answers[submission_id] == old)
+            name = self.question.subject.name
+            expected[submission_id] = (score + delta, {**subject_scores, name: subject_scores[name] + delta})
+
+        job = self.correct(new)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((job.total, job.processed), (sum(a is not None for a in answers.values()),) * 2)
+        self.assertEqual(job.changed, sum(a in (old, new) for a in answers.values()))
+        self.assertGreater(job.changed, 0)
+        self.assertEqual(self.state(), expected)
+        changed = next(sid for sid, answer in answers.items() if answer == new)
+        self.assertEqual(self.client.get(f'/api/results/{changed}/').json()['score'], expected[changed][0])
+        packed = StudentSubmission.objects.get(id=changed).packed_answers()
+        self.assertTrue(dict(zip(packed.question_ids, packed.correct_flags()))[self.question.id])
+
+        # Running again against the same key changes nothing
+        self.assertEqual(rescoring.rescore_submissions(list(answers)), 0)
+        again = rescoring.run_job(RescoreJob.objects.create(question_ids=[self.question.id]).id)
+        self.assertEqual((again.status, again.changed), ('done', 0))
+        self.assertEqual(self.state(), expected)
+
+        # Correcting it back restores the original scores
+        self.correct(old)
+        self.assertEqual(self.state(), before)
+
+    def test_failed_job_resumes_after_its_last_batch(self):
+        # The correction is recorded but its job doesn't start
+        with mock.patch.object(rescoring, 'start_job'):
+            job = self.correct('D' if self.question.correct_option != 'D' else 'A')
+        real = rescoring.rescore_submissions
+        calls = []
+
+        def flaky(ids):
+            calls.append(ids)
+            if len(calls) == 2:
+                raise RuntimeError("database went away")
+            return real(ids)
+
+        with mock.patch.object(rescoring, 'rescore_submissions', flaky), \
+                self.assertLogs('omr_app.rescoring', 'ERROR'):
+            failed = rescoring.run_job(job.id)
+        self.assertEqual((failed.status, failed.processed, failed.cursor), ('failed', 4, calls[0][-1]))
+        self.assertIn("database went away", failed.error)
+
+        done = rescoring.run_job(job.id)
+        self.assertEqual((done.status, done.processed), ('done', done.total))
+        affected = SubmissionAnswer.objects.filter(question_id=self.question.id).values_list('submission_id', flat=True)
+        self.assertEqual(rescoring.rescore_submissions(list(affected)), 0)
+
+    def test_corrections_are_explicit_in_the_admin(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        question = self.question
+        new = 'D' if question.correct_option != 'D' else 'A'
+        form = {
+            'subject': question.subject_id, 'question_text': question.question_text, 'option_a': question.option_a,
+            'option_b': question.option_b, 'option_c': question.option_c, 'option_d': question.option_d,
+            'correct_option': question.correct_option, 'level': question.level,
+        }
+        url = f'/admin/omr_app/question/{question.id}/change/'
+
+        # Ticking the box without changing the key is an error
+        response = self.client.post(url, {**form, 'correct_key': 'on'})
+        self.assertContains(response, "Change the correct option to correct the key.")
+
+        # A new key without the box (e.g. reordered options) is not a correction
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {**form, 'correct_option': new}, follow=True)
+        self.assertContains(response, "without an answer key correction")
+        self.assertFalse(AnswerKeyCorrection.objects.exists())
+        self.assertFalse(RescoreJob.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {**form, 'correct_option': question.correct_option, 'correct_key': 'on'},
+                                        follow=True)
+        self.assertContains(response, "submissions that answered this question are being rescored")
+        correction = AnswerKeyCorrection.objects.get()
+        self.assertEqual((correction.previous_option, correction.correct_option), (new, question.correct_option))
+        self.assertEqual(RescoreJob.objects.get().status, 'done')
+
+    def test_correction_drops_the_adaptive_item_table(self):
+        adaptive.item_table(self.question.subject_id)
+        self.assertIsNotNone(cache.get(adaptive._table_key(self.question.subject_id)))
+        self.correct('D' if self.question.correct_option != 'D' else 'A')
+        self.assertIsNone(cache.get(adaptive._table_key(self.question.subject_id)))
+
+    def test_a_job_runs_once_at_a_time(self):
+        job = RescoreJob.objects.create(question_ids=[self.question.id], status='running', heartbeat_at=timezone.now())
+        with mock.patch.object(rescoring, 'rescore_submissions') as rescore:
+            self.assertEqual(rescoring.run_job(job.id).status, 'running')
+        rescore.assert_not_called()
+        self.assertFalse(rescoring.unfinished_jobs().exists())
+
+        # A running job whose process died is picked up again
+        RescoreJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(list(rescoring.unfinished_jobs()), [job])
+        self.assertEqual(rescoring.run_job(job.id).status, 'done')
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rescore_submissions', '--questions', str(self.question.id), stdout=out)
+        self.assertIn("0 changed", out.getvalue())
+        RescoreJob.objects.create(question_ids=[self.question.id])
+        out = StringIO()
+        call_command('rescore_submissions', '--resume', stdout=out)
+        self.assertEqual(out.getvalue().count("Job "), 1)
+        self.assertFalse(rescoring.unfinished_jobs().exists())
+        with self.assertRaises(CommandError):
+            call_command('rescore_submissions')
@@ -0,0 +1,138 @@
+"""
+Stage-level tracing for report rendering.
+
+A Trace records the stages of one render as spans of (stage, label, milliseconds,
+counts). Section code calls trace.lap(stage, label) at its end to close the span that
+started at the previous lap; trace.span() times a nested block without moving the lap
+mark, and trace.add() accumulates repeated work such as page callbacks into one span.
+
+The caller that creates a trace calls finish(). finish() adds the totals to per-stage
+aggregates (exposed on api/metrics/ as "report_traces") and logs the spans when the
+render took OMR_REPORT_SLOW_MS or longer. to_dict() and server_timing() hand the
+timings back to the caller.
+"""
+from contextlib import contextmanager
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .metrics import register_source
+
+logger = logging.getLogger(__name__)
+
+
+def slow_ms():
+    return getattr(settings, 'OMR_REPORT_SLOW_MS', 2000)
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self._accumulated = {}
+        self.started = self._mark = time.perf_counter()
+        self.total_ms = None
+
+    def record(self, stage, seconds, label=None, **counts):
+        span = {'stage': stage, 'ms': round(seconds * 1000, 2)}
+        if label is not None:
+            span['label'] = label
+        span.update(counts)
+        self.spans.append(span)
+        return span
+
+    def lap(self, stage, label=None, **counts):
+        """Close the span running since the previous lap (or the start)."""
+        now = time.perf_counter()
+        span = self.record(stage, now - self._mark, label, **counts)
+        self._mark = now
+        return span
+
+    def skip(self):
+        """Move the lap mark without recording anything (for work that is not a stage)."""
+        self._mark = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage, label=None, **counts):
+        """Time a block as its own span; the block may add counts to the yielded dict."""
+        start = time.perf_counter()
+        extra = dict(counts)
+        try:
+            yield extra
+        finally:
+            self.record(stage, time.perf_counter() - start, label, **extra)
+
+    def add(self, stage, seconds, **counts):
+        """Accumulate repeated work into one span per stage (calls counts the additions)."""
+        span = self._accumulated.get(stage)
+        if span is None:
+            span = self._accumulated[stage] = self.record(stage, 0, calls=0)
+        span['ms'] = round(span['ms'] + seconds * 1000, 2)
+        span['calls'] += 1
+        for key, value in counts.items():
+            span[key] = span.get(key, 0) + value
+
+    def ms(self, *stages):
+        """Milliseconds recorded so far for the given stages."""
+        return sum(span['ms'] for span in self.spans if span['stage'] in stages)
+
+    def finish(self):
+        self.total_ms = round((time.perf_counter() - self.started) * 1000, 2)
+        _aggregate(self)
+        if self.total_ms >= slow_ms():
+            logger.warning("Slow %s render (%.0f ms): %s", self.name, self.total_ms, json.dumps(self.spans))
+        return self
+
+    def to_dict(self):
+        return {'name': self.name, 'total_ms': self.total_ms, 'spans': list(self.spans)}
+
+    def server_timing(self):
+        """The spans as a Server-Timing header value (same-stage spans are summed)."""
+        totals = {}
+        for span in self.spans:
+            totals[span['stage']] = totals.get(span['stage'], 0) + span['ms']
+        entries = [f"{stage.replace('.', '-')};dur={ms:.1f}" for stage, ms in totals.items()]
+        if self.total_ms is not None:
+            entries.append(f"total;dur={self.total_ms:.1f}")
+        return ', '.join(entries)
+
+
+# --- Aggregates per trace name and stage ---
+
+_lock = threading.Lock()
+_stats = {}  # (trace name, stage): [count, total ms, max ms]
+_totals = {}  # trace name: [count, total ms, max ms, slow count]
+
+
+def _aggregate(trace):
+    with _lock:
+        for span in trace.spans:
+            stats = _stats.setdefault((trace.name, span['stage']), [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += span['ms']
+            stats[2] = max(stats[2], span['ms'])
+        totals = _totals.setdefault(trace.name, [0, 0.0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += trace.total_ms
+        totals[2] = max(totals[2], trace.total_ms)
+        totals[3] += trace.total_ms >= slow_ms()
+
+
+def stats():
+    with _lock:
+        result = {}
+        for name, (count, total, peak, slow) in _totals.items():
+            result[name] = {
+                'renders': count, 'mean_ms': round(total / count, 2), 'max_ms': peak, 'slow': slow,
+                'stages': {
+                    stage: {'spans': n, 'mean_ms': round(ms / n, 2), 'max_ms': stage_peak}
+                    for (trace_name, stage), (n, ms, stage_peak) in sorted(_stats.items()) if trace_name == name
+                },
+            }
+        return result
+
+
+register_source('report_traces', stats)
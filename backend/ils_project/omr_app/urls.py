@@ -7,9 +7,32 @@ urlpatterns = [
     path('submit-form/', views.submit_form, name='submit_form'),
     path('api/subjects/', views.subject_list, name='subject-list'),
     path('api/get_random_questions/', views.get_random_questions, name='get_random_questions'),
+    path('api/paper/<int:student_id>/subjects/<int:subject_id>/', views.paper_subject, name='paper_subject'),
+    path('api/autosave_answers/', views.autosave_answers, name='autosave_answers'),
+    path('api/drafts/<int:student_id>/', views.student_draft, name='student_draft'),
+    path('api/adaptive/next_question/', views.adaptive_next_question, name='adaptive_next_question'),
     path('api/submit_answers/', views.submit_answers, name='submit_answers'),
     # path('api/generate_pdf/<int:submission_id>/', views.generate_pdf, name='generate_pdf'),
     path('api/generate_pdf/<int:submission_id>/', views.generate_pdf, name='generate_pdf'),
+    path('api/results/<int:submission_id>/', views.submission_results, name='submission_results'),
+    path('results/<int:submission_id>/', views.submission_results_page, name='submission_results_page'),
+    path('api/cohort_report/', views.cohort_report, name='cohort_report'),
+    path('api/export_results/', views.export_results, name='export_results'),
+    path('offline/bundles/<str:checksum>/', views.offline_bundle_download, name='offline_bundle_download'),
+    path('api/offline/import/', views.import_offline_results, name='import_offline_results'),
+    path('api/sync/bank/', views.sync_bank, name='sync_bank'),
+    path('api/sync/bank/file/', views.sync_bank_file, name='sync_bank_file'),
+    path('api/sync/media/', views.sync_media, name='sync_media'),
+    path('api/sync/push/', views.sync_push, name='sync_push'),
+    path('api/rescore/', views.rescore_jobs, name='rescore_jobs'),
+    path('api/questions/search/', views.search_questions, name='search_questions'),
+    path('api/questions/check_duplicates/', views.check_duplicate_questions, name='check_duplicate_questions'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:name>/', views.profile_detail, name='profile_detail'),
+    path('api/metrics/', views.metrics, name='metrics'),
+    path('api/live/<str:exam_session>/', views.live_session, name='live_session'),
+    path('api/live/<str:exam_session>/events/', views.live_session_events, name='live_session_events'),
+    path('live/<str:exam_session>/', views.live_session_page, name='live_session_page'),
 
     
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
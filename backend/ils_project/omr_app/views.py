@@ -1,13 +1,35 @@
 # views.py
-from django.shortcuts import get_object_or_404
-from rest_framework.decorators import api_view
+from django.shortcuts import render
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from .models import *
 from rest_framework import status
 from .serializers import *
-from .pdf_utils import generate_student_performance_pdf
+from .papers import question_payloads
+import itertools
+import logging
+import os
 import random
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import IntegrityError
+from django.utils import timezone
+from rest_framework.permissions import IsAdminUser
+from . import adaptive
+from .admission import admission_controlled
+from .delivery import page_max_age, prefetch_links, seeded_papers, start_paged_paper, subject_page
+from .drafts import merge_batch
+from .exam_cache import level_pool_ids, subject_list_data
+from .filters import CohortFilter
+from .live import event_stream, hub
+from .metrics import collect_all
+from .reports import build_report_data, cached_report_payload
+from .scoring import AlreadySubmitted, record_submission
+from .tracing import Trace
+
+logger = logging.getLogger(__name__)
 
 @api_view(['POST'])
 def submit_form(request):
@@ -23,14 +45,8 @@ def subject_list(request):
     class_level = request.GET.get('class_level')
     board = request.GET.get('board')
 
-    subjects = Subject.objects.all()
-    if class_level:
-        subjects = subjects.filter(class_level=class_level)
-    if board:
-        subjects = subjects.filter(board__iexact=board)
-
-    serializer = SubjectSerializer(subjects, many=True, context={'request': request})
-    return Response(serializer.data)
+    # Every student asks for the same list at exam start: cached and coalesced
+    return Response(subject_list_data(request, class_level, board))
 
 # @api_view(['POST'])
 # def get_random_questions(request):
@@ -61,12 +77,54 @@ def subject_list(request):
 #     return Response(result)
 
 
+def seeded_questions(student_id, subject_ids, exam_session):
+    """
+    Build the response for a seeded paper. Nothing per question is stored: the draft
+    for (student, exam_session) only records which snapshot the paper is drawn from.
+    """
+    subjects = list(Subject.objects.filter(id__in=subject_ids))
+    if not subjects:
+        return {}
+
+    snapshot, papers = seeded_papers(student_id, subjects, exam_session)
+
+    result = {}
+    for subject, paper in papers.items():
+        result[subject.name] = {
+            'questions': question_payloads(snapshot.id, [qid for ids in paper.values() for qid in ids]),
+            'level_counts': {level: len(ids) for level, ids in paper.items()},
+            'snapshot_version': snapshot.version,
+        }
+    return result
+
+
 @api_view(['POST'])
+@admission_controlled('get_random_questions')
 def get_random_questions(request):
     subject_ids = request.data.get("subject_ids", [])
     student_id = request.data.get("student_id")
+    exam_session = request.data.get("exam_session")
     result = {}
 
+    # Paged delivery: the paper is fixed now, but only the first subject is sent (see delivery.py)
+    if request.data.get("paged") and student_id:
+        try:
+            paper = start_paged_paper(student_id, subject_ids, str(exam_session)[:64] if exam_session else None)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        response = Response(paper)
+        if paper['first']:
+            subject_order = [subject['id'] for subject in paper['subjects']]
+            response['Link'] = prefetch_links(student_id, paper['first'], subject_order, str(exam_session)[:64] if exam_session else None)
+        return response
+
+    # Seeded papers are rebuilt from the exam session instead of stored per student
+    if exam_session and student_id:
+        try:
+            return Response(seeded_questions(student_id, subject_ids, str(exam_session)[:64]))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     # Check if we have saved questions for this student
     if student_id:
         try:
@@ -100,28 +158,28 @@ def get_random_questions(request):
                         # Remove this subject ID from the list to process
                         subject_ids = [sid for sid in subject_ids if str(sid) != str(saved.subject_id)]
         except Exception as e:
-            print(f"Error retrieving saved questions: {e}")
+            logger.warning("Error retrieving saved questions: %s", e)
             # Continue with generating new questions
     
     # For any remaining subject IDs that weren't found in saved questions,
     # generate new random questions
     for subject_id in subject_ids:
-        questions = Question.objects.filter(subject_id=subject_id)
-        levels = [1, 2, 3, 4]
-        selected = []
+        # Sample ids from the cached per-level pools, then load only the chosen rows
+        pools = level_pool_ids(subject_id)
         level_counts = {}
         selected_ids = []
 
-        for level in levels:
-            level_qs = list(questions.filter(level=level))
-            if level_qs:
+        for level in [1, 2, 3, 4]:
+            level_ids = pools.get(level, [])
+            if level_ids:
                 # Choose up to 5 random questions per level
-                sample_size = min(5, len(level_qs))
-                selected_questions = random.sample(level_qs, sample_size)
-                selected.extend(selected_questions)
-                selected_ids.extend([q.id for q in selected_questions])
+                sample_size = min(5, len(level_ids))
+                selected_ids.extend(random.sample(level_ids, sample_size))
                 level_counts[level] = sample_size
 
+        questions = Question.objects.in_bulk(selected_ids)
+        selected = [questions[qid] for qid in selected_ids if qid in questions]
+
         subject = Subject.objects.get(id=subject_id)
         result[subject.name] = {
             'questions': QuestionSerializer(selected, many=True).data,
@@ -137,7 +195,7 @@ def get_random_questions(request):
                     defaults={'question_ids': selected_ids}
                 )
             except Exception as e:
-                print(f"Error saving questions for student: {e}")
+                logger.warning("Error saving questions for student %s: %s", student_id, e)
 
     return Response(result)
 
@@ -192,92 +250,588 @@ def get_random_questions(request):
 
 
 
+VALID_OPTIONS = {'A', 'B', 'C', 'D'}
+MAX_AUTOSAVE_BATCH = 200
+
+
+@api_view(['GET'])
+def paper_subject(request, student_id, subject_id):
+    """
+    One subject of a paper started in paged mode. The URL (with ?subjects= in exam order
+    and exam_session for seeded papers) comes from the manifest or a Link prefetch hint.
+    """
+    subject = Subject.objects.filter(id=subject_id).first()
+    if subject is None:
+        raise Http404("Subject not found")
+    subject_ids = [int(sid) for sid in request.GET.get('subjects', '').split(',') if sid.strip().isdigit()]
+    exam_session = request.GET.get('exam_session', '')[:64] or None
+    page = subject_page(student_id, subject, subject_ids, exam_session)
+    response = Response(page)
+    # The paper is fixed, so the page can be served from the browser cache for the exam
+    response['Cache-Control'] = f'private, max-age={page_max_age()}'
+    links = prefetch_links(student_id, page, subject_ids, exam_session)
+    if links:
+        response['Link'] = links
+    return response
+
+
 @api_view(['POST'])
-def submit_answers(request):
-    print("🔍 Incoming data:", request.data)
+def autosave_answers(request):
+    """
+    Merge a small batch of changed answers into the student's server-side draft.
+
+    Payload: {"student_id", "paper_key", "seq", "answers": {question_id: option or null}}.
+    A null option clears that answer. Batches are applied only if their seq is newer
+    than the last merged one, so retried or out-of-order batches are harmless and the
+    client can coalesce clicks into one request every few seconds. Each batch is one
+    upsert (see drafts.py).
+    """
+    student_id = request.data.get("student_id")
+    paper_key = str(request.data.get("paper_key") or "")
+    delta = request.data.get("answers") or {}
+
+    try:
+        seq = int(request.data.get("seq"))
+        student_id = int(student_id)
+    except (TypeError, ValueError):
+        return Response({"error": "student_id and seq must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not paper_key or len(paper_key) > 64:
+        return Response({"error": "paper_key is required (max 64 characters)"}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(delta, dict) or len(delta) > MAX_AUTOSAVE_BATCH:
+        return Response({"error": f"answers must be an object with at most {MAX_AUTOSAVE_BATCH} entries"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    for qid, option in delta.items():
+        if not str(qid).isdigit() or (option is not None and option not in VALID_OPTIONS):
+            return Response({"error": f"Invalid answer for question {qid}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        saved = merge_batch(student_id, paper_key, seq, delta)
+    except IntegrityError:
+        return Response({"error": "Student not found"}, status=status.HTTP_400_BAD_REQUEST)
+    if saved is not None:
+        return Response({"paper_key": paper_key, "seq": seq, "saved": saved})
+
+    # Not applied: the paper was submitted, or a batch as new or newer was merged already
+    draft = ExamDraft.objects.filter(student_id=student_id, paper_key=paper_key).values('last_seq', 'submission_id').first()
+    if draft is not None and draft['submission_id']:
+        return Response({"error": "This paper has already been submitted",
+                         "submission_id": draft['submission_id']}, status=status.HTTP_409_CONFLICT)
+    return Response({"paper_key": paper_key, "seq": draft['last_seq'] if draft else seq, "stale": True})
+
+
+@api_view(['POST'])
+def adaptive_next_question(request):
+    """
+    Adaptive mode: answer the pending question of a subject and get the next one.
 
+    Payload: {"student_id", "subject_id", "paper_key", "question_id", "option"}; leave out
+    question_id and option on the first call. Returns {"question", "progress"} or, once the
+    ability estimate has converged, {"question": null, "progress": {"done": true, ...}}.
+    Answers go into the paper's draft, so the paper is submitted with submit_answers and
+    its paper_key as usual. Calling again without an answer re-serves the pending question.
+    """
+    paper_key = str(request.data.get("paper_key") or "")
+    question_id = request.data.get("question_id")
+    option = request.data.get("option")
+
+    try:
+        student_id = int(request.data.get("student_id"))
+        subject_id = int(request.data.get("subject_id"))
+    except (TypeError, ValueError):
+        return Response({"error": "student_id and subject_id must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+    if not paper_key or len(paper_key) > 64:
+        return Response({"error": "paper_key is required (max 64 characters)"}, status=status.HTTP_400_BAD_REQUEST)
+    if question_id is not None and (not str(question_id).isdigit() or option not in VALID_OPTIONS):
+        return Response({"error": "question_id and option (A-D) must be sent together"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not Student.objects.filter(id=student_id).exists():
+        return Response({"error": "Student not found"}, status=status.HTTP_400_BAD_REQUEST)
+    if not Subject.objects.filter(id=subject_id).exists():
+        return Response({"error": "Subject not found"}, status=status.HTTP_400_BAD_REQUEST)
+
+    table = adaptive.item_table(subject_id)
+    draft, _ = ExamDraft.objects.get_or_create(student_id=student_id, paper_key=paper_key)
+
+    # Same optimistic concurrency as autosave: every step bumps last_seq
+    for _attempt in range(3):
+        if draft.submission_id:
+            return Response({"error": "This paper has already been submitted",
+                             "submission_id": draft.submission_id}, status=status.HTTP_409_CONFLICT)
+        states = dict(draft.adaptive)
+        state = states.get(str(subject_id)) or adaptive.new_state()
+        answers = dict(draft.answers)
+
+        if question_id is not None:
+            if state['pending'] != int(question_id):
+                return Response({"error": "That question is not awaiting an answer",
+                                 "pending": state['pending']}, status=status.HTTP_409_CONFLICT)
+            adaptive.record_answer(state, table, int(question_id), option)
+            answers[str(question_id)] = option
+        next_id = state['pending'] if state['pending'] is not None else adaptive.next_question(state, table)
+        states[str(subject_id)] = state
+
+        updated = ExamDraft.objects.filter(id=draft.id, last_seq=draft.last_seq, submission__isnull=True).update(
+            answers=answers, adaptive=states, last_seq=draft.last_seq + 1, updated_at=timezone.now()
+        )
+        if updated:
+            question = QuestionSerializer(Question.objects.get(id=next_id)).data if next_id is not None else None
+            return Response({"paper_key": paper_key, "question": question, "progress": adaptive.progress(state)})
+        draft.refresh_from_db()
+
+    return Response({"error": "Draft is being updated concurrently, retry"}, status=status.HTTP_409_CONFLICT)
+
+
+@api_view(['GET'])
+def student_draft(request, student_id):
+    """
+    The student's open (unsubmitted) draft, so a replacement device can pick the exam up
+    where the dead one left it: ?paper_key= (the exam session for seeded papers) for a
+    specific paper, otherwise the most recently saved one.
+    """
+    drafts = ExamDraft.objects.filter(student_id=student_id, submission__isnull=True)
+    paper_key = request.GET.get('paper_key') or request.GET.get('exam_session')
+    if paper_key:
+        drafts = drafts.filter(paper_key=paper_key)
+    draft = drafts.order_by('-updated_at').first()
+    if draft is None:
+        return Response({"error": "No open draft for this student"}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        "paper_key": draft.paper_key,
+        "seq": draft.last_seq,
+        "answers": draft.answers,
+        "exam_session": draft.paper_key if draft.snapshot_id else None,
+        "updated_at": draft.updated_at,
+    })
+
+
+@api_view(['POST'])
+def submit_answers(request):
     student_id = request.data.get("student_id")
     subject_ids = request.data.get("subject_ids", [])
     answers = request.data.get("answers", {})
+    paper_key = request.data.get("paper_key")
+    draft = None
+
+    # When the exam was autosaved, the client only needs to send the paper_key and
+    # whatever it hasn't synced yet; the draft supplies the rest.
+    if paper_key:
+        draft = ExamDraft.objects.filter(student_id=student_id, paper_key=paper_key).first()
+        if draft is None and not answers:
+            return Response({"error": "No saved draft found for this paper"}, status=status.HTTP_400_BAD_REQUEST)
+        if draft is not None:
+            if draft.submission_id:
+                return Response({"error": "This paper has already been submitted",
+                                 "submission_id": draft.submission_id}, status=status.HTTP_409_CONFLICT)
+            answers = {**draft.answers, **answers}
 
     try:
         student = Student.objects.get(id=student_id)
-        
-        # After successful submission, remove saved questions to clean up
-        StudentSavedQuestions.objects.filter(
-            student_id=student_id,
-            subject_id__in=subject_ids
-        ).delete()
-        
     except Student.DoesNotExist:
         return Response({"error": "Student not found"}, status=status.HTTP_400_BAD_REQUEST)
 
-    score = 0
-    total = 0
-    subject_score_data = {}
-
-    for subject in Subject.objects.filter(id__in=subject_ids):
-        subject_questions = Question.objects.filter(subject=subject)
-        correct = 0
-        for q in subject_questions:
-            qid_str = str(q.id)
-            if qid_str in answers and answers[qid_str] == q.correct_option:
-                correct += 1
-                score += 1
-            total += 1
-        subject_score_data[subject.name] = correct
-        print(f"Subject: {subject.name}, Correct Answers: {correct}, Total Score So Far: {score}")
-
-    submission = StudentSubmission.objects.create(
-        student=student,
-        answers=answers,
-        score=score,
-        subject_scores=subject_score_data
-    )
-    submission.subjects.set(subject_ids)
-
-    return Response({
+    try:
+        submission, total = record_submission(student, subject_ids, answers, draft)
+    except AlreadySubmitted as e:
+        # A concurrent submit of the same paper claimed the draft first
+        return Response({"error": "This paper has already been submitted",
+                         "submission_id": e.submission_id}, status=status.HTTP_409_CONFLICT)
+
+    # After successful submission, remove saved questions to clean up
+    StudentSavedQuestions.objects.filter(
+        student_id=student_id,
+        subject_id__in=subject_ids
+    ).delete()
+
+    result = {
         "message": "Answers submitted successfully",
-        "score": score,
+        "score": submission.score,
         "total": total,
         "submission_id": submission.id
-    }, status=status.HTTP_200_OK)
+    }
+    if submission.abilities:
+        result["abilities"] = submission.abilities
+    return Response(result, status=status.HTTP_200_OK)
 
 
 
 @api_view(['GET'])
+@admission_controlled('generate_pdf')
 def generate_pdf(request, submission_id):
     """
     Generate and download a PDF report for a student submission
     """
-    # Get the submission
-    submission = get_object_or_404(StudentSubmission, id=submission_id)
-    student = submission.student
+    # Stage timings go back in the Server-Timing header (see tracing.py)
+    trace = Trace('student_pdf')
+    # Live or archived submission, 404 if neither
+    with trace.span('fetch'):
+        report = build_report_data(submission_id)
     
     try:
+        # ReportLab is only loaded by the workers that actually render PDFs
+        from .pdf_utils import render_student_performance_pdf
+
         # Generate PDF using the utility function
-        buffer = generate_student_performance_pdf(
-            student_id=student.id,
+        buffer = render_student_performance_pdf(
+            report,
             title="Student Performance Report",
             notes="",
             footer="Generated by ILS Assessment System",
-            include_chart=True
+            include_chart=True,
+            trace=trace,
         )
+        trace.finish()
         
         # Create response with PDF attachment
-        filename = f"{student.name.replace(' ', '_')}_performance_report.pdf"
+        filename = f"{report.student.name.replace(' ', '_')}_performance_report.pdf"
         response = HttpResponse(buffer, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Server-Timing'] = trace.server_timing()
         return response
         
     except Exception as e:
         # Handle any errors that might occur during PDF generation
-        print(f"Error generating PDF: {e}")
+        logger.exception("Error generating PDF for submission %s", submission_id)
         return Response(
             {"error": "Failed to generate PDF report", "details": str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
     
+@api_view(['GET'])
+def submission_results(request, submission_id):
+    """
+    Per-subject and per-level results as JSON: the fast, on-screen alternative to the PDF.
+    Supports conditional GETs via ETag. Add ?questions=1 for the per-question breakdown.
+    """
+    payload, etag = cached_report_payload(submission_id)
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        if request.GET.get('questions') not in ('1', 'true'):
+            payload = {k: v for k, v in payload.items() if k != 'questions'}
+        response = Response(payload)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
+
+
+@cache_control(public=True, max_age=86400)
+def submission_results_page(request, submission_id):
+    """Static HTML shell that renders api/results/<id>/ in the browser."""
+    return render(request, 'omr_app/results.html', {'submission_id': submission_id})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cohort_report(request):
+    """
+    Class / school analytics over every matching submission. Filters: school, class_level,
+    board, subjects (comma separated ids), date_from, date_to. Add ?output=pdf for a PDF.
+    """
+    # NumPy (and ReportLab for the PDF) are only loaded by workers that build cohort reports
+    from .cohort import build_cohort_report
+
+    try:
+        cohort_filter = CohortFilter.from_query_params(request.GET)
+    except ValueError as e:
+        return Response({"error": f"Invalid filter: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+    report = build_cohort_report(cohort_filter)
+
+    if request.GET.get('output') != 'pdf':
+        return Response(report)
+    from .pdf_utils import render_cohort_report_pdf
+    response = HttpResponse(render_cohort_report_pdf(report), content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename="cohort_report.pdf"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_results(request):
+    """
+    Stream results as a spreadsheet: ?output=csv (default), jsonl or parquet. Takes the
+    same filters as the cohort report; add ?questions=1 for one column per question.
+    """
+    from .export import FORMATS, ExportError, ResultsExport
+
+    output = request.GET.get('output', 'csv')
+    if output not in FORMATS:
+        return Response({"error": f"output must be one of {', '.join(FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        cohort_filter = CohortFilter.from_query_params(request.GET)
+    except ValueError as e:
+        return Response({"error": f"Invalid filter: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    export = ResultsExport(cohort_filter, include_questions=request.GET.get('questions') in ('1', 'true'))
+    try:
+        chunks = export.stream(output)
+        if output == 'parquet':
+            # Fail before the response starts if pyarrow is missing
+            first = next(chunks)
+            chunks = itertools.chain([first], chunks)
+    except ExportError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    content_type, extension = FORMATS[output]
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="results.{extension}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def live_session(request, exam_session):
+    """
+    Current counters of an exam session, for scripts (the dashboard page follows the
+    event stream). The ETag changes with the board, so an unchanged board is a 304
+    straight from memory.
+    """
+    data, etag = hub.board(exam_session).encoded()
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(data, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@staff_member_required
+def live_session_events(request, exam_session):
+    """
+    Server-Sent Events with the session's counters on every change. A plain Django view:
+    DRF would answer the EventSource's Accept: text/event-stream with 406. Each stream
+    holds a server thread while open, so this needs a threaded or async server (live.py).
+    """
+    response = StreamingHttpResponse(event_stream(exam_session), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keep nginx from buffering the stream
+    return response
+
+
+@staff_member_required
+def live_session_page(request, exam_session):
+    """Invigilator dashboard: replaces refreshing the admin changelist during a sitting."""
+    return render(request, 'omr_app/live_dashboard.html', {'exam_session': exam_session})
+
+
+@staff_member_required
+def profile_list(request):
+    """Stored request profiles (see profiling.py), newest first."""
+    from .profiling import list_profiles, profiler_settings
+
+    return render(request, 'omr_app/profiles.html', {
+        'profiles': list_profiles(), 'config': profiler_settings(), 'title': 'Request profiles',
+    })
+
+
+@staff_member_required
+def profile_detail(request, name):
+    """One stored profile as a flamegraph, or its raw JSON with ?output=json."""
+    from .profiling import flamegraph_svg, load_profile
+
+    profile = load_profile(name)
+    if profile is None:
+        raise Http404("Profile not found")
+    if request.GET.get('output') == 'json':
+        return JsonResponse(profile)
+    return render(request, 'omr_app/profile_detail.html', {
+        'name': name, 'profile': profile, 'flamegraph': flamegraph_svg(profile['stacks']),
+        'title': f"Profile of {profile['view'] or profile['path']}",
+    })
+
+
+@staff_member_required
+def offline_bundle_download(request, checksum):
+    """The archive of an offline exam bundle (see offline.py)."""
+    from .offline import bundle_dir
+
+    bundle = OfflineBundle.objects.filter(checksum=checksum).first()
+    if bundle is None:
+        raise Http404("Bundle not found")
+    try:
+        archive = open(os.path.join(bundle_dir(), bundle.file), 'rb')
+    except OSError:
+        raise Http404("Bundle file is missing")
+    response = FileResponse(archive, as_attachment=True, filename=bundle.file, content_type='application/zip')
+    response['ETag'] = f'"{bundle.checksum}"'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def import_offline_results(request):
+    """
+    Results of an offline bundle in one upload: a JSON body, or a JSON file (optionally
+    gzip-compressed) in the "results" field. Every result goes through normal scoring.
+    """
+    from .offline import BundleError, import_results, parse_results
+
+    upload = request.FILES.get('results')
+    try:
+        summary = import_results(parse_results(upload.read()) if upload else request.data)
+    except BundleError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(summary)
+
+
+def _sync_node_required(view):
+    """Edge node endpoints authenticate with the node's token (OMR_SYNC['nodes']), not a user."""
+    from functools import wraps
+    from .sync import authenticate_node
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        node = authenticate_node(request)
+        if node is None:
+            return JsonResponse({"error": "Unknown node or invalid token"}, status=403)
+        return view(request, node, *args, **kwargs)
+    return csrf_exempt(wrapper)
+
+
+@_sync_node_required
+def sync_bank(request, node):
+    """The current question bank snapshot of ?board=&class_level= and its subjects."""
+    from .sync import bank_data
+
+    try:
+        class_level = int(request.GET.get('class_level', ''))
+    except ValueError:
+        return JsonResponse({"error": "class_level must be an integer"}, status=400)
+    return JsonResponse(bank_data(request.GET.get('board', 'CBSE'), class_level))
+
+
+@_sync_node_required
+def sync_bank_file(request, node):
+    """A snapshot file, gzip-compressed (?board=&class_level=&version=)."""
+    import gzip
+    from .snapshots import snapshot_dir
+
+    try:
+        class_level, version = int(request.GET.get('class_level', '')), int(request.GET.get('version', ''))
+    except ValueError:
+        return JsonResponse({"error": "class_level and version must be integers"}, status=400)
+    snapshot = QuestionBankSnapshot.objects.filter(
+        board=normalize_board(request.GET.get('board', '')), class_level=class_level, version=version,
+    ).exclude(file='').first()
+    if snapshot is None:
+        raise Http404("Snapshot not found")
+    try:
+        with open(os.path.join(snapshot_dir(), snapshot.file), 'rb') as fh:
+            data = fh.read()
+    except OSError:
+        raise Http404("Snapshot file is missing")
+    return HttpResponse(gzip.compress(data, 6), content_type='application/gzip')
+
+
+@_sync_node_required
+def sync_media(request, node):
+    """A subject or question image (?name=, its storage name)."""
+    from django.core.files.storage import default_storage
+
+    name = request.GET.get('name', '')
+    if not (Question.objects.filter(question_image=name).exists() or Subject.objects.filter(image=name).exists()):
+        raise Http404("Image not found")
+    try:
+        return FileResponse(default_storage.open(name, 'rb'))
+    except OSError:
+        raise Http404("Image file is missing")
+
+
+@_sync_node_required
+def sync_push(request, node):
+    """A gzip-compressed change set from an edge node (see sync.py); answers with its acknowledgement."""
+    from .sync import SyncError, ingest, parse_change_set
+
+    if request.method != 'POST':
+        return JsonResponse({"error": "POST a change set"}, status=405)
+    try:
+        change_set = parse_change_set(request.body, request.headers.get('Content-Encoding', ''))
+        if change_set.get('node', node) != node:
+            raise SyncError("The change set belongs to another node")
+        ack = ingest(node, change_set, size=len(request.body))
+    except SyncError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(ack)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def rescore_jobs(request):
+    """Rescoring jobs after answer key corrections (see rescoring.py): ?active=1 for unfinished ones only."""
+    if request.GET.get('active') in ('1', 'true'):
+        jobs = RescoreJob.objects.exclude(status='done').order_by('id')
+    else:
+        jobs = RescoreJob.objects.all()[:50]
+    return Response([
+        {
+            'id': job.id, 'question_ids': job.question_ids, 'status': job.status, 'total': job.total,
+            'processed': job.processed, 'changed': job.changed, 'progress': job.progress, 'error': job.error,
+            'started_at': job.started_at, 'finished_at': job.finished_at,
+        }
+        for job in jobs
+    ])
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def search_questions(request):
+    """
+    Ranked full-text search over the question bank: ?q= (the last word matches as a prefix),
+    optional subject and level (comma separated), board, limit (max 100) and offset.
+    """
+    from .search import get_backend
+
+    try:
+        subject_ids = [int(x) for x in request.GET.get('subject', '').split(',') if x.strip()]
+        levels = [int(x) for x in request.GET.get('level', '').split(',') if x.strip()]
+        limit = min(int(request.GET.get('limit', 20)), 100)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        return Response({"error": "subject, level, limit and offset must be integers"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    hits = get_backend().search(request.GET.get('q', ''), subject_ids=subject_ids, levels=levels,
+                                board=request.GET.get('board'), limit=limit, offset=offset)
+    questions = Question.objects.select_related('subject').in_bulk([hit['id'] for hit in hits])
+    results = []
+    for hit in hits:
+        question = questions.get(hit['id'])
+        if question is not None:
+            results.append({
+                **QuestionSerializer(question).data,
+                'subject': question.subject.name,
+                'board': question.subject.board,
+                'correct_option': question.correct_option,
+                'rank': hit['rank'],
+                'snippet': hit['snippet'],
+            })
+    return Response({"query": request.GET.get('q', ''), "offset": offset, "results": results})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def check_duplicate_questions(request):
+    """
+    Import-time duplicate check. Payload: {"questions": [{"question_text", "option_a", ...
+    "option_d"}]}. Returns, per question, near-duplicates already in the bank and earlier
+    questions of the same batch it repeats.
+    """
+    from .similarity import check_import
+
+    rows = request.data.get("questions")
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return Response({"error": "questions must be a list of objects"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"results": check_import(rows)})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """Per-process metrics: admission queue depths, single-flight sharing and friends."""
+    return Response(collect_all())
+
+
 @api_view(['GET'])
 def student_performance_charts(request, submission_id):
     try:
@@ -368,4 +922,4 @@ def student_performance_charts(request, submission_id):
         return render(request, 'admin/student_performance_charts.html', context)
     
     except Submission.DoesNotExist:
-        return HttpResponseNotFound('Submission not found')
\ No newline at end of file
+        return HttpResponseNotFound('Submission not found')
@@ -0,0 +1,174 @@
+"""
+Cache warming before an exam window.
+
+warm_exam() reads everything the exam-start endpoints read for a board and its class
+levels, so the first students of a sitting don't pay for it:
+
+* the subject lists behind api/subjects/ and the per-level question id pools
+  (exam_cache.py), and the adaptive item tables (adaptive.py),
+* the current question bank snapshot of each class level (published if there is none
+  yet), its memory-mapped file, pools, pre-rendered payloads and answer key,
+* the subject and question image files,
+* with an exam session, the seeded papers of a roster: the ExamDraft that pins each
+  student's paper to the snapshot is created up front, which is the write the first
+  get_random_questions call of every student would otherwise make. Students carry no
+  board, so the roster is always given (e.g. a school's students): a default of every
+  student at the class level would pin other boards' students to this board's snapshot.
+
+Caches held in process memory (the default local-memory cache, the snapshot readers)
+are only warmed in the process that runs this, so run it in the web workers through the
+admin action, or use a shared cache backend for the warm_exam command to reach them.
+Database rows, snapshot files and the OS page cache behind image and snapshot reads are
+shared by every process either way.
+
+Each step is timed with a Trace (tracing.py); the spans are the report, and the finished
+trace is counted in the api/metrics/ trace aggregates like the report renders.
+"""
+from django.http import HttpRequest
+
+from . import adaptive
+from .exam_cache import level_pool_ids, subject_list_data
+from .models import ExamDraft, Question, Subject, normalize_board
+from .papers import answer_key, build_paper, current_snapshot, snapshot_reader, _snapshot_pools
+from .tracing import Trace
+
+READ_CHUNK = 1 << 20
+
+
+class _HostRequest(HttpRequest):
+    """A made-up request for an operator-given host: not checked against ALLOWED_HOSTS."""
+
+    def __init__(self, host):
+        super().__init__()
+        self.META['HTTP_HOST'] = host
+
+    def get_host(self):
+        return self.META['HTTP_HOST']
+
+
+def _read_file(field):
+    """Read a stored file through (so it is in the page cache); its size, or None if missing."""
+    size = 0
+    try:
+        with field.storage.open(field.name, 'rb') as fh:
+            while chunk := fh.read(READ_CHUNK):
+                size += len(chunk)
+    except OSError:
+        return None
+    return size
+
+
+def warm_exam(board, class_levels, subject_ids=None, exam_session=None, students=None, request=None, host='localhost'):
+    """
+    Warm the caches for an exam of `board` at `class_levels` (optionally only some
+    subjects). With `exam_session`, papers are prepared for the `students` queryset,
+    which is required then. `request` supplies the host of the image URLs in the
+    subject lists; without one a request for `host` is made up.
+
+    Returns the finished Trace; its spans are the steps with their counts and timings.
+    """
+    if exam_session and students is None:
+        raise ValueError("Preparing papers needs the roster of students sitting this board's exam")
+    board = normalize_board(board)
+    class_levels = sorted({int(level) for level in class_levels})
+    trace = Trace('warm_exam')
+    if request is None:
+        request = _HostRequest(host)
+
+    subjects = Subject.objects.filter(board=board, class_level__in=class_levels).order_by('id')
+    if subject_ids:
+        subjects = subjects.filter(id__in=subject_ids)
+    subjects = list(subjects)
+
+    with trace.span('subject_lists', subjects=len(subjects)):
+        for level in class_levels:
+            subject_list_data(request, str(level), board)
+
+    with trace.span('pools') as counts:
+        counts['questions'] = sum(
+            len(ids) for subject in subjects for ids in level_pool_ids(subject.id).values()
+        )
+
+    with trace.span('item_tables', subjects=len(subjects)):
+        for subject in subjects:
+            adaptive.item_table(subject.id)
+
+    snapshots = {}
+    with trace.span('snapshots') as counts:
+        for level in class_levels:
+            snapshot = current_snapshot(board, level)
+            snapshots[level] = snapshot
+            snapshot_reader(snapshot.id)
+            _snapshot_pools(snapshot.id)
+        counts['snapshots'] = len(snapshots)
+
+    # Question ids of the selected subjects, per snapshot
+    question_ids = {}
+    for subject in subjects:
+        snapshot = snapshots[subject.class_level]
+        pools = _snapshot_pools(snapshot.id).get(str(subject.id), {})
+        question_ids.setdefault(snapshot.id, []).extend(qid for pool in pools.values() for qid in pool)
+
+    with trace.span('payloads', payloads=0, bytes=0) as counts:
+        for snapshot_id, ids in question_ids.items():
+            reader = snapshot_reader(snapshot_id)
+            if reader is None:
+                continue  # Snapshot without a file: payloads are serialized per request
+            for qid in ids:
+                counts['payloads'] += 1
+                counts['bytes'] += len(reader.payload_bytes(qid))
+
+    with trace.span('answer_keys') as counts:
+        counts['answers'] = sum(len(answer_key(ids, snapshot_id)) for snapshot_id, ids in question_ids.items())
+
+    with trace.span('images', files=0, bytes=0, missing=0) as counts:
+        images = [subject.image for subject in subjects if subject.image]
+        images += [
+            question.question_image for question in
+            Question.objects.filter(subject__in=subjects).exclude(question_image='').exclude(question_image=None)
+            .only('id', 'question_image')
+        ]
+        for image in images:
+            size = _read_file(image)
+            if size is None:
+                counts['missing'] += 1
+            else:
+                counts['files'] += 1
+                counts['bytes'] += size
+
+    if exam_session:
+        with trace.span('papers') as counts:
+            counts.update(prepare_papers(str(exam_session)[:64], subjects, snapshots, students))
+
+    return trace.finish()
+
+
+def prepare_papers(exam_session, subjects, snapshots, students):
+    """
+    Pin the roster's seeded papers to the current snapshots (one ExamDraft per student,
+    created in bulk) and build them once. Students at other class levels are skipped;
+    those who already have a draft for the session keep it.
+    """
+    roster = list(students.values_list('id', 'classLevel'))
+    existing = set(
+        ExamDraft.objects.filter(paper_key=exam_session, student_id__in=[sid for sid, _ in roster])
+        .values_list('student_id', flat=True)
+    )
+    subjects_by_level = {}
+    for subject in subjects:
+        subjects_by_level.setdefault(subject.class_level, []).append(subject)
+
+    drafts, prepared, questions = [], 0, 0
+    for student_id, class_level in roster:
+        level = int(class_level) if str(class_level).isdigit() else None
+        if level not in snapshots:
+            continue  # Not sitting this board and class level
+        snapshot = snapshots[level]
+        prepared += 1
+        if student_id not in existing:
+            drafts.append(ExamDraft(student_id=student_id, paper_key=exam_session, snapshot=snapshot))
+        for subject in subjects_by_level.get(level, []):
+            questions += sum(len(ids) for ids in build_paper(snapshot.id, student_id, subject.id, exam_session).values())
+    # bulk_create skips the live dashboard's signals; its periodic resync counts these as issued
+    ExamDraft.objects.bulk_create(drafts, batch_size=1000, ignore_conflicts=True)
+    return {'students': prepared, 'created': len(drafts), 'questions': questions}